@@ -23,20 +23,25 @@ _about_exports = [
 ]
 
 from .acicounters import (  # noqa
-    AtomicCounter, AtomicCountersOnGoing, AtomicNode, AtomicPath,
-    InterfaceStats,
+    AtomicCounter, AtomicCountersCollector, AtomicCountersOnGoing, AtomicNode,
+    AtomicPath, InterfaceStats, InterfaceStatsCollector, InterfaceStatsPoller,
+    InterfaceStatsStore,
 )
+from .aciasync import AsyncSession  # noqa
 from .aciHealthScore import HealthScore  # noqa
 from .aciFaults import (Faults)  # noqa
+from .acijson import get_codec, set_codec  # noqa
 from .aciSearch import AciSearch, Searchable  # noqa
-from .acisession import EventHandler, Login, Session, Subscriber, CredentialsError  # noqa
+from .acisession import (EventHandler, Login, Session, Subscriber, CredentialsError,  # noqa
+                         ClusterSession, ClusterMember, PushResult)
 from .aciTable import Table  # noqa
 from .acibaseobject import BaseACIObject, BaseRelation
 from .acitoolkit import (  # noqa
     AnyEPG, AppProfile, AttributeCriterion, BaseContract,
     BGPSession, BridgeDomain, CollectionPolicy,
     CommonEPG, Context, Contract, ContractInterface, ContractSubject, Endpoint,
-    EPG, EPGDomain, FexInterface, Filter, FilterEntry, IPEndpoint, InputTerminal,
+    EndpointEnrichmentCache, EPG, EPGDomain, FexInterface, Filter, FilterEntry,
+    IPEndpoint, InputTerminal,
     L2ExtDomain, L2Interface, L3ExtDomain, L3Interface, LogicalModel, MonitorPolicy,
     MonitorStats, MonitorTarget, NetworkPool, OSPFInterface,
     OSPFInterfacePolicy, OSPFRouter, OutputTerminal, OutsideEPG,
@@ -45,6 +50,7 @@ from .acitoolkit import (  # noqa
     VMM, VMMCredentials, VmmDomain, VMMvSwitchInfo, Tag, _interface_from_dn
 )
 from .acitoolkitlib import Credentials, AcitoolkitGraphBuilder  # noqa
+from .acisnapshot import load_snapshot  # noqa
 from .acifakeapic import FakeSession  # noqa
 # Dependent on acitoolkit
 from .aciConcreteLib import (  # noqa
@@ -30,7 +30,9 @@
 """
 ACI Toolkit module for Health Scores
 """
-import json
+import logging
+
+log = logging.getLogger(__name__)
 
 
 class HealthScore(object):
@@ -59,6 +61,22 @@ class HealthScore(object):
     def _get_url(cls):
         return '/api/class/{}.json'.format(cls._get_apic_classes()[0])
 
+    @staticmethod
+    def _get_class_attributes(session, url, class_name):
+        """
+        Collects the attributes of the objects of an APIC class returned by a query
+        :param session: Session object for communicating with APIC
+        :param url: the URL to query
+        :param class_name: the APIC class name of the objects
+        :return: list of attribute dictionaries. The list is empty if the APIC
+                 returned an error.
+        """
+        resp = session.get(url)
+        if not resp.ok:
+            log.error('Could not get the %s objects: %s', class_name, resp.text)
+            return []
+        return [item[class_name]['attributes'] for item in resp.json()['imdata'] if class_name in item]
+
     @classmethod
     def _get_by_url(cls, session, url):
         """
@@ -67,12 +85,9 @@ class HealthScore(object):
         :param url: the URL to query for healthInst objects
         :return: list of HealthScore objects
         """
-        resp = session.get(url)
-        scores = json.loads(resp.text)['imdata']
         objects = []
-        for score in scores:
+        for attribute_data in cls._get_class_attributes(session, url, cls._get_apic_classes()[0]):
             obj = HealthScore()
-            attribute_data = score[cls._get_apic_classes()[0]]['attributes']
             obj._populate_from_attributes(attribute_data)
             objects.append(obj)
         return objects
@@ -101,14 +116,27 @@ class HealthScore(object):
     @classmethod
     def get_all(cls, session):
         """
-        Gets all of the Health Scores from the APIC.
+        Gets all of the Health Scores from the APIC using a single class query.
         :param session: the instance of Session used for APIC communication
         :returns: List of HealthScore objects
         """
+        return cls._get_by_url(session, cls._get_url())
 
-        url = cls._get_url()
-        objects = cls._get_by_url(session, url)
-        return objects
+    @classmethod
+    def get_node_health(cls, session):
+        """
+        Gets the current health of all of the switch nodes using a single
+        class query rather than one query per node.
+        :param session: the instance of Session used for APIC communication
+        :returns: dictionary of health strings indexed by the node dn.  The
+                  dictionary is empty if the APIC returned an error.
+        """
+        url = '/api/node/class/fabricNodeHealth5min.json'
+        node_health = {}
+        for attributes in cls._get_class_attributes(session, url, 'fabricNodeHealth5min'):
+            node_dn = str(attributes['dn']).split('/sys/')[0]
+            node_health[node_dn] = attributes['healthLast']
+        return node_health
 
     @classmethod
     def get_unhealthy(cls, session, threshold):
@@ -21,6 +21,7 @@
 """
 Implements the Searchable class
 """
+import sys
 
 
 class Searchable(object):
@@ -70,10 +71,11 @@ class Searchable(object):
         :param value:
         :param relation:
         """
-        if isinstance(value, unicode):
-            value = str(value)
-        if isinstance(attr, unicode):
-            attr = str(attr)
+        if sys.version_info < (3, 0, 0):
+            if isinstance(value, unicode):
+                value = str(value)
+            if isinstance(attr, unicode):
+                attr = str(attr)
 
         assert relation in ['primary', 'secondary']
         assert isinstance(value, str) or (value is None)
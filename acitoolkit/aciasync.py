@@ -0,0 +1,660 @@
+################################################################################
+#                                  _    ____ ___                               #
+#                                 / \  / ___|_ _|                              #
+#                                / _ \| |    | |                               #
+#                               / ___ \ |___ | |                               #
+#                         _____/_/   \_\____|___|_ _                           #
+#                        |_   _|__   ___ | | | _(_) |_                         #
+#                          | |/ _ \ / _ \| | |/ / | __|                        #
+#                          | | (_) | (_) | |   <| | |_                         #
+#                          |_|\___/ \___/|_|_|\_\_|\__|                        #
+#                                                                              #
+################################################################################
+#                                                                              #
+# Copyright (c) 2015 Cisco Systems                                             #
+# All Rights Reserved.                                                         #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may   #
+#    not use this file except in compliance with the License. You may obtain   #
+#    a copy of the License at                                                  #
+#                                                                              #
+#         http://www.apache.org/licenses/LICENSE-2.0                           #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT #
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the  #
+#    License for the specific language governing permissions and limitations   #
+#    under the License.                                                        #
+#                                                                              #
+################################################################################
+"""
+ACI Toolkit module for driving many concurrent APIC requests from an
+asyncio event loop.
+"""
+from collections import deque
+import functools
+import logging
+import ssl
+
+import requests
+from requests.exceptions import ConnectionError, Timeout
+from requests.structures import CaseInsensitiveDict
+
+from .acijson import decode_response, get_codec
+from .acisession import Session
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    asyncio = None
+
+log = logging.getLogger(__name__)
+
+TOO_BIG_ERROR = 'Unable to process the query, result dataset is too big'
+
+
+def _chain(source, target):
+    """
+    Copy the outcome of a future to another future
+    """
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def _then(loop, future, callback):
+    """
+    Call a function with the result of a future once it is done
+
+    :param loop: Event loop of the future
+    :param future: Future to wait for
+    :param callback: Function called with the result of the future.  It\
+    can return a value or another future.
+    :returns: Future returning the result of the callback
+    """
+    result = loop.create_future()
+
+    def call(done):
+        if result.done():
+            return
+        if done.cancelled() or done.exception() is not None:
+            _chain(done, result)
+            return
+        try:
+            value = callback(done.result())
+        except Exception as e:
+            result.set_exception(e)
+            return
+        if asyncio.isfuture(value):
+            value.add_done_callback(lambda value_done: _chain(value_done, result))
+        else:
+            result.set_result(value)
+    future.add_done_callback(call)
+    return result
+
+
+class _HTTPProtocol(asyncio.Protocol if asyncio is not None else object):
+    """
+    HTTP/1.1 client connection to the APIC carrying one request at a time
+    """
+    def __init__(self):
+        self.transport = None
+        self.closed = False
+        self.reused = False
+        self._future = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def send(self, method, data, future):
+        """
+        Send a request
+
+        :param method: String containing the HTTP method
+        :param data: Bytes containing the request
+        :param future: Future set to the tuple of the status code, reason,\
+        headers, body and whether the connection can be reused
+        """
+        self._method = method
+        self._future = future
+        self._buffer = bytearray()
+        self._status = None
+        self._received = False
+        self.transport.write(data)
+
+    def data_received(self, data):
+        self._received = True
+        if self._future is None:
+            return
+        self._buffer.extend(data)
+        try:
+            self._parse()
+        except ValueError as e:
+            self._fail(ConnectionError('Invalid response from the APIC: %s' % e))
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        if self._future is None:
+            return
+        if self._status is not None and self._length is None and not self._chunked:
+            # The body ends with the connection
+            self._complete(bytes(self._buffer), False)
+        else:
+            self._fail(ConnectionError('Connection to the APIC closed: %s' % exc))
+
+    def _fail(self, error):
+        future, self._future = self._future, None
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    def _complete(self, body, keep_alive):
+        future, self._future = self._future, None
+        if future is not None and not future.done():
+            future.set_result((self._status, self._reason, self._headers, body, keep_alive))
+
+    def _parse(self):
+        buf = self._buffer
+        if self._status is None:
+            end = buf.find(b'\r\n\r\n')
+            if end < 0:
+                return
+            lines = bytes(buf[:end]).decode('iso-8859-1').split('\r\n')
+            del buf[:end + 4]
+            version, status, reason = (lines[0].split(' ', 2) + [''])[:3]
+            self._headers = CaseInsensitiveDict()
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                self._headers[name.strip()] = value.strip()
+            self._status = int(status)
+            self._reason = reason
+            self._keep_alive = (version == 'HTTP/1.1' and
+                                self._headers.get('Connection', '').lower() != 'close')
+            self._chunked = 'chunked' in self._headers.get('Transfer-Encoding', '').lower()
+            self._length = None
+            if self._method == 'HEAD' or self._status in (204, 304) or self._status < 200:
+                self._length = 0
+            elif not self._chunked and 'Content-Length' in self._headers:
+                self._length = int(self._headers['Content-Length'])
+            elif not self._chunked:
+                self._keep_alive = False
+            self._body = bytearray()
+        if self._chunked:
+            while True:
+                end = buf.find(b'\r\n')
+                if end < 0:
+                    return
+                size = int(bytes(buf[:end]).split(b';')[0], 16)
+                if size == 0:
+                    # Skip the trailer
+                    trailer_end = buf.find(b'\r\n\r\n', end)
+                    if buf[end:end + 4] != b'\r\n\r\n' and trailer_end < 0:
+                        return
+                    self._complete(bytes(self._body), self._keep_alive)
+                    return
+                if len(buf) < end + 2 + size + 2:
+                    return
+                self._body.extend(buf[end + 2:end + 2 + size])
+                del buf[:end + 2 + size + 2]
+        elif self._length is not None and len(buf) >= self._length:
+            self._complete(bytes(buf[:self._length]), self._keep_alive)
+
+
+class _HTTPConnectionPool(object):
+    """
+    Pool of the keep-alive connections to the APIC used by an event loop
+    """
+    def __init__(self, url, verify_ssl=False, max_idle=100):
+        parsed = urlparse(url)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if self.scheme == 'https' else 80)
+        self.netloc = parsed.netloc
+        self.max_idle = max_idle
+        self._ssl = None
+        if self.scheme == 'https':
+            if isinstance(verify_ssl, str):
+                self._ssl = ssl.create_default_context(cafile=verify_ssl)
+            else:
+                self._ssl = ssl.create_default_context()
+                if not verify_ssl:
+                    self._ssl.check_hostname = False
+                    self._ssl.verify_mode = ssl.CERT_NONE
+        self._loop = None
+        self._idle = []
+
+    def _get_connection(self, loop):
+        """
+        Get an idle connection or open a new one
+
+        :returns: Future returning an instance of _HTTPProtocol
+        """
+        if loop is not self._loop:
+            self.close()
+            self._loop = loop
+        while self._idle:
+            protocol = self._idle.pop()
+            if not protocol.closed:
+                protocol.reused = True
+                future = loop.create_future()
+                future.set_result(protocol)
+                return future
+        connect = loop.create_connection(_HTTPProtocol, self.host, self.port, ssl=self._ssl)
+        return _then(loop, loop.create_task(connect), lambda connection: connection[1])
+
+    def _release(self, protocol, keep_alive):
+        if keep_alive and not protocol.closed and len(self._idle) < self.max_idle:
+            self._idle.append(protocol)
+        elif not protocol.closed:
+            protocol.transport.close()
+
+    def request(self, loop, method, path, headers, body=None, timeout=None, retry=True):
+        """
+        Send a request on a pooled connection
+
+        :param loop: Event loop running the request
+        :param method: String containing the HTTP method
+        :param path: String containing the URL path and query
+        :param headers: Dictionary containing the request headers
+        :param body: Optional bytes containing the request body
+        :param timeout: Number of seconds to wait for the response
+        :param retry: True to send the request again on a new connection\
+        if a reused connection was closed by the APIC
+        :returns: Future returning an instance of requests.Response
+        """
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s' % self.netloc,
+                 'Accept: */*', 'Connection: keep-alive']
+        for name, value in headers.items():
+            lines.append('%s: %s' % (name, value))
+        body = body or b''
+        if body or method == 'POST':
+            lines.append('Content-Length: %s' % len(body))
+        data = ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8') + body
+        result = loop.create_future()
+        state = {}
+
+        def on_timeout():
+            if result.done():
+                return
+            result.set_exception(Timeout('Request to %s timed out' % path))
+            protocol = state.get('protocol')
+            if protocol is not None:
+                protocol.transport.close()
+
+        timer = loop.call_later(timeout, on_timeout) if timeout else None
+
+        def on_response(done):
+            protocol = state['protocol']
+            if timer is not None:
+                timer.cancel()
+            if result.done():
+                return
+            error = done.exception()
+            if error is not None:
+                protocol.transport.close()
+                if retry and protocol.reused and not protocol._received:
+                    # The APIC closed the idle connection
+                    retried = self.request(loop, method, path, headers, body, timeout, retry=False)
+                    retried.add_done_callback(lambda retried_done: _chain(retried_done, result))
+                else:
+                    result.set_exception(error)
+                return
+            status, reason, resp_headers, resp_body, keep_alive = done.result()
+            self._release(protocol, keep_alive)
+            resp = requests.Response()
+            resp.status_code = status
+            resp.reason = reason
+            resp.headers = resp_headers
+            resp._content = resp_body
+            resp.encoding = requests.utils.get_encoding_from_headers(resp_headers) or 'utf-8'
+            resp.url = '%s://%s%s' % (self.scheme, self.netloc, path)
+            result.set_result(decode_response(resp))
+
+        def on_connection(done):
+            if done.exception() is not None:
+                if timer is not None:
+                    timer.cancel()
+                if not result.done():
+                    error = done.exception()
+                    if not isinstance(error, requests.RequestException):
+                        error = ConnectionError(error)
+                    result.set_exception(error)
+                return
+            protocol = state['protocol'] = done.result()
+            if result.done():
+                # Timed out while connecting
+                protocol.transport.close()
+                return
+            response = loop.create_future()
+            response.add_done_callback(on_response)
+            protocol.send(method, data, response)
+
+        self._get_connection(loop).add_done_callback(on_connection)
+        return result
+
+    def close(self):
+        """
+        Close the idle connections
+        """
+        for protocol in self._idle:
+            if not protocol.closed:
+                protocol.transport.close()
+        self._idle = []
+
+
+class AsyncSession(object):
+    """
+    Session whose methods return awaitables instead of blocking.
+
+    get() and push_to_apic() are sent by a non-blocking HTTP client running
+    on the event loop, so up to max_requests queries can be in flight from
+    a single thread.  The login, login refresh and subscriptions are left
+    to a blocking Session whose cookies the requests carry, and a request
+    rejected with 403 waits for that Session to log in again.
+
+    The toolkit get methods, get_objects() and get_deep(), and any blocking
+    call given to run() are run by the Session in a ThreadPoolExecutor of
+    max_concurrency threads.  Each of them holds a thread for its whole
+    duration.  get() and push_to_apic() also go through the threads when
+    a session or proxies are given, since the Session handles them.
+    """
+    def __init__(self, url, uid, pwd=None, cert_name=None, key=None, verify_ssl=False,
+                 appcenter_user=False, subscription_enabled=True, proxies=None,
+                 relogin_forever=False, max_concurrency=32, session=None, max_requests=1000,
+                 **kwargs):
+        """
+        :param url:  String containing the APIC URL such as ``https://1.2.3.4``
+        :param uid: String containing the username that will be used as\
+        part of the  the APIC login credentials.
+        :param pwd: String containing the password that will be used as\
+        part of the  the APIC login credentials.
+        :param max_concurrency: Integer containing the number of worker\
+        threads running the blocking calls.  The connection pool of the\
+        Session is sized to match unless pool_maxsize is given.
+        :param session: Session instance to use instead of creating one\
+        e.g. a ClusterSession.  The other connection parameters are ignored.
+        :param max_requests: Integer containing the maximum number of\
+        get() and push_to_apic() requests in flight.  Further requests wait\
+        for one to complete.
+        """
+        if asyncio is None:
+            raise ImportError('Cannot use AsyncSession because asyncio is not available.\n\
+            Please use Python 3.')
+        self._pool = None
+        if session is None:
+            kwargs.setdefault('pool_maxsize', max_concurrency)
+            session = Session(url, uid, pwd, cert_name=cert_name, key=key, verify_ssl=verify_ssl,
+                              appcenter_user=appcenter_user, subscription_enabled=subscription_enabled,
+                              proxies=proxies, relogin_forever=relogin_forever, **kwargs)
+            if not proxies:
+                self._pool = _HTTPConnectionPool(url, verify_ssl, max_idle=max_requests)
+                self._path_prefix = urlparse(url).path.rstrip('/')
+        self.session = session
+        self.max_concurrency = max_concurrency
+        self.max_requests = max_requests
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._in_flight = 0
+        self._waiting = deque()
+
+    @staticmethod
+    def _get_loop():
+        try:
+            return asyncio.get_running_loop()
+        except (AttributeError, RuntimeError):
+            return asyncio.get_event_loop()
+
+    def run(self, func, *args, **kwargs):
+        """
+        Run a blocking function on the worker threads
+
+        :param func: Function to run
+        :returns: Awaitable returning the result of the function
+        """
+        return self._get_loop().run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def login(self, timeout=None):
+        """
+        Initial login to the APIC.
+
+        :param timeout: Integer containing the number of seconds for connection timeout
+        :returns: Awaitable returning an instance of requests.Response
+        """
+        return self.run(self.session.login, timeout=timeout)
+
+    def logged_in(self):
+        """
+        Returns whether the session is logged in to the APIC
+
+        :return: True or False. True if the session is logged in to the APIC.
+        """
+        return self.session.logged_in()
+
+    def refresh_login(self, timeout=None):
+        """
+        Refresh the login to the APIC
+
+        :param timeout: Integer containing the number of seconds for connection timeout
+        :returns: Awaitable returning an instance of requests.Response
+        """
+        return self.run(self.session.refresh_login, timeout=timeout)
+
+    def close(self):
+        """
+        Close the session and stop the worker threads
+        """
+        if self._pool is None or self.session.session is not None:
+            self.session.close()
+        if self._pool is not None:
+            self._pool.close()
+        self._executor.shutdown(wait=False)
+
+    def _send(self, loop, method, url, data=None, timeout=None):
+        """
+        Send a single request with the credentials of the Session
+        """
+        session = self.session
+        body = None
+        if method == 'POST':
+            # The certificate signature covers the payload so it is encoded deterministically
+            body = get_codec().dumps(data, sort_keys=session.cert_auth)
+        cookies = {}
+        if session.session is not None:
+            cookies.update((cookie.name, cookie.value) for cookie in session.session.cookies)
+        cookies.update(session._prep_x509_header(method, url, body))
+        headers = {}
+        if cookies:
+            headers['Cookie'] = '; '.join('%s=%s' % item for item in cookies.items())
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+            body = body.encode('utf-8')
+        if timeout is None:
+            timeout = session.timeout
+        if isinstance(timeout, tuple):
+            timeout = sum(timeout)
+        return self._pool.request(loop, method, self._path_prefix + url, headers, body, timeout)
+
+    def _request(self, loop, method, url, data=None, timeout=None):
+        """
+        Send a request once fewer than max_requests are in flight
+
+        :returns: Future returning an instance of requests.Response
+        """
+        result = loop.create_future()
+
+        def finish(done):
+            self._in_flight -= 1
+            _chain(done, result)
+            if self._waiting:
+                self._waiting.popleft()()
+
+        def start():
+            self._in_flight += 1
+            try:
+                future = self._send(loop, method, url, data, timeout)
+            except Exception as e:
+                future = loop.create_future()
+                future.set_exception(e)
+            future.add_done_callback(finish)
+
+        if self._in_flight < self.max_requests:
+            start()
+        else:
+            self._waiting.append(start)
+        return result
+
+    def _relogin(self, loop, generation, method, url, data=None, timeout=None):
+        """
+        Wait for the Session to log in again and send the request again
+        """
+        log.error('Trying to login again....')
+        relogin = self.run(self.session._relogin, generation)
+        return _then(loop, relogin, lambda resp: self._request(loop, method, url, data, timeout))
+
+    def get(self, url, timeout=None):
+        """
+        Perform a REST GET call to the APIC.  The responses are handled as\
+        by Session.get.
+
+        :param url: String containing the URL that will be used to\
+        send the object data to the APIC.
+        :returns: Awaitable returning an instance of requests.Response
+        """
+        if self._pool is None:
+            return self.run(self.session.get, url, timeout=timeout)
+        session = self.session
+        loop = self._get_loop()
+        generation = session._login_generation
+
+        def retry(retries):
+            def check(resp):
+                if resp.status_code == 200:
+                    return resp
+                if retries <= 1:
+                    log.error('Raising ConnectionError')
+                    raise ConnectionError
+                return retry(retries - 1)
+            return _then(loop, self._request(loop, 'GET', url, timeout=timeout), check)
+
+        def check(resp):
+            if resp.status_code == 403:
+                if session.cert_auth and not (session.appcenter_user and session._subscription_enabled):
+                    log.error('Certificate authentication failed. Please check all settings are correct.')
+                    resp.raise_for_status()
+                return self._relogin(loop, generation, 'GET', url, timeout=timeout)
+            if resp.status_code == 400 and TOO_BIG_ERROR in resp.text:
+                # The Session collects the response in pages
+                return self.run(session.get, url, timeout=timeout)
+            if 400 < resp.status_code < 600:
+                log.debug('Received error: %s %s', resp.status_code, resp.text)
+                return retry(3)
+            return resp
+        return _then(loop, self._request(loop, 'GET', url, timeout=timeout), check)
+
+    def push_to_apic(self, url, data, timeout=None):
+        """
+        Push the object data to the APIC
+
+        :param url: String containing the URL that will be used to\
+                    send the object data to the APIC.
+        :param data: Dictionary containing the JSON objects to be sent\
+                     to the APIC.
+        :returns: Awaitable returning an instance of requests.Response
+        """
+        if self._pool is None:
+            return self.run(self.session.push_to_apic, url, data, timeout=timeout)
+        session = self.session
+        loop = self._get_loop()
+        generation = session._login_generation
+
+        def check(resp):
+            if resp.status_code == 403:
+                if session.cert_auth and not (session.appcenter_user and session._subscription_enabled and
+                                              session._logged_in):
+                    log.error('Certificate authentication failed. Please check all settings are correct.')
+                    resp.raise_for_status()
+                elif not url.startswith('/api/aaaLogin'):
+                    log.error(resp.text)
+                    return self._relogin(loop, generation, 'POST', url, data, timeout)
+            return resp
+        return _then(loop, self._request(loop, 'POST', url, data, timeout), check)
+
+    def subscribe(self, url, only_new=False):
+        """
+        Subscribe to events for a particular URL.
+
+        :param url:  URL string to issue subscription
+        :param only_new: True to only receive events created after the subscription
+        :returns: Awaitable completing when the subscription is sent
+        """
+        return self.run(self.session.subscribe, url, only_new=only_new)
+
+    def unsubscribe(self, url):
+        """
+        Unsubscribe from events for a particular URL.
+
+        :param url:  URL string to remove issue subscription
+        :returns: Awaitable completing when the subscription is removed
+        """
+        return self.run(self.session.unsubscribe, url)
+
+    def has_events(self, url):
+        """
+        Check if there are events for a particular URL.
+
+        :param url:  URL string belonging to subscription
+        :returns: True or False. True if an event exists for this subscription.
+        """
+        return self.session.has_events(url)
+
+    def get_event(self, url, poll_interval=0.1):
+        """
+        Wait for the next event for a particular URL.
+
+        :param url:  URL string belonging to subscription
+        :param poll_interval: Float containing the number of seconds between\
+        checks for a new event
+        :returns: Awaitable returning the event
+        """
+        loop = self._get_loop()
+        future = loop.create_future()
+
+        def poll():
+            if future.done():
+                return
+            if self.session.has_events(url):
+                future.set_result(self.session.get_event(url))
+            else:
+                loop.call_later(poll_interval, poll)
+        poll()
+        return future
+
+    def get_objects(self, toolkit_class, *args, **kwargs):
+        """
+        Run the get classmethod of a toolkit class using this session
+        e.g. ``await session.get_objects(Interface, pod, node)``
+
+        :param toolkit_class: acitoolkit class such as Tenant or Node
+        :returns: Awaitable returning the same objects as toolkit_class.get
+        """
+        return self.run(toolkit_class.get, self.session, *args, **kwargs)
+
+    def get_deep(self, toolkit_class, *args, **kwargs):
+        """
+        Run the get_deep classmethod of a toolkit class using this session
+        e.g. ``await session.get_deep(Tenant, names=['tenant'])``
+
+        :param toolkit_class: acitoolkit class such as Tenant or PhysicalModel
+        :returns: Awaitable returning the same objects as toolkit_class.get_deep
+        """
+        return self.run(toolkit_class.get_deep, self.session, *args, **kwargs)
@@ -33,14 +33,53 @@ This module implements the Base Class for creating all of the ACI Objects.
 import logging
 from operator import attrgetter
 import sys
+import threading
 
 from .aciSearch import AciSearch, Searchable
 from .acisession import Session
 
+# Attributes that are not compared with the snapshot taken by mark_clean().
+# They do not change the JSON of the object or their changes are marked
+# explicitly.
+_UNTRACKED_ATTRIBUTES = frozenset(['_dirty', '_clean_attributes', '_parent', '_session', '_children',
+                                   '_relations', '_attachments', '_tags', '_lazy_loading',
+                                   '_children_loaded'])
+
+# Set while the JSON of only the changed objects is being generated
+_json_state = threading.local()
+
 
 log = logging.getLogger(__name__)
 
 
+def _copy_value(value):
+    """
+    Copy the containers of an attribute value so that changes made in
+    place are detected
+    """
+    if type(value) is list:
+        return [_copy_value(item) for item in value]
+    if type(value) is dict:
+        return dict((key, _copy_value(item)) for key, item in value.items())
+    return value
+
+
+def _same_value(old, new):
+    """
+    Compare an attribute value with the value copied by _copy_value()
+    """
+    if old is new:
+        return True
+    if type(old) is not type(new):
+        return False
+    if type(old) is list:
+        return len(old) == len(new) and all(_same_value(a, b) for a, b in zip(old, new))
+    if type(old) is dict:
+        return len(old) == len(new) and all(key in new and _same_value(item, new[key])
+                                            for key, item in old.items())
+    return old == new
+
+
 class BaseRelation(object):
     """
     Class for all basic relations.
@@ -99,11 +138,28 @@ class BaseRelation(object):
         return not self == other
 
 
+class _LazyLoading(object):
+    """
+    Settings shared by the objects of a tree whose children are fetched
+    from the APIC on demand
+    """
+    def __init__(self, session, include_concrete=False, prefetch=()):
+        self.session = session
+        self.include_concrete = include_concrete
+        self.prefetch = tuple(prefetch)
+
+
 class BaseACIObject(AciSearch):
     """
     This class defines functionality common to all ACI objects.
     Functions may be overwritten by inheriting classes.
     """
+    # Objects are changed until they are marked clean e.g. after being
+    # loaded from the APIC
+    _dirty = True
+    # Children are only fetched on demand once lazy loading is enabled
+    _lazy_loading = None
+    _children_loaded = True
 
     def __init__(self, name=None, parent=None):
         """
@@ -144,6 +200,90 @@ class BaseACIObject(AciSearch):
     def __lt__(self, other):
         return self.name < other.name
 
+    def mark_dirty(self):
+        """
+        Mark the object as changed so that it is included in the JSON\
+        returned by get_json(changed_only=True).  Changed attributes are\
+        detected when the JSON is generated.  Adding a relation or tag\
+        marks the object.
+        """
+        self._dirty = True
+
+    def mark_clean(self):
+        """
+        Mark the object and all of its descendants as unchanged e.g. after\
+        they have been loaded from or pushed to the APIC.  A snapshot of\
+        the attributes is kept to detect later changes.
+        """
+        self._dirty = False
+        self._clean_attributes = dict((key, _copy_value(value)) for key, value in self.__dict__.items()
+                                      if key not in _UNTRACKED_ATTRIBUTES)
+        for child in self._children:
+            child.mark_clean()
+
+    def _is_changed(self):
+        """
+        Check if the object itself has changed since it was marked clean
+        """
+        if self._dirty:
+            return True
+        clean_attributes = self._clean_attributes
+        num_attributes = 0
+        for key, value in self.__dict__.items():
+            if key in _UNTRACKED_ATTRIBUTES:
+                continue
+            num_attributes += 1
+            if key not in clean_attributes or not _same_value(clean_attributes[key], value):
+                return True
+        return num_attributes != len(clean_attributes)
+
+    def _collect_changes(self, changed, changed_subtrees):
+        """
+        Collect the objects that have changed below and including this object
+
+        :param changed: Set of the ids of the changed objects
+        :param changed_subtrees: Set of the ids of the objects with a\
+                                 changed descendant or themselves changed
+        :returns: True if this object or one of its descendants has changed
+        """
+        has_changes = False
+        for child in self._children:
+            if child._collect_changes(changed, changed_subtrees):
+                has_changes = True
+        if self._is_changed():
+            changed.add(id(self))
+            has_changes = True
+        if has_changes:
+            changed_subtrees.add(id(self))
+        return has_changes
+
+    def has_changes(self):
+        """
+        Check if the object or any of its descendants has changed since it\
+        was marked clean.
+
+        :returns: True or False.  True if get_json(changed_only=True) has\
+                  something to push.
+        """
+        return self._is_changed() or any(child.has_changes() for child in self._children)
+
+    def _get_changed_json(self):
+        """
+        Get the JSON of only the changed objects below and including this\
+        object, along with their ancestors.
+
+        :returns: JSON dictionary or None if nothing has changed
+        """
+        changed = set()
+        changed_subtrees = set()
+        if not self._collect_changes(changed, changed_subtrees):
+            return None
+        _json_state.changes = (changed, changed_subtrees)
+        try:
+            return self.get_json()
+        finally:
+            _json_state.changes = None
+
     @classmethod
     def _get_subscription_urls(cls, extension=''):
         """
@@ -342,6 +482,7 @@ class BaseACIObject(AciSearch):
         if not isinstance(tag, _Tag):
             tag = _Tag(tag)
         self.get_tags().append(tag)
+        self.mark_dirty()
 
     def remove_tag(self, tag):
         """
@@ -367,6 +508,7 @@ class BaseACIObject(AciSearch):
         for existing_tag in self.get_tags():
             if existing_tag == tag:
                 existing_tag.mark_as_deleted()
+                self.mark_dirty()
 
     @classmethod
     def _get_parent_from_dn(cls, dn):
@@ -616,6 +758,7 @@ class BaseACIObject(AciSearch):
                 item._attachments.remove(relation)
         self._relations.append(BaseRelation(item, 'attached'))
         item._attachments.append(BaseRelation(self, 'attached'))
+        self.mark_dirty()
 
     def _check_relation(self, item, status):
         """
@@ -657,6 +800,7 @@ class BaseACIObject(AciSearch):
         if not self.is_detached(item):
             self._relations.append(BaseRelation(item, 'detached'))
             item._attachments.append(BaseRelation(self, 'detached'))
+            self.mark_dirty()
 
     def _check_attachment(self, item, status):
         """
@@ -705,6 +849,8 @@ class BaseACIObject(AciSearch):
                            class passed in this parameter.
         :returns: List of children objects.
         """
+        if not self._children_loaded:
+            self._load_children()
         if only_class is not None:
             resp = []
             for child in self._children:
@@ -763,6 +909,66 @@ class BaseACIObject(AciSearch):
 
         return self._children
 
+    def enable_lazy_loading(self, session=None, include_concrete=False, prefetch=()):
+        """
+        Fetch the children of this object from the APIC the first time\
+        get_children() is called instead of populating the whole tree up\
+        front.  The fetched children are loaded on demand in the same way.
+
+        :param session: the instance of Session used for APIC communication.\
+                        Defaults to the session of this object.
+        :param include_concrete: True to also fetch the concrete objects of\
+                                 the switches.  Default is False.
+        :param prefetch: List of acitoolkit classes whose children are\
+                         fetched as soon as their instances are fetched\
+                         e.g. [Pod, Node]
+        """
+        if session is None:
+            session = self._session
+        self._lazy_loading = _LazyLoading(session, include_concrete, prefetch)
+        self._children_loaded = False
+
+    def _set_lazy_loading(self, lazy_loading):
+        """
+        Load the children of this object and of its descendants on demand
+        """
+        if self._lazy_loading is not None:
+            return
+        self._lazy_loading = lazy_loading
+        if self._children:
+            # Already fetched along with the parent
+            for child in self._children:
+                child._set_lazy_loading(lazy_loading)
+            return
+        self._children_loaded = False
+        if isinstance(self, lazy_loading.prefetch):
+            self._load_children()
+
+    def _load_children(self):
+        """
+        Fetch the children of this object if they have not been fetched yet
+        """
+        if self._children_loaded:
+            return
+        self._children_loaded = True
+        lazy_loading = self._lazy_loading
+        if self._session is None:
+            self._session = lazy_loading.session
+        log.debug('Loading children of %s %s', self.__class__.__name__, self.name)
+        self._fetch_children(lazy_loading.session, lazy_loading.include_concrete)
+        for child in self._children:
+            child._set_lazy_loading(lazy_loading)
+
+    def _fetch_children(self, session, include_concrete=False):
+        """
+        Fetch one level of children from the APIC.  Overridden by the\
+        classes whose children are not fetched by populate_children.
+
+        :param session: the instance of Session used for APIC communication
+        :param include_concrete: True to also fetch the concrete objects
+        """
+        self.populate_children(deep=False, include_concrete=include_concrete)
+
     def update_db(self, session, subscribed_classes, deep=False):
         """
         update_db
@@ -835,6 +1041,7 @@ class BaseACIObject(AciSearch):
         relation = BaseRelation(obj, 'attached', relation_type)
         self._relations.append(relation)
         obj._attachments.append(BaseRelation(self, 'attached', relation_type))
+        self.mark_dirty()
 
     def _remove_attachment(self, obj, relation_type=None):
         """
@@ -855,6 +1062,7 @@ class BaseACIObject(AciSearch):
             if relation == removal:
                 relation.set_as_detached()
                 obj._remove_attachment(relation.item, relation_type)
+                self.mark_dirty()
         return True
 
     def _remove_all_relation(self, obj_class, relation_type=None):
@@ -866,6 +1074,7 @@ class BaseACIObject(AciSearch):
             if same_obj_class and same_relation_type and attached:
                 relation.set_as_detached()
                 relation.item._remove_attachment(self, relation_type)
+                self.mark_dirty()
 
     def _get_any_relation(self, obj_class, relation_type=None):
         """Return a single relation belonging to a particular class.
@@ -1017,16 +1226,21 @@ class BaseACIObject(AciSearch):
             children = []
         if attributes is None:
             attributes = {}
+        changes = getattr(_json_state, 'changes', None)
         children_json = []
         for child in children:
             children_json.append(child)
         for tag in self._tags:
+            if changes is not None and id(self) not in changes[0]:
+                break
             child = {'tagInst': {'attributes': {'name': tag.name}}}
             if tag.is_deleted():
                 child['tagInst']['attributes']['status'] = 'deleted'
             children_json.append(child)
         if get_children:
             for child in self._children:
+                if changes is not None and id(child) not in changes[1]:
+                    continue
                 data = child.get_json()
                 if data is not None:
                     if isinstance(data, list):
@@ -1134,6 +1348,7 @@ class BaseACIObject(AciSearch):
             obj = toolkit_class(name, parent)
             attribute_data = object_data[apic_class]['attributes']
             obj._populate_from_attributes(attribute_data)
+            obj.mark_clean()
             resp.append(obj)
         return resp
 
@@ -1470,6 +1685,8 @@ class BaseACIPhysObject(BaseACIObject):
 
         :returns: list of children
         """
+        if not self._children_loaded:
+            self._load_children()
         if child_type:
             children = []
             for child in self._children:
@@ -29,7 +29,41 @@
 ################################################################################
 """ACI Toolkit module for counter and stats objects
 """
+import calendar
+import datetime
+import json
+import math
+import mmap
+import os
 import re
+import struct
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _get_pages(session, url, page_size):
+    """
+    Generator that performs a class query one page at a time
+
+    :param session: Session to use when accessing the APIC
+    :param url: String containing the class query URL
+    :param page_size: Number of objects to retrieve in each query
+    :returns: the imdata list of each page
+    """
+    page = 0
+    while True:
+        ret = session.get(url + '&page=%s&page-size=%s' % (page, page_size))
+        if not ret.ok:
+            raise ValueError('Could not query %s: %s' % (url, ret.text))
+        resp = ret.json()
+        yield resp['imdata']
+        page += 1
+        if not resp['imdata'] or page * page_size >= int(resp.get('totalCount', 0)):
+            break
 
 
 class AtomicCountersOnGoing(object):
@@ -72,13 +106,14 @@ class AtomicCountersOnGoing(object):
         self._parent = parent
         self._nodeDn = nodeDn
 
-    def get(self, session=None):
+    def get(self, session=None, page_size=1000):
         """
         Retrieve the count dictionary.  This method will read in all the
         counters and return them as a dictionary.
 
         :param session: Session to use when accessing the APIC.  If not\
                         specified, it will use the session of the parent.
+        :param page_size: Number of paths to retrieve in each query
 
         :returns:  Dictionary of counters.
                    Format is:
@@ -89,79 +124,75 @@ class AtomicCountersOnGoing(object):
             session = self._parent._session
         self._session = session
 
+        # Get the stats of all of the paths with the paths themselves
+        # rather than querying each path separately
         query_url = ('/api/node/class/fabricPath.json?'
-                     'query-target=self')
-        ret = self._session.get(query_url)
-        data = ret.json()['imdata']
-        if data:
+                     'query-target=self&rsp-subtree-include=stats')
+        for data in _get_pages(self._session, query_url, page_size):
             for path in data:
+                if 'fabricPath' not in path:
+                    continue
                 path_key = (str(path['fabricPath']['attributes']['n1']),
                             str(path['fabricPath']['attributes']['n2']))
-                result[path_key] = self._get_path(path['fabricPath']['attributes']['dn'])
+                result[path_key] = self._process_data(path)
         return result
 
-    def _get_path(self, dn):
+    @staticmethod
+    def _process_data(data):
         """
-        Will get the path counters
+        Process the data
+        :param data: JSON dictionary of a fabricPath containing the stats children
+        :return: Dictonary containing processed data
         """
         result = {}
-
-        prefix = '/api/mo/'
-        suffix = '.json?query-target=self&rsp-subtree-include=stats'
-        mo_query_url = prefix + dn + suffix
-
-        ret = self._session.get(mo_query_url)
-        data = ret.json()['imdata']
-
-        if data:
-            if 'children' in data[0]['fabricPath']:
-                children = data[0]['fabricPath']['children']
-                for grandchildren in children:
-                    for count in grandchildren:
-                        counterAttr = grandchildren[count]['attributes']
-                        if counterAttr['rn'].startswith('C'):
-                            period = 0
-                        else:
-                            period = int(counterAttr['index']) + 1
-
-                        if 'TxRx' in count:
-                            countName = 'txrx'
-                        elif 'DropExcess' in count:
-                            countName = 'dropexcess'
-                        else:
-                            countName = count
-
-                        granularity = re.search(r'(\d+\D+)$', count).group(1)
-
-                        if countName not in result:
-                            result[countName] = {}
-                        if granularity not in result[countName]:
-                            result[countName][granularity] = {}
-                        if period not in result[countName][granularity]:
-                            result[countName][granularity][period] = {}
-
-                        if countName in ['txrx']:
-                            for attrName in ['rxPktAvg', 'rxPktCum', 'rxPktMax', 'rxPktMin', 'rxPktPer',
-                                             'txPktAvg', 'txPktCum', 'txPktMax', 'txPktMin', 'txPktPer']:
-                                result[countName][granularity][period][attrName] = int(counterAttr[attrName])
-
-                            for attrName in ['rxPktRate', 'txPktRate']:
-                                result[countName][granularity][period][attrName] = float(counterAttr[attrName])
-
-                        elif countName in ['dropexcess']:
-                            for attrName in ['dropPktAvg', 'dropPktCum', 'dropPktMax', 'dropPktMin', 'dropPktPer',
-                                             'excessPktAvg', 'excessPktCum', 'excessPktMax', 'excessPktMin',
-                                             'excessPktPer']:
-                                result[countName][granularity][period][attrName] = int(counterAttr[attrName])
-                            for attrName in ['dropPktRate', 'excessPktRate']:
-                                result[countName][granularity][period][attrName] = float(counterAttr[attrName])
-
-                        else:
-                            print('Found unsupported counter ' + str(countName) + " " +
-                                  str(granularity) + " " + str(period))
-
-                        result[countName][granularity][period]['intervalEnd'] = counterAttr.get('repIntvEnd')
-                        result[countName][granularity][period]['intervalStart'] = counterAttr.get('repIntvStart')
+        if 'children' in data['fabricPath']:
+            children = data['fabricPath']['children']
+            for grandchildren in children:
+                for count in grandchildren:
+                    counterAttr = grandchildren[count]['attributes']
+                    if counterAttr['rn'].startswith('C'):
+                        period = 0
+                    else:
+                        period = int(counterAttr['index']) + 1
+
+                    if 'TxRx' in count:
+                        countName = 'txrx'
+                    elif 'DropExcess' in count:
+                        countName = 'dropexcess'
+                    else:
+                        countName = count
+
+                    granularity = re.search(r'(\d+\D+)$', count).group(1)
+
+                    if countName not in result:
+                        result[countName] = {}
+                    if granularity not in result[countName]:
+                        result[countName][granularity] = {}
+                    if period not in result[countName][granularity]:
+                        result[countName][granularity][period] = {}
+
+                    if countName in ['txrx']:
+                        for attrName in ['rxPktAvg', 'rxPktCum', 'rxPktMax', 'rxPktMin', 'rxPktPer',
+                                         'txPktAvg', 'txPktCum', 'txPktMax', 'txPktMin', 'txPktPer']:
+                            result[countName][granularity][period][attrName] = int(counterAttr[attrName])
+
+                        for attrName in ['rxPktRate', 'txPktRate']:
+                            result[countName][granularity][period][attrName] = float(counterAttr[attrName])
+
+                    elif countName in ['dropexcess']:
+                        for attrName in ['dropPktAvg', 'dropPktCum', 'dropPktMax', 'dropPktMin', 'dropPktPer',
+                                         'excessPktAvg', 'excessPktCum', 'excessPktMax', 'excessPktMin',
+                                         'excessPktPer']:
+                            result[countName][granularity][period][attrName] = int(counterAttr[attrName])
+                        for attrName in ['dropPktRate', 'excessPktRate']:
+                            result[countName][granularity][period][attrName] = float(counterAttr[attrName])
+
+                    else:
+                        print('Found unsupported counter ' + str(countName) + " " +
+                              str(granularity) + " " + str(period))
+
+                    result[countName][granularity][period]['intervalEnd'] = counterAttr.get('repIntvEnd')
+                    result[countName][granularity][period]['intervalStart'] = counterAttr.get('repIntvStart')
 
         return result
 
@@ -275,6 +306,154 @@ class AtomicNode(object):
         self.remote_port_id = None
 
 
+class AtomicCountersCollector(object):
+    """
+    This class collects the on-going atomic counters of every path in the
+    fabric with a single paged class query.  The counters of the selected
+    granularity and period are stored as NumPy matrices indexed by the
+    (node1, node2) node ids of the path so that the paths of the whole
+    fabric can be compared at once.
+    """
+    def __init__(self, session, granularity='15min', period=0, page_size=1000):
+        """
+        :param session: Session to use when accessing the APIC
+        :param granularity: The counter granularity such as '15min'
+        :param period: Integer of time period to get the counters from.\
+                       Period 0 is the current period.
+        :param page_size: Number of paths to retrieve in each query
+        """
+        if numpy is None:
+            raise ImportError('AtomicCountersCollector requires the numpy package')
+        self._session = session
+        self._granularity = granularity
+        self._period = period
+        self._page_size = page_size
+        self.nodes = []
+        self._node_index = {}
+        self._matrices = {}
+
+    def collect(self):
+        """
+        Collect the atomic counters of all of the paths from the APIC
+
+        :returns: Number of paths collected
+        """
+        self.nodes = []
+        self._node_index = {}
+        self._matrices = {}
+        paths = []
+        query_url = '/api/node/class/fabricPath.json?query-target=self&rsp-subtree-include=stats'
+        for data in _get_pages(self._session, query_url, self._page_size):
+            for path in data:
+                if 'fabricPath' not in path:
+                    continue
+                attributes = path['fabricPath']['attributes']
+                counters = AtomicCountersOnGoing._process_data(path)
+                paths.append((str(attributes['n1']), str(attributes['n2']), counters))
+        self.process(paths)
+        return len(paths)
+
+    def process(self, paths):
+        """
+        Build the counter matrices
+
+        :param paths: List of (node1, node2, counters) tuples where counters is\
+                      the dictionary returned by AtomicCountersOnGoing
+        """
+        for node1, node2, counters in paths:
+            for node_id in (node1, node2):
+                if node_id not in self._node_index:
+                    self._node_index[node_id] = len(self.nodes)
+                    self.nodes.append(node_id)
+        size = len(self.nodes)
+        for node1, node2, counters in paths:
+            row = self._node_index[node1]
+            column = self._node_index[node2]
+            for family in counters:
+                values = counters[family].get(self._granularity, {}).get(self._period, {})
+                for name, value in values.items():
+                    if not isinstance(value, (int, float)):
+                        continue
+                    if name not in self._matrices:
+                        self._matrices[name] = numpy.full((size, size), numpy.nan)
+                    self._matrices[name][row, column] = value
+
+    def get_counter_names(self):
+        """
+        :returns: List of the counter names collected
+        """
+        return sorted(self._matrices.keys())
+
+    def get_matrix(self, counter):
+        """
+        Get a counter for all of the paths
+
+        :param counter: Name of the counter such as 'dropPktPer'
+        :returns: NumPy array indexed by the positions of node1 and node2 in\
+                  the nodes list.  Paths without the counter are NaN.
+        """
+        if counter not in self._matrices:
+            size = len(self.nodes)
+            return numpy.full((size, size), numpy.nan)
+        return self._matrices[counter]
+
+    def retrieve(self, node1, node2, counter):
+        """
+        Get the counter of a single path
+
+        :param node1: The node id of the first node in the path
+        :param node2: The node id of the second node in the path
+        :param counter: Name of the counter such as 'dropPktPer'
+        :returns: float or None if the counter is not present
+        """
+        if node1 not in self._node_index or node2 not in self._node_index:
+            return None
+        value = self.get_matrix(counter)[self._node_index[node1], self._node_index[node2]]
+        if numpy.isnan(value):
+            return None
+        return float(value)
+
+    def get_loss_ratio(self):
+        """
+        Get the ratio of dropped packets to transmitted packets of all of
+        the paths.  Paths that did not transmit any packets are NaN.
+
+        :returns: NumPy array indexed like get_matrix()
+        """
+        dropped = self.get_matrix('dropPktPer')
+        transmitted = self.get_matrix('txPktPer')
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ratio = dropped / transmitted
+        ratio[~(transmitted > 0)] = numpy.nan
+        return ratio
+
+    def get_top_lossy_paths(self, num=10, counter=None):
+        """
+        Get the paths with the most loss.  Paths without any loss are not
+        returned.
+
+        :param num: Number of paths to return
+        :param counter: Optional counter name to rank the paths by such as\
+                        'dropPktPer'.  The paths are ranked by loss ratio\
+                        if it is not specified.
+        :returns: List of ((node1, node2), value) tuples sorted from the\
+                  highest value
+        """
+        if counter is None:
+            matrix = self.get_loss_ratio()
+        else:
+            matrix = self.get_matrix(counter)
+        values = numpy.where(numpy.isnan(matrix), -numpy.inf, matrix).ravel()
+        num = min(num, numpy.count_nonzero(values > 0))
+        if num <= 0:
+            return []
+        indexes = numpy.argpartition(-values, num - 1)[:num]
+        indexes = indexes[numpy.argsort(-values[indexes], kind='mergesort')]
+        size = len(self.nodes)
+        return [((self.nodes[index // size], self.nodes[index % size]), float(values[index]))
+                for index in indexes]
+
+
 class InterfaceStats(object):
     """
     This class defines interface statistics.  It will provide methods to
@@ -396,6 +575,39 @@ class InterfaceStats(object):
         self.result = result
         return result
 
+    @staticmethod
+    def _get_count_name(count):
+        """
+        Map the APIC stats class name to the counter family name
+        :param count: stats class name such as 'eqptIngrBytes5min'
+        :return: counter family name such as 'ingrBytes'
+        """
+        if 'EgrTotal' in count:
+            countName = 'egrTotal'
+        elif 'EgrBytes' in count:
+            countName = 'egrBytes'
+        elif 'EgrPkts' in count:
+            countName = 'egrPkts'
+        elif 'EgrDropPkts' in count:
+            countName = 'egrDropPkts'
+        elif 'IngrBytes' in count:
+            countName = 'ingrBytes'
+        elif 'IngrPkts' in count:
+            countName = 'ingrPkts'
+        elif 'IngrTotal' in count:
+            countName = 'ingrTotal'
+        elif 'IngrDropPkts' in count:
+            countName = 'ingrDropPkts'
+        elif 'IngrUnkBytes' in count:
+            countName = 'ingrUnkBytes'
+        elif 'IngrUnkPkts' in count:
+            countName = 'ingrUnkPkts'
+        elif 'IngrStorm' in count:
+            countName = 'ingrStorm'
+        else:
+            countName = count
+        return countName
+
     @staticmethod
     def _process_data(data):
         """
@@ -415,30 +627,7 @@ class InterfaceStats(object):
                         else:
                             period = int(counterAttr['index']) + 1
 
-                        if 'EgrTotal' in count:
-                            countName = 'egrTotal'
-                        elif 'EgrBytes' in count:
-                            countName = 'egrBytes'
-                        elif 'EgrPkts' in count:
-                            countName = 'egrPkts'
-                        elif 'EgrDropPkts' in count:
-                            countName = 'egrDropPkts'
-                        elif 'IngrBytes' in count:
-                            countName = 'ingrBytes'
-                        elif 'IngrPkts' in count:
-                            countName = 'ingrPkts'
-                        elif 'IngrTotal' in count:
-                            countName = 'ingrTotal'
-                        elif 'IngrDropPkts' in count:
-                            countName = 'ingrDropPkts'
-                        elif 'IngrUnkBytes' in count:
-                            countName = 'ingrUnkBytes'
-                        elif 'IngrUnkPkts' in count:
-                            countName = 'ingrUnkPkts'
-                        elif 'IngrStorm' in count:
-                            countName = 'ingrStorm'
-                        else:
-                            countName = count
+                        countName = InterfaceStats._get_count_name(count)
 
                         granularity = re.search(r'(\d+\D+)$', count).group(1)
 
@@ -576,3 +765,620 @@ class InterfaceStats(object):
                         result = self.result[countFamily][granularity][period][countName]
 
         return result
+
+
+class InterfaceStatsCollector(object):
+    """
+    This class collects the interface stats for all of the ports in the
+    fabric in bulk.  The l1PhysIf stats are read from the APIC one page at
+    a time and the counter values are stored in columnar NumPy arrays
+    rather than the nested dictionaries built by InterfaceStats.
+
+    There is one table per counter family.  Each row of a table is
+    identified by the (port_id, granularity, period) of the stats object
+    and each column holds one counter such as 'bytesCum' or 'pktsRate'.
+    Counters that were not reported are stored as NaN.
+
+    The values of the previous collection are kept so that deltas and rates
+    can be computed for all of the ports at once.
+    """
+    NON_COUNTER_ATTRIBUTES = ('childAction', 'clearTs', 'cnt', 'dn', 'index',
+                              'lastCollOffset', 'modTs', 'repIntvEnd',
+                              'repIntvStart', 'rn', 'status')
+
+    def __init__(self, session, period=None, granularities=None, page_size=1000):
+        """
+        :param session: Session to use when accessing the APIC
+        :param period: Epoch or period to retrieve - all are retrieved if this is not specified
+        :param granularities: Optional list of granularities such as ['5min', '1h'] to keep.\
+                              All of the granularities are kept if this is not specified.
+        :param page_size: Number of interfaces to retrieve in each query
+        """
+        if numpy is None:
+            raise ImportError('InterfaceStatsCollector requires the numpy package')
+        if period is not None and period < 1:
+            raise ValueError('Counter epoch/period value of 0 not yet implemented')
+        self._session = session
+        self._period = period
+        self._granularities = granularities
+        self._page_size = page_size
+        self._port_ids = {}
+        self._tables = {}
+        self.timestamp = None
+        self.previous_timestamp = None
+
+    def _get_url(self):
+        """
+        Get the class query URL for the l1PhysIf stats
+        """
+        mo_query_url = '/api/class/l1PhysIf.json?&rsp-subtree-include=stats&rsp-subtree-class=statsHist'
+        if self._period:
+            mo_query_url += '&rsp-subtree-filter=eq(statsHist.index,"' + str(self._period - 1) + '")'
+        return mo_query_url
+
+    def collect(self):
+        """
+        Collect the stats of all of the interfaces from the APIC.  The
+        interfaces are retrieved and stored one page at a time so that the
+        whole response is never held in memory.
+
+        :returns: Number of interfaces with stats that were collected
+        """
+        for table in self._tables.values():
+            table.rotate()
+        self.previous_timestamp = self.timestamp
+        self.timestamp = time.time()
+        num_ports = 0
+        for data in _get_pages(self._session, self._get_url(), self._page_size):
+            num_ports += self.process(data)
+        return num_ports
+
+    def process(self, data):
+        """
+        Store the stats of a list of l1PhysIf objects
+
+        :param data: List of l1PhysIf JSON dictionaries with their stats children
+        :returns: Number of interfaces with stats that were processed
+        """
+        num_ports = 0
+        for interface in data:
+            if 'children' not in interface.get('l1PhysIf', {}):
+                continue
+            num_ports += 1
+            dn = interface['l1PhysIf']['attributes']['dn']
+            port_id = self._port_ids.get(dn)
+            if port_id is None:
+                port_id = InterfaceStats._parseDn2PortId(dn)
+                self._port_ids[dn] = port_id
+            for child in interface['l1PhysIf']['children']:
+                for count in child:
+                    counter_attr = child[count]['attributes']
+                    granularity = re.search(r'(\d+\D+)$', count).group(1)
+                    if self._granularities and granularity not in self._granularities:
+                        continue
+                    if counter_attr['rn'].startswith('C'):
+                        period = 0
+                    else:
+                        period = int(counter_attr['index']) + 1
+                    family = InterfaceStats._get_count_name(count)
+                    table = self._tables.get(family)
+                    if table is None:
+                        table = _CounterTable()
+                        self._tables[family] = table
+                    table.set_row((port_id, granularity, period), counter_attr,
+                                  self.NON_COUNTER_ATTRIBUTES)
+        return num_ports
+
+    def get_families(self):
+        """
+        :returns: List of the counter families that have been collected
+        """
+        return sorted(self._tables.keys())
+
+    def get_counter_names(self, family):
+        """
+        :param family: The counter family string such as 'ingrTotal'
+        :returns: List of the counter names collected for the counter family
+        """
+        if family not in self._tables:
+            return []
+        return list(self._tables[family].columns)
+
+    def retrieve(self, port_id, family, granularity, period, counter):
+        """
+        Get a single counter value
+
+        :param port_id: Port identifier such as '1/101/1/12'
+        :param family: The counter family string such as 'ingrTotal'
+        :param granularity: The counter granularity such as '5min'
+        :param period: Integer of time period to get the counter from
+        :param counter: Name of the counter such as 'bytesCum'
+        :returns: float or None if the counter has not been collected
+        """
+        table = self._tables.get(family)
+        if table is None:
+            return None
+        row = table.rows.get((port_id, granularity, period))
+        column = table.columns.get(counter)
+        if row is None or column is None:
+            return None
+        value = table.values[row, column]
+        if numpy.isnan(value):
+            return None
+        return float(value)
+
+    def get_values(self, family, granularity, counter, period=1):
+        """
+        Get a counter for all of the ports
+
+        :param family: The counter family string such as 'ingrTotal'
+        :param granularity: The counter granularity such as '5min'
+        :param counter: Name of the counter such as 'bytesCum'
+        :param period: Integer of time period to get the counter from
+        :returns: tuple of the list of port ids and the NumPy array of values
+        """
+        port_ids, rows, column, table = self._select(family, granularity, counter, period)
+        if column is None:
+            return port_ids, numpy.zeros(0)
+        return port_ids, table.values[rows, column]
+
+    def get_deltas(self, family, granularity, counter, period=1):
+        """
+        Get the change of a counter for all of the ports since the previous
+        collection.  Ports that were not present in the previous collection
+        have a NaN delta.
+
+        :param family: The counter family string such as 'ingrTotal'
+        :param granularity: The counter granularity such as '5min'
+        :param counter: Name of the counter such as 'bytesCum'
+        :param period: Integer of time period to get the counter from
+        :returns: tuple of the list of port ids and the NumPy array of deltas
+        """
+        port_ids, rows, column, table = self._select(family, granularity, counter, period)
+        if column is None:
+            return port_ids, numpy.zeros(0)
+        return port_ids, table.values[rows, column] - table.get_previous(rows, column)
+
+    def get_rates(self, family, granularity, counter, period=1):
+        """
+        Get the per second rate of change of a counter for all of the ports
+        since the previous collection.
+
+        :param family: The counter family string such as 'ingrTotal'
+        :param granularity: The counter granularity such as '5min'
+        :param counter: Name of the counter such as 'bytesCum'
+        :param period: Integer of time period to get the counter from
+        :returns: tuple of the list of port ids and the NumPy array of rates
+        """
+        port_ids, deltas = self.get_deltas(family, granularity, counter, period)
+        if self.previous_timestamp is None or self.timestamp == self.previous_timestamp:
+            return port_ids, numpy.full(len(port_ids), numpy.nan)
+        return port_ids, deltas / (self.timestamp - self.previous_timestamp)
+
+    def get_top(self, family, granularity, counter, period=1, num=10, mode='value'):
+        """
+        Get the ports with the highest values of a counter
+
+        :param family: The counter family string such as 'ingrTotal'
+        :param granularity: The counter granularity such as '5min'
+        :param counter: Name of the counter such as 'bytesCum'
+        :param period: Integer of time period to get the counter from
+        :param num: Number of ports to return
+        :param mode: One of 'value', 'delta' or 'rate'
+        :returns: List of (port_id, value) tuples sorted from the highest value
+        """
+        if mode == 'value':
+            port_ids, values = self.get_values(family, granularity, counter, period)
+        elif mode == 'delta':
+            port_ids, values = self.get_deltas(family, granularity, counter, period)
+        elif mode == 'rate':
+            port_ids, values = self.get_rates(family, granularity, counter, period)
+        else:
+            raise ValueError('Unknown mode %s' % mode)
+        values = numpy.where(numpy.isnan(values), -numpy.inf, values)
+        if num < len(values):
+            indexes = numpy.argpartition(-values, num)[:num]
+        else:
+            indexes = numpy.arange(len(values))
+        indexes = indexes[numpy.argsort(-values[indexes], kind='mergesort')]
+        return [(port_ids[index], float(values[index])) for index in indexes
+                if values[index] != -numpy.inf]
+
+    def _select(self, family, granularity, counter, period):
+        """
+        Find the rows and column of a counter for all of the ports
+        """
+        table = self._tables.get(family)
+        if table is None or counter not in table.columns:
+            return [], numpy.zeros(0, dtype=int), None, table
+        port_ids = []
+        rows = []
+        for key, row in table.rows.items():
+            if key[1] == granularity and key[2] == period:
+                port_ids.append(key[0])
+                rows.append(row)
+        return port_ids, numpy.array(rows, dtype=int), table.columns[counter], table
+
+
+class _CounterTable(object):
+    """
+    Columnar storage of the counters of a single counter family
+    """
+    def __init__(self):
+        self.rows = {}
+        self.columns = {}
+        self._values = numpy.full((64, 8), numpy.nan)
+        self._previous = numpy.full((0, 0), numpy.nan)
+
+    @property
+    def values(self):
+        return self._values[:len(self.rows), :len(self.columns)]
+
+    def rotate(self):
+        """
+        Keep a copy of the current values as the previous collection and
+        clear the current values
+        """
+        self._previous = self.values.copy()
+        self._values.fill(numpy.nan)
+
+    def get_previous(self, rows, column):
+        """
+        Get the previous values of a column for a set of rows.  Rows and
+        columns that were added since the previous collection are NaN.
+        """
+        result = numpy.full(len(rows), numpy.nan)
+        if column >= self._previous.shape[1]:
+            return result
+        present = rows < self._previous.shape[0]
+        result[present] = self._previous[rows[present], column]
+        return result
+
+    def _grow(self, num_rows, num_columns):
+        shape = self._values.shape
+        if num_rows <= shape[0] and num_columns <= shape[1]:
+            return
+        new_shape = (max(shape[0] * 2, num_rows) if num_rows > shape[0] else shape[0],
+                     max(shape[1] * 2, num_columns) if num_columns > shape[1] else shape[1])
+        values = numpy.full(new_shape, numpy.nan)
+        values[:shape[0], :shape[1]] = self._values
+        self._values = values
+
+    def set_row(self, key, attributes, ignored):
+        """
+        Store the counter attributes of a stats object
+        """
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.rows)
+            self._grow(row + 1, len(self.columns))
+            self.rows[key] = row
+        for name in attributes:
+            if name in ignored:
+                continue
+            try:
+                value = float(attributes[name])
+            except (TypeError, ValueError):
+                continue
+            column = self.columns.get(name)
+            if column is None:
+                column = len(self.columns)
+                self._grow(len(self.rows), column + 1)
+                self.columns[name] = column
+            self._values[row, column] = value
+
+
+def _parse_timestamp(timestamp):
+    """
+    Convert an APIC timestamp such as '2016-01-01T00:05:00.000+00:00' to
+    seconds since the epoch
+    """
+    date_time, offset = timestamp[:19], timestamp[19:]
+    seconds = calendar.timegm(datetime.datetime.strptime(date_time, '%Y-%m-%dT%H:%M:%S').timetuple())
+    if offset.startswith('.'):
+        fraction = re.match(r'\.(\d+)', offset).group(1)
+        seconds += float('0.' + fraction)
+        offset = offset[len(fraction) + 1:]
+    if offset and offset != 'Z':
+        sign = -1 if offset[0] == '-' else 1
+        hours, minutes = offset[1:].split(':')
+        seconds -= sign * (int(hours) * 3600 + int(minutes) * 60)
+    return seconds
+
+
+class InterfaceStatsStore(object):
+    """
+    This class stores the historical interface stats on disk.  There is a
+    data file for each counter family and granularity made of fixed size
+    binary records that are only ever appended to.  Each record holds the
+    port index, the interval start and end times and the counter values in
+    the order listed in the accompanying metadata file.  The data files can
+    be memory mapped to read them back.
+
+    The high-water mark, i.e. the most recent interval end time, of each
+    port is rebuilt from the data files when the store is opened so that a
+    poller using the store can be restarted without gaps or duplicates.
+    """
+    HEADER_FORMAT = '<Idd'
+    FORMAT_VERSION = 1
+
+    def __init__(self, path):
+        """
+        :param path: Directory where the stats are stored.  It is created\
+                     if it does not exist.
+        """
+        self._path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._ports = []
+        self._port_index = {}
+        self._counters = {}
+        self._high_water_marks = {}
+        self._pending = {}
+        self._load()
+
+    def _get_filename(self, family, granularity, extension):
+        return os.path.join(self._path, '%s-%s.%s' % (family, granularity, extension))
+
+    def _get_record_format(self, family, granularity):
+        return self.HEADER_FORMAT + 'd' * len(self._counters[(family, granularity)])
+
+    def _load(self):
+        """
+        Load the port index, the counter names and the high-water marks
+        """
+        ports_filename = os.path.join(self._path, 'ports.txt')
+        if os.path.exists(ports_filename):
+            with open(ports_filename) as ports_file:
+                for port_id in ports_file.read().splitlines():
+                    self._port_index[port_id] = len(self._ports)
+                    self._ports.append(port_id)
+        for filename in sorted(os.listdir(self._path)):
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(self._path, filename)) as meta_file:
+                meta = json.load(meta_file)
+            if meta.get('version') != self.FORMAT_VERSION:
+                raise ValueError('Unsupported stats store format in %s' % filename)
+            key = (meta['family'], meta['granularity'])
+            self._counters[key] = meta['counters']
+            record_size = struct.calcsize(self._get_record_format(*key))
+            data_filename = self._get_filename(meta['family'], meta['granularity'], 'dat')
+            if not os.path.exists(data_filename):
+                continue
+            # Drop a partially written record left behind by an interrupted write
+            size = os.path.getsize(data_filename)
+            if size % record_size:
+                with open(data_filename, 'r+b') as data_file:
+                    data_file.truncate(size - size % record_size)
+            for record in self._read_records(key[0], key[1]):
+                hwm_key = (record[0], key[0], key[1])
+                if record[2] > self._high_water_marks.get(hwm_key, 0):
+                    self._high_water_marks[hwm_key] = record[2]
+
+    def _read_records(self, family, granularity):
+        """
+        Generator of the raw records of a data file using a memory map
+        """
+        filename = self._get_filename(family, granularity, 'dat')
+        if not os.path.exists(filename) or not os.path.getsize(filename):
+            return
+        record_format = self._get_record_format(family, granularity)
+        record_size = struct.calcsize(record_format)
+        with open(filename, 'rb') as data_file:
+            data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in range(0, len(data) - len(data) % record_size, record_size):
+                    yield struct.unpack_from(record_format, data, offset)
+            finally:
+                data.close()
+
+    def _add_port(self, port_id):
+        index = self._port_index.get(port_id)
+        if index is None:
+            index = len(self._ports)
+            with open(os.path.join(self._path, 'ports.txt'), 'a') as ports_file:
+                ports_file.write(port_id + '\n')
+            self._port_index[port_id] = index
+            self._ports.append(port_id)
+        return index
+
+    def _add_counters(self, family, granularity, attributes):
+        key = (family, granularity)
+        if key not in self._counters:
+            counters = []
+            for name in sorted(attributes):
+                if name in InterfaceStatsCollector.NON_COUNTER_ATTRIBUTES:
+                    continue
+                try:
+                    float(attributes[name])
+                except (TypeError, ValueError):
+                    continue
+                counters.append(name)
+            meta = {'version': self.FORMAT_VERSION, 'family': family,
+                    'granularity': granularity, 'counters': counters}
+            with open(self._get_filename(family, granularity, 'json'), 'w') as meta_file:
+                json.dump(meta, meta_file)
+            self._counters[key] = counters
+        return self._counters[key]
+
+    def get_high_water_mark(self, port_id, family, granularity):
+        """
+        Get the interval end time of the most recent stats stored for a port
+
+        :param port_id: Port identifier such as '1/101/1/12'
+        :param family: The counter family string such as 'ingrTotal'
+        :param granularity: The counter granularity such as '5min'
+        :returns: seconds since the epoch or None if nothing is stored
+        """
+        index = self._port_index.get(port_id)
+        return self._high_water_marks.get((index, family, granularity))
+
+    def get_oldest_high_water_mark(self, granularity):
+        """
+        Get the oldest high-water mark of all of the ports for a granularity
+
+        :param granularity: The counter granularity such as '5min'
+        :returns: seconds since the epoch or None if nothing is stored
+        """
+        marks = [mark for key, mark in self._high_water_marks.items() if key[2] == granularity]
+        if not marks:
+            return None
+        return min(marks)
+
+    def append(self, port_id, family, granularity, attributes):
+        """
+        Add the stats of a port.  The stats are ignored if they are not
+        newer than the stats already stored for the port.  The stats are
+        written to disk by flush().
+
+        :param port_id: Port identifier such as '1/101/1/12'
+        :param family: The counter family string such as 'ingrTotal'
+        :param granularity: The counter granularity such as '5min'
+        :param attributes: Dictionary of the stats object attributes
+        :returns: True if the stats were added
+        """
+        interval_end = _parse_timestamp(attributes['repIntvEnd'])
+        index = self._add_port(port_id)
+        hwm_key = (index, family, granularity)
+        if interval_end <= self._high_water_marks.get(hwm_key, 0):
+            return False
+        counters = self._add_counters(family, granularity, attributes)
+        values = []
+        for name in counters:
+            try:
+                values.append(float(attributes[name]))
+            except (KeyError, TypeError, ValueError):
+                values.append(float('nan'))
+        interval_start = _parse_timestamp(attributes['repIntvStart'])
+        record = struct.pack(self._get_record_format(family, granularity),
+                             index, interval_start, interval_end, *values)
+        self._pending.setdefault((family, granularity), []).append(record)
+        self._high_water_marks[hwm_key] = interval_end
+        return True
+
+    def flush(self):
+        """
+        Append the pending stats to the data files
+        """
+        for (family, granularity), records in self._pending.items():
+            with open(self._get_filename(family, granularity, 'dat'), 'ab') as data_file:
+                data_file.write(b''.join(records))
+        self._pending = {}
+
+    def get_counter_names(self, family, granularity):
+        """
+        :param family: The counter family string such as 'ingrTotal'
+        :param granularity: The counter granularity such as '5min'
+        :returns: List of the counter names stored for the family and granularity
+        """
+        return list(self._counters.get((family, granularity), []))
+
+    def read(self, family, granularity, port_id=None):
+        """
+        Read back the stored stats
+
+        :param family: The counter family string such as 'ingrTotal'
+        :param granularity: The counter granularity such as '5min'
+        :param port_id: Optional port identifier to only read the stats of one port
+        :returns: List of dictionaries with the port id, the interval start\
+                  and end times in seconds since the epoch and the counters
+        """
+        result = []
+        if (family, granularity) not in self._counters:
+            return result
+        counters = self._counters[(family, granularity)]
+        index = self._port_index.get(port_id)
+        if port_id is not None and index is None:
+            return result
+        for record in self._read_records(family, granularity):
+            if index is not None and record[0] != index:
+                continue
+            stats = {'port': self._ports[record[0]],
+                     'intervalStart': record[1],
+                     'intervalEnd': record[2]}
+            stats.update(zip(counters, record[3:]))
+            result.append(stats)
+        return result
+
+
+class InterfaceStatsPoller(object):
+    """
+    This class incrementally polls the historical interface stats of all of
+    the ports into an InterfaceStatsStore.  Each poll reads just enough of
+    the statsHist periods to cover the time since the oldest stats in the
+    store and only the periods newer than each port's high-water mark are
+    stored.
+    """
+    INTERVALS = {'5min': 300, '15min': 900, '1h': 3600, '1d': 86400,
+                 '1w': 604800, '1mo': 2678400, '1qtr': 7948800, '1year': 31622400}
+
+    def __init__(self, session, store, granularity='5min', initial_periods=1,
+                 max_periods=12, page_size=1000):
+        """
+        :param session: Session to use when accessing the APIC
+        :param store: InterfaceStatsStore where the stats are saved
+        :param granularity: The counter granularity such as '5min'
+        :param initial_periods: Number of periods to read when the store is empty
+        :param max_periods: Maximum number of periods to read in a single poll
+        :param page_size: Number of interfaces to retrieve in each query
+        """
+        if granularity not in self.INTERVALS:
+            raise ValueError('Unknown granularity %s' % granularity)
+        self._session = session
+        self._store = store
+        self._granularity = granularity
+        self._initial_periods = initial_periods
+        self._max_periods = max_periods
+        self._page_size = page_size
+
+    def get_num_periods(self, now=None):
+        """
+        Get the number of periods needed to cover the time since the oldest
+        high-water mark
+
+        :param now: Current time in seconds since the epoch
+        :returns: Number of periods
+        """
+        oldest = self._store.get_oldest_high_water_mark(self._granularity)
+        if oldest is None:
+            return self._initial_periods
+        if now is None:
+            now = time.time()
+        periods = int(math.ceil((now - oldest) / self.INTERVALS[self._granularity]))
+        return max(1, min(periods, self._max_periods))
+
+    def poll(self, now=None):
+        """
+        Read the missing stats from the APIC and save them in the store
+
+        :param now: Current time in seconds since the epoch
+        :returns: Number of stats records saved
+        """
+        periods = self.get_num_periods(now)
+        mo_query_url = ('/api/class/l1PhysIf.json?&rsp-subtree-include=stats&rsp-subtree-class=statsHist'
+                        '&rsp-subtree-filter=lt(statsHist.index,"%s")' % periods)
+        stats = []
+        for data in _get_pages(self._session, mo_query_url, self._page_size):
+            for interface in data:
+                if 'children' not in interface.get('l1PhysIf', {}):
+                    continue
+                port_id = InterfaceStats._parseDn2PortId(interface['l1PhysIf']['attributes']['dn'])
+                for child in interface['l1PhysIf']['children']:
+                    for count in child:
+                        if re.search(r'(\d+\D+)$', count).group(1) != self._granularity:
+                            continue
+                        counter_attr = child[count]['attributes']
+                        if 'repIntvEnd' not in counter_attr:
+                            continue
+                        family = InterfaceStats._get_count_name(count)
+                        stats.append((_parse_timestamp(counter_attr['repIntvEnd']),
+                                      port_id, family, counter_attr))
+        # Save the oldest periods first so the high-water marks only move forward
+        stats.sort(key=lambda item: item[0])
+        num_records = 0
+        for interval_end, port_id, family, counter_attr in stats:
+            if self._store.append(port_id, family, self._granularity, counter_attr):
+                num_records += 1
+        self._store.flush()
+        return num_records
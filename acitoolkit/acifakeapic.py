@@ -20,9 +20,11 @@ from copy import deepcopy
 import json
 import re
 try:
-    import urlparse
+    from urlparse import urlparse, parse_qs
 except ImportError:
-    from urllib.parse import urlparse
+    from urllib.parse import urlparse, parse_qs
+
+from six import iteritems
 
 from .acisession import Session
 import logging
@@ -84,6 +86,7 @@ class FakeSession(Session):
         self.db = []
         self.subscription_thread = FakeSubscriber()
         self._classes = {}
+        self._dns = {}
         for filename in filenames:
             with open(filename, 'r') as f:
                 try:
@@ -100,7 +103,7 @@ class FakeSession(Session):
                 self._fill_data(data['imdata'], None)
                 self.db.append(data)
             with open(filename, "w") as f:
-                f.write(unicode(json.dumps(data, indent=4)))
+                f.write(json.dumps(data, indent=4))
 
     def _get_config(self, url):
         """
@@ -130,12 +133,12 @@ class FakeSession(Session):
         """
         # set a dummy url scheme to make the url look like a real one
         url = 'scheme://apic' + url
-        url_parsed = urlparse.urlparse(url)
+        url_parsed = urlparse(url)
         cl_path = url_parsed.path.partition('.json')[0]
         path_regex = r'/api/(?:mo|node/class|class|node/mo)/(([^/]*).*)'
         dn, root_cl = re.search(path_regex, cl_path).groups()
         # get the queries as a dict
-        url_queries = urlparse.parse_qs(url_parsed.query)
+        url_queries = parse_qs(url_parsed.query)
         # get the queries and convert them to a string
         query_target = ''.join(url_queries.get('query-target', ['self']))
         rsp_subtree = ''.join(url_queries.get('rsp-subtree', ['no']))
@@ -168,15 +171,14 @@ class FakeSession(Session):
                 log.error('Unknown class %s', cl)
                 return []
             return [cl_obj for _, cl_obj in lst]
-        for _, lst in self._classes.iteritems():
-            if target and query_target != 'self':
+        if query_target == 'self':
+            return list(self._dns.get(dn, []))
+        for _, lst in iteritems(self._classes):
+            if target:
                 lst = self._classes[target]
             for tup in lst:
                 node_dn, node_cl = tup
-                valid_dn = (dn == node_dn)
-                if query_target == 'self' and valid_dn:
-                    resp.append(node_cl)
-                elif query_target == 'children':
+                if query_target == 'children':
                     if self._is_child(node_dn, dn):
                         resp.append(node_cl)
                 elif query_target == 'subtree':
@@ -200,7 +202,7 @@ class FakeSession(Session):
         if rsp_subtree != 'full':
             resp = []
             for node in db:
-                node_cl, _ = next(node.iteritems())
+                node_cl, _ = next(iteritems(node))
                 # make a deep copy to avoid deleting other nodes
                 node_cl_copy = deepcopy(node[node_cl])
                 ret = {}
@@ -225,7 +227,7 @@ class FakeSession(Session):
         :return: None
         """
         for child in db:
-            _, contents = next(child.iteritems())
+            _, contents = next(iteritems(child))
             if contents.get('children'):
                 del contents['children']
 
@@ -285,7 +287,7 @@ class FakeSession(Session):
         :return: None
         """
         for child in children:
-            node_cl, contents = next(child.iteritems())
+            node_cl, contents = next(iteritems(child))
             attributes = contents['attributes']
             if not attributes.get('dn'):
                 rn = attributes['rn']
@@ -294,6 +296,7 @@ class FakeSession(Session):
             if not self._classes.get(node_cl):
                 self._classes[node_cl] = []
             self._classes[node_cl].append(tup)
+            self._dns.setdefault(attributes['dn'], []).append(child)
             if contents.get('children'):
                 self._fill_data(contents['children'], attributes['dn'])
 
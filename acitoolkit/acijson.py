@@ -0,0 +1,189 @@
+################################################################################
+#                                  _    ____ ___                               #
+#                                 / \  / ___|_ _|                              #
+#                                / _ \| |    | |                               #
+#                               / ___ \ |___ | |                               #
+#                         _____/_/   \_\____|___|_ _                           #
+#                        |_   _|__   ___ | | | _(_) |_                         #
+#                          | |/ _ \ / _ \| | |/ / | __|                        #
+#                          | | (_) | (_) | |   <| | |_                         #
+#                          |_|\___/ \___/|_|_|\_\_|\__|                        #
+#                                                                              #
+################################################################################
+#                                                                              #
+# Copyright (c) 2015 Cisco Systems                                             #
+# All Rights Reserved.                                                         #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may   #
+#    not use this file except in compliance with the License. You may obtain   #
+#    a copy of the License at                                                  #
+#                                                                              #
+#         http://www.apache.org/licenses/LICENSE-2.0                           #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT #
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the  #
+#    License for the specific language governing permissions and limitations   #
+#    under the License.                                                        #
+#                                                                              #
+################################################################################
+"""
+ACI Toolkit module for encoding and decoding the JSON exchanged with the APIC.
+orjson or ujson are used when installed and the standard library json module
+is used otherwise.
+"""
+import json
+
+import requests
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JSONCodec(object):
+    """
+    JSON codec using the standard library json module
+    """
+    name = 'json'
+
+    def loads(self, data):
+        """
+        Decode a JSON document.  The APIC sometimes returns control
+        characters such as newlines within strings so they are accepted.
+
+        :param data: String or bytes containing the JSON document
+        :returns: Decoded JSON data
+        """
+        if isinstance(data, bytes) and not isinstance(data, str):
+            data = data.decode('utf-8')
+        return json.loads(data, strict=False)
+
+    def dumps(self, data, sort_keys=False):
+        """
+        Encode data as a JSON document
+
+        :param data: Data to be encoded
+        :param sort_keys: True if the keys must be sorted so that the document\
+        is deterministic
+        :returns: String containing the JSON document
+        """
+        return json.dumps(data, sort_keys=sort_keys)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    JSON codec using orjson
+    """
+    name = 'orjson'
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            return super(OrjsonCodec, self).loads(data)
+
+    def dumps(self, data, sort_keys=False):
+        try:
+            return orjson.dumps(data, option=orjson.OPT_SORT_KEYS if sort_keys else 0).decode('utf-8')
+        except TypeError:
+            return super(OrjsonCodec, self).dumps(data, sort_keys=sort_keys)
+
+
+class UjsonCodec(JSONCodec):
+    """
+    JSON codec using ujson
+    """
+    name = 'ujson'
+
+    def loads(self, data):
+        try:
+            return ujson.loads(data)
+        except ValueError:
+            return super(UjsonCodec, self).loads(data)
+
+    def dumps(self, data, sort_keys=False):
+        return ujson.dumps(data, sort_keys=sort_keys, escape_forward_slashes=False)
+
+
+CODECS = {'json': JSONCodec}
+if orjson is not None:
+    CODECS['orjson'] = OrjsonCodec
+if ujson is not None:
+    CODECS['ujson'] = UjsonCodec
+
+_codec = None
+
+
+def get_codec():
+    """
+    Get the JSON codec in use.  The fastest installed codec is selected
+    the first time.
+
+    :returns: JSONCodec instance
+    """
+    global _codec
+    if _codec is None:
+        for name in ('orjson', 'ujson', 'json'):
+            if name in CODECS:
+                _codec = CODECS[name]()
+                break
+    return _codec
+
+
+def set_codec(codec):
+    """
+    Set the JSON codec to be used
+
+    :param codec: String containing the codec name ('orjson', 'ujson' or 'json')\
+    or JSONCodec instance
+    :returns: None
+    """
+    global _codec
+    if not isinstance(codec, JSONCodec):
+        if codec not in CODECS:
+            raise ValueError('JSON codec %s is not available' % codec)
+        codec = CODECS[codec]()
+    _codec = codec
+
+
+class CodecResponse(requests.Response):
+    """
+    Response whose JSON body is decoded once with the JSON codec.  Later
+    calls to json() return the same decoded data.
+    """
+    _json = None
+
+    def json(self, **kwargs):
+        """
+        :returns: Decoded JSON body
+        """
+        if self._json is None:
+            self._json = get_codec().loads(self.content)
+        return self._json
+
+    def set_json(self, data):
+        """
+        Replace the body with the specified JSON data
+
+        :param data: JSON data to be the new body
+        """
+        self._content = get_codec().dumps(data).encode('utf-8')
+        self._json = data
+
+
+def decode_response(resp):
+    """
+    Make the JSON body of a Response be decoded once with the JSON codec
+
+    :param resp: Instance of requests.Response
+    :returns: The same Response as a CodecResponse
+    """
+    if type(resp) is requests.Response:
+        resp.__class__ = CodecResponse
+    return resp
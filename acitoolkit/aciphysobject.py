@@ -38,6 +38,8 @@ from .acibaseobject import (
     BaseACIObject, BaseACIPhysModule, BaseACIPhysObject, BaseInterface
 )
 from .acicounters import AtomicCountersOnGoing, InterfaceStats
+from .aciHealthScore import HealthScore
+from .acijson import decode_response
 from .aciSearch import Searchable
 from .acisession import Session
 from .aciTable import Table
@@ -1455,6 +1457,7 @@ class Node(BaseACIPhysObject):
                             # base_url = '/api/mo/topology/pod-{0}.json?'.format(pod_id)
 
         nodes = []
+        node_health = None
         data = working_data.get_class('fabricNode')
         for apic_node in data:
             if 'fabricNode' in apic_node:
@@ -1492,7 +1495,11 @@ class Node(BaseACIPhysObject):
                 if node_match and pod_match:
                     if node.role == 'leaf':
                         node._add_vpc_info(working_data)
-                    node.get_health()
+                    if node.role != 'controller':
+                        # Get the health of all of the nodes in a single query
+                        if node_health is None:
+                            node_health = HealthScore.get_node_health(session)
+                        node.health = node_health.get(node.dn)
                     node.get_firmware(working_data)
 
                     if isinstance(parent, Pod):
@@ -1526,7 +1533,7 @@ class Node(BaseACIPhysObject):
                 if 'topSystem' in data[0]:
                     if 'children' in data[0]['topSystem']:
                         ts_child = data[0]['topSystem']['children']
-                        if 'fabricNodeHealth5Min' in ts_child[0]:
+                        if 'fabricNodeHealth5min' in ts_child[0]:
                             self.health = ts_child[0]['fabricNodeHealth5min']['attributes']['healthLast']
 
     def _add_vpc_info(self, working_data):
@@ -3127,12 +3134,12 @@ class WorkingData(object):
             apic_classes = toolkit_class._get_apic_classes()
         query_url = url + 'query-target=subtree&target-subtree-class=' + ','.join(apic_classes)
 
-        ret = session.get(query_url)
-        ret._content = ret._content.decode().replace('\n', '').encode()
+        # The JSON codec accepts the newlines that the APIC leaves in strings
+        ret = decode_response(session.get(query_url))
         data = ret.json()['imdata']
 
         if data:
-            self.rawjson = ret.json()['imdata']
+            self.rawjson = data
         else:
             self.rawjson = None
         if self.rawjson is not None:
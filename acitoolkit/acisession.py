@@ -31,7 +31,6 @@
      with the APIC.
 """
 import copy
-import json
 import logging
 import ssl
 import threading
@@ -41,6 +40,7 @@ import base64
 import requests
 import sys
 from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
 if sys.version_info < (3, 0, 0):
     from urllib import unquote
@@ -51,9 +51,13 @@ try:
     from requests.packages.urllib3.exceptions import InsecureRequestWarning
 except ImportError:
     pass
+from requests.adapters import HTTPAdapter
 from six.moves.queue import Queue
 from websocket import create_connection, WebSocketException
 from requests.exceptions import ConnectionError
+
+from .acijson import decode_response, get_codec
+
 try:
     from OpenSSL.crypto import FILETYPE_PEM, load_privatekey, sign
     NO_OPENSSL = False
@@ -213,7 +217,8 @@ class Subscriber(threading.Thread):
             resp.status_code = 404
             resp._content = '{"error": "Could not send subscription to APIC"}'
             return resp
-        resp_data = json.loads(resp.text)
+        resp = decode_response(resp)
+        resp_data = resp.json()
         if 'subscriptionId' not in resp_data:
             log.error('Did not receive proper subscription response from APIC for url %s response: %s',
                       url, resp_data)
@@ -224,12 +229,12 @@ class Subscriber(threading.Thread):
         subscription_id = resp_data['subscriptionId']
         self._subscriptions[url] = subscription_id
         if not only_new:
-            while len(resp_data['imdata']):
+            # Leave the cached body of the response returned to the caller untouched
+            for item in list(resp_data['imdata']):
                 event = {"totalCount": "1",
-                         "subscriptionId": [resp_data['subscriptionId']],
-                         "imdata": [resp_data["imdata"][0]]}
-                self._event_q.put(json.dumps(event))
-                resp_data["imdata"].remove(resp_data["imdata"][0])
+                         "subscriptionId": [subscription_id],
+                         "imdata": [item]}
+                self._event_q.put(event)
         return resp
 
     def refresh_subscriptions(self):
@@ -314,6 +319,15 @@ class Subscriber(threading.Thread):
         for url in urls:
             self.subscribe(url, only_new=True)
 
+    def _clear_subscriptions(self):
+        """
+        Forget the subscriptions and their pending events without contacting
+        the APIC.  Used when the subscriptions are moved to another APIC.
+        """
+        self._subscriptions = {}
+        self._events = {}
+        self._event_q = Queue()
+
     def _process_event_q(self):
         """
         Put the event into correct bucket based on URLs that have been
@@ -324,12 +338,13 @@ class Subscriber(threading.Thread):
 
         while not self._event_q.empty():
             event = self._event_q.get()
-            orig_event = event
-            try:
-                event = json.loads(event)
-            except ValueError:
-                log.error('Non-JSON event: %s', orig_event)
-                continue
+            if not isinstance(event, dict):
+                orig_event = event
+                try:
+                    event = get_codec().loads(event)
+                except ValueError:
+                    log.error('Non-JSON event: %s', orig_event)
+                    continue
             # Find the URL for this event
             num_subscriptions = len(event['subscriptionId'])
             for i in range(0, num_subscriptions):
@@ -433,7 +448,7 @@ class Subscriber(threading.Thread):
         while self.has_events(url):
             self.get_event(url)
         del self._subscriptions[url]
-        if not self._subscriptions:
+        if not self._subscriptions and self._ws is not None:
             self._ws.close(timeout=0)
 
     def run(self):
@@ -446,6 +461,138 @@ class Subscriber(threading.Thread):
                 log.error('Could not refresh subscriptions due to ConnectionError')
 
 
+class KeepAliveAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that optionally enables TCP keep-alive on its connections so
+    that idle pooled connections to the APIC are not silently dropped by
+    firewalls and load balancers.
+    """
+    def __init__(self, keepalive_idle=None, **kwargs):
+        """
+        :param keepalive_idle: Number of idle seconds before TCP keep-alive probes\
+        are sent.  TCP keep-alive is disabled if None.
+        """
+        self.keepalive_idle = keepalive_idle
+        super(KeepAliveAdapter, self).__init__(**kwargs)
+
+    def get_socket_options(self):
+        """
+        :returns: List of socket options for the pooled connections
+        """
+        try:
+            from urllib3.connection import HTTPConnection
+        except ImportError:
+            from requests.packages.urllib3.connection import HTTPConnection
+        options = list(HTTPConnection.default_socket_options)
+        if self.keepalive_idle is None:
+            return options
+        options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keepalive_idle))
+        if hasattr(socket, 'TCP_KEEPINTVL'):
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, self.keepalive_idle // 3)))
+        if hasattr(socket, 'TCP_KEEPCNT'):
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3))
+        return options
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self.get_socket_options()
+        super(KeepAliveAdapter, self).init_poolmanager(*args, **kwargs)
+
+    def get_stats(self):
+        """
+        Get the connection reuse statistics of the pools of this adapter
+
+        :returns: List of dictionaries containing the host, port, number of\
+        connections opened and number of requests sent for each pool
+        """
+        stats = []
+        pools = self.poolmanager.pools
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            if pool is None:
+                continue
+            stats.append({'host': pool.host,
+                          'port': pool.port,
+                          'connections': pool.num_connections,
+                          'requests': pool.num_requests})
+        return stats
+
+
+def _split_payload(data, max_payload):
+    """
+    Split the JSON of an object tree into payloads that are no larger than
+    max_payload.  The tree is split between the children of an object and
+    each payload also contains the attributes of the ancestors of the
+    children so that it can be pushed on its own.
+
+    :param data: Dictionary containing the JSON of the object tree
+    :param max_payload: Integer containing the maximum payload size in bytes
+    :returns: List of dictionaries containing the JSON payloads
+    """
+    codec = get_codec()
+    if len(codec.dumps(data)) <= max_payload or len(data) != 1:
+        return [data]
+    obj_class = list(data.keys())[0]
+    attributes = data[obj_class].get('attributes', {})
+    children = data[obj_class].get('children', [])
+    if not children or attributes.get('status') == 'deleted':
+        return [data]
+
+    def wrap(subset):
+        return {obj_class: {'attributes': attributes, 'children': subset}}
+
+    overhead = len(codec.dumps(wrap([])))
+    payloads = []
+    current = []
+    size = overhead
+    for child in children:
+        child_size = len(codec.dumps(child)) + 2
+        if overhead + child_size > max_payload:
+            for payload in _split_payload(child, max_payload - overhead):
+                payloads.append(wrap([payload]))
+            continue
+        if current and size + child_size > max_payload:
+            payloads.append(wrap(current))
+            current = []
+            size = overhead
+        current.append(child)
+        size += child_size
+    if current:
+        payloads.append(wrap(current))
+    return payloads
+
+
+class PushResult(object):
+    """
+    Result of pushing an object with Session.push_many
+    """
+    def __init__(self, obj, url, payloads):
+        """
+        :param obj: Object that was pushed
+        :param url: String containing the URL the object was pushed to
+        :param payloads: List of dictionaries containing the JSON payloads\
+        the object was split into
+        """
+        self.obj = obj
+        self.url = url
+        self.payloads = payloads
+        self.responses = [None] * len(payloads)
+        self.errors = []
+
+    @property
+    def ok(self):
+        """
+        :returns: True if all of the payloads were pushed successfully
+        """
+        if self.errors:
+            return False
+        return all(resp is not None and resp.ok for resp in self.responses)
+
+    def __repr__(self):
+        return '<PushResult %s %s chunks=%s ok=%s>' % (self.obj, self.url, len(self.payloads), self.ok)
+
+
 class Session(object):
     """
        Session class
@@ -453,7 +600,8 @@ class Session(object):
     """
     def __init__(self, url, uid, pwd=None, cert_name=None, key=None, verify_ssl=False,
                  appcenter_user=False, subscription_enabled=True, proxies=None,
-                 relogin_forever=False):
+                 relogin_forever=False, pool_connections=10, pool_maxsize=10,
+                 max_retries=0, timeout=None, keepalive_idle=None):
         """
         :param url:  String containing the APIC URL such as ``https://1.2.3.4``
         :param uid: String containing the username that will be used as\
@@ -473,6 +621,14 @@ class Session(object):
         directly to the Requests library
         :param relogin_forever: Boolean that when set to True will attempt to re-login
                                 forever regardless of the error returned from APIC.
+        :param pool_connections: Number of connection pools to cache
+        :param pool_maxsize: Maximum number of connections kept open to the APIC.\
+        Should be at least the number of threads sharing the session.
+        :param max_retries: Number of times a failed connection is retried
+        :param timeout: Default number of seconds for connection timeout when a\
+        request does not give one
+        :param keepalive_idle: Number of idle seconds before TCP keep-alive probes\
+        are sent on the pooled connections.  TCP keep-alive is disabled if None.
         """
         if not isinstance(url, str):
             url = str(url)
@@ -546,12 +702,18 @@ class Session(object):
         self.login_error = False
         self._logged_in = False
         self.relogin_forever = relogin_forever
-        self._subscription_enabled = subscription_enabled
+        self._subscription_enabled = False
         self._proxies = proxies
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.keepalive_idle = keepalive_idle
+        self._login_lock = threading.RLock()
+        self._login_generation = 0
+        self.login_count = 0
         if subscription_enabled:
-            self.subscription_thread = Subscriber(self)
-            self.subscription_thread.daemon = True
-            self.subscription_thread.start()
+            self.enable_subscriptions()
 
     def __reduce__(self):
         """
@@ -583,7 +745,7 @@ class Session(object):
             return {}
 
         if not self.session:
-            self.session = requests.Session()
+            self.session = self._create_http_session()
 
         if self.appcenter_user:
             cert_dn = 'uni/userext/appuser-{0}/usercert-{1}'.format(self.uid, self.cert_name)
@@ -617,18 +779,72 @@ class Session(object):
         log.debug('Authentication cookie %s', cookie)
         return cookie
 
+    def _create_http_session(self):
+        """
+        Create the requests Session with the configured connection pool
+
+        :returns: Instance of requests.Session
+        """
+        session = requests.Session()
+        for prefix in ('http://', 'https://'):
+            session.mount(prefix, KeepAliveAdapter(keepalive_idle=self.keepalive_idle,
+                                                   pool_connections=self.pool_connections,
+                                                   pool_maxsize=self.pool_maxsize,
+                                                   max_retries=self.max_retries))
+        return session
+
+    def get_connection_stats(self):
+        """
+        Get the connection reuse statistics of the session
+
+        :returns: Dictionary containing the number of logins and, for each pool,\
+        the host, port, number of connections opened and number of requests sent
+        """
+        stats = {'logins': self.login_count, 'pools': []}
+        if self.session is None:
+            return stats
+        for adapter in self.session.adapters.values():
+            if isinstance(adapter, KeepAliveAdapter):
+                stats['pools'].extend(adapter.get_stats())
+        return stats
+
+    def _relogin(self, generation):
+        """
+        Login again after the APIC rejected a request.  Only one thread logs
+        in when several threads are rejected with the same login token.
+
+        :param generation: Login generation in use when the request was sent
+        :returns: Response class instance from the requests library or None if\
+        another thread has already logged in again.
+        """
+        with self._login_lock:
+            if generation != self._login_generation:
+                return None
+            resp = self._send_login()
+        self.resubscribe()
+        return resp
+
     def _send_login(self, timeout=None):
         """
         Send the actual login request to the APIC and open the web
-        socket interface.
+        socket interface.  The existing connection pool is kept so that
+        the warm connections are reused.
         """
+        with self._login_lock:
+            return self._send_login_locked(timeout)
+
+    def _send_login_locked(self, timeout=None):
         if not self.verify_ssl:
             try:
                 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
             except (AttributeError, NameError):
                 pass
-        self.session = requests.Session()
+        if self.session is None:
+            self.session = self._create_http_session()
+        else:
+            self.session.cookies.clear()
         self._logged_in = False
+        self.login_count += 1
 
         if self.appcenter_user and self._subscription_enabled:
             login_url = '/api/requestAppToken.json'
@@ -651,18 +867,44 @@ class Session(object):
                 return ret
             log.error('Could not relogin to APIC. Aborting login thread.')
             self.login_thread.exit()
-            self.subscription_thread.exit()
+            if self._subscription_enabled:
+                self.subscription_thread.exit()
             return ret
         self._logged_in = True
-        ret_data = json.loads(ret.text)['imdata'][0]
+        self._login_generation += 1
+        ret_data = decode_response(ret).json()['imdata'][0]
         timeout = ret_data['aaaLogin']['attributes']['refreshTimeoutSeconds']
         self.token = str(ret_data['aaaLogin']['attributes']['token'])
         if self._subscription_enabled:
-            self.subscription_thread._open_web_socket('https://' in self.api)
+            self._open_web_socket()
         timeout = int(timeout)
         self.login_thread._login_timeout = timeout / 2
         return ret
 
+    def _open_web_socket(self):
+        """
+        Open the web socket used to receive the subscription events
+        """
+        self.subscription_thread._open_web_socket('https://' in self.api)
+
+    def enable_subscriptions(self):
+        """
+        Start the subscription thread of a Session created with subscriptions
+        disabled.  The web socket is opened if the Session is already logged in.
+        """
+        if self._subscription_enabled:
+            return
+        self._subscription_enabled = True
+        self.subscription_thread = Subscriber(self)
+        self.subscription_thread.daemon = True
+        self.subscription_thread.start()
+        if self._logged_in:
+            if self.appcenter_user:
+                # The web socket needs an application token
+                self._send_login()
+            else:
+                self._open_web_socket()
+
     def login(self, timeout=None):
         """
         Initiate login to the APIC.  Opens a communication session with the\
@@ -702,7 +944,7 @@ class Session(object):
         refresh_url = '/api/aaaRefresh.json'
         resp = self.get(refresh_url, timeout=timeout)
         if resp.ok:
-            ret_data = json.loads(resp.text)['imdata'][0]
+            ret_data = resp.json()['imdata'][0]
             self.token = str(ret_data['aaaLogin']['attributes']['token'])
         return resp
 
@@ -796,9 +1038,13 @@ class Session(object):
         """
         post_url = self.api + url
         log.debug('Posting url: %s data: %s', post_url, data)
+        if timeout is None:
+            timeout = self.timeout
+        generation = self._login_generation
 
         if self.cert_auth and not (self.appcenter_user and self._subscription_enabled and self._logged_in):
-            data = json.dumps(data, sort_keys=True)
+            # The signature covers the payload so it is encoded deterministically
+            data = get_codec().dumps(data, sort_keys=True)
             cookies = self._prep_x509_header('POST', url, data)
             resp = self.session.post(post_url, data=data, verify=self.verify_ssl,
                                      timeout=timeout, proxies=self._proxies, cookies=cookies)
@@ -806,20 +1052,88 @@ class Session(object):
                 log.error('Certificate authentication failed. Please check all settings are correct.')
                 resp.raise_for_status()
         else:
-            resp = self.session.post(post_url, data=json.dumps(data, sort_keys=True), verify=self.verify_ssl,
+            data = get_codec().dumps(data)
+            resp = self.session.post(post_url, data=data, verify=self.verify_ssl,
                                      timeout=timeout, proxies=self._proxies)
-            if resp.status_code == 403:
+            if resp.status_code == 403 and not url.startswith('/api/aaaLogin'):
                 log.error(resp.text)
                 log.error('Trying to login again....')
-                resp = self._send_login()
-                self.resubscribe()
+                self._relogin(generation)
                 log.error('Trying post again...')
                 log.debug(post_url)
-                resp = self.session.post(post_url, data=json.dumps(data, sort_keys=True), verify=self.verify_ssl,
+                resp = self.session.post(post_url, data=data, verify=self.verify_ssl,
                                          timeout=timeout, proxies=self._proxies)
-        log.debug('Response: %s %s', resp, resp.text)
+        resp = decode_response(resp)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('Response: %s %s', resp, resp.text)
         return resp
 
+    def _push_payload(self, result, index, retries, timeout):
+        """
+        Push a single payload of a PushResult retrying on connection errors
+        and APIC server errors
+        """
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(0.5 * 2 ** (attempt - 1))
+            try:
+                resp = self.push_to_apic(result.url, result.payloads[index], timeout=timeout)
+            except (ConnectionError, requests.exceptions.Timeout) as error:
+                log.warning('Push of %s failed: %s', result.url, error)
+                result.responses[index] = None
+                continue
+            result.responses[index] = resp
+            if resp.status_code < 500:
+                break
+            log.warning('Push of %s failed: %s %s', result.url, resp.status_code, resp.text)
+        resp = result.responses[index]
+        if resp is None:
+            result.errors.append('Could not connect to the APIC')
+        elif not resp.ok:
+            result.errors.append(resp.text)
+
+    def push_many(self, objects, max_payload=1000000, workers=4, retries=2, timeout=None):
+        """
+        Push several objects to the APIC.  Objects larger than max_payload
+        are split between their children and the payloads are sent
+        concurrently.  The first payload of each object is sent before the
+        others so that the object exists before its children are pushed.
+
+        :param objects: List of objects with get_url() and get_json() methods\
+        such as Tenant, or tuples of URL string and JSON dictionary
+        :param max_payload: Integer containing the maximum payload size in bytes
+        :param workers: Integer containing the number of concurrent pushes
+        :param retries: Integer containing the number of times a payload is\
+        sent again after a connection error or an APIC server error
+        :param timeout: Integer containing the number of seconds for connection timeout
+        :returns: List of PushResult instances in the same order as objects
+        """
+        results = []
+        for obj in objects:
+            if isinstance(obj, tuple):
+                url, data = obj
+            else:
+                url, data = obj.get_url(), obj.get_json()
+            payloads = [] if data is None else _split_payload(data, max_payload)
+            results.append(PushResult(obj, url, payloads))
+
+        first = [(result, 0) for result in results if result.payloads]
+        pool = ThreadPool(max(1, workers))
+        try:
+            pool.map(lambda item: self._push_payload(item[0], item[1], retries, timeout), first)
+            rest = []
+            for result in results:
+                if not result.payloads:
+                    continue
+                if not result.errors:
+                    rest.extend((result, index) for index in range(1, len(result.payloads)))
+                elif len(result.payloads) > 1:
+                    result.errors.append('Remaining payloads not sent')
+            pool.map(lambda item: self._push_payload(item[0], item[1], retries, timeout), rest)
+        finally:
+            pool.close()
+        return results
+
     def get(self, url, timeout=None):
         """
         Perform a REST GET call to the APIC.
@@ -832,6 +1146,9 @@ class Session(object):
         """
         get_url = self.api + url
         log.debug(get_url)
+        if timeout is None:
+            timeout = self.timeout
+        generation = self._login_generation
 
         cookies = self._prep_x509_header('GET', url)
         resp = self.session.get(get_url, timeout=timeout, verify=self.verify_ssl,
@@ -843,8 +1160,7 @@ class Session(object):
             else:
                 log.error(resp.text)
                 log.error('Trying to login again....')
-                resp = self._send_login()
-                self.resubscribe()
+                self._relogin(generation)
                 log.error('Trying get again...')
                 log.debug(get_url)
                 resp = self.session.get(get_url, timeout=timeout, verify=self.verify_ssl, proxies=self._proxies)
@@ -859,8 +1175,10 @@ class Session(object):
                                     timeout=timeout, verify=self.verify_ssl, proxies=self._proxies, cookies=cookies)
             entries = []
             if resp.ok:
+                resp = decode_response(resp)
                 entries += resp.json()['imdata']
                 orig_total_count = int(resp.json()['totalCount'])
+                subscription_id = resp.json().get('subscriptionId')
                 total_count = orig_total_count - 10000
                 while total_count > 0 and resp.ok:
                     page_number += 1
@@ -875,7 +1193,10 @@ class Session(object):
                         total_count -= 10000
                 resp_content = {'imdata': entries,
                                 'totalCount': orig_total_count}
-                resp._content = json.dumps(resp_content).encode('ascii')
+                if subscription_id is not None:
+                    resp_content['subscriptionId'] = subscription_id
+                resp = decode_response(resp)
+                resp.set_json(resp_content)
         elif 400 < resp.status_code < 600:
             log.debug('Received error: %s %s', str(resp.status_code), resp.text)
             retries = 3
@@ -893,8 +1214,10 @@ class Session(object):
             if retries == 0:
                 log.error('Raising ConnectionError')
                 raise ConnectionError
-        log.debug(resp)
-        log.debug(resp.text)
+        resp = decode_response(resp)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(resp)
+            log.debug(resp.text)
         return resp
 
     def register_login_callback(self, callback_fn):
@@ -926,3 +1249,486 @@ class Session(object):
         for callback_fn in self._relogin_callbacks:
             log.info('Invoking login callback...')
             callback_fn(self)
+
+
+class ClusterMember(object):
+    """
+    Tracks the health and response latency of a single APIC in a ClusterSession
+    """
+    def __init__(self, session):
+        """
+        :param session: Session instance logged into this APIC
+        """
+        self.session = session
+        self.latency = None
+        self.inflight = 0
+        self.failures = 0
+        self.down_until = 0
+
+    @property
+    def url(self):
+        """
+        :returns: String containing the APIC URL
+        """
+        return self.session.api
+
+    def is_available(self, now):
+        """
+        Check whether the APIC can currently be used
+
+        :param now: Current time in seconds since the epoch
+        :returns: True if the APIC is logged in and not backing off from a failure
+        """
+        return self.session.logged_in() and now >= self.down_until
+
+    def get_score(self):
+        """
+        :returns: Expected cost of sending a request to this APIC. Lower is better.
+        """
+        return (self.latency or 0.0) * (self.inflight + 1)
+
+    def record_success(self, latency, weight):
+        """
+        Record a successful request
+
+        :param latency: Float containing the number of seconds taken by the request
+        :param weight: Float containing the weight of the latest sample in the average
+        """
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += weight * (latency - self.latency)
+        self.failures = 0
+        self.down_until = 0
+
+    def record_failure(self, now, retry_interval, max_retry_interval):
+        """
+        Record a failed request.  The APIC is not used again until the
+        retry interval, doubled on every consecutive failure, has passed.
+
+        :param now: Current time in seconds since the epoch
+        :param retry_interval: Number of seconds to wait after the first failure
+        :param max_retry_interval: Maximum number of seconds to wait
+        """
+        self.failures += 1
+        self.down_until = now + min(retry_interval * 2 ** (self.failures - 1), max_retry_interval)
+
+
+class ClusterSession(Session):
+    """
+       ClusterSession class
+       This class spreads the communication across the members of an APIC
+       cluster.  Each APIC has its own Session and login token.  GETs are
+       sent to the available APIC with the lowest expected latency and fail
+       over to the other APICs.  Writes and subscriptions are pinned to a
+       single APIC so that they are seen in order, and are moved to another
+       APIC when that APIC becomes unavailable.
+    """
+    def __init__(self, urls, uid, pwd=None, cert_name=None, key=None, verify_ssl=False,
+                 appcenter_user=False, subscription_enabled=True, proxies=None,
+                 relogin_forever=False, pool_connections=10, pool_maxsize=10,
+                 max_retries=0, timeout=None, keepalive_idle=None, retry_interval=5,
+                 max_retry_interval=120, latency_weight=0.2):
+        """
+        :param urls: List of strings containing the APIC URLs such as ``https://1.2.3.4``.\
+        The first APIC is initially used for writes and subscriptions.
+        :param retry_interval: Number of seconds before an APIC is used again after a failure.\
+        The interval is doubled on every consecutive failure.
+        :param max_retry_interval: Maximum number of seconds before an APIC is used again\
+        after a failure.
+        :param latency_weight: Float containing the weight of the latest response time in\
+        the average latency of an APIC.
+
+        The remaining parameters are the same as for the Session class.  The
+        APICs used for writes and subscriptions always try to log back in
+        forever and only the APIC used for subscriptions opens a web socket.
+        """
+        if isinstance(urls, str):
+            urls = [urls]
+        if not len(urls):
+            raise CredentialsError("At least one APIC URL must be provided")
+        super(ClusterSession, self).__init__(urls[0], uid, pwd, cert_name=cert_name, key=key,
+                                             verify_ssl=verify_ssl, appcenter_user=appcenter_user,
+                                             subscription_enabled=False, proxies=proxies,
+                                             relogin_forever=relogin_forever,
+                                             pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                             max_retries=max_retries, timeout=timeout,
+                                             keepalive_idle=keepalive_idle)
+        self._subscription_enabled = subscription_enabled
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.latency_weight = latency_weight
+        self._lock = threading.Lock()
+        self._next_member = 0
+        self._members = []
+        self._subscription_urls = []
+        for url in urls:
+            self.add_member(url)
+        self._write_member = self._members[0]
+        self._subscription_member = self._members[0]
+        self._pin_member(self._members[0], subscriptions=True)
+
+    def __reduce__(self):
+        """
+        This will enable this class to be pickled by only saving the APIC URLs,
+        uid and pwd when pickling.
+        """
+        return self.__class__, (self.get_member_urls(), self.uid, self.pwd)
+
+    def _create_session(self, url):
+        """
+        Create the Session for a single APIC
+
+        :param url: String containing the APIC URL
+        :returns: Session instance
+        """
+        return Session(url, self.uid, self.pwd, cert_name=self.cert_name, key=self.key,
+                       verify_ssl=self.verify_ssl, appcenter_user=self.appcenter_user,
+                       subscription_enabled=False,
+                       proxies=self._proxies,
+                       relogin_forever=self.relogin_forever,
+                       pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+                       max_retries=self.max_retries, timeout=self.timeout,
+                       keepalive_idle=self.keepalive_idle)
+
+    def _pin_member(self, member, subscriptions=False):
+        """
+        Make an APIC log back in forever while the writes or subscriptions
+        are pinned to it
+
+        :param member: ClusterMember instance
+        :param subscriptions: True if the subscriptions are pinned to the APIC.\
+        The subscription thread of the APIC is started if needed.
+        """
+        member.session.relogin_forever = True
+        if subscriptions and self._subscription_enabled:
+            member.session.enable_subscriptions()
+
+    def _unpin_member(self, member):
+        """
+        Restore the relogin behavior requested for the cluster on an APIC
+        that no longer has the writes or subscriptions pinned to it
+
+        :param member: ClusterMember instance
+        """
+        if member is not self._write_member and member is not self._subscription_member:
+            member.session.relogin_forever = self.relogin_forever
+
+    def add_member(self, url):
+        """
+        Add an APIC to the cluster.  The APIC is logged into if the
+        cluster is already logged in.
+
+        :param url: String containing the APIC URL
+        :returns: ClusterMember instance or None if the APIC is already a member
+        """
+        if url in self.get_member_urls():
+            return None
+        member = ClusterMember(self._create_session(url))
+        member.session.register_login_callback(self._member_relogin)
+        if self._logged_in:
+            self._login_member(member)
+        with self._lock:
+            self._members.append(member)
+        return member
+
+    def get_connection_stats(self):
+        """
+        Get the connection reuse statistics of all of the APICs
+
+        :returns: Dictionary of the Session connection statistics indexed by APIC URL
+        """
+        return dict((member.url, member.session.get_connection_stats()) for member in self._members)
+
+    def get_member_urls(self):
+        """
+        :returns: List of strings containing the URLs of the APICs in the cluster
+        """
+        return [member.url for member in self._members]
+
+    def discover_members(self):
+        """
+        Add the other controllers of the APIC cluster using the management
+        addresses of the controllers
+
+        :returns: List of strings containing the URLs of the added APICs
+        """
+        scheme = 'https://' if self.api.startswith('https://') else 'http://'
+        query_url = '/api/node/class/topSystem.json?query-target-filter=eq(topSystem.role,"controller")'
+        resp = self.get(query_url)
+        added = []
+        if not resp.ok:
+            log.error('Could not discover the APIC cluster members: %s', resp.text)
+            return added
+        for item in resp.json()['imdata']:
+            attributes = item['topSystem']['attributes']
+            address = attributes.get('oobMgmtAddr', '0.0.0.0')
+            if address in ('', '0.0.0.0'):
+                address = attributes.get('inbMgmtAddr', '0.0.0.0')
+            if address in ('', '0.0.0.0'):
+                continue
+            if self.add_member(scheme + address) is not None:
+                added.append(scheme + address)
+        return added
+
+    def _login_member(self, member, timeout=None):
+        resp = member.session.login(timeout)
+        if not resp.ok:
+            member.record_failure(time.time(), self.retry_interval, self.max_retry_interval)
+        return resp
+
+    def _member_relogin(self, session):
+        if session is self._subscription_member.session:
+            self.invoke_login_callbacks()
+
+    def login(self, timeout=None):
+        """
+        Initiate login to all of the APICs in the cluster.
+
+        :returns: Response class instance from the requests library of the first\
+        successful login. response.ok is True if at least one login is successful.
+        """
+        log.info('Initializing connection to the APIC cluster')
+        resp = None
+        for member in self._members:
+            member_resp = self._login_member(member, timeout)
+            if resp is None or (member_resp.ok and not resp.ok):
+                resp = member_resp
+        self._logged_in = resp.ok
+        if resp.ok and not self._write_member.session.logged_in():
+            self._failover_writes()
+        if resp.ok and not self._subscription_member.session.logged_in():
+            self._failover_subscriptions()
+        return resp
+
+    def logged_in(self):
+        """
+        Returns whether the session is logged in to any of the APICs
+
+        :return: True or False. True if at least one APIC is logged in.
+        """
+        return any(member.session.logged_in() for member in self._members)
+
+    def refresh_login(self, timeout=None):
+        """
+        Refresh the login to the APICs.  Each APIC is normally refreshed by
+        its own login thread.
+
+        :param timeout: Integer containing the number of seconds for connection timeout
+        :return: Instance of requests.Response from the APIC used for writes
+        """
+        for member in self._members:
+            if member is not self._write_member:
+                member.session.refresh_login(timeout)
+        return self._write_member.session.refresh_login(timeout)
+
+    def close(self):
+        """
+        Close the sessions to all of the APICs
+        """
+        for member in self._members:
+            member.session.login_thread.exit()
+            if member.session.session is not None:
+                member.session.close()
+        self._logged_in = False
+
+    def _get_read_members(self):
+        """
+        Get the APICs in the order that a read should try them.  The
+        available APICs with the lowest score come first, with ties spread
+        round robin.  The unavailable APICs are only tried last.
+        """
+        now = time.time()
+        with self._lock:
+            members = list(self._members)
+            start = self._next_member
+            self._next_member = (self._next_member + 1) % len(members)
+        order = {}
+        for index, member in enumerate(members):
+            order[member] = (not member.is_available(now), member.get_score(),
+                             (index - start) % len(members))
+        return sorted(members, key=lambda member: order[member])
+
+    def get(self, url, timeout=None):
+        """
+        Perform a REST GET call to one of the APICs, failing over to the
+        other APICs on a connection error, a timeout or a server error
+        such as the one returned while an APIC is restarting.
+
+        :param url: String containing the URL that will be used to\
+        send the object data to the APIC.
+        :returns: Response class instance from the requests library.\
+        response.ok is True if request is sent successfully.\
+        response.json() will return the JSON data sent back by the APIC.\
+        The server error of the last APIC is returned if all of the APICs fail.
+        """
+        error = None
+        error_resp = None
+        for member in self._get_read_members():
+            with self._lock:
+                member.inflight += 1
+            start = time.time()
+            try:
+                resp = member.session.get(url, timeout=timeout)
+            except (ConnectionError, requests.exceptions.Timeout) as e:
+                log.warning('GET to APIC %s failed. Trying next APIC...', member.url)
+                member.record_failure(time.time(), self.retry_interval, self.max_retry_interval)
+                error = e
+                continue
+            finally:
+                with self._lock:
+                    member.inflight -= 1
+            if resp.status_code >= 500:
+                log.warning('GET to APIC %s returned %s. Trying next APIC...', member.url, resp.status_code)
+                member.record_failure(time.time(), self.retry_interval, self.max_retry_interval)
+                error_resp = resp
+                continue
+            member.record_success(time.time() - start, self.latency_weight)
+            return resp
+        if error_resp is not None:
+            return error_resp
+        raise error
+
+    def _failover_writes(self):
+        """
+        Pin the writes to the next available APIC
+        """
+        now = time.time()
+        with self._lock:
+            members = list(self._members)
+        index = members.index(self._write_member)
+        for member in members[index + 1:] + members[:index]:
+            if member.is_available(now):
+                log.warning('Failing over writes from APIC %s to APIC %s',
+                            self._write_member.url, member.url)
+                old_member = self._write_member
+                self._write_member = member
+                self._pin_member(member)
+                self._unpin_member(old_member)
+                return True
+        return False
+
+    def push_to_apic(self, url, data, timeout=None):
+        """
+        Push the object data to the APIC used for writes, failing over to
+        another APIC on a connection error or timeout.
+
+        :param url: String containing the URL that will be used to\
+                    send the object data to the APIC.
+        :param data: Dictionary containing the JSON objects to be sent\
+                     to the APIC.
+        :returns: Response class instance from the requests library.\
+                  response.ok is True if request is sent successfully.
+        """
+        while True:
+            member = self._write_member
+            try:
+                return member.session.push_to_apic(url, data, timeout=timeout)
+            except (ConnectionError, requests.exceptions.Timeout):
+                member.record_failure(time.time(), self.retry_interval, self.max_retry_interval)
+                if not self._failover_writes():
+                    raise
+
+    def _failover_subscriptions(self):
+        """
+        Move the subscriptions to the next available APIC.  The events that
+        were not received from the previous APIC are lost so the login
+        callbacks are invoked as on a relogin.
+        """
+        now = time.time()
+        with self._lock:
+            members = list(self._members)
+        old_member = self._subscription_member
+        index = members.index(old_member)
+        for member in members[index + 1:] + members[:index]:
+            if member.is_available(now):
+                break
+        else:
+            return False
+        log.warning('Failing over subscriptions from APIC %s to APIC %s', old_member.url, member.url)
+        if self._subscription_enabled:
+            old_member.session.subscription_thread._clear_subscriptions()
+        self._subscription_member = member
+        self._pin_member(member, subscriptions=True)
+        self._unpin_member(old_member)
+        if len(self._subscription_urls):
+            self.resubscribe()
+            self.invoke_login_callbacks()
+        return True
+
+    def _get_subscription_member(self):
+        """
+        Get the APIC used for subscriptions, failing over to another APIC
+        if it is unavailable
+        """
+        if not self._subscription_member.is_available(time.time()):
+            self._failover_subscriptions()
+        return self._subscription_member
+
+    def subscribe(self, url, only_new=False):
+        """
+        Subscribe to events for a particular URL on the APIC used for subscriptions
+
+        :param url:  URL string to issue subscription
+        """
+        if url not in self._subscription_urls:
+            self._subscription_urls.append(url)
+        return self._get_subscription_member().session.subscribe(url, only_new=only_new)
+
+    def is_subscribed(self, url):
+        """
+        Check if subscribed to events for a particular URL.
+
+        :param url:  URL string to issue subscription
+        """
+        return self._get_subscription_member().session.is_subscribed(url)
+
+    def resubscribe(self):
+        """
+        Resubscribe to the current subscriptions on the APIC used for subscriptions.
+
+        :return: None
+        """
+        session = self._subscription_member.session
+        session.resubscribe()
+        for url in self._subscription_urls:
+            if not session.is_subscribed(url):
+                session.subscribe(url, only_new=True)
+
+    def has_events(self, url):
+        """
+        Check if there are events for a particular URL.
+
+        :param url:  URL string belonging to subscription
+        :returns: True or False. True if an event exists for this subscription.
+        """
+        return self._get_subscription_member().session.has_events(url)
+
+    def get_event_count(self, url):
+        """
+        Check the number of subscription events for a particular APIC URL
+
+        :param url:  URL string belonging to subscription
+        :returns: Interger number of events in event queue
+        """
+        return self._get_subscription_member().session.get_event_count(url)
+
+    def get_event(self, url):
+        """
+        Get an event for a particular URL.
+
+        :param url:  URL string belonging to subscription
+        :returns: Object belonging to the instance or class that the
+                  subscription was made.
+        """
+        return self._get_subscription_member().session.get_event(url)
+
+    def unsubscribe(self, url):
+        """
+        Unsubscribe from events for a particular URL.
+
+        :param url:  URL string to remove issue subscription
+        """
+        if url in self._subscription_urls:
+            self._subscription_urls.remove(url)
+        return self._subscription_member.session.unsubscribe(url)
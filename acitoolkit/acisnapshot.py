@@ -0,0 +1,209 @@
+################################################################################
+#                                  _    ____ ___                               #
+#                                 / \  / ___|_ _|                              #
+#                                / _ \| |    | |                               #
+#                               / ___ \ |___ | |                               #
+#                         _____/_/   \_\____|___|_ _                           #
+#                        |_   _|__   ___ | | | _(_) |_                         #
+#                          | |/ _ \ / _ \| | |/ / | __|                        #
+#                          | | (_) | (_) | |   <| | |_                         #
+#                          |_|\___/ \___/|_|_|\_\_|\__|                        #
+#                                                                              #
+################################################################################
+#                                                                              #
+# Copyright (c) 2015 Cisco Systems                                             #
+# All Rights Reserved.                                                         #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may   #
+#    not use this file except in compliance with the License. You may obtain   #
+#    a copy of the License at                                                  #
+#                                                                              #
+#         http://www.apache.org/licenses/LICENSE-2.0                           #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT #
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the  #
+#    License for the specific language governing permissions and limitations   #
+#    under the License.                                                        #
+#                                                                              #
+################################################################################
+"""
+ACI Toolkit module for building the toolkit object model from APIC
+configuration snapshots without querying the APIC.
+
+Snapshots can be APIC configuration export archives such as the ones taken
+by Snapback, directories of JSON files or individual JSON files containing
+either a REST response or an exported configuration.
+"""
+import logging
+import multiprocessing
+import os
+import tarfile
+
+from six import string_types
+
+from .acijson import get_codec
+from .aciphysobject import Fabric
+from .acitoolkit import Tenant, build_object_dictionary
+
+log = logging.getLogger(__name__)
+
+
+def _get_snapshot_data(data, name):
+    """
+    Decode a snapshot file
+
+    :param data: String or bytes containing the JSON file
+    :param name: String containing the name of the file
+    :returns: List of dictionaries containing the top level managed objects
+    """
+    try:
+        data = get_codec().loads(data)
+    except ValueError:
+        log.warning('Skipping %s which is not a JSON file', name)
+        return []
+    if isinstance(data, dict) and 'imdata' in data:
+        # REST response.  Skip timeouts and other errors
+        return [item for item in data['imdata'] if 'error' not in item]
+    if isinstance(data, dict):
+        # Exported configuration
+        return [data]
+    return data
+
+
+def iter_snapshot_objects(paths):
+    """
+    Read the top level managed objects of the snapshots one file at a time.
+    Archives are read as a stream without being extracted.
+
+    :param paths: String or list of strings containing the paths of the\
+                  export archives, directories or JSON files
+    :returns: Iterator of dictionaries containing the managed objects
+    """
+    if isinstance(paths, string_types):
+        paths = [paths]
+    for path in paths:
+        if os.path.isdir(path):
+            file_names = [os.path.join(path, file_name) for file_name in sorted(os.listdir(path))]
+            file_names = [file_name for file_name in file_names
+                          if os.path.isfile(file_name) and file_name.endswith(('.json', '.tar', '.tar.gz', '.tgz'))]
+            for obj in iter_snapshot_objects(file_names):
+                yield obj
+        elif tarfile.is_tarfile(path):
+            archive = tarfile.open(path, 'r|*')
+            try:
+                for member in archive:
+                    if member.isfile() and member.name.endswith('.json'):
+                        data = archive.extractfile(member).read()
+                        for obj in _get_snapshot_data(data, member.name):
+                            yield obj
+            finally:
+                archive.close()
+        else:
+            with open(path, 'rb') as snapshot_file:
+                data = snapshot_file.read()
+            for obj in _get_snapshot_data(data, path):
+                yield obj
+
+
+def _fill_dn(data, parent_dn):
+    """
+    Fill in the dn of the managed objects that only have a rn
+
+    :param data: Dictionary containing the managed object
+    :param parent_dn: String containing the dn of the parent
+    """
+    for contents in data.values():
+        attributes = contents.setdefault('attributes', {})
+        if not attributes.get('dn') and attributes.get('rn') and parent_dn:
+            attributes['dn'] = parent_dn + '/' + attributes['rn']
+        for child in contents.get('children', []):
+            _fill_dn(child, attributes.get('dn'))
+
+
+def iter_snapshot_tenants(paths):
+    """
+    Get the JSON of the Tenants in the snapshots.  A Tenant found in\
+    several snapshots is only returned the first time.
+
+    :param paths: String or list of strings containing the paths of the\
+                  export archives, directories or JSON files
+    :returns: Iterator of dictionaries containing the fvTenant JSON
+    """
+    names = set()
+    for obj in iter_snapshot_objects(paths):
+        if 'polUni' in obj:
+            candidates = obj['polUni'].get('children', [])
+        else:
+            candidates = [obj]
+        for candidate in candidates:
+            if 'fvTenant' not in candidate:
+                continue
+            attributes = candidate['fvTenant'].setdefault('attributes', {})
+            name = attributes.get('name')
+            if name is None or name in names:
+                continue
+            names.add(name)
+            if not attributes.get('dn'):
+                attributes['dn'] = 'uni/tn-%s' % name
+            _fill_dn(candidate, None)
+            yield candidate
+
+
+def _build_tenant(tenant_json):
+    """
+    Build the Tenant and all of its children from its JSON.  Relations are\
+    resolved once all of the Tenants are built.
+
+    :param tenant_json: Dictionary containing the fvTenant JSON
+    :returns: Tenant instance
+    """
+    return super(Tenant, Tenant).get_deep(full_data=[tenant_json], working_data=[tenant_json])
+
+
+def load_snapshot(paths, parent=None, workers=None):
+    """
+    Get the Tenant objects and all of the children objects from snapshots\
+    instead of from the APIC as Tenant.get_deep does.  The Tenants are built\
+    in worker processes while the snapshots are being read.
+
+    :param paths: String or list of strings containing the paths of the\
+                  export archives, directories or JSON files
+    :param parent: The parent instance to assign to the tenant objects.\
+                   If None, a Fabric instance will be created.
+    :param workers: Integer containing the number of worker processes.\
+                    Defaults to the number of CPUs.  The Tenants are built\
+                    in this process if 1.
+    :returns: List of Tenant objects
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    full_data = []
+
+    def read_tenants():
+        for tenant_json in iter_snapshot_tenants(paths):
+            full_data.append(tenant_json)
+            yield tenant_json
+
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            tenants = list(pool.imap(_build_tenant, read_tenants()))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        tenants = [_build_tenant(tenant_json) for tenant_json in read_tenants()]
+
+    if parent is None:
+        parent = Fabric()
+    tenants = [tenant for tenant in tenants if tenant is not None]
+    for tenant in tenants:
+        tenant.set_parent(parent)
+        parent.add_child(tenant)
+    obj_dict = build_object_dictionary(tenants)
+    for tenant in tenants:
+        tenant._extract_relationships(full_data, obj_dict)
+    for tenant in tenants:
+        tenant.mark_clean()
+    return tenants
@@ -42,9 +42,11 @@ from operator import attrgetter, itemgetter
 import re
 import sys
 import copy
+import threading
 
 from requests.compat import urlencode
 from requests.exceptions import ConnectionError
+from six.moves.queue import Empty, Full, Queue
 
 from .acibaseobject import BaseACIObject, BaseInterface, _Tag
 from .aciphysobject import Interface, Fabric
@@ -100,12 +102,18 @@ class Tenant(BaseACIObject):
     def _get_name_dn_delimiters():
         return ['/tn-', '/']
 
-    def get_json(self):
+    def get_json(self, changed_only=False):
         """
         Returns json representation of the fvTenant object
 
-        :returns: A json dictionary of fvTenant
+        :param changed_only: True to only include the objects that were\
+                             added, modified or deleted since the Tenant was\
+                             loaded or marked clean, along with their ancestors.
+        :returns: A json dictionary of fvTenant or None if changed_only is\
+                  True and nothing has changed
         """
+        if changed_only:
+            return self._get_changed_json()
         attr = self._generate_attributes()
         return super(Tenant, self).get_json(self._get_apic_classes()[0],
                                             attributes=attr)
@@ -213,6 +221,8 @@ class Tenant(BaseACIObject):
         obj_dict = build_object_dictionary(objs)
         for obj in objs:
             obj._extract_relationships(full_data, obj_dict)
+        for obj in objs:
+            obj.mark_clean()
         return resp
 
     @classmethod
@@ -232,6 +242,18 @@ class Tenant(BaseACIObject):
                     parent.add_child(tenant)
         return tenants
 
+    def _fetch_children(self, session, include_concrete=False):
+        """
+        Fetch the whole subtree of a lazily loaded Tenant in a single query
+
+        :param session: the instance of Session used for APIC communication
+        :param include_concrete: Unused
+        """
+        for tenant in Tenant.get_deep(session, names=[self.name]):
+            for child in list(tenant.get_children()):
+                child.set_parent(self)
+                self.add_child(child)
+
     @classmethod
     def exists(cls, session, tenant):
         """
@@ -805,6 +827,7 @@ class AttributeCriterion(BaseACIObject):
         """
         if ip_addr not in self._ip_addresses:
             self._ip_addresses.append(ip_addr)
+            self.mark_dirty()
 
     def get_ip_addresses(self):
         """
@@ -1331,6 +1354,7 @@ class EPG(CommonEPG):
             }
         }
         self._leaf_bindings.append(text)
+        self.mark_dirty()
 
     @staticmethod
     def get_from_json(self, data, parent=None):
@@ -5306,7 +5330,24 @@ class Endpoint(BaseACIObject):
         return obj
 
     @classmethod
-    def get_event(cls, session, with_relations=True):
+    def get_event(cls, session, with_relations=True, cache=None):
+        """
+        Gets the next Endpoint event
+
+        :param session: Session instance used to communicate with the APIC
+        :param with_relations: Boolean indicating whether the interface and\
+                               secondary IP information should be filled in
+        :param cache: Optional EndpointEnrichmentCache used to fill in the\
+                      interface information locally rather than querying\
+                      the APIC for every event.  Events for endpoints that\
+                      are not in the cache are returned once they have\
+                      been looked up on the APIC.
+        :returns: Endpoint instance or None if there are no events
+        """
+        if cache is not None:
+            resolved = cache.get_resolved()
+            if resolved is not None:
+                return resolved
         urls = cls._get_subscription_urls()
         for url in urls:
             if not session.has_events(url):
@@ -5320,7 +5361,10 @@ class Endpoint(BaseACIObject):
                 status = str(attributes.get('status'))
             if 'dn' in attributes:
                 dn = str(attributes.get('dn'))
-            parent = cls._get_parent_from_dn(cls._get_parent_dn(dn))
+            if cache is not None:
+                parent = cache.get_parent(cls._get_parent_dn(dn))
+            else:
+                parent = cls._get_parent_from_dn(cls._get_parent_dn(dn))
             if status == 'created' and 'mac' in attributes:
                 name = str(attributes.get('mac'))
             else:
@@ -5334,6 +5378,12 @@ class Endpoint(BaseACIObject):
             try:
                 if status == 'deleted':
                     obj.mark_as_deleted()
+                    if cache is not None:
+                        cache.remove_endpoint(dn)
+                elif with_relations and cache is not None:
+                    if not cache.resolve(obj, dn, attributes):
+                        # Returned later by cache.get_resolved()
+                        continue
                 elif with_relations:
                     objs = cls.get(session, name)
                     if len(objs):
@@ -5541,6 +5591,270 @@ class Endpoint(BaseACIObject):
         return results
 
 
+class EndpointEnrichmentCache(object):
+    """
+    Cache of the information needed to fill in the interface and secondary
+    IP addresses of Endpoint events without querying the APIC for each
+    event.  It holds the fabricPathEp interface names, the interface
+    relations and IP addresses of the endpoints and the endpoint attributes.
+    The cache is loaded once and then kept up to date with subscriptions.
+
+    Endpoints that can not be resolved from the cache are looked up by a
+    background thread through a bounded queue and are only returned, once
+    resolved, by later calls to Endpoint.get_event.
+    """
+    PATH_CLASSES = ('fvRsCEpToPathEp', 'fvRsStCEpToPathEp')
+    PATH_DN_REGEX = re.compile(r'^(.+)/rs(?:st)?[cC]EpToPathEp-\[(.+)\]$')
+
+    def __init__(self, session, max_pending=100):
+        """
+        :param session: Session instance used to communicate with the APIC
+        :param max_pending: Maximum number of endpoints waiting to be looked up\
+                            on the APIC.  Further misses are dropped.
+        """
+        self._session = session
+        self._interfaces = {}
+        self._if_names = {}
+        self._paths = {}
+        self._ips = {}
+        self._endpoints = {}
+        self._parents = {}
+        self._pending = set()
+        self._lookups = Queue(maxsize=max_pending)
+        self._resolved = Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    @staticmethod
+    def _get_urls():
+        urls = []
+        for class_name in ('fabricPathEp',) + EndpointEnrichmentCache.PATH_CLASSES + ('fvIp',):
+            urls.append('/api/class/%s.json?subscription=yes' % class_name)
+        return urls
+
+    def subscribe(self):
+        """
+        Subscribe to the changes of the cached classes.  This should be
+        called before load() so that no change is missed.  The endpoint
+        attributes themselves are updated from the events passed to
+        Endpoint.get_event.
+        """
+        for url in self._get_urls():
+            self._session.subscribe(url, only_new=True)
+
+    def load(self):
+        """
+        Load the cache from the APIC.  This is done with one class query per
+        cached class.
+        """
+        for class_name in ('fabricPathEp',) + self.PATH_CLASSES + ('fvIp',) + \
+                tuple(Endpoint._get_apic_classes()):
+            ret = self._session.get('/api/node/class/%s.json?query-target=self' % class_name)
+            for item in ret.json()['imdata']:
+                self._apply(item)
+
+    def update(self):
+        """
+        Apply the pending subscription events to the cache
+        """
+        for url in self._get_urls():
+            if not self._session.is_subscribed(url):
+                continue
+            while self._session.has_events(url):
+                event = self._session.get_event(url)
+                for item in event['imdata']:
+                    self._apply(item)
+
+    def _apply(self, item):
+        """
+        Apply the attributes of an APIC object to the cache
+        """
+        for class_name in item:
+            attributes = item[class_name]['attributes']
+            dn = str(attributes.get('dn'))
+            deleted = attributes.get('status') == 'deleted'
+            if class_name == 'fabricPathEp':
+                if deleted:
+                    self._interfaces.pop(dn, None)
+                else:
+                    interface = self._interfaces.setdefault(dn, {})
+                    interface.update(attributes)
+                self._if_names.pop(dn, None)
+            elif class_name in self.PATH_CLASSES:
+                match = self.PATH_DN_REGEX.match(dn)
+                if match is None:
+                    continue
+                ep_dn = match.group(1)
+                tdn = str(attributes.get('tDn', match.group(2)))
+                if deleted:
+                    if tdn in self._paths.get(ep_dn, []):
+                        self._paths[ep_dn].remove(tdn)
+                elif tdn not in self._paths.setdefault(ep_dn, []):
+                    self._paths[ep_dn].append(tdn)
+            elif class_name == 'fvIp':
+                ep_dn = dn.split('/ip-[')[0]
+                addr = str(attributes.get('addr', dn.split('/ip-[')[-1][:-1]))
+                if deleted:
+                    if addr in self._ips.get(ep_dn, []):
+                        self._ips[ep_dn].remove(addr)
+                elif addr not in self._ips.setdefault(ep_dn, []):
+                    self._ips[ep_dn].append(addr)
+            else:
+                if deleted:
+                    self.remove_endpoint(dn)
+                else:
+                    self._endpoints.setdefault(dn, {}).update(attributes)
+
+    def remove_endpoint(self, dn):
+        """
+        Forget a deleted endpoint
+
+        :param dn: String containing the endpoint distinguished name
+        """
+        self._endpoints.pop(dn, None)
+        self._paths.pop(dn, None)
+        self._ips.pop(dn, None)
+
+    def get_parent(self, parent_dn):
+        """
+        Get the EPG of an endpoint.  The tenant, application profile and EPG
+        names are cached per EPG distinguished name.
+
+        :param parent_dn: String containing the EPG distinguished name
+        :returns: EPG instance
+        """
+        names = self._parents.get(parent_dn)
+        if names is None:
+            epg = Endpoint._get_parent_from_dn(parent_dn)
+            names = (epg.get_parent().get_parent().name, epg.get_parent().name, epg.name)
+            self._parents[parent_dn] = names
+        return EPG(names[2], AppProfile(names[1], Tenant(names[0])))
+
+    def _get_if_name(self, tdn):
+        """
+        Get the interface name of a fabricPathEp distinguished name
+        """
+        if_name = self._if_names.get(tdn)
+        if if_name is None:
+            interface = self._interfaces.get(tdn)
+            if interface is None:
+                return tdn
+            if str(interface.get('lagT')) == 'not-aggregated':
+                if_name = _interface_from_dn(tdn).if_name
+            else:
+                if_name = str(interface.get('name'))
+            self._if_names[tdn] = if_name
+        return if_name
+
+    def enrich(self, endpoint, dn):
+        """
+        Fill in the interface and secondary IP information of an Endpoint
+        from the cache
+
+        :param endpoint: Endpoint instance
+        :param dn: String containing the endpoint distinguished name
+        :returns: True if the interface information was found in the cache
+        """
+        self.update()
+        paths = self._paths.get(dn)
+        if not paths:
+            return False
+        for tdn in paths:
+            endpoint.if_name = self._get_if_name(tdn)
+            interface = self._interfaces.get(tdn)
+            if interface is not None and str(interface.get('lagT')) != 'not-aggregated':
+                endpoint.if_dn.append(tdn)
+        for addr in self._ips.get(dn, []):
+            if addr != endpoint.ip:
+                endpoint.secondary_ip.append(addr)
+        return True
+
+    def resolve(self, endpoint, dn, attributes):
+        """
+        Complete an Endpoint created from an event.  The event attributes
+        are merged with the cached attributes of the endpoint and the
+        interface information is filled in from the cache.  If it is not
+        in the cache, the endpoint is queued to be looked up on the APIC
+        and the looked up Endpoint is returned by get_resolved().
+
+        :param endpoint: Endpoint instance created from the event
+        :param dn: String containing the endpoint distinguished name
+        :param attributes: Dictionary of the event attributes
+        :returns: True if the endpoint was resolved from the cache.  False if\
+                  the endpoint was queued to be looked up, in which case\
+                  the endpoint instance should be discarded.
+        """
+        merged = self._endpoints.setdefault(dn, {})
+        merged.update(attributes)
+        if 'mac' in merged and 'lcC' in merged:
+            endpoint._populate_from_attributes(merged)
+        if 'modTs' in merged:
+            endpoint.timestamp = str(merged.get('modTs'))
+        if self.enrich(endpoint, dn):
+            return True
+        # Keep what the event holds when the lookup is dropped
+        return not self.lookup(endpoint.name)
+
+    def lookup(self, name):
+        """
+        Queue an endpoint to be looked up on the APIC in the background
+
+        :param name: String containing the endpoint name
+        :returns: True if the endpoint was queued
+        """
+        with self._lock:
+            if name in self._pending:
+                return True
+            try:
+                self._lookups.put_nowait(name)
+            except Full:
+                log.warning('Endpoint lookup queue is full. Dropping lookup of %s', name)
+                return False
+            self._pending.add(name)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._lookup_worker)
+                self._worker.daemon = True
+                self._worker.start()
+        return True
+
+    def _lookup_worker(self):
+        while True:
+            name = self._lookups.get()
+            try:
+                for endpoint in Endpoint.get(self._session, name):
+                    self._resolved.put(endpoint)
+            except Exception as e:
+                log.error('Could not look up endpoint %s: %s', name, e)
+            with self._lock:
+                self._pending.discard(name)
+            self._lookups.task_done()
+
+    def has_resolved(self):
+        """
+        Check if there are endpoints that were looked up in the background
+
+        :returns: True or False
+        """
+        return not self._resolved.empty()
+
+    def get_resolved(self):
+        """
+        Get an endpoint that was looked up on the APIC in the background
+
+        :returns: Endpoint instance or None
+        """
+        try:
+            return self._resolved.get_nowait()
+        except Empty:
+            return None
+
+    def wait_for_lookups(self):
+        """
+        Block until all of the queued lookups are done
+        """
+        self._lookups.join()
+
+
 class IPEndpoint(BaseACIObject):
     """
     Endpoint class
@@ -1325,6 +1325,9 @@ class SearchDb(object):
         self._implied_contract_guid = 0
         self.epg_contract = {}
         self.contract_filter = {}
+        self.contract_protocol_filter = {}
+        self._tenant_match_cache = {}
+        self._context_match_cache = {}
         self.session = session
         self.context_radix = {}
         self.tenants_by_name = {}
@@ -1366,6 +1369,8 @@ class SearchDb(object):
             contracts = tenant.get_children(Contract)
 
             self.build_contract_filter(contracts)
+        self._tenant_match_cache = {}
+        self._context_match_cache = {}
         self.initialized = True
 
     def build_ip_epg(self, epgs):
@@ -1549,6 +1554,9 @@ class SearchDb(object):
                         for filter_entry in filter_entries:
                             filter_entry.direction = filter_direction
                             self.contract_filter[(tenant, contract)].add(filter_entry)
+            # Convert the filter entries once rather than on every search
+            self.contract_protocol_filter[(tenant, contract)] = [ProtocolFilter(filter_entry) for filter_entry in
+                                                                 self.contract_filter[(tenant, contract)]]
 
     def show_contract_filter(self):
         for (tenant, contract) in self.contract_filter:
@@ -1584,40 +1592,43 @@ class SearchDb(object):
         consumed_contracts = self.find_contracts(flow_spec.get_source(), 'consume')
         provided_contracts = self.find_contracts(flow_spec.get_dest(), 'provide')
         connections = []
+        # index the provided contracts by contract so that each consumed contract
+        # is only compared with the provided contracts of the same contract
+        provided_by_contract = {}
+        for p_contract in provided_contracts:
+            provided_by_contract.setdefault(p_contract['contract'], []).append(p_contract)
         for c_contract in consumed_contracts:
-            for p_contract in provided_contracts:
-                if c_contract['contract'] == p_contract['contract']:
-                    if c_contract['epg'] == p_contract['epg']:
-                        try:
-                            if c_contract['contract'][1].implied:
-                                connections.append({'source': c_contract['prefix'],
-                                                    'source_epg': c_contract['epg'],
-                                                    'source_tenant': c_contract['tenant'],
-                                                    'dest': p_contract['prefix'],
-                                                    'dest_epg': p_contract['epg'],
-                                                    'dest_tenant': p_contract['tenant'],
-                                                    'contract': c_contract['contract']})
-                        except AttributeError:
-                            pass
-                    else:
-                        connections.append({'source': c_contract['prefix'],
-                                            'source_epg': c_contract['epg'],
-                                            'source_tenant': c_contract['tenant'],
-                                            'dest': p_contract['prefix'],
-                                            'dest_epg': p_contract['epg'],
-                                            'dest_tenant': p_contract['tenant'],
-                                            'contract': c_contract['contract']})
+            for p_contract in provided_by_contract.get(c_contract['contract'], []):
+                if c_contract['epg'] == p_contract['epg']:
+                    try:
+                        if c_contract['contract'][1].implied:
+                            connections.append({'source': c_contract['prefix'],
+                                                'source_epg': c_contract['epg'],
+                                                'source_tenant': c_contract['tenant'],
+                                                'dest': p_contract['prefix'],
+                                                'dest_epg': p_contract['epg'],
+                                                'dest_tenant': p_contract['tenant'],
+                                                'contract': c_contract['contract']})
+                    except AttributeError:
+                        pass
+                else:
+                    connections.append({'source': c_contract['prefix'],
+                                        'source_epg': c_contract['epg'],
+                                        'source_tenant': c_contract['tenant'],
+                                        'dest': p_contract['prefix'],
+                                        'dest_epg': p_contract['epg'],
+                                        'dest_tenant': p_contract['tenant'],
+                                        'contract': c_contract['contract']})
 
         # t2 = datetime.datetime.now()
         # print('connections done', t2-t1)
         # t1=t2
         for connection in connections:
             if connection['source_tenant'] in self.valid_tenants or connection['dest_tenant'] in self.valid_tenants:
-                filters = self.contract_filter[connection['contract']]
+                filters = self.contract_protocol_filter[connection['contract']]
                 matching_filters = []
-                for aci_filter in filters:
+                for aci_protocol_filter in filters:
                     for fs_p_filter in flow_spec.protocol_filter:
-                        aci_protocol_filter = ProtocolFilter(aci_filter)
                         overlap_filter = fs_p_filter.overlap(aci_protocol_filter)
                         if overlap_filter is not None:
                             matching_filters.append(aci_protocol_filter)
@@ -1679,6 +1690,49 @@ class SearchDb(object):
 
         return result
 
+    def _match_tenants(self, tenant_name):
+        """
+        Will return the names of the tenants that match the tenant name, which
+        may contain '*' wildcards.  The result is cached until the db is rebuilt.
+        :param tenant_name:
+        :return: set of tenant names
+        """
+        if tenant_name not in self._tenant_match_cache:
+            tenant_search = re.compile('^' + tenant_name.replace('*', '.*') + '$')
+            valid_tenants = set()
+            for name in self.tenants_by_name:
+                if tenant_search.match(name) is not None:
+                    valid_tenants.add(name)
+            self._tenant_match_cache[tenant_name] = valid_tenants
+        return set(self._tenant_match_cache[tenant_name])
+
+    def _match_contexts(self, tenant_name, context_name):
+        """
+        Will return the contexts that match the tenant and context names, which
+        may contain '*' wildcards, plus all of the contexts in tenant common.
+        The result is cached until the db is rebuilt.
+        :param tenant_name:
+        :param context_name:
+        :return: set of contexts
+        """
+        if (tenant_name, context_name) not in self._context_match_cache:
+            # if 'common' not in tenants:
+            tenants = self._match_tenants(tenant_name) | {'common'}
+            contexts = set()
+            context_search = re.compile('^' + context_name.replace('*', '.*') + '$')
+            for (context_tenant_name, name) in self.context_by_name:
+                if context_tenant_name in tenants:
+                    match_result = context_search.match(name)
+                    context = self.context_by_name[(context_tenant_name, name)]
+                    # if context not in contexts:
+                    # todo: redundant entries are created
+                    if match_result is not None:
+                        contexts.add(context)
+                    if context_tenant_name == 'common':
+                        contexts.add(context)
+            self._context_match_cache[(tenant_name, context_name)] = contexts
+        return self._context_match_cache[(tenant_name, context_name)]
+
     def find_contracts(self, subflow_spec, pro_con):
         """
         This will find all the contracts that are either provided or consumed by the
@@ -1688,31 +1742,13 @@ class SearchDb(object):
         :return:
         """
         # t1 = datetime.datetime.now()
-        self.valid_tenants = set()
-        tenant_search = '^' + subflow_spec.tenant_name.replace('*', '.*') + '$'
-        for tenant_name in self.tenants_by_name:
-            match_result = re.match(tenant_search, tenant_name)
-            if match_result is not None:
-                self.valid_tenants.add(tenant_name)
+        self.valid_tenants = self._match_tenants(subflow_spec.tenant_name)
 
         # t2 = datetime.datetime.now()
         # print('tenants done', t2-t1)
         # t1=t2
 
-        # if 'common' not in tenants:
-        tenants = self.valid_tenants | {'common'}
-        contexts = set()
-        context_search = '^' + subflow_spec.context_name.replace('*', '.*') + '$'
-        for (tenant_name, context_name) in self.context_by_name:
-            if tenant_name in tenants:
-                match_result = re.match(context_search, context_name)
-                context = self.context_by_name[(tenant_name, context_name)]
-                # if context not in contexts:
-                # todo: redundant entries are created
-                if match_result is not None:
-                    contexts.add(context)
-                if tenant_name == 'common':
-                    contexts.add(context)
+        contexts = self._match_contexts(subflow_spec.tenant_name, subflow_spec.context_name)
 
         epgs_prefix = {}
         nodes = set()
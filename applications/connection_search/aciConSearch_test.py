@@ -1798,6 +1798,38 @@ class TestWildcardFields(unittest.TestCase):
         self.assertEqual(result[0].tenant_name, 'tenant')
         self.assertEqual(result[19].tenant_name, 'tenant2')
 
+    def test_repeated_search(self):
+        flow_spec = FlowSpec()
+        flow_spec.context_name = 'ctx'
+        filt = ProtocolFilter()
+        flow_spec.protocol_filter.append(filt)
+        filt.prot = 'tcp'
+        flow_spec.sip = '0/0'
+        flow_spec.dip = '0/0'
+
+        flow_spec.tenant_name = 'tenant2'
+        self.assertEqual(len(self.sdb.search(flow_spec)), 6)
+        flow_spec.tenant_name = 'tenant*'
+        self.assertEqual(len(self.sdb.search(flow_spec)), 20)
+        flow_spec.tenant_name = 'tenant2'
+        self.assertEqual(len(self.sdb.search(flow_spec)), 6)
+        self.assertEqual(self.sdb.valid_tenants, set(['tenant2']))
+
+        # the cached tenant matches are dropped when the db is rebuilt
+        sdb = SearchDb()
+        sdb.build(get_tree())
+        flow_spec.tenant_name = 'tenant*'
+        self.assertEqual(sorted(sdb._match_tenants(flow_spec.tenant_name)), ['tenant'])
+        sdb.build(get_tree2())
+        self.assertEqual(sorted(sdb._match_tenants(flow_spec.tenant_name)), ['tenant', 'tenant2'])
+
+    def test_precompiled_filters(self):
+        for contract in self.sdb.contract_filter:
+            protocol_filters = self.sdb.contract_protocol_filter[contract]
+            self.assertEqual(len(protocol_filters), len(self.sdb.contract_filter[contract]))
+            for protocol_filter in protocol_filters:
+                self.assertTrue(isinstance(protocol_filter, ProtocolFilter))
+
     def test_any_context(self):
         flow_spec = FlowSpec()
         flow_spec.tenant_name = 'tenant2'
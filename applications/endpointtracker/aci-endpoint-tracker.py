@@ -43,6 +43,7 @@ import os
 import logging
 import time
 from daemon import Daemon
+from endpointdb import EndpointWriter, EndpointState
 
 try:
     import mysql.connector as mysql
@@ -88,19 +89,6 @@ def connect_mysql(args):
         c.execute('CREATE DATABASE IF NOT EXISTS endpointtracker;')
         cnx.commit()
     c.execute('USE endpointtracker;')
-    with warnings.catch_warnings():
-        warnings.filterwarnings('ignore')
-        c.execute('''CREATE TABLE IF NOT EXISTS endpoints (
-                         mac       CHAR(18) NOT NULL,
-                         ip        CHAR(16),
-                         tenant    CHAR(100) NOT NULL,
-                         app       CHAR(100) NOT NULL,
-                         epg       CHAR(100) NOT NULL,
-                         interface CHAR(100) NOT NULL,
-                         timestart TIMESTAMP NOT NULL,
-                         timestop  TIMESTAMP NULL);''')
-        cnx.commit()
-
     return c, cnx
 
 
@@ -118,6 +106,15 @@ def tracker(args):
         sys.exit(0)
 
     c, cnx = connect_mysql(args)
+    writer = EndpointWriter(cnx, mysql.paramstyle, connect=lambda: connect_mysql(args)[1])
+    writer.create_table()
+    state = EndpointState(writer)
+    state.load()
+
+    # Cache the interface information so that events can be resolved locally
+    cache = aci.EndpointEnrichmentCache(session)
+    cache.subscribe()
+    cache.load()
 
     # Download all of the Endpoints and store in the database
     endpoints = aci.Endpoint.get(session)
@@ -145,71 +142,47 @@ def tracker(args):
                 logging.info(e)
             continue
 
-        ep_exists = c.execute("""SELECT * FROM endpoints
-                                 WHERE mac="%s"
-                                 AND
-                                 timestop is null;""" % ep.mac)
-        c.fetchall()
-        if not ep_exists:
-            c.execute("""INSERT INTO endpoints (mac, ip, tenant,
-                         app, epg, interface, timestart)
-                         VALUES ('%s', '%s', '%s', '%s',
-                         '%s', '%s', '%s')""" % data)
-            cnx.commit()
+        state.update(*data)
+    writer.flush()
 
     # Subscribe to live updates and update the database
     sys.stdout.write("Starting subscribe to apic events")
     aci.Endpoint.subscribe(session)
     while True:
-        if aci.Endpoint.has_events(session):
-            ep = aci.Endpoint.get_event(session)
-            try:
-                epg = ep.get_parent()
-                app_profile = epg.get_parent()
-                tenant = app_profile.get_parent()
-            except AttributeError:
-                continue
+        if not aci.Endpoint.has_events(session) and not cache.has_resolved():
+            if writer.is_due():
+                writer.flush()
+            # Sleep or else the endpointtracker will take 100% cpu
+            time.sleep(0.1)
+            continue
+        ep = aci.Endpoint.get_event(session, cache=cache)
+        try:
+            epg = ep.get_parent()
+            app_profile = epg.get_parent()
+            tenant = app_profile.get_parent()
+        except AttributeError:
+            continue
 
-            if ep.is_deleted():
-                ep.if_name = None
-                data = (convert_timestamp_to_mysql(ep.timestamp),
-                        ep.mac,
-                        tenant.name)
-                update_cmd = """UPDATE endpoints SET timestop='%s',
-                                timestart=timestart
-                                WHERE mac='%s' AND tenant='%s' AND
-                                timestop is null""" % data
-                c.execute(update_cmd)
+        if ep.is_deleted():
+            ep.if_name = None
+            state.delete(ep.mac, tenant.name,
+                         convert_timestamp_to_mysql(ep.timestamp))
+        else:
+            if ep.if_dn:
+                for dn in ep.if_dn:
+                    match = re.match('protpaths-(\d+)-(\d+)', dn.split('/')[2])
+                    if match:
+                        if match.group(1) and match.group(2):
+                            int_name = "Nodes: " + match.group(1) + "-" + match.group(2) + " " + ep.if_name
+                            pass
             else:
-                if ep.if_dn:
-                    for dn in ep.if_dn:
-                        match = re.match('protpaths-(\d+)-(\d+)', dn.split('/')[2])
-                        if match:
-                            if match.group(1) and match.group(2):
-                                int_name = "Nodes: " + match.group(1) + "-" + match.group(2) + " " + ep.if_name
-                                pass
-                else:
-                    int_name = ep.if_name
+                int_name = ep.if_name
 
-                data = (ep.mac, ep.ip, tenant.name, app_profile.name, epg.name,
-                        int_name, convert_timestamp_to_mysql(ep.timestamp))
-                insert_data = "'%s', '%s', '%s', '%s', '%s', '%s', '%s'" % data
-                query_data = ("mac='%s', ip='%s', tenant='%s', "
-                              "app='%s', epg='%s', interface='%s', "
-                              "timestart='%s'" % data).replace(',', ' AND')
-                select_cmd = """SELECT COUNT(*) FROM endpoints
-                                WHERE %s""" % query_data
-                c.execute(select_cmd)
-                for count in c:
-                    if not count[0]:
-                        insert_cmd = """INSERT INTO endpoints (mac, ip,
-                                        tenant, app, epg, interface,
-                                        timestart)
-                                        VALUES (%s)""" % insert_data
-                        c.execute(insert_cmd)
-            cnx.commit()
-        # Sleep or else the endpointtracker will take 100% cpu
-        time.sleep(0.1)
+            data = (ep.mac, ep.ip, tenant.name, app_profile.name, epg.name,
+                    int_name, convert_timestamp_to_mysql(ep.timestamp))
+            state.update(*data)
+        if writer.is_due():
+            writer.flush()
 
 
 class Daemonize(Daemon):
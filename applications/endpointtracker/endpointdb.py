@@ -0,0 +1,351 @@
+################################################################################
+#                                 _    ____ ___                                #
+#                                / \  / ___|_ _|                               #
+#                               / _ \| |    | |                                #
+#                  _____       / ___ \ |___ | |  _       _                     #
+#                 | ____|_ __ /_/_| \_\____|___|(_)_ __ | |_                   #
+#                 |  _| | '_ \ / _` | '_ \ / _ \| | '_ \| __|                  #
+#                 | |___| | | | (_| | |_) | (_) | | | | | |_                   #
+#                 |_____|_|_|_|\__,_| .__/ \___/|_|_| |_|\__|                  #
+#                     |_   _| __ __ |_|___| | _____ _ __                       #
+#                       | || '__/ _` |/ __| |/ / _ \ '__|                      #
+#                       | || | | (_| | (__|   <  __/ |                         #
+#                       |_||_|  \__,_|\___|_|\_\___|_|                         #
+#                                                                              #
+################################################################################
+#                                                                              #
+# Copyright (c) 2015 Cisco Systems                                             #
+# All Rights Reserved.                                                         #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may   #
+#    not use this file except in compliance with the License. You may obtain   #
+#    a copy of the License at                                                  #
+#                                                                              #
+#         http://www.apache.org/licenses/LICENSE-2.0                           #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT #
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the  #
+#    License for the specific language governing permissions and limitations   #
+#    under the License.                                                        #
+#                                                                              #
+################################################################################
+"""
+Database writer and open endpoint state for the Endpoint Tracker.
+
+Endpoint records are buffered in memory and written to the database in
+batches using parameterized statements.  Any DB-API connection can be used,
+such as MySQL in production or SQLite when testing.
+"""
+import logging
+import time
+import warnings
+
+# Interface stored for the endpoints that have no interface.  The interface
+# column is not nullable and this is the value that was always stored.
+NO_INTERFACE = 'None'
+
+# DB-API exceptions raised for the data of a record.  Any other error, such
+# as a lost connection, is not caused by the records and they are retried.
+DATA_ERRORS = ('IntegrityError', 'DataError')
+
+# Maximum number of seconds between the retries of a failed write
+MAX_RETRY_DELAY = 60
+
+
+def is_data_error(error):
+    """
+    Check whether a database error was caused by the data of the record.
+    The DB-API exception names are used so that any database module works.
+
+    :param error: Exception raised by the database module
+    :return: True if the record itself was rejected by the database
+    """
+    return any(cls.__name__ in DATA_ERRORS for cls in type(error).__mro__)
+
+
+class EndpointWriter(object):
+    """
+    Buffers the endpoint record inserts and updates and writes them to the
+    database with executemany once either the number of buffered records or
+    the time since the oldest buffered record reaches its threshold.
+    Records that the database rejects are dropped from the buffer and kept
+    in the rejected list so that they do not block the following records.
+    When the write fails for another reason, such as a lost connection, the
+    records stay buffered and the write is retried with an increasing delay
+    after reconnecting.
+    """
+    def __init__(self, cnx, paramstyle='format', max_records=500, max_delay=1.0, connect=None):
+        """
+        :param cnx: DB-API connection to the database
+        :param paramstyle: string containing the paramstyle of the database
+                           module. Only 'qmark' and 'format' style
+                           placeholders are used. Default is 'format'.
+        :param max_records: integer containing the number of buffered
+                            records that triggers a flush. Default is 500.
+        :param max_delay: float containing the number of seconds that a
+                          record can stay buffered. Default is 1.0.
+        :param connect: optional function returning a new DB-API connection
+                        used to reconnect after a failed write
+        """
+        self._cnx = cnx
+        self._cursor = cnx.cursor()
+        self._connect = connect
+        if paramstyle == 'qmark':
+            placeholder = '?'
+        else:
+            placeholder = '%s'
+        self._insert_cmd = ('INSERT INTO endpoints (mac, ip, tenant, app, epg, '
+                            'interface, timestart) VALUES (%s)' % ', '.join([placeholder] * 7))
+        self._close_cmd = ('UPDATE endpoints SET timestop={0}, timestart=timestart '
+                           'WHERE mac={0} AND tenant={0} AND timestop is null'.format(placeholder))
+        self._open_records_cmd = ('SELECT mac, tenant, ip, app, epg, interface, timestart '
+                                  'FROM endpoints WHERE timestop is null')
+        self.max_records = max_records
+        self.max_delay = max_delay
+        self._pending = []
+        self._oldest = None
+        self._failures = 0
+        self._retry_time = 0
+        self.rejected = []
+
+    def create_table(self):
+        """
+        Create the endpoints table and its indexes if they do not exist
+        """
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore')
+            self._cursor.execute('''CREATE TABLE IF NOT EXISTS endpoints (
+                                    mac       CHAR(18) NOT NULL,
+                                    ip        CHAR(16),
+                                    tenant    CHAR(100) NOT NULL,
+                                    app       CHAR(100) NOT NULL,
+                                    epg       CHAR(100) NOT NULL,
+                                    interface CHAR(100) NOT NULL,
+                                    timestart TIMESTAMP NOT NULL,
+                                    timestop  TIMESTAMP NULL);''')
+            self._cnx.commit()
+        try:
+            self._cursor.execute('CREATE INDEX endpoints_mac_timestop '
+                                 'ON endpoints (mac, timestop)')
+            self._cnx.commit()
+        except Exception:
+            # Index already exists
+            self._cnx.rollback()
+
+    def get_open_records(self):
+        """
+        Get the endpoint records that are still open
+
+        :return: list of tuples containing the mac, tenant, ip, app, epg,
+                 interface and timestart of each record
+        """
+        self.flush()
+        self._cursor.execute(self._open_records_cmd)
+        return self._cursor.fetchall()
+
+    def _add(self, cmd, data):
+        """
+        Buffer a single statement and flush if a threshold is reached
+        """
+        if not self._pending:
+            self._oldest = time.time()
+        self._pending.append((cmd, data))
+        if len(self._pending) >= self.max_records:
+            self.flush()
+
+    def insert(self, mac, ip, tenant, app, epg, interface, timestart):
+        """
+        Buffer the insert of an open endpoint record
+
+        :param mac: string containing the endpoint MAC address
+        :param ip: string containing the endpoint IP address
+        :param tenant: string containing the tenant name
+        :param app: string containing the application profile name
+        :param epg: string containing the EPG name
+        :param interface: string containing the interface name or None
+        :param timestart: string containing the MySQL timestamp of the event
+        """
+        if interface is None:
+            interface = NO_INTERFACE
+        self._add(self._insert_cmd, (mac, ip, tenant, app, epg, interface, timestart))
+
+    def close(self, mac, tenant, timestop):
+        """
+        Buffer the update that closes the open endpoint records of a MAC
+        address within a tenant
+
+        :param mac: string containing the endpoint MAC address
+        :param tenant: string containing the tenant name
+        :param timestop: string containing the MySQL timestamp of the event
+        """
+        self._add(self._close_cmd, (timestop, mac, tenant))
+
+    def is_due(self):
+        """
+        Check whether the oldest buffered record has reached the time
+        threshold
+
+        :return: True if the buffer should be flushed
+        """
+        now = time.time()
+        return bool(self._pending) and now - self._oldest >= self.max_delay and now >= self._retry_time
+
+    def flush(self):
+        """
+        Write all of the buffered records to the database and commit.
+        Consecutive statements of the same kind are sent with a single
+        executemany so that the order of the events is kept.  If the batch
+        is rejected because of its data, it is rolled back and the records
+        are written one at a time so that only the records that fail are
+        rejected.  Any other error keeps the records buffered until the
+        retry delay has passed.
+
+        :return: True if all of the buffered records were written
+        """
+        if not self._pending:
+            return True
+        if time.time() < self._retry_time:
+            return False
+        try:
+            batch_cmd = None
+            batch = []
+            for (cmd, data) in self._pending:
+                if cmd != batch_cmd and batch:
+                    self._cursor.executemany(batch_cmd, batch)
+                    batch = []
+                batch_cmd = cmd
+                batch.append(data)
+            self._cursor.executemany(batch_cmd, batch)
+            self._cnx.commit()
+        except Exception as e:
+            self._rollback()
+            if not is_data_error(e):
+                self._retry_later(e)
+                return False
+            logging.warning('Endpoint batch write failed, retrying each record: %s', e)
+            while self._pending:
+                (cmd, data) = self._pending[0]
+                try:
+                    self._cursor.execute(cmd, data)
+                    self._cnx.commit()
+                except Exception as e:
+                    self._rollback()
+                    if not is_data_error(e):
+                        self._retry_later(e)
+                        return False
+                    logging.error('Endpoint record %s rejected: %s', str(data), e)
+                    self.rejected.append((cmd, data))
+                self._pending.pop(0)
+        self._pending = []
+        self._oldest = None
+        self._failures = 0
+        self._retry_time = 0
+        return True
+
+    def _retry_later(self, error):
+        """
+        Keep the buffered records after a failed write, reconnect and delay
+        the next attempt
+        """
+        self._failures += 1
+        delay = min(self.max_delay * 2 ** self._failures, MAX_RETRY_DELAY)
+        self._retry_time = time.time() + delay
+        logging.error('Endpoint database write failed, retrying %s records in %s seconds: %s',
+                      len(self._pending), delay, error)
+        if self._connect is None:
+            return
+        try:
+            self._cnx = self._connect()
+            self._cursor = self._cnx.cursor()
+        except Exception as e:
+            logging.error('Could not reconnect to the endpoint database: %s', e)
+
+    def _rollback(self):
+        """
+        Roll back the current transaction.  The error is ignored if the
+        connection itself is broken.
+        """
+        try:
+            self._cnx.rollback()
+        except Exception as e:
+            logging.error('Endpoint database rollback failed: %s', e)
+
+
+class EndpointState(object):
+    """
+    In-memory map of the open endpoint records indexed by (mac, tenant).
+    Endpoint events are compared with this map so that only the events that
+    actually change an endpoint are sent to the EndpointWriter and no
+    database query is needed per event.
+    """
+    def __init__(self, writer):
+        """
+        :param writer: EndpointWriter instance used to write the changes
+        """
+        self._writer = writer
+        self._open = {}
+
+    def __len__(self):
+        return len(self._open)
+
+    def load(self):
+        """
+        Load the open endpoint records from the database
+        """
+        self._open = {}
+        for (mac, tenant, ip, app, epg, interface, timestart) in self._writer.get_open_records():
+            self._open[(mac, tenant)] = (ip, app, epg, interface, timestart)
+
+    def get(self, mac, tenant):
+        """
+        Get the open record of an endpoint
+
+        :param mac: string containing the endpoint MAC address
+        :param tenant: string containing the tenant name
+        :return: tuple containing the ip, app, epg, interface and timestart
+                 of the open record or None if the endpoint has no open record
+        """
+        return self._open.get((mac, tenant))
+
+    def update(self, mac, ip, tenant, app, epg, interface, timestamp):
+        """
+        Record that an endpoint was learned.  A new record is opened if the
+        endpoint has no open record or if its location changed, in which case
+        the previous record is closed first.
+
+        :param mac: string containing the endpoint MAC address
+        :param ip: string containing the endpoint IP address
+        :param tenant: string containing the tenant name
+        :param app: string containing the application profile name
+        :param epg: string containing the EPG name
+        :param interface: string containing the interface name or None
+        :param timestamp: string containing the MySQL timestamp of the event
+        :return: True if the database is changed
+        """
+        if interface is None:
+            interface = NO_INTERFACE
+        key = (mac, tenant)
+        current = self._open.get(key)
+        if current is not None:
+            if current[:4] == (ip, app, epg, interface):
+                return False
+            self._writer.close(mac, tenant, timestamp)
+        self._writer.insert(mac, ip, tenant, app, epg, interface, timestamp)
+        self._open[key] = (ip, app, epg, interface, timestamp)
+        return True
+
+    def delete(self, mac, tenant, timestamp):
+        """
+        Record that an endpoint was removed.  The open record of the
+        endpoint, if any, is closed.
+
+        :param mac: string containing the endpoint MAC address
+        :param tenant: string containing the tenant name
+        :param timestamp: string containing the MySQL timestamp of the event
+        :return: True if the database is changed
+        """
+        if self._open.pop((mac, tenant), None) is None:
+            return False
+        self._writer.close(mac, tenant, timestamp)
+        return True
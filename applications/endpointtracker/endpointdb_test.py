@@ -0,0 +1,344 @@
+"""
+Test routines for the Endpoint Tracker database writer and open endpoint
+state.  SQLite is used as a local stand-in for MySQL.
+"""
+import sqlite3
+import unittest
+from endpointdb import EndpointWriter, EndpointState, NO_INTERFACE
+
+
+class TestEndpointWriter(unittest.TestCase):
+    """
+    Endpoint database writer testcases
+    """
+    def setUp(self):
+        self.cnx = sqlite3.connect(':memory:')
+        self.writer = EndpointWriter(self.cnx, sqlite3.paramstyle,
+                                     max_records=3, max_delay=60)
+        self.writer.create_table()
+
+    def tearDown(self):
+        self.cnx.close()
+
+    def _get_records(self):
+        c = self.cnx.cursor()
+        c.execute('SELECT mac, ip, tenant, app, epg, interface, timestart, timestop '
+                  'FROM endpoints ORDER BY mac, timestart')
+        return c.fetchall()
+
+    def test_create_table_twice(self):
+        """
+        Test that the table and index creation can be repeated
+        """
+        self.writer.create_table()
+        c = self.cnx.cursor()
+        c.execute("SELECT name FROM sqlite_master WHERE type='index'")
+        self.assertEqual(c.fetchall(), [('endpoints_mac_timestop',)])
+
+    def test_buffered_until_flush(self):
+        """
+        Test that the records are only written when flushed
+        """
+        self.writer.insert('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                           'eth1/1', '2016-01-01 00:00:00')
+        self.assertEqual(self._get_records(), [])
+        self.assertFalse(self.writer.is_due())
+        self.writer.flush()
+        self.assertEqual(len(self._get_records()), 1)
+
+    def test_flush_on_max_records(self):
+        """
+        Test that the buffer is flushed when the size threshold is reached
+        """
+        for i in range(3):
+            self.writer.insert('00:00:00:00:00:0%s' % i, '10.0.0.%s' % i, 'tenant', 'app', 'epg',
+                               'eth1/1', '2016-01-01 00:00:00')
+        self.assertEqual(len(self._get_records()), 3)
+
+    def test_flush_on_max_delay(self):
+        """
+        Test the time threshold
+        """
+        self.writer.max_delay = 0
+        self.assertFalse(self.writer.is_due())
+        self.writer.insert('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                           'eth1/1', '2016-01-01 00:00:00')
+        self.assertTrue(self.writer.is_due())
+
+    def test_order_is_kept(self):
+        """
+        Test that an endpoint closed and reopened in the same batch is written
+        in the event order
+        """
+        self.writer.insert('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg1',
+                           'eth1/1', '2016-01-01 00:00:00')
+        self.writer.close('00:00:00:00:00:01', 'tenant', '2016-01-01 00:01:00')
+        self.writer.insert('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg2',
+                           'eth1/2', '2016-01-01 00:02:00')
+        self.writer.flush()
+        self.assertEqual(self._get_records(),
+                         [('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg1',
+                           'eth1/1', '2016-01-01 00:00:00', '2016-01-01 00:01:00'),
+                          ('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg2',
+                           'eth1/2', '2016-01-01 00:02:00', None)])
+        self.assertEqual(self.writer.get_open_records(),
+                         [('00:00:00:00:00:01', 'tenant', '10.0.0.1', 'app', 'epg2',
+                           'eth1/2', '2016-01-01 00:02:00')])
+
+    def test_parameterized(self):
+        """
+        Test that values are not interpolated in the statements
+        """
+        self.writer.insert("00:00:00:00:00:01", "10.0.0.1", "ten'ant", 'app', 'epg',
+                           'eth1/1', '2016-01-01 00:00:00')
+        self.writer.flush()
+        self.assertEqual(self._get_records()[0][2], "ten'ant")
+
+    def test_no_interface(self):
+        """
+        Test that an endpoint without an interface is written
+        """
+        self.writer.insert('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                           None, '2016-01-01 00:00:00')
+        self.writer.flush()
+        self.assertEqual([record[5] for record in self._get_records()], [NO_INTERFACE])
+        self.assertEqual(self.writer.rejected, [])
+
+    def test_rejected_record(self):
+        """
+        Test that a record rejected by the database does not block the
+        other records
+        """
+        self.writer.insert('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                           'eth1/1', '2016-01-01 00:00:00')
+        self.writer.insert('00:00:00:00:00:02', '10.0.0.2', None, 'app', 'epg',
+                           'eth1/1', '2016-01-01 00:00:00')
+        self.writer.flush()
+        self.assertEqual([record[0] for record in self._get_records()], ['00:00:00:00:00:01'])
+        self.assertEqual(len(self.writer.rejected), 1)
+        self.assertEqual(self.writer.rejected[0][1][0], '00:00:00:00:00:02')
+        self.writer.insert('00:00:00:00:00:03', '10.0.0.3', 'tenant', 'app', 'epg',
+                           'eth1/1', '2016-01-01 00:00:00')
+        self.writer.flush()
+        self.assertEqual(len(self._get_records()), 2)
+        self.assertEqual(len(self.writer.rejected), 1)
+
+
+class FlakyConnection(object):
+    """
+    DB-API connection that loses the connection on the next writes
+    """
+    def __init__(self, cnx, failures=0):
+        self.cnx = cnx
+        self.failures = failures
+
+    def cursor(self):
+        return FlakyCursor(self, self.cnx.cursor())
+
+    def commit(self):
+        self.cnx.commit()
+
+    def rollback(self):
+        self.cnx.rollback()
+
+
+class FlakyCursor(object):
+    """
+    DB-API cursor of a FlakyConnection
+    """
+    def __init__(self, connection, cursor):
+        self._connection = connection
+        self._cursor = cursor
+
+    def _check(self):
+        if self._connection.failures:
+            self._connection.failures -= 1
+            raise sqlite3.OperationalError('Lost connection to database')
+
+    def execute(self, cmd, data=()):
+        self._check()
+        return self._cursor.execute(cmd, data)
+
+    def executemany(self, cmd, data):
+        self._check()
+        return self._cursor.executemany(cmd, data)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+
+class TestEndpointWriterConnection(unittest.TestCase):
+    """
+    Endpoint database writer testcases with connection errors
+    """
+    def setUp(self):
+        self.cnx = sqlite3.connect(':memory:')
+        self.flaky = FlakyConnection(self.cnx)
+        self.connects = 0
+        self.writer = EndpointWriter(self.flaky, sqlite3.paramstyle, max_delay=0,
+                                     connect=self._connect)
+        self.writer.create_table()
+
+    def tearDown(self):
+        self.cnx.close()
+
+    def _connect(self):
+        self.connects += 1
+        return self.flaky
+
+    def _get_macs(self):
+        c = self.cnx.cursor()
+        c.execute('SELECT mac FROM endpoints ORDER BY mac')
+        return [record[0] for record in c.fetchall()]
+
+    def test_connection_error(self):
+        """
+        Test that the records are kept and written after reconnecting when
+        the connection is lost
+        """
+        self.writer.insert('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                           'eth1/1', '2016-01-01 00:00:00')
+        self.writer.insert('00:00:00:00:00:02', '10.0.0.2', 'tenant', 'app', 'epg',
+                           'eth1/1', '2016-01-01 00:00:00')
+        self.flaky.failures = 2
+        self.assertFalse(self.writer.flush())
+        self.assertFalse(self.writer.flush())
+        self.assertEqual(self._get_macs(), [])
+        self.assertEqual(self.connects, 2)
+        self.assertTrue(self.writer.flush())
+        self.assertEqual(self._get_macs(), ['00:00:00:00:00:01', '00:00:00:00:00:02'])
+        self.assertEqual(self.writer.rejected, [])
+
+    def test_retry_delay(self):
+        """
+        Test that the write is not retried before the retry delay
+        """
+        self.writer.max_delay = 10
+        self.writer.insert('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                           'eth1/1', '2016-01-01 00:00:00')
+        self.flaky.failures = 1
+        self.assertFalse(self.writer.flush())
+        self.assertFalse(self.writer.flush())
+        self.assertFalse(self.writer.is_due())
+        self.assertEqual(self._get_macs(), [])
+        self.assertEqual(self.connects, 1)
+
+    def test_connection_error_after_rejected_record(self):
+        """
+        Test that the records after a rejected record are kept when the
+        connection is lost while writing them one at a time
+        """
+        self.writer.insert('00:00:00:00:00:01', '10.0.0.1', None, 'app', 'epg',
+                           'eth1/1', '2016-01-01 00:00:00')
+        self.writer.insert('00:00:00:00:00:02', '10.0.0.2', 'tenant', 'app', 'epg',
+                           'eth1/1', '2016-01-01 00:00:00')
+        # The batch is rejected and the connection is lost on the second record
+        self.writer._cursor.execute = self._lose_connection(self.writer._cursor.execute, 2)
+        self.assertFalse(self.writer.flush())
+        self.assertEqual(len(self.writer.rejected), 1)
+        self.assertTrue(self.writer.flush())
+        self.assertEqual(self._get_macs(), ['00:00:00:00:00:02'])
+        self.assertEqual(len(self.writer.rejected), 1)
+
+    def _lose_connection(self, execute, call):
+        calls = []
+
+        def lose_connection(cmd, data=()):
+            calls.append(cmd)
+            if len(calls) == call:
+                raise sqlite3.OperationalError('Lost connection to database')
+            return execute(cmd, data)
+        return lose_connection
+
+
+class TestEndpointState(unittest.TestCase):
+    """
+    Open endpoint state testcases
+    """
+    def setUp(self):
+        self.cnx = sqlite3.connect(':memory:')
+        self.writer = EndpointWriter(self.cnx, sqlite3.paramstyle)
+        self.writer.create_table()
+        self.state = EndpointState(self.writer)
+
+    def tearDown(self):
+        self.cnx.close()
+
+    def _get_records(self):
+        self.writer.flush()
+        c = self.cnx.cursor()
+        c.execute('SELECT mac, tenant, epg, timestart, timestop FROM endpoints '
+                  'ORDER BY timestart')
+        return c.fetchall()
+
+    def test_duplicate_event(self):
+        """
+        Test that an event for an unchanged endpoint is not written
+        """
+        self.assertTrue(self.state.update('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                                          'eth1/1', '2016-01-01 00:00:00'))
+        self.assertFalse(self.state.update('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                                           'eth1/1', '2016-01-01 00:01:00'))
+        self.assertEqual(self._get_records(),
+                         [('00:00:00:00:00:01', 'tenant', 'epg', '2016-01-01 00:00:00', None)])
+
+    def test_move(self):
+        """
+        Test that a moved endpoint closes the previous record
+        """
+        self.state.update('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg1',
+                          'eth1/1', '2016-01-01 00:00:00')
+        self.assertTrue(self.state.update('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg2',
+                                          'eth1/1', '2016-01-01 00:01:00'))
+        self.assertEqual(self._get_records(),
+                         [('00:00:00:00:00:01', 'tenant', 'epg1', '2016-01-01 00:00:00',
+                           '2016-01-01 00:01:00'),
+                          ('00:00:00:00:00:01', 'tenant', 'epg2', '2016-01-01 00:01:00', None)])
+
+    def test_delete(self):
+        """
+        Test that only endpoints with an open record are closed
+        """
+        self.assertFalse(self.state.delete('00:00:00:00:00:01', 'tenant', '2016-01-01 00:00:00'))
+        self.state.update('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                          'eth1/1', '2016-01-01 00:00:00')
+        self.assertTrue(self.state.delete('00:00:00:00:00:01', 'tenant', '2016-01-01 00:01:00'))
+        self.assertIsNone(self.state.get('00:00:00:00:00:01', 'tenant'))
+        self.assertEqual(self._get_records(),
+                         [('00:00:00:00:00:01', 'tenant', 'epg', '2016-01-01 00:00:00',
+                           '2016-01-01 00:01:00')])
+
+    def test_load(self):
+        """
+        Test that the state is warmed from the database
+        """
+        self.state.update('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                          'eth1/1', '2016-01-01 00:00:00')
+        self.state.update('00:00:00:00:00:02', '10.0.0.2', 'tenant', 'app', 'epg',
+                          'eth1/1', '2016-01-01 00:00:00')
+        self.state.delete('00:00:00:00:00:02', 'tenant', '2016-01-01 00:01:00')
+        self.writer.flush()
+        state = EndpointState(self.writer)
+        state.load()
+        self.assertEqual(len(state), 1)
+        self.assertEqual(state.get('00:00:00:00:00:01', 'tenant'),
+                         ('10.0.0.1', 'app', 'epg', 'eth1/1', '2016-01-01 00:00:00'))
+        self.assertFalse(state.update('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                                      'eth1/1', '2016-01-01 00:02:00'))
+
+    def test_no_interface_loaded(self):
+        """
+        Test that an endpoint without an interface is unchanged after the
+        state is loaded from the database
+        """
+        self.assertTrue(self.state.update('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                                          None, '2016-01-01 00:00:00'))
+        self.writer.flush()
+        state = EndpointState(self.writer)
+        state.load()
+        self.assertFalse(state.update('00:00:00:00:00:01', '10.0.0.1', 'tenant', 'app', 'epg',
+                                      None, '2016-01-01 00:01:00'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,8 +3,8 @@
 Inheritance application enables EPGs to inherit contracts from other EPGs
 For documentation, refer to http://acitoolkit.readthedocs.org/en/latest/inheritance.html
 """
-from acitoolkit.acitoolkit import (Tenant, AppProfile, EPG, OutsideL3, OutsideEPG,
-                                   Session, Contract, ContractInterface, Taboo)
+from acitoolkit.acitoolkit import Session
+from collections import OrderedDict
 import json
 from jsonschema import validate, ValidationError, FormatChecker
 import threading
@@ -345,6 +345,34 @@ class SubnetDB(BaseDB):
         logging.debug('Found covering EPGs: %s', covering_epg_policies)
         return covering_epg_policies
 
+    def get_all_covered_epgs_for_subnet(self, epg, subnet):
+        """
+        Get all of the EPGs with subnets covered by the specified subnet.
+
+        :param epg: EPGPolicy instance that is used to provide the tenant and l3out to scope the EPG search
+        :param subnet: String containing the subnet that the search is for
+        :return: list of EPGPolicy instances of EPGs with subnets that are covered by the specified subnet
+        """
+        logging.debug('get_all_covered_epgs_for_subnet for epg: %s subnet: %s', epg, subnet)
+        covered_epgs = []
+        if not self.is_l3out_known(epg):
+            return covered_epgs
+
+        for covered_subnet in self.db[epg.tenant][epg.l3out_name].search_covered(subnet):
+            covered_epg = covered_subnet.data['l3instp']
+            if covered_epg not in covered_epgs and covered_epg != epg.name:
+                covered_epgs.append(covered_epg)
+
+        covered_epg_policies = []
+        for covered_epg in covered_epgs:
+            covered_epg_policy = {"tenant": epg.tenant,
+                                  "epg_container": {"name": epg.epg_container_name,
+                                                    "container_type": epg.epg_container_type},
+                                  "name": covered_epg}
+            covered_epg_policies.append(EPGPolicy(covered_epg_policy))
+        logging.debug('Found covered EPGs: %s', covered_epg_policies)
+        return covered_epg_policies
+
     def get_all_covering_epgs(self, epg):
         logging.debug('get_all_covering_epgs for epg: %s', epg)
 
@@ -482,7 +510,7 @@ class TagDB(BaseDB):
     def get_relations(self):
         relations = {}
         for epg in self.db:
-            policy_epg = self._convert_db_epg_to_policy_epg(epg).get_json()
+            policy_epg = self._convert_db_epg_to_policy_epg(epg)
             if policy_epg not in relations:
                 relations[policy_epg] = []
             for relation in self.db[epg]:
@@ -503,6 +531,107 @@ class TagDB(BaseDB):
         return relation in self.db[epg]
 
 
+class PushPlanner(object):
+    """
+    Collects the inherited relations to be added or deleted during a monitor cycle and
+    builds the minimal per-EPG configuration to push to the APIC in bounded-size batches
+    """
+    RELATION_ATTRIBUTES = {'fvRsProv': 'tnVzBrCPName',
+                           'fvRsCons': 'tnVzBrCPName',
+                           'fvRsConsIf': 'tnVzCPIfName',
+                           'fvRsProtBy': 'tnVzTabooName'}
+
+    def __init__(self, batch_size=100):
+        """
+        :param batch_size: Maximum number of relations to push in a single request
+        """
+        self.batch_size = batch_size
+        self._changes = OrderedDict()
+
+    def add_relation(self, epg, relation):
+        """
+        Plan the addition of an inherited relation
+
+        :param epg: EPGPolicy instance of the EPG inheriting the relation
+        :param relation: Tuple containing relation_type, relation_name
+        :return: None
+        """
+        self._changes[(epg, relation)] = False
+
+    def remove_relation(self, epg, relation):
+        """
+        Plan the deletion of an inherited relation
+
+        :param epg: EPGPolicy instance of the EPG that inherited the relation
+        :param relation: Tuple containing relation_type, relation_name
+        :return: None
+        """
+        self._changes[(epg, relation)] = True
+
+    def has_changes(self):
+        """
+        Check whether any relations have been planned
+
+        :return: True if there are relations to push. False otherwise
+        """
+        return len(self._changes) > 0
+
+    def _get_relation_json(self, relation, deleted):
+        relation_type, relation_name = relation
+        relation_json = {relation_type: {'attributes': {self.RELATION_ATTRIBUTES[relation_type]: relation_name}}}
+        tag_json = {'tagInst': {'attributes': {'name': 'inherited:%s:%s' % (relation_type, relation_name)}}}
+        if deleted:
+            relation_json[relation_type]['attributes']['status'] = 'deleted'
+            tag_json['tagInst']['attributes']['status'] = 'deleted'
+        return [relation_json, tag_json]
+
+    @staticmethod
+    def _get_tenant_json(tenant_name, epgs):
+        containers = OrderedDict()
+        for epg, children in epgs.items():
+            if epg.is_l3out():
+                container_class, epg_class = 'l3extOut', 'l3extInstP'
+            else:
+                container_class, epg_class = 'fvAp', 'fvAEPg'
+            container_key = (container_class, epg.epg_container_name)
+            if container_key not in containers:
+                containers[container_key] = []
+            containers[container_key].append({epg_class: {'attributes': {'name': epg.name},
+                                                          'children': children}})
+        tenant_children = []
+        for (container_class, container_name), container_children in containers.items():
+            tenant_children.append({container_class: {'attributes': {'name': container_name},
+                                                      'children': container_children}})
+        return {'fvTenant': {'attributes': {'name': tenant_name},
+                             'children': tenant_children}}
+
+    def get_batches(self):
+        """
+        Get the planned configuration
+
+        :return: List of tuples containing the tenant URL and the tenant JSON.  Each tenant JSON
+                 contains at most batch_size relations
+        """
+        batches = []
+        tenants = OrderedDict()
+        for (epg, relation), deleted in self._changes.items():
+            tenants.setdefault(epg.tenant, []).append((epg, relation, deleted))
+        for tenant_name, changes in tenants.items():
+            url = '/api/mo/uni/tn-%s.json' % tenant_name
+            for index in range(0, len(changes), self.batch_size):
+                epgs = OrderedDict()
+                for epg, relation, deleted in changes[index:index + self.batch_size]:
+                    epgs.setdefault(epg, []).extend(self._get_relation_json(relation, deleted))
+                batches.append((url, self._get_tenant_json(tenant_name, epgs)))
+        return batches
+
+    def clear(self):
+        """
+        Remove all of the planned relations
+        """
+        self._changes = OrderedDict()
+
+
 class Monitor(threading.Thread):
     """
     Thread responsible for monitoring EPG-to-Contract relations.
@@ -519,6 +648,11 @@ class Monitor(threading.Thread):
         self._inheritance_tags = TagDB()
         self._subnets = SubnetDB()
         self._old_relations = {}
+        # EPGs whose relations need to be recalculated. None forces all of them to be recalculated
+        self._dirty_epgs = None
+        # The EPGs that each policy EPG inherits from and the reverse mapping
+        self._dependencies = {}
+        self._dependents = {}
         self.apic = None
 
     def exit(self):
@@ -612,106 +746,13 @@ class Monitor(threading.Thread):
         self.apic.subscribe(tag_query_url)
         self._inheritance_tag_subscriptions.append(tag_query_url)
 
-    def _does_tenant_have_contract(self, tenant_name, contract_name, contract_type='brc'):
-        logging.debug('tenant: %s contract: %s contract_type: %s',
-                      tenant_name, contract_name, contract_type)
-        query_url = '/api/mo/uni/tn-%s/%s-%s.json' % (tenant_name,
-                                                      contract_type,
-                                                      contract_name)
-        resp = self.apic.get(query_url)
-        return resp.ok and int(resp.json()['totalCount']) > 0
-
-    def does_tenant_have_contract_if(self, tenant_name, contract_if_name):
-        return self._does_tenant_have_contract(tenant_name,
-                                               contract_if_name,
-                                               contract_type='cif')
-
-    def does_tenant_have_contract(self, tenant_name, contract_name):
-        return self._does_tenant_have_contract(tenant_name,
-                                               contract_name)
-
-    def _add_inherited_relation(self, tenants, epg, relation, deleted=False):
-        tenant_found = False
-
-        # Find the tenant. Add if necessary
-        for tenant in tenants:
-            if tenant.name == epg.tenant:
-                tenant_found = True
-                break
-        if not tenant_found:
-            tenant = Tenant(epg.tenant)
-            tenants.append(tenant)
-
-        # Find the EPG Container. Add if necessary
-        if epg.is_l3out():
-            epg_container_class = OutsideL3
-        else:
-            epg_container_class = AppProfile
-        epg_containers = tenant.get_children(only_class=epg_container_class)
-        epg_container_found = False
-        for epg_container in epg_containers:
-            if epg_container.name == epg.epg_container_name:
-                epg_container_found = True
-                break
-        if not epg_container_found:
-            epg_container = epg_container_class(epg.epg_container_name, tenant)
-
-        # Find the EPG. Add if necessary
-        if epg.is_l3out():
-            epg_class = OutsideEPG
-        else:
-            epg_class = EPG
-        epgs = tenant.get_children(only_class=epg_class)
-        epg_found = False
-        for tenant_epg in epgs:
-            if tenant_epg.name == epg.name:
-                epg_found = True
-                break
-        if not epg_found:
-            tenant_epg = epg_class(epg.name, epg_container)
-
-        # Add the relation
-        (relation_type, relation_name) = relation
-        if relation_type == 'fvRsProv':
-            contract = Contract(relation_name, tenant)
-            tenant_epg.provide(contract)
-            if deleted:
-                tenant_epg.provide(contract)
-                tenant_epg.dont_provide(contract)
-        elif relation_type == 'fvRsCons':
-            contract = Contract(relation_name, tenant)
-            tenant_epg.consume(contract)
-            if deleted:
-                tenant_epg.consume(contract)
-                tenant_epg.dont_consume(contract)
-        elif relation_type == 'fvRsConsIf':
-            contract_interface = ContractInterface(relation_name, tenant)
-            tenant_epg.consume_cif(contract_interface)
-            if deleted:
-                tenant_epg.consume_cif(contract_interface)
-                tenant_epg.dont_consume_cif(contract_interface)
-        elif relation_type == 'fvRsProtBy':
-            taboo = Taboo(relation_name, tenant)
-            tenant_epg.protect(taboo)
-            if deleted:
-                tenant_epg.protect(taboo)
-                tenant_epg.dont_protect(taboo)
-        tenant_epg.add_tag('inherited:%s:%s' % (relation_type, relation_name))
-        if deleted:
-            tenant_epg.delete_tag('inherited:%s:%s' % (relation_type, relation_name))
-        return tenants
-
-    def add_inherited_relation(self, tenants, epg, relation):
-        return self._add_inherited_relation(tenants, epg, relation)
-
-    def remove_inherited_relation(self, tenants, epg, relation):
-        return self._add_inherited_relation(tenants, epg, relation, deleted=True)
-
     def _calculate_relations_for_l3out_policy(self, inheritance_policy):
         logging.debug('_calculate_relations_for_l3out_policy: %s', inheritance_policy)
         # Get all of the EPGs covering this policy's EPG's subnets
         covering_epgs = self._subnets.get_all_covering_epgs(inheritance_policy.epg)
 
+        self._set_dependencies(inheritance_policy.epg, covering_epgs)
+
         # Remove any EPGs that are not allowed to be inherited
         for covering_epg in covering_epgs:
             if not self.cdb.is_inheritance_allowed(covering_epg):
@@ -745,6 +786,7 @@ class Monitor(threading.Thread):
             return relations
         # Get the EPG that this policy is inheriting from
         parent_epg = inheritance_policy.inherit_from
+        self._set_dependencies(inheritance_policy.epg, [parent_epg])
         # Is inheritance allowed on that EPG ?
         if not self.cdb.is_inheritance_allowed(parent_epg):
             logging.warning('Parent EPG policy does not allow inheritance')
@@ -752,32 +794,74 @@ class Monitor(threading.Thread):
         # Get the relations belonging to that EPG
         return self._relations.get_relations_for_epg(parent_epg)
 
-    def calculate_relations(self):
+    def _set_dependencies(self, epg, parent_epgs):
+        """
+        Record the EPGs that a policy EPG inherits its relations from
+
+        :param epg: EPGPolicy instance of the inheriting EPG
+        :param parent_epgs: List of EPGPolicy instances that the EPG inherits from
+        :return: None
+        """
+        for parent_epg in self._dependencies.get(epg, set()):
+            self._dependents[parent_epg].discard(epg)
+        self._dependencies[epg] = set(parent_epgs)
+        for parent_epg in parent_epgs:
+            self._dependents.setdefault(parent_epg, set()).add(epg)
+
+    def mark_dirty(self, epg):
+        """
+        Mark an EPG and all of the EPGs inheriting from it as needing their relations recalculated
+
+        :param epg: EPGPolicy instance
+        :return: None
+        """
+        if self._dirty_epgs is None:
+            return
+        self._dirty_epgs.add(epg)
+        self._dirty_epgs.update(self._dependents.get(epg, set()))
+
+    def calculate_relations(self, epgs=None):
+        """
+        Calculate the relations for the enabled inheritance policies
+
+        :param epgs: Optional set of EPGPolicy instances limiting the policies to calculate. All are calculated if None
+        :return: Dictionary of relation lists indexed by EPGPolicy instance
+        """
         relations = {}
         for inheritance_policy in self.cdb.get_inheritance_policies():
             if not inheritance_policy.enabled:
                 continue
-            if inheritance_policy.epg.is_l3out():
+            epg = inheritance_policy.epg
+            if epgs is not None and epg not in epgs:
+                continue
+            if epg.is_l3out():
                 epg_relations = self._calculate_relations_for_l3out_policy(inheritance_policy)
             else:
                 # TODO: may eventually need to process l2out
                 epg_relations = self._calculate_relations_for_app_policy(inheritance_policy)
-            relations[inheritance_policy.epg.get_json()] = epg_relations
+            relations[epg] = epg_relations
         return relations
 
     def process_relation_event(self, event):
         logging.debug('process_event EVENT: %s', event.event)
         self._relations.store_relation(event)
+        self.mark_dirty(event.epg)
 
     def process_subnet_event(self, event):
         logging.debug('Received subnet event: %s', event)
         # Store the subnet in the SubnetDB
         self._subnets.store_subnet_event(event)
+        # The EPG and any EPGs with subnets within this subnet may now inherit differently
+        epg = event.epg
+        self.mark_dirty(epg)
+        for covered_epg in self._subnets.get_all_covered_epgs_for_subnet(epg, event.subnet):
+            self.mark_dirty(covered_epg)
 
     def process_inheritance_tag_event(self, event):
         logging.debug('Received subnet event: %s', event)
         # Store the tag in the TagDB
         self._inheritance_tags.store_tag(event)
+        self.mark_dirty(event.epg)
 
     def _process_events(self, old_relations):
         while self.apic is None:
@@ -804,68 +888,49 @@ class Monitor(threading.Thread):
                 event = SubnetEvent(self.apic.get_event(subscription)['imdata'][0])
                 self.process_subnet_event(event)
 
-        # Calculate the new set of relations
-        new_relations = self.calculate_relations()
+        # Calculate the new set of relations. Only the EPGs affected by the events are recalculated
+        # once the full set of relations has been calculated
+        if self._dirty_epgs is None:
+            new_relations = self.calculate_relations()
+            changed_epgs = set(old_relations) | set(new_relations)
+        else:
+            new_relations = dict(old_relations)
+            new_relations.update(self.calculate_relations(self._dirty_epgs))
+            changed_epgs = self._dirty_epgs
+        self._dirty_epgs = set()
 
-        for old_epg in old_relations:
-            logging.debug(old_epg)
-        for new_epg in new_relations:
-            logging.debug(new_epg)
+        for changed_epg in changed_epgs:
+            logging.debug(changed_epg)
 
         # Compare the old and the new relations for changes
-        tenants = []
-        for new_epg in new_relations:
-            if new_epg not in old_relations:
-                # New EPG, so we need to add all of the relations
-                for new_relation in new_relations[new_epg]:
-                    if self._inheritance_tags.is_inherited(EPGPolicy(json.loads(new_epg)), new_relation):
-                        # If it's inherited, but we don't have the relation. We are likely coming up and not populated
-                        # the old_relations yet
-                        pass
-                    # If just configured, we will have a relationDB entry. Otherwise, we need to inherit it
-                    if self._relations.has_relation_for_epg(EPGPolicy(json.loads(new_epg)), new_relation):
-                        continue
-                    tenants = self.add_inherited_relation(tenants, EPGPolicy(json.loads(new_epg)), new_relation)
-            else:
-                # Handle any new added relations
-                for new_relation in new_relations[new_epg]:
-                    if new_relation not in old_relations[new_epg]:
-                        if self._relations.has_relation_for_epg(EPGPolicy(json.loads(new_epg)), new_relation):
-                            continue
-                        tenants = self.add_inherited_relation(tenants, EPGPolicy(json.loads(new_epg)), new_relation)
-                # Handle any deleted relations
-                for old_relation in old_relations[new_epg]:
-                    if old_relation not in new_relations[new_epg]:
-                        if self._inheritance_tags.is_inherited(EPGPolicy(json.loads(new_epg)), old_relation):
-                            tenants = self.remove_inherited_relation(tenants, EPGPolicy(json.loads(new_epg)), old_relation)
-                        else:
-                            # Must have been configured and manually deleted
-                            pass
-        for old_epg in old_relations:
-            if old_epg not in new_relations:
-                for old_relation in old_relations[old_epg]:
-                    if self._inheritance_tags.is_inherited(EPGPolicy(json.loads(old_epg)), old_relation):
-                        tenants = self.remove_inherited_relation(tenants, EPGPolicy(json.loads(old_epg)), old_relation)
+        planner = PushPlanner()
+        for epg in changed_epgs:
+            old_epg_relations = old_relations.get(epg, [])
+            new_epg_relations = new_relations.get(epg, [])
+            # Handle any new added relations
+            for new_relation in new_epg_relations:
+                if new_relation in old_epg_relations:
+                    continue
+                # If just configured, we will have a relationDB entry. Otherwise, we need to inherit it
+                if self._relations.has_relation_for_epg(epg, new_relation):
+                    continue
+                planner.add_relation(epg, new_relation)
+            # Handle any deleted relations
+            for old_relation in old_epg_relations:
+                if old_relation in new_epg_relations:
+                    continue
+                if self._inheritance_tags.is_inherited(epg, old_relation):
+                    planner.remove_relation(epg, old_relation)
+                # Otherwise, must have been configured and manually deleted
 
         # Push the necessary config to the APIC
-        for tenant in tenants:
-            tenant_json = tenant.get_json()
-            # Check that the tenant actually has the contracts since they may actually be tenant common contracts.
-            # If tenant common is used, we need to clean up the tenant JSON to not create an empty contract within
-            # this tenant
-            for child in tenant_json['fvTenant']['children']:
-                if 'vzBrCP' in child:
-                    if not self.does_tenant_have_contract(tenant.name, child['vzBrCP']['attributes']['name']):
-                        tenant_json['fvTenant']['children'].remove(child)
-                elif 'vzCPIf' in child:
-                    if not self.does_tenant_have_contract_if(tenant.name, child['vzCPIf']['attributes']['name']):
-                        tenant_json['fvTenant']['children'].remove(child)
+        for url, tenant_json in planner.get_batches():
             logging.debug('Pushing tenant configuration to the APIC: %s', tenant_json)
-            resp = self.apic.push_to_apic(tenant.get_url(), tenant_json)
+            resp = self.apic.push_to_apic(url, tenant_json)
             if resp.ok:
                 logging.debug('Pushed to APIC successfully')
             else:
-                logging.error('Error pushing to APIC', resp.text)
+                logging.error('Error pushing to APIC %s', resp.text)
         return new_relations
 
     def run(self):
@@ -891,11 +956,17 @@ class PolicyObject(object):
     def __eq__(self, other):
         return self._policy == other._policy
 
+    def __ne__(self, other):
+        return not self == other
+
     def __str__(self):
         return str(self._policy)
 
 
 class EPGPolicy(PolicyObject):
+    def __hash__(self):
+        return hash((self.tenant, self.epg_container_type, self.epg_container_name, self.name))
+
     @property
     def tenant(self):
         return self._policy['tenant']
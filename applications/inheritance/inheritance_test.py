@@ -2,7 +2,7 @@
 Inheritance test suite
 """
 import unittest
-from inheritance import execute_tool
+from inheritance import execute_tool, ConfigDB, Monitor, PushPlanner, EPGPolicy
 from acitoolkit import (Tenant, Context, OutsideL3, OutsideEPG, OutsideNetwork,
                         Contract, FilterEntry, Session, AppProfile, EPG,
                         ContractInterface, Fabric)
@@ -210,6 +210,187 @@ class TestWithoutApicCommunication(unittest.TestCase):
         self.assertTrue(fake_out.verify_output([sample_config, '\n']))
 
 
+class FakeResponse(object):
+    """
+    Fake class to mock out the APIC response
+    """
+    def __init__(self, data=None):
+        self.ok = True
+        self.text = ''
+        self._data = data or {'totalCount': '1', 'imdata': []}
+
+    def json(self):
+        return self._data
+
+
+class FakeApic(object):
+    """
+    Fake class to mock out the APIC Session for the Monitor
+    """
+    def __init__(self):
+        self.events = {}
+        self.pushed = []
+
+    def add_event(self, subscription, event):
+        self.events.setdefault(subscription, []).append({'imdata': [event]})
+
+    def has_events(self, subscription):
+        return len(self.events.get(subscription, [])) > 0
+
+    def get_event(self, subscription):
+        return self.events[subscription].pop(0)
+
+    def get(self, url):
+        return FakeResponse()
+
+    def push_to_apic(self, url, data):
+        self.pushed.append(data)
+        return FakeResponse()
+
+
+class TestIncrementalRelations(unittest.TestCase):
+    """
+    Tests for recalculating only the relations of EPGs affected by events
+    """
+    @staticmethod
+    def _get_epg(epg_name):
+        return {"tenant": "inheritanceautomatedtest",
+                "epg_container": {"name": "myapp",
+                                  "container_type": "app"},
+                "name": epg_name}
+
+    def _get_monitor(self):
+        cdb = ConfigDB()
+        cdb.store_config({"inheritance_policies": [
+            {"epg": self._get_epg('parent1'), "allowed": True, "enabled": False},
+            {"epg": self._get_epg('child1'), "inherit_from": self._get_epg('parent1'),
+             "allowed": True, "enabled": True},
+            {"epg": self._get_epg('parent2'), "allowed": True, "enabled": False},
+            {"epg": self._get_epg('child2'), "inherit_from": self._get_epg('parent2'),
+             "allowed": True, "enabled": True}]})
+        monitor = Monitor(cdb)
+        monitor.apic = FakeApic()
+        monitor._relation_subscriptions.append('relations')
+        self.calculated = []
+        calculate = monitor._calculate_relations_for_app_policy
+
+        def record_calculation(policy):
+            self.calculated.append(policy.epg.name)
+            return calculate(policy)
+        monitor._calculate_relations_for_app_policy = record_calculation
+        return monitor
+
+    @staticmethod
+    def _get_relation_event(epg_name, contract_name, status='created'):
+        dn = 'uni/tn-inheritanceautomatedtest/ap-myapp/epg-%s/rsprov-%s' % (epg_name, contract_name)
+        return {'fvRsProv': {'attributes': {'dn': dn, 'status': status}}}
+
+    def test_only_dependent_epgs_recalculated(self):
+        """
+        Test that a relation event only recalculates the EPGs inheriting from the changed EPG
+        """
+        monitor = self._get_monitor()
+        old_relations = monitor._process_events({})
+        self.assertEqual(sorted(self.calculated), ['child1', 'child2'])
+
+        self.calculated = []
+        monitor.apic.add_event('relations', self._get_relation_event('parent1', 'contract1'))
+        new_relations = monitor._process_events(old_relations)
+        self.assertEqual(self.calculated, ['child1'])
+        self.assertEqual(len(monitor.apic.pushed), 1)
+        self.assertIn('contract1', str(monitor.apic.pushed[0]))
+        self.assertIn('child1', str(monitor.apic.pushed[0]))
+        self.assertNotIn('child2', str(monitor.apic.pushed[0]))
+
+        # No events so nothing should be recalculated
+        self.calculated = []
+        monitor._process_events(new_relations)
+        self.assertEqual(self.calculated, [])
+        self.assertEqual(len(monitor.apic.pushed), 1)
+
+    def test_relation_removed_from_dependent_epg(self):
+        """
+        Test that deleting a relation from the parent EPG removes the inherited relation
+        """
+        monitor = self._get_monitor()
+        old_relations = monitor._process_events({})
+        monitor.apic.add_event('relations', self._get_relation_event('parent2', 'contract2'))
+        old_relations = monitor._process_events(old_relations)
+        monitor._inheritance_tags.db[('inheritanceautomatedtest', 'app', 'myapp', 'child2')] = [('fvRsProv',
+                                                                                               'contract2')]
+
+        self.calculated = []
+        monitor.apic.add_event('relations', self._get_relation_event('parent2', 'contract2', status='deleted'))
+        new_relations = monitor._process_events(old_relations)
+        self.assertEqual(self.calculated, ['child2'])
+        for epg in new_relations:
+            self.assertEqual(new_relations[epg], [])
+        self.assertIn('deleted', str(monitor.apic.pushed[-1]))
+
+
+class TestPushPlanner(unittest.TestCase):
+    """
+    Tests for the PushPlanner
+    """
+    @staticmethod
+    def _get_epg(epg_name, container_type='app'):
+        return EPGPolicy({"tenant": "inheritanceautomatedtest",
+                          "epg_container": {"name": "mycontainer",
+                                            "container_type": container_type},
+                          "name": epg_name})
+
+    def test_duplicate_relations(self):
+        """
+        Test that a relation planned multiple times is only pushed once
+        """
+        planner = PushPlanner()
+        self.assertFalse(planner.has_changes())
+        planner.add_relation(self._get_epg('epg1'), ('fvRsProv', 'contract1'))
+        planner.add_relation(self._get_epg('epg1'), ('fvRsProv', 'contract1'))
+        batches = planner.get_batches()
+        self.assertEqual(len(batches), 1)
+        url, tenant_json = batches[0]
+        self.assertEqual(url, '/api/mo/uni/tn-inheritanceautomatedtest.json')
+        app = tenant_json['fvTenant']['children'][0]['fvAp']
+        epg = app['children'][0]['fvAEPg']
+        self.assertEqual(epg['attributes']['name'], 'epg1')
+        self.assertEqual(epg['children'],
+                         [{'fvRsProv': {'attributes': {'tnVzBrCPName': 'contract1'}}},
+                          {'tagInst': {'attributes': {'name': 'inherited:fvRsProv:contract1'}}}])
+
+    def test_removed_relation(self):
+        """
+        Test that removing a relation after adding it in the same cycle pushes only the deletion
+        """
+        planner = PushPlanner()
+        planner.add_relation(self._get_epg('epg1', 'l3out'), ('fvRsConsIf', 'cif1'))
+        planner.remove_relation(self._get_epg('epg1', 'l3out'), ('fvRsConsIf', 'cif1'))
+        url, tenant_json = planner.get_batches()[0]
+        l3out = tenant_json['fvTenant']['children'][0]['l3extOut']
+        epg = l3out['children'][0]['l3extInstP']
+        self.assertEqual(epg['children'],
+                         [{'fvRsConsIf': {'attributes': {'tnVzCPIfName': 'cif1', 'status': 'deleted'}}},
+                          {'tagInst': {'attributes': {'name': 'inherited:fvRsConsIf:cif1', 'status': 'deleted'}}}])
+
+    def test_batch_size(self):
+        """
+        Test that the relations are split into bounded-size batches
+        """
+        planner = PushPlanner(batch_size=2)
+        for index in range(5):
+            planner.add_relation(self._get_epg('epg%s' % (index % 2)), ('fvRsCons', 'contract%s' % index))
+        batches = planner.get_batches()
+        self.assertEqual(len(batches), 3)
+        num_relations = 0
+        for url, tenant_json in batches:
+            app = tenant_json['fvTenant']['children'][0]['fvAp']
+            for epg in app['children']:
+                num_relations += len(epg['fvAEPg']['children']) // 2
+        self.assertEqual(num_relations, 5)
+        planner.clear()
+        self.assertFalse(planner.has_changes())
+
+
 class BaseBasicL3Out(BaseTestCase):
     """
     Base class for basic Inheritance test cases enabled on OutsideEPGs
@@ -2475,6 +2656,8 @@ if __name__ == '__main__':
     # Run the tests
     live = unittest.TestSuite()
     live.addTest(unittest.makeSuite(TestWithoutApicCommunication))
+    live.addTest(unittest.makeSuite(TestIncrementalRelations))
+    live.addTest(unittest.makeSuite(TestPushPlanner))
     live.addTest(unittest.makeSuite(TestBasicL3Out))
     live.addTest(unittest.makeSuite(TestContractEvents))
     live.addTest(unittest.makeSuite(TestSubnetEvents))
@@ -34,9 +34,101 @@ from acitoolkit.acitoolkit import OutsideL3, OutsideEPG, OutsideNetwork
 from acitoolkit.acitoolkit import Contract, ContractSubject, InputTerminal
 from acitoolkit.acitoolkit import OutputTerminal, Filter, FilterEntry
 from acitoolkit.acitoolkit import Credentials, Session
-from acitoolkit.acifakeapic import FakeSession
+from acitoolkit.acisnapshot import load_snapshot
+from multiprocessing.pool import ThreadPool
 import argparse
 import ipaddress
+import time
+
+
+def lint_rule(object_type):
+    """
+    Decorator subscribing a lint rule to a type of object in the TenantIndex.
+    The rule is called with the TenantIndex and each object of that type and
+    yields the messages to be reported.
+
+    :param object_type: String containing one of 'tenant', 'app', 'epg', 'bd',
+                        'context' or 'contract'
+    """
+    def decorator(func):
+        func.object_type = object_type
+        return func
+    return decorator
+
+
+class EPGInfo(object):
+    """
+    The relations of a single EPG as gathered by the TenantIndex
+    """
+    def __init__(self, app, epg):
+        self.app = app
+        self.epg = epg
+        self.bd = None
+        self.context = None
+        if epg.has_bd():
+            self.bd = epg.get_bd()
+            if self.bd.has_context():
+                self.context = self.bd.get_context()
+        self.provided = epg.get_all_provided()
+        self.consumed = epg.get_all_consumed()
+
+
+class TenantIndex(object):
+    """
+    Index of the objects and relations within a single Tenant.  The Tenant is
+    walked once and the index is shared by all of the lint rules.
+    """
+    def __init__(self, tenant):
+        self.tenant = tenant
+        self.apps = tenant.get_children(AppProfile)
+        self.bds = tenant.get_children(BridgeDomain)
+        self.contexts = tenant.get_children(Context)
+        self.contracts = tenant.get_children(Contract)
+        self.l3outs = tenant.get_children(OutsideL3)
+        self.epgs = []
+        self.epgs_by_app = {}
+        for app in self.apps:
+            self.epgs_by_app[app.name] = []
+            for epg in app.get_children(EPG):
+                epg_info = EPGInfo(app, epg)
+                self.epgs.append(epg_info)
+                self.epgs_by_app[app.name].append(epg_info)
+
+        # Relation maps
+        self.bds_by_context = {}
+        for bd in self.bds:
+            if bd.has_context():
+                self.bds_by_context.setdefault(bd.get_context().name, []).append(bd)
+        self.epgs_by_bd = {}
+        self.providers = {}
+        self.consumers = {}
+        self.provided_contexts = {}
+        for epg_info in self.epgs:
+            if epg_info.bd is not None:
+                self.epgs_by_bd.setdefault(epg_info.bd.name, []).append(epg_info)
+            for contract in epg_info.provided:
+                self.providers.setdefault(contract.name, []).append(epg_info)
+                if epg_info.bd is not None:
+                    contexts = self.provided_contexts.setdefault(contract.name, set())
+                    if epg_info.context is not None:
+                        contexts.add(epg_info.context.name)
+            for contract in epg_info.consumed:
+                self.consumers.setdefault(contract.name, []).append(epg_info)
+
+    def get_objects(self, object_type):
+        """
+        Get the objects of the specified type
+
+        :param object_type: String containing the object type
+        :return: List of objects
+        """
+        if object_type == 'tenant':
+            return [self.tenant]
+        return {'app': self.apps,
+                'epg': self.epgs,
+                'bd': self.bds,
+                'context': self.contexts,
+                'contract': self.contracts}[object_type]
 
 
 class Checker(object):
@@ -44,11 +136,18 @@ class Checker(object):
     Checker class contains a series of lint checks that are executed against the
     provided configuration.
     """
-    def __init__(self, session, output, fh=None):
-        print('Getting configuration from APIC....')
-        self.tenants = Tenant.get_deep(session)
+    OBJECT_TYPES = ('tenant', 'app', 'epg', 'bd', 'context', 'contract')
+
+    def __init__(self, session, output, fh=None, workers=1, tenants=None):
+        if tenants is None:
+            print('Getting configuration from APIC....')
+            tenants = Tenant.get_deep(session)
+        self.tenants = tenants
         self.output = output
         self.file = fh
+        self.workers = workers
+        self.timings = {}
+        self.index_time = 0
         print('Processing configuration....')
 
     def output_handler(self, msg):
@@ -91,171 +190,106 @@ class Checker(object):
                 return False
         return True
 
-    def warning_001(self):
+    @lint_rule('tenant')
+    def warning_001(self, index, tenant):
         """
         W001: Tenant has no app profile
         """
-        for tenant in self.tenants:
-            if len(tenant.get_children(AppProfile)) == 0:
-                self.output_handler("Warning 001: Tenant '%s' has no Application "
-                                    "Profile." % tenant.name)
+        if len(index.apps) == 0:
+            yield ("Warning 001: Tenant '%s' has no Application "
+                   "Profile." % tenant.name)
 
-    def warning_002(self):
+    @lint_rule('tenant')
+    def warning_002(self, index, tenant):
         """
         W002: Tenant has no context
         """
-        for tenant in self.tenants:
-            if len(tenant.get_children(Context)) == 0:
-                self.output_handler("Warning 002: Tenant '%s' has no Context." % tenant.name)
+        if len(index.contexts) == 0:
+            yield "Warning 002: Tenant '%s' has no Context." % tenant.name
 
-    def warning_003(self):
+    @lint_rule('app')
+    def warning_003(self, index, app):
         """
         W003: AppProfile has no EPGs
         """
-        for tenant in self.tenants:
-            for app in tenant.get_children(AppProfile):
-                if len(app.get_children(EPG)) == 0:
-                    self.output_handler("Warning 003: AppProfile '%s' in Tenant '%s'"
-                                        "has no EPGs." % (app.name, tenant.name))
+        if len(index.epgs_by_app[app.name]) == 0:
+            yield ("Warning 003: AppProfile '%s' in Tenant '%s'"
+                   "has no EPGs." % (app.name, index.tenant.name))
 
-    def warning_004(self):
+    @lint_rule('context')
+    def warning_004(self, index, context):
         """
         W004: Context has no BridgeDomain
         """
-        for tenant in self.tenants:
-            contexts = []
-            for context in tenant.get_children(Context):
-                contexts.append(context.name)
-            for bd in tenant.get_children(BridgeDomain):
-                if bd.has_context():
-                    context = bd.get_context().name
-                    if context in contexts:
-                        contexts.remove(context)
-            for context in contexts:
-                self.output_handler("Warning 004: Context '%s' in Tenant '%s' has no "
-                                    "BridgeDomains." % (context, tenant.name))
-
-    def warning_005(self):
+        if context.name not in index.bds_by_context:
+            yield ("Warning 004: Context '%s' in Tenant '%s' has no "
+                   "BridgeDomains." % (context.name, index.tenant.name))
+
+    @lint_rule('bd')
+    def warning_005(self, index, bd):
         """
         W005: BridgeDomain has no EPGs assigned
         """
-        for tenant in self.tenants:
-            bds = []
-            for bd in tenant.get_children(BridgeDomain):
-                bds.append(bd.name)
-            for app in tenant.get_children(AppProfile):
-                for epg in app.get_children(EPG):
-                    if epg.has_bd():
-                        bd = epg.get_bd().name
-                        if bd in bds:
-                            bds.remove(bd)
-            for bd in bds:
-                self.output_handler("Warning 005: BridgeDomain '%s' in Tenant '%s'"
-                                    " has no EPGs." % (bd, tenant.name))
-
-    def warning_006(self):
+        if bd.name not in index.epgs_by_bd:
+            yield ("Warning 005: BridgeDomain '%s' in Tenant '%s'"
+                   " has no EPGs." % (bd.name, index.tenant.name))
+
+    @lint_rule('contract')
+    def warning_006(self, index, contract):
         """
         W006: Contract is not provided at all.
         """
-        for tenant in self.tenants:
-            contracts = []
-            for contract in tenant.get_children(Contract):
-                contracts.append(contract.name)
-            for app in tenant.get_children(AppProfile):
-                for epg in app.get_children(EPG):
-                    provided = epg.get_all_provided()
-                    for contract in provided:
-                        if contract.name in contracts:
-                            contracts.remove(contract.name)
-            for contract in contracts:
-                self.output_handler("Warning 006: Contract '%s' in Tenant '%s' is not"
-                                    " provided at all." % (contract, tenant.name))
-
-    def warning_007(self):
+        if contract.name not in index.providers:
+            yield ("Warning 006: Contract '%s' in Tenant '%s' is not"
+                   " provided at all." % (contract.name, index.tenant.name))
+
+    @lint_rule('contract')
+    def warning_007(self, index, contract):
         """
         W007: Contract is not consumed at all.
         """
-        for tenant in self.tenants:
-            contracts = []
-            for contract in tenant.get_children(Contract):
-                contracts.append(contract.name)
-            for app in tenant.get_children(AppProfile):
-                for epg in app.get_children(EPG):
-                    consumed = epg.get_all_consumed()
-                    for contract in consumed:
-                        if contract.name in contracts:
-                            contracts.remove(contract.name)
-            for contract in contracts:
-                self.output_handler("Warning 007: Contract '%s' in Tenant '%s' is not"
-                                    " consumed at all." % (contract, tenant.name))
-
-    def warning_008(self):
+        if contract.name not in index.consumers:
+            yield ("Warning 007: Contract '%s' in Tenant '%s' is not"
+                   " consumed at all." % (contract.name, index.tenant.name))
+
+    @lint_rule('epg')
+    def warning_008(self, index, epg_info):
         """
         W008: EPG providing contracts but in a Context with no enforcement.
         """
-        for tenant in self.tenants:
-            for app in tenant.get_children(AppProfile):
-                for epg in app.get_children(EPG):
-                    if len(epg.get_all_provided()):
-                        if epg.has_bd():
-                            bd = epg.get_bd()
-                            if bd.has_context():
-                                context = bd.get_context()
-                                if context.get_allow_all():
-                                    self.output_handler("Warning 008: EPG '%s' providing "
-                                                        "contracts in Tenant '%s', App"
-                                                        "Profile '%s' but Context '%s' "
-                                                        "is not enforcing." % (epg.name,
-                                                                               tenant.name,
-                                                                               app.name,
-                                                                               context.name))
-
-    def warning_010(self):
+        if len(epg_info.provided) and epg_info.context is not None:
+            if epg_info.context.get_allow_all():
+                yield ("Warning 008: EPG '%s' providing "
+                       "contracts in Tenant '%s', App"
+                       "Profile '%s' but Context '%s' "
+                       "is not enforcing." % (epg_info.epg.name,
+                                              index.tenant.name,
+                                              epg_info.app.name,
+                                              epg_info.context.name))
+
+    @lint_rule('tenant')
+    def warning_010(self, index, tenant):
         """
         W010: EPG providing contract but consuming EPG is in a different
               context.
         """
-        provide_db = {}
-        for tenant in self.tenants:
-            for app in tenant.get_children(AppProfile):
-                for epg in app.get_children(EPG):
-                    if epg.has_bd():
-                        bd = epg.get_bd()
-                        if bd.has_context():
-                            context = bd.get_context()
-                        provided = epg.get_all_provided()
-                        for contract in provided:
-                            if tenant.name not in provide_db:
-                                provide_db[tenant.name] = {}
-                            if contract.name not in provide_db[tenant.name]:
-                                provide_db[tenant.name][contract.name] = []
-                            if context.name not in provide_db[tenant.name][contract.name]:
-                                provide_db[tenant.name][contract.name].append(context.name)
-
-        for tenant in self.tenants:
-            if tenant.name not in provide_db:
-                self.output_handler("Warning 010: No contract provided within"
-                                    " this tenant '%s'" % tenant.name)
-                continue  # don't repeat this message for each option below.
-            epgs = []
-            for app in tenant.get_children(AppProfile):
-                for epg in app.get_children(EPG):
-                    epgs.append(epg)
-            for epg in epgs:
-                if epg.has_bd():
-                    bd = epg.get_bd()
-                    if bd.has_context():
-                        context = bd.get_context()
-                    consumed = epg.get_all_consumed()
-                    for contract in consumed:
-                        if contract.name not in provide_db[tenant.name]:
-                            self.output_handler("Warning 010: Contract '%s' not provided "
-                                                "within the same tenant "
-                                                "'%s'" % (contract.name, tenant.name))
-                        elif context.name not in provide_db[tenant.name][contract.name]:
-                            self.output_handler("Warning 010: Contract '%s' not provided in context '%s' "
-                                                "where it is being consumed for"
-                                                " tenant '%s'" % (contract.name, context.name, tenant.name))
+        if len(index.provided_contexts) == 0:
+            yield ("Warning 010: No contract provided within"
+                   " this tenant '%s'" % tenant.name)
+            return
+        for epg_info in index.epgs:
+            if epg_info.bd is None:
+                continue
+            for contract in epg_info.consumed:
+                if contract.name not in index.provided_contexts:
+                    yield ("Warning 010: Contract '%s' not provided "
+                           "within the same tenant "
+                           "'%s'" % (contract.name, tenant.name))
+                elif (epg_info.context is not None and
+                      epg_info.context.name not in index.provided_contexts[contract.name]):
+                    yield ("Warning 010: Contract '%s' not provided in context '%s' "
+                           "where it is being consumed for"
+                           " tenant '%s'" % (contract.name, epg_info.context.name, tenant.name))
 
     @staticmethod
     def subj_matches_proto(filterlist, protocol):
@@ -273,240 +307,187 @@ class Checker(object):
                     return True
         return False
 
-    def warning_011(self):
+    def _get_bidi_state(self, contract, protocol):
+        """
+        Check whether the contract has a bidirectional subject for the protocol
+
+        :param contract: Contract instance
+        :param protocol: The protocol we are looking for.
+        :return: 3 if a subject is bidirectional, 2 if a subject is explicitly
+                 bidirectional through its terminals, 1 or 0 otherwise.
+        """
+        is_bidi = 0
+        for subject in contract.get_children(ContractSubject):
+            if self.subj_matches_proto(subject.get_filters(), protocol):
+                is_bidi = 3
+                break
+
+            in_terminal = subject.get_children(InputTerminal)
+            out_terminal = subject.get_children(OutputTerminal)
+            if in_terminal:
+                in_filterlist = in_terminal[0].get_filters()
+            else:
+                in_filterlist = ()
+            if out_terminal:
+                out_filterlist = out_terminal[0].get_filters()
+            else:
+                out_filterlist = ()
+
+            if in_filterlist:
+                if self.subj_matches_proto(in_filterlist, protocol):
+                    is_bidi = 1
+            if out_filterlist:
+                if self.subj_matches_proto(out_filterlist, protocol):
+                    is_bidi += 1
+            # Otherwise, either there are no terminals so it's a permit
+            # everything which doesn't count.
+
+            if is_bidi:
+                break
+        return is_bidi
+
+    @lint_rule('contract')
+    def warning_011(self, index, contract):
         """
         W011: Contract has Bidirectional TCP Subjects.
         """
-        for tenant in self.tenants:
-            for contract in tenant.get_children(Contract):
-                is_tcp_bidi = 0
-                for subject in contract.get_children(ContractSubject):
-                    if self.subj_matches_proto(subject.get_filters(), 'tcp'):
-                        is_tcp_bidi = 3
-                        break
-
-                    in_terminal = subject.get_children(InputTerminal)
-                    out_terminal = subject.get_children(OutputTerminal)
-                    if in_terminal:
-                        in_filterlist = in_terminal[0].get_filters()
-                    else:
-                        in_filterlist = ()
-                    if out_terminal:
-                        out_filterlist = out_terminal[0].get_filters()
-                    else:
-                        out_filterlist = ()
-
-                    if in_filterlist:
-                        if self.subj_matches_proto(in_filterlist, 'tcp'):
-                            is_tcp_bidi = 1
-                    if out_filterlist:
-                        if self.subj_matches_proto(out_filterlist, 'tcp'):
-                            is_tcp_bidi += 1
-                    # Otherwise, either there are no terminals so it's a permit
-                    # everything which doesn't count.
-
-                    if is_tcp_bidi:
-                        break
-
-                if is_tcp_bidi == 3:
-                    self.output_handler("Warning 011: In tenant '%s' contract "
-                                        "'%s' is a Bidirectional TCP contract."
-                                        % (tenant.name, contract.name))
-                elif is_tcp_bidi == 2:
-                    self.output_handler("Warning 011: In tenant '%s' contract "
-                                        "'%s' is an explictly "
-                                        "Bidirectional TCP contract."
-                                        % (tenant.name, contract.name))
-
-    def warning_012(self):
+        is_tcp_bidi = self._get_bidi_state(contract, 'tcp')
+        if is_tcp_bidi == 3:
+            yield ("Warning 011: In tenant '%s' contract "
+                   "'%s' is a Bidirectional TCP contract."
+                   % (index.tenant.name, contract.name))
+        elif is_tcp_bidi == 2:
+            yield ("Warning 011: In tenant '%s' contract "
+                   "'%s' is an explictly "
+                   "Bidirectional TCP contract."
+                   % (index.tenant.name, contract.name))
+
+    @lint_rule('contract')
+    def warning_012(self, index, contract):
         """
         W012: Contract has Bidirectional UDP Subjects.
         """
-        for tenant in self.tenants:
-            for contract in tenant.get_children(Contract):
-                is_udp_bidi = 0
-                for subject in contract.get_children(ContractSubject):
-                    if self.subj_matches_proto(subject.get_filters(), 'udp'):
-                        is_udp_bidi = 3
-                        break
-
-                    in_terminal = subject.get_children(InputTerminal)
-                    out_terminal = subject.get_children(OutputTerminal)
-                    if in_terminal:
-                        in_filterlist = in_terminal[0].get_filters()
-                    else:
-                        in_filterlist = ()
-                    if out_terminal:
-                        out_filterlist = out_terminal[0].get_filters()
-                    else:
-                        out_filterlist = ()
-
-                    if in_filterlist:
-                        if self.subj_matches_proto(in_filterlist, 'udp'):
-                            is_udp_bidi = 1
-                    if out_filterlist:
-                        if self.subj_matches_proto(out_filterlist, 'udp'):
-                            is_udp_bidi += 1
-                    # Otherwise, either there are no terminals so it's a permit
-                    # everything which doesn't count.
-
-                    if is_udp_bidi:
-                        break
-
-                if is_udp_bidi == 3:
-                    self.output_handler("Warning 012: In tenant '%s' contract "
-                                        "'%s' is a Bidirectional UDP contract."
-                                        % (tenant.name, contract.name))
-                elif is_udp_bidi == 2:
-                    self.output_handler("Warning 012: In tenant '%s' contract "
-                                        "'%s' is an explictly "
-                                        "Bidirectional UDP contract."
-                                        % (tenant.name, contract.name))
-
-    def warning_013(self):
+        is_udp_bidi = self._get_bidi_state(contract, 'udp')
+        if is_udp_bidi == 3:
+            yield ("Warning 012: In tenant '%s' contract "
+                   "'%s' is a Bidirectional UDP contract."
+                   % (index.tenant.name, contract.name))
+        elif is_udp_bidi == 2:
+            yield ("Warning 012: In tenant '%s' contract "
+                   "'%s' is an explictly "
+                   "Bidirectional UDP contract."
+                   % (index.tenant.name, contract.name))
+
+    @lint_rule('contract')
+    def warning_013(self, index, contract):
         """
         W013: Contract has no Subjects.
         """
-        for tenant in self.tenants:
-            for contract in tenant.get_children(Contract):
-                if len(contract.get_children(ContractSubject)) == 0:
-                    self.output_handler("Warning 013: In tenant '%s' contract "
-                                        "'%s' has no Subjects."
-                                        % (tenant.name, contract.name))
+        if len(contract.get_children(ContractSubject)) == 0:
+            yield ("Warning 013: In tenant '%s' contract "
+                   "'%s' has no Subjects."
+                   % (index.tenant.name, contract.name))
 
-    def warning_014(self):
+    @lint_rule('contract')
+    def warning_014(self, index, contract):
         """
         W014: Contract has Subjects with no Filters.
         """
-        for tenant in self.tenants:
-            for contract in tenant.get_children(Contract):
-                missing_filter = False
-                for subject in contract.get_children(ContractSubject):
-                    if len(subject.get_filters()) == 0:
-                        # No directly attached filters...
-                        for terminal in subject.get_children(InputTerminal):
-                            if len(terminal.get_filters()) == 0:
-                                for out_terminal in subject.get_children(OutputTerminal):
-                                    if len(out_terminal.get_filters()) == 0:
-                                        missing_filter = True
-                    if missing_filter:
-                        self.output_handler("Warning 014: In tenant '%s' contract "
-                                            "'%s' subject '%s' has no Filters." % (tenant.name,
-                                                                                   contract.name,
-                                                                                   subject.name))
-
-    def error_001(self):
+        missing_filter = False
+        for subject in contract.get_children(ContractSubject):
+            if len(subject.get_filters()) == 0:
+                # No directly attached filters...
+                for terminal in subject.get_children(InputTerminal):
+                    if len(terminal.get_filters()) == 0:
+                        for out_terminal in subject.get_children(OutputTerminal):
+                            if len(out_terminal.get_filters()) == 0:
+                                missing_filter = True
+            if missing_filter:
+                yield ("Warning 014: In tenant '%s' contract "
+                       "'%s' subject '%s' has no Filters." % (index.tenant.name,
+                                                              contract.name,
+                                                              subject.name))
+
+    @lint_rule('bd')
+    def error_001(self, index, bd):
         """
         E001: BridgeDomain has no Context
         """
-        for tenant in self.tenants:
-            for bd in tenant.get_children(BridgeDomain):
-                if not bd.has_context():
-                    self.output_handler("Error 001: BridgeDomain '%s' in tenant '%s' "
-                                        "has no Context assigned." % (bd.name, tenant.name))
+        if not bd.has_context():
+            yield ("Error 001: BridgeDomain '%s' in tenant '%s' "
+                   "has no Context assigned." % (bd.name, index.tenant.name))
 
-    def error_002(self):
+    @lint_rule('epg')
+    def error_002(self, index, epg_info):
         """
         E002: EPG has no BD assigned.
         """
-        for tenant in self.tenants:
-            for app in tenant.get_children(AppProfile):
-                for epg in app.get_children(EPG):
-                    if not epg.has_bd():
-                        self.output_handler("Error 002: EPG '%s' in Tenant '%s', "
-                                            "AppProfile '%s' has no BridgeDomain "
-                                            "assigned." % (epg.name, tenant.name,
-                                                           app.name))
+        if epg_info.bd is None:
+            yield ("Error 002: EPG '%s' in Tenant '%s', "
+                   "AppProfile '%s' has no BridgeDomain "
+                   "assigned." % (epg_info.epg.name, index.tenant.name,
+                                  epg_info.app.name))
 
     def error_004(self):
         # E004: EPG not assigned to an interface or VMM domain
         pass
 
-    def error_005(self):
+    @lint_rule('tenant')
+    def error_005(self, index, tenant):
         """
         E005: Overlapping subnets are defined in a single context.
         Note: Only subnets inside the fabric are inspected.
-        """
-        for tenant in self.tenants:
-            context_info = {}
-            for bd in tenant.get_children(BridgeDomain):
-                current_context = bd.get_context()
-                if not current_context:
-                    # BridgeDomain has no Context so ignore it.
-                    continue
-                if current_context not in context_info:
-                    context_info[current_context] = {'v4list': [],
-                                                     'v6list': []}
-                for subnet in bd.get_subnets():
-                    try:
-                        ip_subnet = ipaddress.ip_network(unicode(subnet.addr),
-                                                         strict=False)
-                    except NameError:
-                        # Python3 doesn't support unicode anymore
-                        ip_subnet = ipaddress.ip_network(str(subnet.addr),
-                                                         strict=False)
-                    index = 0
-                    index_to_insert = 0
-                    if ip_subnet.version == 4:
-                        address_list = context_info[current_context]['v4list']
-                    else:
-                        address_list = context_info[current_context]['v6list']
-
-                    while index < len(address_list):
-                        if ip_subnet == address_list[index]['addr']:
-                            index_to_insert = index
-                            if bd.name != address_list[index]['bd']:
-                                # Because sometimes they are equal...
-                                self.output_handler(
-                                    "Error 005: In tenant/context '{}/{}': "
-                                    "subnet {} in BridgeDomain '{}' "
-                                    "duplicated by subnet {} in BridgeDomain "
-                                    "'{}'".format(tenant.name,
-                                                  current_context,
-                                                  ip_subnet.with_prefixlen,
-                                                  bd.name,
-                                                  address_list[index][
-                                                      'addr'].with_prefixlen,
-                                                  address_list[index]['bd']))
-                        elif ip_subnet < address_list[index]['addr']:
-                            index_to_insert = index + 1
-                            if ip_subnet.overlaps(address_list[index]['addr']):
-                                self.output_handler(
-                                    "Error 005: In tenant/context '{}/{}': "
-                                    "subnet {} in BridgeDomain '{}' "
-                                    "contains subnet {} in BridgeDomain "
-                                    "'{}'".format(tenant.name,
-                                                  current_context,
-                                                  ip_subnet.with_prefixlen,
-                                                  bd.name,
-                                                  address_list[index - 1][
-                                                      'addr'].with_prefixlen,
-                                                  address_list[index - 1]['bd']))
-                            else:
-                                break
-                        elif address_list[index]['addr'].overlaps(ip_subnet):
-                            index_to_insert = index
-                            self.output_handler("Error 005: In tenant/context "
-                                                "'{}/{}': subnet {} in "
-                                                "BridgeDomain '{}' contains "
-                                                "subnet {} in BridgeDomain "
-                                                "'{}'".format(tenant.name,
-                                                              current_context,
-                                                              address_list[index][
-                                                                  'addr'].with_prefixlen,
-                                                              address_list[index]['bd'],
-                                                              ip_subnet.with_prefixlen,
-                                                              bd.name))
-                            break
-                        index += 1
-                    if index_to_insert:
-                        address_list.insert(index_to_insert, {'addr': ip_subnet,
-                                                              'bd': bd.name})
+
+        The subnets of each context are sorted by address and prefix length
+        so that any subnet containing another one precedes it.  A single
+        sweep then compares each subnet with the closest containing subnet.
+        """
+        context_info = {}
+        for bd in index.bds:
+            current_context = bd.get_context()
+            if not current_context:
+                # BridgeDomain has no Context so ignore it.
+                continue
+            for subnet in bd.get_subnets():
+                try:
+                    ip_subnet = ipaddress.ip_network(unicode(subnet.addr),
+                                                     strict=False)
+                except NameError:
+                    # Python3 doesn't support unicode anymore
+                    ip_subnet = ipaddress.ip_network(str(subnet.addr),
+                                                     strict=False)
+                key = (current_context.name, ip_subnet.version)
+                context_info.setdefault(key, []).append((ip_subnet, bd.name))
+
+        for (context_name, version) in sorted(context_info):
+            address_list = sorted(context_info[(context_name, version)],
+                                  key=lambda x: (x[0].network_address, x[0].prefixlen))
+            containing = []
+            for ip_subnet, bd_name in address_list:
+                while containing and not containing[-1][0].overlaps(ip_subnet):
+                    containing.pop()
+                if containing:
+                    outer_subnet, outer_bd_name = containing[-1]
+                    if ip_subnet == outer_subnet:
+                        if bd_name != outer_bd_name:
+                            # Because sometimes they are equal...
+                            yield ("Error 005: In tenant/context '{}/{}': "
+                                   "subnet {} in BridgeDomain '{}' "
+                                   "duplicated by subnet {} in BridgeDomain "
+                                   "'{}'".format(tenant.name, context_name,
+                                                 ip_subnet.with_prefixlen, bd_name,
+                                                 outer_subnet.with_prefixlen, outer_bd_name))
                     else:
-                        address_list.insert(index, {'addr': ip_subnet,
-                                                    'bd': bd.name})
+                        yield ("Error 005: In tenant/context '{}/{}': "
+                               "subnet {} in BridgeDomain '{}' "
+                               "contains subnet {} in BridgeDomain "
+                               "'{}'".format(tenant.name, context_name,
+                                             outer_subnet.with_prefixlen, outer_bd_name,
+                                             ip_subnet.with_prefixlen, bd_name))
+                containing.append((ip_subnet, bd_name))
 
-    def error_006(self):
+    @lint_rule('tenant')
+    def error_006(self, index, tenant):
         """
         E006: Check for duplicated subnets in ExternalNetworks.
 
@@ -514,111 +495,177 @@ class Checker(object):
         ExternalNetworks or between an ExternalNetwork and a BD within a
         single VRF. Overlapping but not the equal subnets are not a problem.
         """
-        for tenant in self.tenants:
-            context_set = {}
-            for l3out in tenant.get_children(OutsideL3):
-                current_ctxt = l3out.get_context()
-                if not current_ctxt:
-                    # OutsideL3 Network has no Context so ignore it.
-                    continue
-                if current_ctxt.name not in context_set:
-                    context_set[current_ctxt.name] = {}
-                current_subnets = context_set[current_ctxt.name]
-
-                for extnet in l3out.get_children(OutsideEPG):
-                    for subnet in extnet.get_children(OutsideNetwork):
-                        if subnet.addr in current_subnets:
-                            current_subnets[subnet.addr].append(
-                                "{}/{}/{}/{}".format(tenant.name,
-                                                     current_ctxt.name,
-                                                     l3out.name,
-                                                     extnet.name))
-                        else:
-                            current_subnets[subnet.addr] = [
-                                "{}/{}/{}/{}".format(tenant.name,
-                                                     current_ctxt.name,
-                                                     l3out.name,
-                                                     extnet.name)]
-            for current_ctxt in context_set:
-                for subnet in context_set[current_ctxt]:
-                    if 1 < len(context_set[current_ctxt][subnet]):
-                        for subnet_info in context_set[current_ctxt][subnet]:
-                            self.output_handler(
-                                "Error 006: In Tenant/Context/L3Out/ExtEPG "
-                                "'{}' found duplicate subnet {}.".format(
-                                    subnet_info, subnet))
-
-            for bd in tenant.get_children(BridgeDomain):
-                bd_ctxt = bd.get_context()
-                if not bd_ctxt:
-                    # BridgeDomain has no Context so ignore it.
-                    continue
-                if bd_ctxt.name not in context_set:
-                    # BridgeDomain Context has no associated ExternalNetworks so ignore it.
-                    continue
-                for subnet in bd.get_subnets():
-                    ip_subnet = ipaddress.ip_network(str(subnet.addr),
-                                                     strict=False)
-                    ip_subnet_str = ip_subnet.network_address
-                    if ip_subnet_str in context_set[bd_ctxt.name]:
-                        for subnet_info in context_set[bd_ctxt.name][ip_subnet_str]:
-                            self.output_handler(
-                                "Error 006: Subnet {0:s} in "
-                                "Tenant/Context/BridgeDomain '{}/{}/{}' "
-                                "conflicts with subnet {} in "
-                                "Tenant/Context/L3Out/ExtEPG '{}'.".format(
-                                    ip_subnet.with_prefixlen, tenant.name,
-                                    bd_ctxt.name, bd.name, ip_subnet_str,
-                                    subnet_info))
-
-    def critical_001(self):
+        context_set = {}
+        for l3out in index.l3outs:
+            current_ctxt = l3out.get_context()
+            if not current_ctxt:
+                # OutsideL3 Network has no Context so ignore it.
+                continue
+            if current_ctxt.name not in context_set:
+                context_set[current_ctxt.name] = {}
+            current_subnets = context_set[current_ctxt.name]
+
+            for extnet in l3out.get_children(OutsideEPG):
+                for subnet in extnet.get_children(OutsideNetwork):
+                    if subnet.addr in current_subnets:
+                        current_subnets[subnet.addr].append(
+                            "{}/{}/{}/{}".format(tenant.name,
+                                                 current_ctxt.name,
+                                                 l3out.name,
+                                                 extnet.name))
+                    else:
+                        current_subnets[subnet.addr] = [
+                            "{}/{}/{}/{}".format(tenant.name,
+                                                 current_ctxt.name,
+                                                 l3out.name,
+                                                 extnet.name)]
+        for current_ctxt in context_set:
+            for subnet in context_set[current_ctxt]:
+                if 1 < len(context_set[current_ctxt][subnet]):
+                    for subnet_info in context_set[current_ctxt][subnet]:
+                        yield ("Error 006: In Tenant/Context/L3Out/ExtEPG "
+                               "'{}' found duplicate subnet {}.".format(
+                                   subnet_info, subnet))
+
+        for bd in index.bds:
+            bd_ctxt = bd.get_context()
+            if not bd_ctxt:
+                # BridgeDomain has no Context so ignore it.
+                continue
+            if bd_ctxt.name not in context_set:
+                # BridgeDomain Context has no associated ExternalNetworks so ignore it.
+                continue
+            for subnet in bd.get_subnets():
+                ip_subnet = ipaddress.ip_network(str(subnet.addr),
+                                                 strict=False)
+                ip_subnet_str = ip_subnet.network_address
+                if ip_subnet_str in context_set[bd_ctxt.name]:
+                    for subnet_info in context_set[bd_ctxt.name][ip_subnet_str]:
+                        yield ("Error 006: Subnet {0:s} in "
+                               "Tenant/Context/BridgeDomain '{}/{}/{}' "
+                               "conflicts with subnet {} in "
+                               "Tenant/Context/L3Out/ExtEPG '{}'.".format(
+                                   ip_subnet.with_prefixlen, tenant.name,
+                                   bd_ctxt.name, bd.name, ip_subnet_str,
+                                   subnet_info))
+
+    @lint_rule('tenant')
+    def critical_001(self, index, tenant):
         """
         This is an example of a compliance check where all EPGs are expected
         to be tagged with either 'secure' or 'nonsecure' and secure EPGs are
         not allowed to provide or consume contracts from nonsecure EPGs.
         """
-        for tenant in self.tenants:
-            # Look at all the EPGs and verify that they are all
-            # assigned a security level
-            secure_epgs = []
-            nonsecure_epgs = []
-            for app in tenant.get_children(AppProfile):
-                for epg in app.get_children(EPG):
-                    if not self.ensure_tagged([epg], ('secure', 'nonsecure')):
-                        self.output_handler("Critical 001: EPG '%s' in tenant '%s' "
-                                            "app '%s' is not assigned security "
-                                            "clearance" % (epg.name, tenant.name, app.name))
-                    if epg.has_tag('secure'):
-                        if epg.has_tag('nonsecure'):
-                            self.output_handler("Critical 001: EPG '%s' in tenant '%s' "
-                                                "app '%s' is assigned secure and nonsecure security "
-                                                "clearance" % (epg.name, tenant.name, app.name))
-                            # Squirrel away the Secure EPGs
-                        secure_epgs.append(epg)
-                    else:
-                        nonsecure_epgs.append(epg)
-
-                # Verify that the secure EPGs are only providing/consuming from
-                # secure EPGs
-                for secure_epg in secure_epgs:
-                    for contract in secure_epg.get_all_provided():
-                        for nonsecure_epg in nonsecure_epgs:
-                            if nonsecure_epg.does_consume(contract):
-                                self.output_handler("Critical 001: Nonsecure EPG '%s' in tenant '%s' "
-                                                    "is consuming secure contract from 'EPG' %s" % (nonsecure_epg.name,
-                                                                                                    tenant.name,
-                                                                                                    secure_epg.name))
-                    for contract in secure_epg.get_all_consumed():
-                        for nonsecure_epg in nonsecure_epgs:
-                            if nonsecure_epg.does_provide(contract):
-                                self.output_handler("Critical 001: Nonsecure EPG '%s' in tenant '%s' "
-                                                    "is providing contract to secure EPG '%s'" % (nonsecure_epg.name,
-                                                                                                  tenant.name,
-                                                                                                  secure_epg.name))
+        # Look at all the EPGs and verify that they are all
+        # assigned a security level
+        secure_epgs = []
+        nonsecure_epgs = []
+        for app in index.apps:
+            for epg_info in index.epgs_by_app[app.name]:
+                epg = epg_info.epg
+                if not self.ensure_tagged([epg], ('secure', 'nonsecure')):
+                    yield ("Critical 001: EPG '%s' in tenant '%s' "
+                           "app '%s' is not assigned security "
+                           "clearance" % (epg.name, tenant.name, app.name))
+                if epg.has_tag('secure'):
+                    if epg.has_tag('nonsecure'):
+                        yield ("Critical 001: EPG '%s' in tenant '%s' "
+                               "app '%s' is assigned secure and nonsecure security "
+                               "clearance" % (epg.name, tenant.name, app.name))
+                        # Squirrel away the Secure EPGs
+                    secure_epgs.append(epg_info)
+                else:
+                    nonsecure_epgs.append(epg_info)
+
+            # Verify that the secure EPGs are only providing/consuming from
+            # secure EPGs
+            for secure_epg in secure_epgs:
+                for contract in secure_epg.provided:
+                    for nonsecure_epg in nonsecure_epgs:
+                        if nonsecure_epg.epg.does_consume(contract):
+                            yield ("Critical 001: Nonsecure EPG '%s' in tenant '%s' "
+                                   "is consuming secure contract from 'EPG' %s" % (nonsecure_epg.epg.name,
+                                                                                   tenant.name,
+                                                                                   secure_epg.epg.name))
+                for contract in secure_epg.consumed:
+                    for nonsecure_epg in nonsecure_epgs:
+                        if nonsecure_epg.epg.does_provide(contract):
+                            yield ("Critical 001: Nonsecure EPG '%s' in tenant '%s' "
+                                   "is providing contract to secure EPG '%s'" % (nonsecure_epg.epg.name,
+                                                                                 tenant.name,
+                                                                                 secure_epg.epg.name))
+
+    def check_tenant(self, tenant, methods):
+        """
+        Run the lint rules against a single Tenant.  The Tenant is indexed once
+        and each object is passed to the rules subscribed to its type.
+
+        :param tenant: Tenant instance
+        :param methods: List of strings containing the rule names
+        :return: Tuple containing a dictionary of the messages indexed by rule name,
+                 a dictionary of the time spent indexed by rule name and the
+                 time spent indexing the Tenant
+        """
+        timings = {}
+        start = time.time()
+        index = TenantIndex(tenant)
+        index_time = time.time() - start
+
+        subscriptions = {}
+        for method in methods:
+            rule = getattr(self, method)
+            object_type = getattr(rule, 'object_type', None)
+            if object_type is not None:
+                subscriptions.setdefault(object_type, []).append((method, rule))
+
+        messages = {}
+        for object_type in self.OBJECT_TYPES:
+            rules = subscriptions.get(object_type, [])
+            if not rules:
+                continue
+            for obj in index.get_objects(object_type):
+                for method, rule in rules:
+                    start = time.time()
+                    messages.setdefault(method, []).extend(rule(index, obj))
+                    timings[method] = timings.get(method, 0) + time.time() - start
+        return messages, timings, index_time
 
     def execute(self, methods):
+        """
+        Run the lint rules against all of the Tenants and report the messages
+        grouped by rule
+
+        :param methods: List of strings containing the rule names
+        """
+        if self.workers > 1:
+            pool = ThreadPool(self.workers)
+            try:
+                results = pool.map(lambda tenant: self.check_tenant(tenant, methods), self.tenants)
+            finally:
+                pool.close()
+        else:
+            results = [self.check_tenant(tenant, methods) for tenant in self.tenants]
+
+        self.timings = {}
+        self.index_time = 0
+        for messages, timings, index_time in results:
+            self.index_time += index_time
+            for method in timings:
+                self.timings[method] = self.timings.get(method, 0) + timings[method]
         for method in methods:
-            getattr(self, method)()
+            for messages, timings, index_time in results:
+                for msg in messages.get(method, []):
+                    self.output_handler(msg)
+
+    def print_timings(self):
+        """
+        Print the time spent in each rule, slowest first, and the time spent
+        indexing the Tenants
+        """
+        print('Rule timings:')
+        for method in sorted(self.timings, key=lambda x: self.timings[x], reverse=True):
+            print('%-14s %8.3f s' % (method, self.timings[method]))
+        print('Indexing the Tenants took %.3f s' % self.index_time)
 
 
 def acilint():
@@ -636,6 +683,10 @@ def acilint():
     creds.add_argument('-g', '--generateconfigfile',
                        type=argparse.FileType('w'))
     creds.add_argument('-o', '--output', required=False, default='console')
+    creds.add_argument('-w', '--workers', type=int, default=4,
+                       help='Number of threads checking the tenants in parallel (default is 4)')
+    creds.add_argument('-t', '--timings', action='store_true', default=False,
+                       help='Print the time spent in each check')
     args = creds.get()
     if args.generateconfigfile:
         print('Generating configuration file....')
@@ -662,8 +713,11 @@ def acilint():
             if method.startswith(('warning_', 'error_', 'critical_')):
                 methods.append(method)
 
+    tenants = None
+    session = None
     if args.snapshotfiles:
-        session = FakeSession(filenames=args.snapshotfiles)
+        print('Loading configuration from snapshot files....')
+        tenants = load_snapshot(args.snapshotfiles)
     else:
         # Login to APIC
         session = Session(args.url, args.login, args.password)
@@ -685,8 +739,10 @@ def acilint():
         </tr>
         """)
 
-    checker = Checker(session, args.output, html)
+    checker = Checker(session, args.output, html, workers=args.workers, tenants=tenants)
     checker.execute(methods)
+    if args.timings:
+        checker.print_timings()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,346 @@
+"""
+Test routines for acilint.  The Tenants are built in memory so these tests
+do not communicate with the APIC.
+"""
+import sys
+import unittest
+from acitoolkit.acitoolkit import (AppProfile, BridgeDomain, Context, Contract, ContractSubject, EPG,
+                                   Filter, FilterEntry, InputTerminal, OutputTerminal, OutsideEPG,
+                                   OutsideL3, OutsideNetwork, Subnet, Tenant)
+from acilint import Checker
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+METHODS = [method for method in dir(Checker) if method.startswith(('warning_', 'error_', 'critical_'))]
+
+
+class RecordingChecker(Checker):
+    """
+    Checker keeping the reported messages
+    """
+    def __init__(self, tenants, workers=1):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            super(RecordingChecker, self).__init__(None, 'console', workers=workers, tenants=tenants)
+        finally:
+            sys.stdout = stdout
+        self.messages = []
+
+    def output_handler(self, msg):
+        self.messages.append(msg)
+
+
+def check(tenants, methods=METHODS, workers=1):
+    """
+    Run the lint rules and return the messages
+    """
+    checker = RecordingChecker(tenants, workers)
+    checker.execute(methods)
+    return checker.messages
+
+
+def add_bd(tenant, name, context=None, subnets=()):
+    bd = BridgeDomain(name, tenant)
+    if context is not None:
+        bd.add_context(context)
+    for i, addr in enumerate(subnets):
+        subnet = Subnet('%s-subnet%s' % (name, i), bd)
+        subnet.set_addr(addr)
+    return bd
+
+
+def add_epg(app, name, bd=None, provided=(), consumed=(), tags=('secure',)):
+    epg = EPG(name, app)
+    if bd is not None:
+        epg.add_bd(bd)
+    for contract in provided:
+        epg.provide(contract)
+    for contract in consumed:
+        epg.consume(contract)
+    for tag in tags:
+        epg.add_tag(tag)
+    return epg
+
+
+def add_contract(tenant, name, protocol='tcp'):
+    contract = Contract(name, tenant)
+    subject = ContractSubject('subject', contract)
+    filter_obj = Filter('%s-filter' % name, tenant)
+    FilterEntry('entry', filter_obj, etherT='ip', prot=protocol)
+    subject.add_filter(filter_obj)
+    return contract
+
+
+class TestRules(unittest.TestCase):
+    """
+    Test the messages of each lint rule
+    """
+    def test_clean_tenant(self):
+        """
+        Test that a consistent tenant has no messages apart from the
+        bidirectional TCP contract
+        """
+        tenant = Tenant('tenant')
+        app = AppProfile('app', tenant)
+        context = Context('ctx', tenant)
+        bd = add_bd(tenant, 'bd', context, ['10.0.0.1/24'])
+        contract = add_contract(tenant, 'web')
+        add_epg(app, 'web', bd, provided=[contract])
+        add_epg(app, 'app', bd, consumed=[contract])
+        self.assertEqual(check([tenant]),
+                         ["Warning 011: In tenant 'tenant' contract 'web' is a Bidirectional TCP contract."])
+
+    def test_empty_tenant(self):
+        """
+        Test the messages of a tenant without any configuration
+        """
+        self.assertEqual(check([Tenant('empty')]),
+                         ["Warning 001: Tenant 'empty' has no Application Profile.",
+                          "Warning 002: Tenant 'empty' has no Context.",
+                          "Warning 010: No contract provided within this tenant 'empty'"])
+
+    def test_unused_objects(self):
+        """
+        Test the messages of the unused application profiles, contexts,
+        bridge domains and contracts
+        """
+        tenant = Tenant('tenant')
+        AppProfile('app', tenant)
+        Context('ctx', tenant)
+        add_bd(tenant, 'bd')
+        add_contract(tenant, 'web')
+        self.assertEqual(check([tenant], ['warning_003', 'warning_004', 'warning_005', 'warning_006',
+                                          'warning_007', 'error_001']),
+                         ["Warning 003: AppProfile 'app' in Tenant 'tenant'has no EPGs.",
+                          "Warning 004: Context 'ctx' in Tenant 'tenant' has no BridgeDomains.",
+                          "Warning 005: BridgeDomain 'bd' in Tenant 'tenant' has no EPGs.",
+                          "Warning 006: Contract 'web' in Tenant 'tenant' is not provided at all.",
+                          "Warning 007: Contract 'web' in Tenant 'tenant' is not consumed at all.",
+                          "Error 001: BridgeDomain 'bd' in tenant 'tenant' has no Context assigned."])
+
+    def test_not_enforcing_context(self):
+        """
+        Test that a provider EPG in a context that is not enforcing is reported
+        """
+        tenant = Tenant('tenant')
+        app = AppProfile('app', tenant)
+        context = Context('ctx', tenant)
+        context.set_allow_all()
+        bd = add_bd(tenant, 'bd', context)
+        add_epg(app, 'epg', bd, provided=[add_contract(tenant, 'web')])
+        self.assertEqual(check([tenant], ['warning_008']),
+                         ["Warning 008: EPG 'epg' providing contracts in Tenant 'tenant', "
+                          "AppProfile 'app' but Context 'ctx' is not enforcing."])
+
+    def test_consumed_in_other_context(self):
+        """
+        Test that a contract consumed in a context where it is not provided
+        and a contract that is not provided at all are reported
+        """
+        tenant = Tenant('tenant')
+        app = AppProfile('app', tenant)
+        bd1 = add_bd(tenant, 'bd1', Context('ctx1', tenant))
+        bd2 = add_bd(tenant, 'bd2', Context('ctx2', tenant))
+        web = add_contract(tenant, 'web')
+        db = add_contract(tenant, 'db')
+        add_epg(app, 'web', bd1, provided=[web])
+        add_epg(app, 'client', bd2, consumed=[web, db])
+        self.assertEqual(check([tenant], ['warning_010']),
+                         ["Warning 010: Contract 'web' not provided in context 'ctx2' "
+                          "where it is being consumed for tenant 'tenant'",
+                          "Warning 010: Contract 'db' not provided within the same tenant 'tenant'"])
+
+    def test_consumed_without_context(self):
+        """
+        Test that an EPG whose BridgeDomain has no context is not reported
+        as consuming from another context
+        """
+        tenant = Tenant('tenant')
+        app = AppProfile('app', tenant)
+        web = add_contract(tenant, 'web')
+        add_epg(app, 'web', add_bd(tenant, 'bd1', Context('ctx1', tenant)), provided=[web])
+        add_epg(app, 'client', add_bd(tenant, 'bd2'), consumed=[web])
+        add_epg(app, 'no-bd', consumed=[web])
+        self.assertEqual(check([tenant], ['warning_010']), [])
+
+    def test_provided_without_context(self):
+        """
+        Test that a contract provided only by an EPG whose BridgeDomain has
+        no context is reported where it is consumed
+        """
+        tenant = Tenant('tenant')
+        app = AppProfile('app', tenant)
+        web = add_contract(tenant, 'web')
+        add_epg(app, 'web', add_bd(tenant, 'bd1'), provided=[web])
+        add_epg(app, 'client', add_bd(tenant, 'bd2', Context('ctx2', tenant)), consumed=[web])
+        self.assertEqual(check([tenant], ['warning_010']),
+                         ["Warning 010: Contract 'web' not provided in context 'ctx2' "
+                          "where it is being consumed for tenant 'tenant'"])
+
+    def test_contract_subjects(self):
+        """
+        Test the messages of the contract subjects
+        """
+        tenant = Tenant('tenant')
+        add_contract(tenant, 'udp', protocol='udp')
+        Contract('no-subject', tenant)
+        subject = ContractSubject('subject', Contract('no-filter', tenant))
+        InputTerminal('input', subject)
+        OutputTerminal('output', subject)
+        self.assertEqual(check([tenant], ['warning_011', 'warning_012', 'warning_013', 'warning_014']),
+                         ["Warning 012: In tenant 'tenant' contract 'udp' is a Bidirectional UDP contract.",
+                          "Warning 013: In tenant 'tenant' contract 'no-subject' has no Subjects.",
+                          "Warning 014: In tenant 'tenant' contract 'no-filter' subject 'subject' "
+                          "has no Filters."])
+
+    def test_epg_without_bd(self):
+        """
+        Test that an EPG without a BridgeDomain is reported
+        """
+        tenant = Tenant('tenant')
+        add_epg(AppProfile('app', tenant), 'epg')
+        self.assertEqual(check([tenant], ['error_002']),
+                         ["Error 002: EPG 'epg' in Tenant 'tenant', AppProfile 'app' "
+                          "has no BridgeDomain assigned."])
+
+    def test_duplicate_external_subnets(self):
+        """
+        Test that a subnet in two external networks of a context is reported
+        """
+        tenant = Tenant('tenant')
+        context = Context('ctx', tenant)
+        l3out = OutsideL3('l3out', tenant)
+        l3out.add_context(context)
+        for name in ('ext1', 'ext2'):
+            OutsideNetwork('net', OutsideEPG(name, l3out), address='20.0.0.0/24')
+        self.assertEqual(check([tenant], ['error_006']),
+                         ["Error 006: In Tenant/Context/L3Out/ExtEPG 'tenant/ctx/l3out/ext1' "
+                          "found duplicate subnet 20.0.0.0/24.",
+                          "Error 006: In Tenant/Context/L3Out/ExtEPG 'tenant/ctx/l3out/ext2' "
+                          "found duplicate subnet 20.0.0.0/24."])
+
+    def test_security_clearance(self):
+        """
+        Test that EPGs without a security clearance and nonsecure EPGs
+        consuming secure contracts are reported
+        """
+        tenant = Tenant('tenant')
+        app = AppProfile('app', tenant)
+        bd = add_bd(tenant, 'bd', Context('ctx', tenant))
+        web = add_contract(tenant, 'web')
+        add_epg(app, 'web', bd, provided=[web])
+        add_epg(app, 'client', bd, consumed=[web], tags=('nonsecure',))
+        add_epg(app, 'untagged', bd, tags=())
+        self.assertEqual(check([tenant], ['critical_001']),
+                         ["Critical 001: EPG 'untagged' in tenant 'tenant' app 'app' "
+                          "is not assigned security clearance",
+                          "Critical 001: Nonsecure EPG 'client' in tenant 'tenant' "
+                          "is consuming secure contract from 'EPG' web"])
+
+
+class TestOverlappingSubnets(unittest.TestCase):
+    """
+    Test the overlapping subnets rule
+    """
+    def check_subnets(self, subnets_by_bd, context_by_bd=None):
+        tenant = Tenant('tenant')
+        contexts = {}
+        for bd_name in sorted(subnets_by_bd):
+            context_name = (context_by_bd or {}).get(bd_name, 'ctx')
+            if context_name not in contexts:
+                contexts[context_name] = Context(context_name, tenant)
+            add_bd(tenant, bd_name, contexts[context_name], subnets_by_bd[bd_name])
+        return check([tenant], ['error_005'])
+
+    def test_disjoint(self):
+        """
+        Test that disjoint subnets are not reported
+        """
+        self.assertEqual(self.check_subnets({'bd1': ['10.0.0.1/24', '10.0.2.1/24'],
+                                             'bd2': ['10.0.1.1/24', '2001:db8::1/64']}), [])
+
+    def test_nested(self):
+        """
+        Test that a subnet containing subnets of other BridgeDomains is
+        reported for each of them
+        """
+        self.assertEqual(self.check_subnets({'bd1': ['10.0.0.1/16'],
+                                             'bd2': ['10.0.1.1/24', '10.0.1.129/25'],
+                                             'bd3': ['10.1.0.1/24']}),
+                         ["Error 005: In tenant/context 'tenant/ctx': subnet 10.0.0.0/16 in "
+                          "BridgeDomain 'bd1' contains subnet 10.0.1.0/24 in BridgeDomain 'bd2'",
+                          "Error 005: In tenant/context 'tenant/ctx': subnet 10.0.1.0/24 in "
+                          "BridgeDomain 'bd2' contains subnet 10.0.1.128/25 in BridgeDomain 'bd2'"])
+
+    def test_duplicate(self):
+        """
+        Test that the same subnet in two BridgeDomains is reported
+        """
+        self.assertEqual(self.check_subnets({'bd1': ['10.0.0.1/24'],
+                                             'bd2': ['10.0.0.2/24']}),
+                         ["Error 005: In tenant/context 'tenant/ctx': subnet 10.0.0.0/24 in "
+                          "BridgeDomain 'bd2' duplicated by subnet 10.0.0.0/24 in BridgeDomain 'bd1'"])
+
+    def test_other_context(self):
+        """
+        Test that overlapping subnets in different contexts are not reported
+        """
+        self.assertEqual(self.check_subnets({'bd1': ['10.0.0.1/24'], 'bd2': ['10.0.0.1/16']},
+                                            {'bd1': 'ctx1', 'bd2': 'ctx2'}), [])
+
+
+class TestExecute(unittest.TestCase):
+    """
+    Test running the rules against several Tenants
+    """
+    def get_tenants(self):
+        tenants = [Tenant('empty')]
+        for i in range(8):
+            tenant = Tenant('tenant%s' % i)
+            app = AppProfile('app', tenant)
+            context = Context('ctx', tenant)
+            web = add_contract(tenant, 'web')
+            bd1 = add_bd(tenant, 'bd1', context, ['10.0.0.1/16'])
+            bd2 = add_bd(tenant, 'bd2', context if i % 2 else None, ['10.0.%s.1/24' % i])
+            add_epg(app, 'web', bd1, provided=[web])
+            add_epg(app, 'client', bd2, consumed=[web], tags=('nonsecure',))
+            tenants.append(tenant)
+        return tenants
+
+    def test_workers(self):
+        """
+        Test that the messages are the same and in the same order whatever
+        the number of workers
+        """
+        tenants = self.get_tenants()
+        messages = check(tenants)
+        self.assertTrue(messages)
+        self.assertEqual(check(tenants, workers=4), messages)
+
+    def test_print_timings(self):
+        """
+        Test that the indexing time is not reported as a rule
+        """
+        checker = RecordingChecker(self.get_tenants())
+        checker.execute(METHODS)
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            checker.print_timings()
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        lines = output.splitlines()
+        self.assertEqual(lines[0], 'Rule timings:')
+        self.assertTrue(lines[1:-1])
+        for line in lines[1:-1]:
+            self.assertIn(line.split()[0], METHODS)
+        self.assertTrue(lines[-1].startswith('Indexing the Tenants took'))
+
+
+if __name__ == '__main__':
+    unittest.main()
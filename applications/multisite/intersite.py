@@ -6,6 +6,7 @@ For documentation, refer to http://acitoolkit.readthedocs.org/en/latest/intersit
 from acitoolkit.acitoolkit import (Tenant, OutsideL3, OutsideEPG, OutsideNetwork,
                                    IPEndpoint, Session, Contract, ContractInterface,
                                    Taboo)
+from collections import OrderedDict
 import json
 import re
 import threading
@@ -28,6 +29,9 @@ import argparse
 # Maximum number of endpoints to handle in a single burst
 MAX_ENDPOINTS = 500
 
+# Minimum number of queued export policies to reconcile with bulk queries
+BULK_RECONCILE_POLICIES = 10
+
 endpoint_db_lock = threading.Lock()
 
 
@@ -121,113 +125,257 @@ class IntersiteTag(object):
         return self._remote_site
 
 
-class EndpointHandler(object):
+class PendingEndpointStore(object):
     """
-    Class responsible for tracking the Endpoints during processing.
-    Used to queue bursts of Endpoint events before sending to the APIC
+    Indexed store of the endpoint changes waiting to be pushed to the remote sites.
+    The changes are keyed by (tenant, l3out, instP, ip) for each remote site so that
+    a newer change for an endpoint replaces the queued one instead of both being pushed.
     """
-    def __init__(self, my_monitor):
-        self.db = {}  # Indexed by remote site
-        self.addresses = {}
-        self.mac_tracker = {}
-        self.endpoint_add_events = 0
-        self.endpoint_del_events = 0
-        self._monitor = my_monitor
+    def __init__(self):
+        self._changes = {}  # Indexed by remote site
+        self._instps = {}  # (tenant, l3out, ip) -> instP names with queued changes, indexed by remote site
+        self._in_flight = {}
+        self._condition = threading.Condition()
 
-    def _remove_queued_endpoint(self, remote_site, l3out_policy, endpoint):
-        if remote_site not in self.db:
-            return
-        # Find the remote site's list of tenant JSONs
-        db_entry = self.db[remote_site]
-        # Find the l3outs we should be looking at based on the policy
-        for tenant_json in db_entry:
-            if tenant_json['fvTenant']['attributes']['name'] != l3out_policy.tenant:
+    def add(self, remote_site, tenant, l3out, instp, ip, subnet_json, deleted):
+        """
+        Queue an endpoint change for a remote site
+
+        :param remote_site: String containing the remote site name
+        :param tenant: String containing the remote tenant name
+        :param l3out: String containing the remote OutsideL3 name
+        :param instp: String containing the remote OutsideEPG name
+        :param ip: String containing the endpoint IP address
+        :param subnet_json: JSON dictionary containing the l3extSubnet
+        :param deleted: True if the endpoint is being deleted
+        """
+        with self._condition:
+            changes = self._changes.setdefault(remote_site, OrderedDict())
+            instps = self._instps.setdefault(remote_site, {}).setdefault((tenant, l3out, ip), set())
+            if not deleted:
+                # A queued addition of the same address in another Outside EPG is stale
+                for other_instp in list(instps):
+                    other_key = (tenant, l3out, other_instp, ip)
+                    if other_instp != instp and not changes[other_key][1]:
+                        del changes[other_key]
+                        instps.discard(other_instp)
+            key = (tenant, l3out, instp, ip)
+            changes.pop(key, None)
+            changes[key] = (subnet_json, deleted)
+            instps.add(instp)
+            self._condition.notify_all()
+
+    def _requeue(self, remote_site, batch):
+        changes = self._changes.setdefault(remote_site, OrderedDict())
+        instps = self._instps.setdefault(remote_site, {})
+        for key, change in batch:
+            # Do not overwrite a newer change queued while the push was in progress
+            if key in changes:
                 continue
-            for l3out in tenant_json['fvTenant']['children']:
-                if 'l3extOut' not in l3out:
-                    continue
-                if l3out['l3extOut']['attributes']['name'] != l3out_policy.name:
+            changes[key] = change
+            instps.setdefault((key[0], key[1], key[3]), set()).add(key[2])
+
+    def take(self, remote_site, max_changes, timeout=None):
+        """
+        Remove a batch of changes for a remote site, waiting for one if needed.
+        The batch must be handed back with done().
+
+        :param remote_site: String containing the remote site name
+        :param max_changes: Maximum number of changes in the batch
+        :param timeout: Maximum number of seconds to wait for a change
+        :returns: List of ((tenant, l3out, instP, ip), (subnet_json, deleted)) tuples
+        """
+        with self._condition:
+            if not self._changes.get(remote_site) and timeout:
+                self._condition.wait(timeout)
+            changes = self._changes.get(remote_site)
+            batch = []
+            while changes and len(batch) < max_changes:
+                key, change = changes.popitem(last=False)
+                instps = self._instps[remote_site][(key[0], key[1], key[3])]
+                instps.discard(key[2])
+                if not instps:
+                    del self._instps[remote_site][(key[0], key[1], key[3])]
+                batch.append((key, change))
+            self._in_flight[remote_site] = self._in_flight.get(remote_site, 0) + len(batch)
+            return batch
+
+    def done(self, remote_site, batch, pushed=True):
+        """
+        Hand back a batch of changes returned by take()
+
+        :param remote_site: String containing the remote site name
+        :param batch: List of changes returned by take()
+        :param pushed: False if the changes could not be pushed and should be queued again
+        """
+        with self._condition:
+            if not pushed:
+                self._requeue(remote_site, batch)
+            self._in_flight[remote_site] -= len(batch)
+            self._condition.notify_all()
+
+    def get_pending_count(self, remote_site=None):
+        """
+        Get the number of changes queued or being pushed
+
+        :param remote_site: Optional string containing the remote site name
+        :returns: Integer number of changes
+        """
+        with self._condition:
+            sites = [remote_site] if remote_site is not None else list(self._changes.keys())
+            return sum(len(self._changes.get(site, {})) + self._in_flight.get(site, 0) for site in sites)
+
+    def get_sites(self):
+        """
+        :returns: List of the remote site names with queued changes
+        """
+        with self._condition:
+            return [site for site in self._changes if self._changes[site]]
+
+    def wait_until_empty(self, timeout=None):
+        """
+        Wait until all of the changes have been pushed
+
+        :param timeout: Maximum number of seconds to wait
+        :returns: True if all of the changes were pushed
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while any(self._changes.values()) or any(self._in_flight.values()):
+                if deadline is None:
+                    self._condition.wait(1)
                     continue
-                for l3instp in l3out['l3extOut']['children']:
-                    if 'l3extInstP' not in l3instp:
-                        continue
-                    remove_list = []
-                    for ep in l3instp['l3extInstP']['children']:
-                        if 'l3extSubnet' not in ep:
-                            continue
-                        if ep['l3extSubnet']['attributes']['name'] == '':
-                            logging.warning('Endpoint JSON has no name %s', ep)
-                        if endpoint.ip == '':
-                            logging.warning('Endpoint has no IP %s %s', endpoint.name, endpoint.ip)
-                        if ep['l3extSubnet']['attributes']['name'] == endpoint.ip:
-                            remove_list.append(ep)
-                    for ep in remove_list:
-                        l3instp['l3extInstP']['children'].remove(ep)
-
-    def _merge_tenant_json(self, remote_site, new_json):
-        """
-        Merge the JSON for the endpoint with the rest of the endpoints
-        already processed
-
-        :param remote_site: String containing the remote site to push the endpoint
-        :param new_json: JSON dictionary containing the JSON for the endpoint
-        """
-        # Add the remote site if the first endpoint for that site
-        if remote_site not in self.db:
-            self.db[remote_site] = [new_json]
-            return
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
 
-        # Look for the tenant JSON
-        db_json = self.db[remote_site]
-        tenant_found = False
-        for tenant_json in db_json:
-            if tenant_json['fvTenant']['attributes']['name'] == new_json['fvTenant']['attributes']['name']:
-                tenant_found = True
-                break
 
-        # Add the tenant if the first endpoint for this tenant
-        if not tenant_found:
-            self.db[remote_site].append(new_json)
-            return
+class RemoteSitePusher(threading.Thread):
+    """
+    Worker thread that pushes the queued endpoint changes to a single remote site.
+    A slow or unreachable remote site only delays its own changes.
+    """
+    def __init__(self, handler, remote_site, collector, max_changes=MAX_ENDPOINTS):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._handler = handler
+        self._remote_site = remote_site
+        self._collector = collector
+        self._max_changes = max_changes
+        self._exit = False
+        self._failures = 0
 
-        new_l3out = new_json['fvTenant']['children'][0]
-        assert 'l3extOut' in new_l3out
+    def exit(self):
+        """
+        Indicate that the thread should exit.
+        """
+        self._exit = True
 
-        # Find the l3out in the existing JSON
-        l3out_found = False
-        for l3out in tenant_json['fvTenant']['children']:
-            if 'l3extOut' not in l3out:
-                continue
-            if l3out['l3extOut']['attributes']['name'] == new_l3out['l3extOut']['attributes']['name']:
-                l3out_found = True
-                break
+    @staticmethod
+    def build_tenant_jsons(batch):
+        """
+        Build the tenant JSONs for a batch of changes.  The deletions are sent
+        before the additions so that an address moving between Outside EPGs
+        is removed from the old one first.
 
-        # Add the l3out JSON if the first endpoint for this tenant's l3out
-        if not l3out_found:
-            tenant_json['fvTenant']['children'].append(new_l3out)
-            return
+        :param batch: List of changes returned by PendingEndpointStore.take()
+        :returns: List of tenant JSON dictionaries
+        """
+        tenant_jsons = []
+        for deleted in (True, False):
+            tenants = OrderedDict()
+            for (tenant, l3out, instp, ip), (subnet_json, is_deleted) in batch:
+                if is_deleted != deleted:
+                    continue
+                if tenant not in tenants:
+                    tenants[tenant] = ({'fvTenant': {'attributes': {'name': tenant}, 'children': []}}, {})
+                tenant_json, instp_jsons = tenants[tenant]
+                if (l3out, instp) not in instp_jsons:
+                    l3out_json = {'l3extOut': {'attributes': {'name': l3out},
+                                               'children': [{'l3extInstP': {'attributes': {'name': instp},
+                                                                            'children': []}}]}}
+                    tenant_json['fvTenant']['children'].append(l3out_json)
+                    instp_jsons[(l3out, instp)] = l3out_json['l3extOut']['children'][0]
+                instp_jsons[(l3out, instp)]['l3extInstP']['children'].append(subnet_json)
+            tenant_jsons.extend(tenant_json for tenant_json, instp_jsons in tenants.values())
+        return tenant_jsons
+
+    def push(self, batch):
+        """
+        Push a batch of changes to the remote site
 
-        new_outside_epg = new_l3out['l3extOut']['children'][0]
-        assert 'l3extInstP' in new_outside_epg
+        :param batch: List of changes returned by PendingEndpointStore.take()
+        :returns: True if the batch was handled, False if it should be retried
+        """
+        remote_site_obj = self._collector.get_site(self._remote_site)
+        if remote_site_obj is None or remote_site_obj.session is None:
+            logging.error('Could not find remote site %s', self._remote_site)
+            return False
+        remote_session = remote_site_obj.session
+        for tenant_json in self.build_tenant_jsons(batch):
+            keep_trying = True
+            while keep_trying:
+                try:
+                    resp = remote_session.push_to_apic(Tenant.get_url(), tenant_json)
+                except (Timeout, ConnectionError):
+                    logging.error('Timeout error when attempting configuration push to %s', self._remote_site)
+                    return False
+                keep_trying = False
+                if not resp.ok:
+                    logging.warning('Could not push to remote site: %s %s', resp, resp.text)
+                    if resp.status_code == 400:
+                        keep_trying = self._handler.check_and_remove_duplicate(remote_session,
+                                                                               tenant_json,
+                                                                               resp.json())
+        return True
 
-        # Find the Outside EPG in the existing JSON
-        epg_found = False
-        for outside_epg in l3out['l3extOut']['children']:
-            if 'l3extInstP' not in outside_epg:
+    def run(self):
+        store = self._handler.pending
+        while not self._exit:
+            batch = store.take(self._remote_site, self._max_changes, timeout=1)
+            if not batch:
                 continue
-            if outside_epg['l3extInstP']['attributes']['name'] == new_outside_epg['l3extInstP']['attributes']['name']:
-                epg_found = True
-                break
+            pushed = False
+            try:
+                pushed = self.push(batch)
+            except Exception as e:
+                logging.error('Could not push to remote site %s: %s', self._remote_site, e)
+            store.done(self._remote_site, batch, pushed)
+            if pushed:
+                self._failures = 0
+            else:
+                # Back off while the remote site is unreachable
+                self._failures += 1
+                time.sleep(min(0.5 * 2 ** self._failures, 30))
 
-        if not epg_found:
-            l3out['l3extOut']['children'].append(new_outside_epg)
-            return
 
-        # Add the endpoint configuration with the existing JSON
-        new_endpoint = new_outside_epg['l3extInstP']['children'][0]
-        assert 'l3extSubnet' in new_endpoint
-        if new_endpoint not in outside_epg['l3extInstP']['children']:
-            outside_epg['l3extInstP']['children'].append(new_endpoint)
+class EndpointHandler(object):
+    """
+    Class responsible for tracking the Endpoints during processing.
+    Used to queue bursts of Endpoint events before sending to the APIC
+    """
+    def __init__(self, my_monitor):
+        self.pending = PendingEndpointStore()
+        self.pushers = {}  # Indexed by remote site
+        self.mac_tracker = {}
+        self.endpoint_add_events = 0
+        self.endpoint_del_events = 0
+        self._monitor = my_monitor
+
+    def _get_pusher(self, remote_site):
+        """
+        Get the pusher thread of a remote site, starting it if needed
+
+        :param remote_site: String containing the remote site name
+        """
+        pusher = self.pushers.get(remote_site)
+        if pusher is None or not pusher.is_alive():
+            pusher = RemoteSitePusher(self, remote_site, self._monitor._my_collector)
+            self.pushers[remote_site] = pusher
+            pusher.start()
+        return pusher
 
     def add_endpoint(self, endpoint, local_site):
         """
@@ -261,16 +409,6 @@ class EndpointHandler(object):
         else:
             self.mac_tracker[(tenant.name, app.name, epg.name, endpoint.name)] = endpoint.mac
 
-        # Track the IP to (Tenant, App, EPG)
-        # This is in case the IPs are moving from 1 EPG to another EPG then we want to
-        # send the currently queued endpoints before handling this endpoint to avoid
-        # a subnet already present error
-        if endpoint.name in self.addresses:
-            if self.addresses[endpoint.name] != (tenant.name, app.name, epg.name):
-                self.push_to_remote_sites(self._monitor._my_collector)
-        else:
-            self.addresses[endpoint.name] = (tenant.name, app.name, epg.name)
-
         # Get the policy for the EPG
         policy = local_site.get_policy_for_epg(tenant.name, app.name, epg.name)
         if policy is None:
@@ -288,12 +426,7 @@ class EndpointHandler(object):
         # Process the endpoint policy
         for remote_site_policy in policy.get_site_policies():
             for l3out_policy in remote_site_policy.get_interfaces():
-                # Remove existing JSON for the endpoint if any already queued since this
-                # update will override that
-                self._remove_queued_endpoint(remote_site_policy.name, l3out_policy, endpoint)
-
                 # Create the JSON
-                tag = IntersiteTag(tenant.name, app.name, epg.name, local_site.name)
                 remote_tenant = Tenant(l3out_policy.tenant)
                 remote_l3out = OutsideL3(l3out_policy.name, remote_tenant)
                 remote_epg = OutsideEPG(policy.remote_epg, remote_l3out)
@@ -304,10 +437,12 @@ class EndpointHandler(object):
                 remote_ep = OutsideNetwork(endpoint.name, remote_epg, address=remote_ep_ip)
                 if endpoint.is_deleted():
                     remote_ep.mark_as_deleted()
-                tenant_json = remote_tenant.get_json()
 
-                # Add to the database
-                self._merge_tenant_json(remote_site_policy.name, tenant_json)
+                # Queue the change.  Any change already queued for the endpoint is replaced.
+                self.pending.add(remote_site_policy.name, l3out_policy.tenant, l3out_policy.name,
+                                 policy.remote_epg, endpoint.name, remote_ep.get_json(),
+                                 endpoint.is_deleted())
+                self._get_pusher(remote_site_policy.name)
 
     def check_and_remove_duplicate(self, session, tenant_json, response):
         """
@@ -409,32 +544,31 @@ class EndpointHandler(object):
             return False
         return found_duplicates
 
-    def push_to_remote_sites(self, collector):
+    def push_to_remote_sites(self, collector, timeout=None):
         """
-        Push the endpoints to the remote sites
+        Start pushing the queued endpoints to the remote sites.  The pusher
+        threads drain the queue in the background so this only waits when
+        a timeout is given.  An unreachable remote site keeps its changes
+        queued.
+
+        :param collector: Instance of MultisiteCollector
+        :param timeout: Optional maximum number of seconds to wait
+        :returns: True if all of the queued endpoints were pushed
         """
         logging.debug('')
-        for remote_site in self.db:
-            remote_site_obj = collector.get_site(remote_site)
-            assert remote_site_obj is not None
-            remote_session = remote_site_obj.session
-            for tenant_json in self.db[remote_site]:
-                keep_trying = True
-                while keep_trying:
-                    try:
-                        resp = remote_session.push_to_apic(Tenant.get_url(), tenant_json)
-                    except Timeout:
-                        logging.error('Timeout error when attempting configuration push')
-                        return
-                    keep_trying = False
-                    if not resp.ok:
-                        logging.warning('Could not push to remote site: %s %s', resp, resp.text)
-                        if resp.status_code == 400:
-                            keep_trying = self.check_and_remove_duplicate(remote_session,
-                                                                          tenant_json,
-                                                                          resp.json())
-        self.db = {}
-        self.addresses = {}
+        for remote_site in self.pending.get_sites():
+            self._get_pusher(remote_site)
+        if self.pending.wait_until_empty(timeout or 0):
+            return True
+        logging.info('%s endpoint changes still pending', self.pending.get_pending_count())
+        return False
+
+    def shutdown(self):
+        """
+        Stop the pusher threads
+        """
+        for pusher in self.pushers.values():
+            pusher.exit()
 
 
 class MultisiteMonitor(threading.Thread):
@@ -454,6 +588,40 @@ class MultisiteMonitor(threading.Thread):
         Indicate that the thread should exit.
         """
         self._exit = True
+        self._endpoints.shutdown()
+
+    @staticmethod
+    def get_dirty_relation(export_policy, site_name, l3out, child):
+        """
+        Check a contract or taboo relation of a remote Outside EPG against the export policy
+
+        :param export_policy: Instance of ExportPolicy
+        :param site_name: String containing the remote site name
+        :param l3out: Instance of L3OutPolicy
+        :param child: JSON dictionary containing the child of the remote l3extInstP
+        :returns: JSON dictionary to delete the relation if it is not in the policy, None otherwise
+        """
+        if 'fvRsProv' in child:
+            name = child['fvRsProv']['attributes']['tnVzBrCPName']
+            if export_policy.provides(site_name, l3out.name, l3out.tenant, name):
+                return None
+            return {'fvRsProv': {'attributes': {'tnVzBrCPName': name, 'status': 'deleted'}}}
+        elif 'fvRsCons' in child:
+            name = child['fvRsCons']['attributes']['tnVzBrCPName']
+            if export_policy.consumes(site_name, l3out.name, l3out.tenant, name):
+                return None
+            return {'fvRsCons': {'attributes': {'tnVzBrCPName': name, 'status': 'deleted'}}}
+        elif 'fvRsProtBy' in child:
+            name = child['fvRsProtBy']['attributes']['tnVzTabooName']
+            if export_policy.protected_by(site_name, l3out.name, l3out.tenant, name):
+                return None
+            return {'fvRsProtBy': {'attributes': {'tnVzTabooName': name, 'status': 'deleted'}}}
+        elif 'fvRsConsIf' in child:
+            name = child['fvRsConsIf']['attributes']['tnVzCPIfName']
+            if export_policy.consumes_cif(site_name, l3out.name, l3out.tenant, name):
+                return None
+            return {'fvRsConsIf': {'attributes': {'tnVzCPIfName': name, 'status': 'deleted'}}}
+        return None
 
     def verify_policy(self, export_policy):
         for site in export_policy.get_site_policies():
@@ -480,41 +648,12 @@ class MultisiteMonitor(threading.Thread):
 
                 # Check that each entry matches the current policy
                 for child in resp.json()['imdata']:
-                    dirty = False
-                    dirty_children = []
-                    if 'fvRsProv' in child:
-                        if export_policy.provides(site.name, l3out.name, l3out.tenant,
-                                                  child['fvRsProv']['attributes']['tnVzBrCPName']):
-                            continue
-                        dirty = True
-                        dirty_children.append({'fvRsProv': {'attributes': {'tnVzBrCPName': child['fvRsProv']['attributes']['tnVzBrCPName'],
-                                                                           'status': 'deleted'}}})
-                    elif 'fvRsCons' in child:
-                        if export_policy.consumes(site.name, l3out.name, l3out.tenant,
-                                                  child['fvRsCons']['attributes']['tnVzBrCPName']):
-                            continue
-                        dirty = True
-                        dirty_children.append({'fvRsCons': {'attributes': {'tnVzBrCPName': child['fvRsCons']['attributes']['tnVzBrCPName'],
-                                                                           'status': 'deleted'}}})
-                    elif 'fvRsProtBy' in child:
-                        if export_policy.protected_by(site.name, l3out.name, l3out.tenant,
-                                                      child['fvRsProtBy']['attributes']['tnVzTabooName']):
-                            continue
-                        dirty = True
-                        dirty_children.append({'fvRsProtBy': {'attributes': {'tnVzTabooName': child['fvRsProtBy']['attributes']['tnVzTabooName'],
-                                                                             'status': 'deleted'}}})
-                    elif 'fvRsConsIf' in child:
-                        if export_policy.consumes_cif(site.name, l3out.name, l3out.tenant,
-                                                      child['fvRsConsIf']['attributes']['tnVzCPIfName']):
-                            continue
-                        dirty = True
-                        dirty_children.append({'fvRsConsIf': {'attributes': {'tnVzCPIfName': child['fvRsConsIf']['attributes']['tnVzCPIfName'],
-                                                                             'status': 'deleted'}}})
-                    if dirty:
+                    dirty_child = self.get_dirty_relation(export_policy, site.name, l3out, child)
+                    if dirty_child is not None:
                         logging.debug('cleaning dirty entry')
                         url = '/api/mo/uni/tn-%s/out-%s.json' % (l3out.tenant, l3out.name)
                         data = {'l3extInstP': {'attributes': {'name': export_policy.remote_epg},
-                                               'children': dirty_children}}
+                                               'children': [dirty_child]}}
                         resp = site_obj.session.push_to_apic(url, data)
                         if not resp.ok:
                             logging.warning('Could not push modified entry to remote site %s %s', resp, resp.text)
@@ -529,13 +668,8 @@ class MultisiteMonitor(threading.Thread):
         except ConnectionError:
             logging.error('Could not connect to APIC to get all endpoints for the EPG')
             return
-        num_eps = MAX_ENDPOINTS
         for endpoint in endpoints:
             self._endpoints.add_endpoint(endpoint, self._local_site)
-            num_eps -= 1
-            if num_eps == 0:
-                self._endpoints.push_to_remote_sites(self._my_collector)
-                num_eps = MAX_ENDPOINTS
 
     def handle_endpoint_event(self):
         num_eps = MAX_ENDPOINTS
@@ -544,7 +678,6 @@ class MultisiteMonitor(threading.Thread):
             logging.info('for Endpoint: %s', ep.name)
             self._endpoints.add_endpoint(ep, self._local_site)
             num_eps -= 1
-        self._endpoints.push_to_remote_sites(self._my_collector)
 
     def run(self):
         # Subscribe to endpoints
@@ -1189,13 +1322,156 @@ class LocalSite(Site):
         self.policy_tenant_queue = {}
         # Handle the cleanup for each policy
         with endpoint_db_lock:
+            policies = []
             for policy in self.policy_queue:
-                self.remove_stale_entries(policy)
-                self.monitor.handle_existing_endpoints(policy)
+                if policy not in policies:
+                    policies.append(policy)
+            if len(policies) >= BULK_RECONCILE_POLICIES:
+                try:
+                    self.reconcile_policies(policies)
+                except ConnectionError:
+                    logging.error('Could not reconcile the policies with the remote sites')
+            else:
+                for policy in policies:
+                    self.remove_stale_entries(policy)
+                    self.monitor.handle_existing_endpoints(policy)
             self.monitor._endpoints.push_to_remote_sites(self.monitor._my_collector)
         # Clear the queue
         self.policy_queue = []
 
+    @staticmethod
+    def _get_remote_instps(session):
+        """
+        Get the subnets and relations of all of the Outside EPGs of a remote site
+
+        :param session: Session of the remote site
+        :returns: Dictionary of the l3extInstP children indexed by (tenant, l3out, instP)
+        """
+        query_url = ('/api/node/class/l3extInstP.json?rsp-subtree=children&'
+                     'rsp-subtree-class=l3extSubnet,fvRsProv,fvRsCons,fvRsProtBy,fvRsConsIf')
+        resp = session.get(query_url)
+        if not resp.ok:
+            raise ConnectionError
+        instps = {}
+        for item in resp.json()['imdata']:
+            dn = item['l3extInstP']['attributes']['dn']
+            match = re.match(r'uni/tn-([^/]+)/out-([^/]+)/instP-(.+)$', dn)
+            if match is None:
+                continue
+            instps[match.groups()] = item['l3extInstP'].get('children', [])
+        return instps
+
+    def reconcile_policies(self, policies):
+        """
+        Reconcile the remote sites with a set of export policies using bulk
+        queries.  The local endpoints are read once and the Outside EPGs of
+        each remote site are read with a single class query.  The stale
+        subnets and relations are then deleted with one push per remote
+        tenant and the missing endpoints are queued to be pushed.  The
+        policies exported to a remote site that can not be read are
+        reconciled one at a time instead.
+
+        :param policies: List of ExportPolicy instances
+        """
+        logging.info('Reconciling %s policies', len(policies))
+        # Get all of the local endpoints
+        local_endpoints = {}
+        for endpoint in IPEndpoint.get(self.session):
+            epg = endpoint.get_parent()
+            app = epg.get_parent()
+            tenant = app.get_parent()
+            local_endpoints.setdefault((tenant.name, app.name, epg.name), []).append(endpoint)
+
+        remote_sites = {}
+        failed_sites = set()
+        for policy in policies:
+            for site_policy in policy.get_site_policies():
+                if site_policy.name in remote_sites or site_policy.name in failed_sites:
+                    continue
+                site = self.my_collector.get_site(site_policy.name)
+                if site is None:
+                    logging.error('Could not find remote site %s', site_policy.name)
+                    continue
+                try:
+                    remote_sites[site_policy.name] = (site, self._get_remote_instps(site.session))
+                except ConnectionError:
+                    logging.error('Could not get the Outside EPGs of remote site %s', site_policy.name)
+                    failed_sites.add(site_policy.name)
+        fallback_policies = [policy for policy in policies
+                             if any(site_policy.name in failed_sites
+                                    for site_policy in policy.get_site_policies())]
+        policies = [policy for policy in policies if policy not in fallback_policies]
+
+        # Compute the corrections for each remote site
+        corrections = {}
+        present = {}
+        for policy in policies:
+            endpoints = local_endpoints.get((policy.tenant, policy.app, policy.epg), [])
+            local_ips = set(endpoint.name for endpoint in endpoints)
+            for site_policy in policy.get_site_policies():
+                if site_policy.name not in remote_sites:
+                    continue
+                site, instps = remote_sites[site_policy.name]
+                for l3out in site_policy.get_interfaces():
+                    children = instps.get((l3out.tenant, l3out.name, policy.remote_epg), [])
+                    dirty_children = []
+                    remote_ips = set()
+                    for child in children:
+                        if 'l3extSubnet' in child:
+                            ip_addr = child['l3extSubnet']['attributes']['ip'].rpartition('-')[-1]
+                            search_ip_addr = ip_addr.rpartition('/32')[0] if '/32' in ip_addr else ip_addr
+                            if search_ip_addr in local_ips:
+                                remote_ips.add(search_ip_addr)
+                            else:
+                                dirty_children.append({'l3extSubnet': {'attributes': {'ip': ip_addr,
+                                                                                      'status': 'deleted'}}})
+                        elif not l3out.noclean:
+                            dirty_child = self.monitor.get_dirty_relation(policy, site_policy.name, l3out, child)
+                            if dirty_child is not None:
+                                dirty_children.append(dirty_child)
+                    if dirty_children:
+                        tenant_json = corrections.setdefault(site_policy.name, OrderedDict()).setdefault(
+                            l3out.tenant, {'fvTenant': {'attributes': {'name': l3out.tenant}, 'children': []}})
+                        tenant_json['fvTenant']['children'].append(
+                            {'l3extOut': {'attributes': {'name': l3out.name},
+                                          'children': [{'l3extInstP': {'attributes': {'name': policy.remote_epg},
+                                                                       'children': dirty_children}}]}})
+                    for ip in remote_ips:
+                        present[(policy.tenant, policy.app, policy.epg, ip)] = \
+                            present.get((policy.tenant, policy.app, policy.epg, ip), 0) + 1
+
+        # Push the corrections with one push per remote tenant
+        for site_name in corrections:
+            site = remote_sites[site_name][0]
+            for tenant_json in corrections[site_name].values():
+                try:
+                    resp = site.session.push_to_apic(Tenant.get_url(), tenant_json)
+                except ConnectionError:
+                    logging.error('Could not push corrections to remote site %s', site_name)
+                    break
+                if not resp.ok:
+                    logging.warning('Could not push corrections to remote site %s: %s %s',
+                                    site_name, resp, resp.text)
+
+        # Queue the endpoints that are missing from any of the remote sites
+        handler = self.monitor._endpoints
+        for policy in policies:
+            num_targets = sum(len(site_policy.get_interfaces()) for site_policy in policy.get_site_policies()
+                              if site_policy.name in remote_sites)
+            for endpoint in local_endpoints.get((policy.tenant, policy.app, policy.epg), []):
+                if present.get((policy.tenant, policy.app, policy.epg, endpoint.name), 0) == num_targets:
+                    handler.mac_tracker[(policy.tenant, policy.app, policy.epg, endpoint.name)] = endpoint.mac
+                    continue
+                handler.add_endpoint(endpoint, self)
+
+        for policy in fallback_policies:
+            try:
+                self.remove_stale_entries(policy)
+            except ConnectionError:
+                logging.error('Could not remove stale entries for %s %s %s',
+                              policy.tenant, policy.app, policy.epg)
+            self.monitor.handle_existing_endpoints(policy)
+
     def remove_policy(self, policy):
         logging.info('')
         if policy in self.policy_db:
@@ -1657,6 +1933,7 @@ class CommandLine(cmd.Cmd):
             handler = self.collector.get_local_site().monitor._endpoints
             print('Endpoint addition events: ' + str(handler.endpoint_add_events))
             print('Endpoint deletion events: ' + str(handler.endpoint_del_events))
+            print('Endpoint changes waiting to be pushed: ' + str(handler.pending.get_pending_count()))
 
     def emptyline(self):
         """
@@ -4,7 +4,9 @@ Test suite for Intersite application
 import unittest
 from acitoolkit import (AppProfile, EPG, Endpoint, Interface, L2Interface, Context, BridgeDomain, Session, Tenant,
                         IPEndpoint, OutsideL3, OutsideEPG, OutsideNetwork, Contract)
-from intersite import execute_tool, IntersiteTag, CommandLine, get_arg_parser
+from intersite import (execute_tool, IntersiteTag, CommandLine, get_arg_parser, PendingEndpointStore,
+                       RemoteSitePusher, EndpointHandler, ExportPolicy, LocalSite, MultisiteMonitor)
+from requests.exceptions import ConnectionError
 import argparse
 import logging
 from StringIO import StringIO
@@ -477,6 +479,335 @@ class TestBadConfiguration(unittest.TestCase):
             IntersiteTag.fromstring('badstring')
 
 
+class TestPendingEndpointStore(unittest.TestCase):
+    """
+    Tests for the store of the endpoint changes waiting to be pushed.
+    These tests do not communicate with the APIC.
+    """
+    @staticmethod
+    def get_subnet_json(ip, deleted=False):
+        attributes = {'ip': ip + '/32', 'name': ip}
+        if deleted:
+            attributes['status'] = 'deleted'
+        return {'l3extSubnet': {'attributes': attributes}}
+
+    def add(self, store, instp, ip, deleted=False, remote_site='Site2'):
+        store.add(remote_site, 'tenant', 'l3out', instp, ip, self.get_subnet_json(ip, deleted), deleted)
+
+    def test_coalesce(self):
+        """
+        Test that a newer change for an endpoint replaces the queued one
+        """
+        store = PendingEndpointStore()
+        self.add(store, 'instp1', '10.0.0.1')
+        self.add(store, 'instp1', '10.0.0.2')
+        self.add(store, 'instp1', '10.0.0.1', deleted=True)
+        self.assertEqual(store.get_pending_count(), 2)
+        batch = store.take('Site2', 10)
+        self.assertEqual([(key[3], change[1]) for key, change in batch],
+                         [('10.0.0.2', False), ('10.0.0.1', True)])
+
+    def test_coalesce_move(self):
+        """
+        Test that a queued addition in another Outside EPG is dropped when the
+        endpoint moves, while a queued deletion is kept
+        """
+        store = PendingEndpointStore()
+        self.add(store, 'instp1', '10.0.0.1')
+        self.add(store, 'instp2', '10.0.0.1')
+        self.assertEqual([key[2] for key, change in store.take('Site2', 10)], ['instp2'])
+        self.add(store, 'instp1', '10.0.0.2', deleted=True)
+        self.add(store, 'instp2', '10.0.0.2')
+        self.assertEqual([(key[2], change[1]) for key, change in store.take('Site2', 10)],
+                         [('instp1', True), ('instp2', False)])
+
+    def test_coalesce_per_site(self):
+        """
+        Test that the changes of each remote site are kept separately
+        """
+        store = PendingEndpointStore()
+        self.add(store, 'instp1', '10.0.0.1', remote_site='Site2')
+        self.add(store, 'instp1', '10.0.0.1', remote_site='Site3')
+        self.assertEqual(sorted(store.get_sites()), ['Site2', 'Site3'])
+        self.assertEqual(store.get_pending_count('Site2'), 1)
+        self.assertEqual(store.get_pending_count(), 2)
+
+    def test_take_batch_size(self):
+        """
+        Test that the batches are limited in size and in queue order
+        """
+        store = PendingEndpointStore()
+        for i in range(5):
+            self.add(store, 'instp1', '10.0.0.%s' % i)
+        batch = store.take('Site2', 2)
+        self.assertEqual([key[3] for key, change in batch], ['10.0.0.0', '10.0.0.1'])
+        self.assertEqual(store.get_pending_count('Site2'), 5)
+        store.done('Site2', batch)
+        self.assertEqual(store.get_pending_count('Site2'), 3)
+
+    def test_take_timeout(self):
+        """
+        Test that take waits at most the timeout for a change
+        """
+        store = PendingEndpointStore()
+        start = time.time()
+        self.assertEqual(store.take('Site2', 10, timeout=0.1), [])
+        self.assertTrue(time.time() - start < 5)
+
+    def test_requeue(self):
+        """
+        Test that a batch that could not be pushed is queued again without
+        overwriting a newer change
+        """
+        store = PendingEndpointStore()
+        self.add(store, 'instp1', '10.0.0.1')
+        self.add(store, 'instp1', '10.0.0.2')
+        batch = store.take('Site2', 10)
+        self.add(store, 'instp1', '10.0.0.1', deleted=True)
+        store.done('Site2', batch, pushed=False)
+        self.assertEqual(store.get_pending_count('Site2'), 2)
+        self.assertEqual([(key[3], change[1]) for key, change in store.take('Site2', 10)],
+                         [('10.0.0.1', True), ('10.0.0.2', False)])
+
+    def test_wait_until_empty(self):
+        """
+        Test that waiting for the changes to be pushed includes the changes in flight
+        """
+        store = PendingEndpointStore()
+        self.assertTrue(store.wait_until_empty(0))
+        self.add(store, 'instp1', '10.0.0.1')
+        self.assertFalse(store.wait_until_empty(0.1))
+        batch = store.take('Site2', 10)
+        self.assertFalse(store.wait_until_empty(0.1))
+        store.done('Site2', batch)
+        self.assertTrue(store.wait_until_empty(0))
+
+
+class FakeRemoteSession(object):
+    """
+    Remote site session that fails a number of pushes before accepting them
+    """
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.pushed = []
+
+    def push_to_apic(self, url, data):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('Remote site is unreachable')
+        self.pushed.append(data)
+        return mock.Mock(ok=True)
+
+
+class TestRemoteSitePusher(unittest.TestCase):
+    """
+    Tests for pushing the queued endpoint changes to the remote sites.
+    These tests do not communicate with the APIC.
+    """
+    def get_handler(self, session):
+        monitor = mock.Mock()
+        monitor._my_collector.get_site.return_value = mock.Mock(session=session)
+        handler = EndpointHandler(monitor)
+        self.addCleanup(handler.shutdown)
+        return handler
+
+    @staticmethod
+    def add(handler, ip, deleted=False):
+        subnet_json = TestPendingEndpointStore.get_subnet_json(ip, deleted)
+        handler.pending.add('Site2', 'tenant', 'l3out', 'instp', ip, subnet_json, deleted)
+
+    def test_build_tenant_jsons(self):
+        """
+        Test that the deletions are pushed before the additions
+        """
+        store = PendingEndpointStore()
+        store.add('Site2', 'tenant', 'l3out', 'instp1', '10.0.0.1',
+                  TestPendingEndpointStore.get_subnet_json('10.0.0.1'), False)
+        store.add('Site2', 'tenant', 'l3out', 'instp2', '10.0.0.2',
+                  TestPendingEndpointStore.get_subnet_json('10.0.0.2', True), True)
+        tenant_jsons = RemoteSitePusher.build_tenant_jsons(store.take('Site2', 10))
+        self.assertEqual(len(tenant_jsons), 2)
+        instps = [tenant_json['fvTenant']['children'][0]['l3extOut']['children'][0]['l3extInstP']
+                  for tenant_json in tenant_jsons]
+        self.assertEqual([instp['attributes']['name'] for instp in instps], ['instp2', 'instp1'])
+
+    def test_push(self):
+        """
+        Test that the queued changes are drained by the pusher thread
+        """
+        session = FakeRemoteSession()
+        handler = self.get_handler(session)
+        self.add(handler, '10.0.0.1')
+        self.add(handler, '10.0.0.2')
+        self.assertTrue(handler.push_to_remote_sites(None, timeout=5))
+        self.assertEqual(handler.pending.get_pending_count(), 0)
+        self.assertEqual(len(session.pushed), 1)
+        subnets = session.pushed[0]['fvTenant']['children'][0]['l3extOut']['children'][0]['l3extInstP']['children']
+        self.assertEqual([subnet['l3extSubnet']['attributes']['name'] for subnet in subnets],
+                         ['10.0.0.1', '10.0.0.2'])
+
+    def test_push_failure_requeued(self):
+        """
+        Test that a batch is queued again and retried when the push fails
+        """
+        session = FakeRemoteSession(failures=1)
+        handler = self.get_handler(session)
+        self.add(handler, '10.0.0.1')
+        self.assertTrue(handler.push_to_remote_sites(None, timeout=10))
+        self.assertEqual(session.failures, 0)
+        self.assertEqual(len(session.pushed), 1)
+
+    def test_push_timeout(self):
+        """
+        Test that waiting for an unreachable remote site times out and keeps
+        the changes queued
+        """
+        session = FakeRemoteSession(failures=1000)
+        handler = self.get_handler(session)
+        self.add(handler, '10.0.0.1')
+        self.assertFalse(handler.push_to_remote_sites(None, timeout=0.5))
+        self.assertEqual(handler.pending.get_pending_count('Site2'), 1)
+        self.assertEqual(session.pushed, [])
+
+    def test_push_does_not_wait(self):
+        """
+        Test that pushing to an unreachable remote site does not block
+        without a timeout
+        """
+        session = FakeRemoteSession(failures=1000)
+        handler = self.get_handler(session)
+        self.add(handler, '10.0.0.1')
+        start = time.time()
+        self.assertFalse(handler.push_to_remote_sites(None))
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(handler.pending.get_pending_count('Site2'), 1)
+
+    def test_push_removed_site(self):
+        """
+        Test that pushing to a remote site that is no longer configured
+        does not block and keeps the changes queued
+        """
+        handler = self.get_handler(None)
+        handler._monitor._my_collector.get_site.return_value = None
+        self.add(handler, '10.0.0.1')
+        start = time.time()
+        self.assertFalse(handler.push_to_remote_sites(None))
+        self.assertFalse(handler.push_to_remote_sites(None, timeout=0.5))
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(handler.pending.get_pending_count('Site2'), 1)
+
+
+class FakeInstPSession(object):
+    """
+    Remote site session that serves the l3extInstP children of the remote site
+    """
+    def __init__(self, instps=None, reachable=True):
+        self.instps = instps or {}
+        self.reachable = reachable
+        self.urls = []
+        self.pushed = []
+
+    def get(self, url):
+        self.urls.append(url)
+        if not self.reachable:
+            raise ConnectionError('Remote site is unreachable')
+        imdata = [{'l3extInstP': {'attributes': {'dn': dn}, 'children': children}}
+                  for dn, children in self.instps.items()]
+        resp = mock.Mock(ok=True)
+        resp.json.return_value = {'imdata': imdata, 'totalCount': str(len(imdata))}
+        return resp
+
+    def push_to_apic(self, url, data):
+        if not self.reachable:
+            raise ConnectionError('Remote site is unreachable')
+        self.pushed.append(data)
+        return mock.Mock(ok=True)
+
+
+class TestReconcilePolicies(unittest.TestCase):
+    """
+    Tests for the bulk reconciliation of the export policies with the remote sites.
+    These tests do not communicate with the APIC.
+    """
+    @staticmethod
+    def get_policy(epg, remote_site):
+        return ExportPolicy({'export': {'tenant': 'tenant', 'app': 'app', 'epg': epg,
+                                        'remote_epg': 'remote-' + epg,
+                                        'remote_sites': [{'site': {'name': remote_site,
+                                                                   'interfaces': [{'l3out': {'name': 'l3out',
+                                                                                             'tenant': 'remote',
+                                                                                             'provides': [{'contract_name': 'c1'}]}}]}}]}})
+
+    @staticmethod
+    def get_endpoints(epg_name, ips):
+        epg = EPG(epg_name, AppProfile('app', Tenant('tenant')))
+        endpoints = []
+        for ip in ips:
+            endpoint = IPEndpoint(ip, epg)
+            endpoint.mac = '00:00:00:00:00:01'
+            endpoints.append(endpoint)
+        return endpoints
+
+    def get_local_site(self, sessions):
+        collector = mock.Mock()
+        collector.get_site.side_effect = lambda name: mock.Mock(session=sessions[name])
+        local_site = LocalSite('Site1', None, collector)
+        local_site.monitor = mock.Mock()
+        local_site.monitor.get_dirty_relation = MultisiteMonitor.get_dirty_relation
+        local_site.monitor._endpoints.mac_tracker = {}
+        return local_site
+
+    def test_dirty_relation(self):
+        """
+        Test that stale subnets and relations are deleted with one push and only
+        the missing endpoints are queued
+        """
+        session = FakeInstPSession({'uni/tn-remote/out-l3out/instP-remote-epg1': [
+            {'fvRsProv': {'attributes': {'tnVzBrCPName': 'c1'}}},
+            {'fvRsProv': {'attributes': {'tnVzBrCPName': 'c2'}}},
+            {'l3extSubnet': {'attributes': {'ip': '10.0.0.1/32'}}},
+            {'l3extSubnet': {'attributes': {'ip': '10.0.0.9/32'}}}]})
+        local_site = self.get_local_site({'Site2': session})
+        endpoints = self.get_endpoints('epg1', ['10.0.0.1', '10.0.0.2'])
+        with mock.patch.object(IPEndpoint, 'get', return_value=endpoints):
+            local_site.reconcile_policies([self.get_policy('epg1', 'Site2')])
+        self.assertEqual(len(session.urls), 1)
+        self.assertEqual(len(session.pushed), 1)
+        tenant_json = session.pushed[0]['fvTenant']
+        self.assertEqual(tenant_json['attributes'], {'name': 'remote'})
+        instp = tenant_json['children'][0]['l3extOut']['children'][0]['l3extInstP']
+        self.assertEqual(instp['attributes'], {'name': 'remote-epg1'})
+        self.assertEqual(instp['children'],
+                         [{'fvRsProv': {'attributes': {'tnVzBrCPName': 'c2', 'status': 'deleted'}}},
+                          {'l3extSubnet': {'attributes': {'ip': '10.0.0.9/32', 'status': 'deleted'}}}])
+        handler = local_site.monitor._endpoints
+        self.assertEqual([call[0][0].name for call in handler.add_endpoint.call_args_list], ['10.0.0.2'])
+        self.assertIn(('tenant', 'app', 'epg1', '10.0.0.1'), handler.mac_tracker)
+        self.assertFalse(local_site.monitor.handle_existing_endpoints.called)
+
+    def test_failed_site(self):
+        """
+        Test that the policies exported to an unreachable remote site are
+        reconciled one at a time while the other remote sites are reconciled in bulk
+        """
+        site2 = FakeInstPSession({'uni/tn-remote/out-l3out/instP-remote-epg1': [
+            {'l3extSubnet': {'attributes': {'ip': '10.0.0.9/32'}}}]})
+        site3 = FakeInstPSession(reachable=False)
+        local_site = self.get_local_site({'Site2': site2, 'Site3': site3})
+        policy1 = self.get_policy('epg1', 'Site2')
+        policy2 = self.get_policy('epg2', 'Site3')
+        endpoints = self.get_endpoints('epg1', ['10.0.0.1']) + self.get_endpoints('epg2', ['10.0.0.2'])
+        with mock.patch.object(IPEndpoint, 'get', return_value=endpoints):
+            with mock.patch.object(IPEndpoint, 'get_all_by_epg', return_value=endpoints[1:]):
+                local_site.reconcile_policies([policy1, policy2])
+        self.assertEqual(len(site2.pushed), 1)
+        handler = local_site.monitor._endpoints
+        self.assertEqual([call[0][0].name for call in handler.add_endpoint.call_args_list], ['10.0.0.1'])
+        local_site.monitor.handle_existing_endpoints.assert_called_once_with(policy2)
+        # The bulk query and the per-policy query of the unreachable site
+        self.assertEqual(len(site3.urls), 2)
+
+
 class BaseTestCase(unittest.TestCase):
     """
     BaseTestCase: Base class to be used for creating other TestCases. Not to be instantiated directly.
@@ -3632,6 +3963,9 @@ def main_test():
     full = unittest.TestSuite()
     full.addTest(unittest.makeSuite(TestToolOptions))
     full.addTest(unittest.makeSuite(TestBadConfiguration))
+    full.addTest(unittest.makeSuite(TestPendingEndpointStore))
+    full.addTest(unittest.makeSuite(TestRemoteSitePusher))
+    full.addTest(unittest.makeSuite(TestReconcilePolicies))
     full.addTest(unittest.makeSuite(TestBasicEndpoints))
     full.addTest(unittest.makeSuite(TestMultipleEPG))
     full.addTest(unittest.makeSuite(TestBasicExistingEndpoints))
@@ -38,6 +38,8 @@ import json
 import threading
 import datetime
 import sys
+import tempfile
+from collections import OrderedDict
 
 import acitoolkit as ACI
 from requests import Timeout, ConnectionError
@@ -188,6 +190,520 @@ class SnapshotScheduler(threading.Thread):
                 time.sleep(seconds)
 
 
+class ConfigChange(object):
+    """
+    A single object level change found by ConfigDiff.
+    """
+    def __init__(self, action, class_name, key, ancestors, old, new):
+        """
+        :param action: string containing the change type.  One of 'created',
+                       'modified' or 'deleted'.
+        :param class_name: string containing the APIC class of the object
+        :param key: tuple used to identify the object among its siblings
+        :param ancestors: list of (class_name, key, attributes) tuples of the
+                          parents of the object, starting at the root
+        :param old: dictionary containing the object JSON in the old
+                    configuration or None if the object was created
+        :param new: dictionary containing the object JSON in the new
+                    configuration or None if the object was deleted
+        """
+        self.action = action
+        self.class_name = class_name
+        self.key = key
+        self.ancestors = ancestors
+        self.old = old
+        self.new = new
+
+    def get_path(self):
+        """
+        Get a readable path of the object from the root of the configuration
+
+        :returns: string containing the path
+        """
+        path = [ConfigDiff.get_key_name(class_name, key) for (class_name, key, attributes) in self.ancestors]
+        path.append(ConfigDiff.get_key_name(self.class_name, self.key))
+        return '/'.join(path)
+
+    def get_changed_properties(self):
+        """
+        Get the names of the properties that differ between the old and the
+        new configuration
+
+        :returns: sorted list of strings containing the property names
+        """
+        old_attributes = ConfigDiff.get_config_attributes(self.old)
+        new_attributes = ConfigDiff.get_config_attributes(self.new)
+        props = set(old_attributes.keys()) | set(new_attributes.keys())
+        return sorted([prop for prop in props
+                       if old_attributes.get(prop) != new_attributes.get(prop)])
+
+    def get_json(self):
+        """
+        Get the JSON needed to bring the object to the new configuration
+
+        :returns: dictionary containing the object JSON
+        """
+        if self.action == 'created':
+            return {self.class_name: self.new}
+        if self.action == 'modified':
+            return {self.class_name: {'attributes': ConfigDiff.get_config_attributes(self.new)}}
+        attributes = ConfigDiff.get_config_attributes(self.old)
+        attributes['status'] = 'deleted'
+        return {self.class_name: {'attributes': attributes}}
+
+
+class ConfigDiff(object):
+    """
+    Structural diff between 2 APIC JSON configurations.  Objects are matched
+    by class and rn/dn (or their naming properties when neither is present)
+    rather than by position, so the result is the minimal set of created,
+    modified and deleted objects needed to go from the old configuration to
+    the new configuration.
+    """
+    # Properties that do not hold configuration
+    IGNORED_PROPS = ('childAction', 'lcOwn', 'modTs', 'status', 'uid')
+    # Naming properties of the classes, i.e. the properties that make up the
+    # rn.  An empty tuple is used for classes with a single instance per
+    # parent.  Objects of other classes are matched by name when they have
+    # one and by all of their configuration properties otherwise.
+    NAMING_PROPS = {
+        'fvSubnet': ('ip',),
+        'fvRsBd': (),
+        'fvRsCtx': (),
+        'fvRsBDToOut': ('tnL3extOutName',),
+        'fvRsCons': ('tnVzBrCPName',),
+        'fvRsConsIf': ('tnVzCPIfName',),
+        'fvRsProv': ('tnVzBrCPName',),
+        'fvRsProtBy': ('tnVzTabooName',),
+        'fvRsDomAtt': ('tDn',),
+        'fvRsPathAtt': ('tDn',),
+        'fvRsNodeAtt': ('tDn',),
+        'fvRsCustQosPol': (),
+        'fvRsBdToEpRet': (),
+        'fvRsIgmpsn': (),
+        'fvRsCtxToEpRet': (),
+        'fvStCEp': ('mac', 'type'),
+        'fvnsEncapBlk': ('from', 'to'),
+        'fvnsVlanInstP': ('name', 'allocMode'),
+        'vzRsSubjFiltAtt': ('tnVzFilterName',),
+        'vzRsFiltAtt': ('tnVzFilterName',),
+        'vzRsDenyRule': ('tnVzFilterName',),
+        'vzRsIf': (),
+        'vzInTerm': (),
+        'vzOutTerm': (),
+        'l3extSubnet': ('ip',),
+        'l3extIp': ('addr',),
+        'l3extMember': ('side',),
+        'l3extRsEctx': (),
+        'l3extRsL3DomAtt': (),
+        'l3extRsNodeL3OutAtt': ('tDn',),
+        'l3extRsPathL3OutAtt': ('tDn',),
+        'ipRouteP': ('ip',),
+        'ipNexthopP': ('nhAddr',),
+        'bgpPeerP': ('addr',),
+        'bgpExtP': (),
+        'ospfExtP': (),
+        'ospfIfP': (),
+        'infraHPortS': ('name', 'type'),
+        'infraLeafS': ('name', 'type'),
+        'infraRsAccBaseGrp': (),
+        'infraRsAccPortP': ('tDn',),
+        'infraRsDomP': ('tDn',),
+        'infraRsAttEntP': (),
+        'infraRsVlanNs': (),
+        'infraRsLacpPol': (),
+        'infraRsCdpIfPol': (),
+        'infraRsLldpIfPol': (),
+        'infraRsHIfPol': (),
+    }
+
+    def __init__(self, old, new):
+        """
+        :param old: old configuration.  Either an APIC response dictionary
+                    containing 'imdata', a single object dictionary or a list
+                    of object dictionaries.
+        :param new: new configuration in the same format as old.
+        """
+        self.created = []
+        self.modified = []
+        self.deleted = []
+        self._diff_children(self._get_objects(old), self._get_objects(new), [])
+
+    @staticmethod
+    def _get_objects(config):
+        """
+        Internal function to get the list of top level objects
+        """
+        if isinstance(config, dict):
+            if 'imdata' in config:
+                return config['imdata']
+            return [config]
+        return config
+
+    @classmethod
+    def get_config_attributes(cls, body):
+        """
+        Get the configuration attributes of an object
+
+        :param body: dictionary containing the object attributes and children
+        :returns: dictionary containing the attributes without the properties
+                  that do not hold configuration
+        """
+        if body is None:
+            return {}
+        attributes = body.get('attributes', {})
+        return dict((prop, attributes[prop]) for prop in attributes
+                    if prop not in cls.IGNORED_PROPS)
+
+    @classmethod
+    def get_key(cls, class_name, attributes):
+        """
+        Get the key used to match an object with the same object in the
+        other configuration
+
+        :param class_name: string containing the APIC class of the object
+        :param attributes: dictionary containing the object attributes
+        :returns: tuple identifying the object among its siblings.  The
+                  class name is followed by the property names and values
+                  that identify the object.
+        """
+        for prop in ('rn', 'dn'):
+            if attributes.get(prop):
+                return (class_name, prop, attributes[prop])
+        if class_name in cls.NAMING_PROPS:
+            props = cls.NAMING_PROPS[class_name]
+        elif attributes.get('name'):
+            props = ('name',)
+        else:
+            props = sorted(prop for prop in attributes if prop not in cls.IGNORED_PROPS)
+        key = (class_name,)
+        for prop in props:
+            key += (prop, attributes.get(prop, ''))
+        return key
+
+    @staticmethod
+    def get_key_name(class_name, key):
+        """
+        Get a readable name from an object key
+
+        :param class_name: string containing the APIC class of the object
+        :param key: tuple identifying the object
+        :returns: string containing the name
+        """
+        if len(key) < 3:
+            return class_name
+        return '%s[%s]' % (class_name, ','.join('%s=%s' % (key[i], key[i + 1])
+                                                for i in range(1, len(key), 2)))
+
+    @classmethod
+    def _index(cls, objects):
+        """
+        Internal function to index a list of sibling objects by key
+        """
+        index = OrderedDict()
+        for obj in objects:
+            for class_name in obj:
+                body = obj[class_name]
+                index[cls.get_key(class_name, body.get('attributes', {}))] = (class_name, body)
+        return index
+
+    def _diff_children(self, old_children, new_children, ancestors):
+        """
+        Internal function to recursively diff 2 lists of sibling objects
+        """
+        old_index = self._index(old_children)
+        new_index = self._index(new_children)
+        for key in old_index:
+            if key not in new_index:
+                (class_name, old_body) = old_index[key]
+                self.deleted.append(ConfigChange('deleted', class_name, key,
+                                                 ancestors, old_body, None))
+        for key in new_index:
+            (class_name, new_body) = new_index[key]
+            if key not in old_index:
+                self.created.append(ConfigChange('created', class_name, key,
+                                                 ancestors, None, new_body))
+                continue
+            old_body = old_index[key][1]
+            if old_body == new_body:
+                continue
+            if self.get_config_attributes(old_body) != self.get_config_attributes(new_body):
+                self.modified.append(ConfigChange('modified', class_name, key,
+                                                  ancestors, old_body, new_body))
+            self._diff_children(old_body.get('children', []),
+                                new_body.get('children', []),
+                                ancestors + [(class_name, key,
+                                              self.get_config_attributes(new_body))])
+
+    def has_changes(self):
+        """
+        Check whether any differences were found
+
+        :returns: True or False.  True if the configurations differ.
+        """
+        return bool(len(self.created) or len(self.modified) or len(self.deleted))
+
+    def get_changes(self):
+        """
+        Get all of the changes
+
+        :returns: list of ConfigChange instances.  Deletions are first.
+        """
+        return self.deleted + self.modified + self.created
+
+    def get_summary(self):
+        """
+        Get a summary of the changes suitable for display
+
+        :returns: list of tuples where each tuple contains a string with the
+                  change type, a string with the object path and a list of
+                  the changed property names
+        """
+        return [(change.action, change.get_path(), change.get_changed_properties())
+                for change in self.get_changes()]
+
+    @staticmethod
+    def _build_payloads(changes):
+        """
+        Internal function to merge a number of changes into the minimal
+        object trees that hold them
+        """
+        roots = []
+        nodes = {}
+        for change in changes:
+            parent = None
+            path = ()
+            for (class_name, key, attributes) in change.ancestors:
+                path = path + (key,)
+                if path not in nodes:
+                    nodes[path] = {class_name: {'attributes': dict(attributes),
+                                                'children': []}}
+                    if parent is None:
+                        roots.append(nodes[path])
+                    else:
+                        parent.setdefault('children', []).append(nodes[path])
+                parent = nodes[path][class_name]
+            path = path + (change.key,)
+            if path in nodes:
+                # Already present as the parent of another change
+                body = nodes[path][change.class_name]
+                body['attributes'].update(change.get_json()[change.class_name]['attributes'])
+                continue
+            nodes[path] = change.get_json()
+            if parent is None:
+                roots.append(nodes[path])
+            else:
+                parent.setdefault('children', []).append(nodes[path])
+        return roots
+
+    def get_payloads(self, max_changes=500):
+        """
+        Get the JSON payloads that apply the changes.  Deletions are sent in
+        their own payloads ahead of the creations and modifications so that
+        an object replaced by another object with the same rn is handled
+        correctly.
+
+        :param max_changes: Optional integer containing the maximum number of
+                            changed objects per payload.  Default is 500.
+        :returns: list of dictionaries containing the JSON payloads
+        """
+        payloads = []
+        for changes in (self.deleted, self.modified + self.created):
+            for start in range(0, len(changes), max_changes):
+                payloads.extend(self._build_payloads(changes[start:start + max_changes]))
+        return payloads
+
+
+class ChangeStatsCache(object):
+    """
+    Persistent cache of the change statistics (additions/deletions) of every
+    snapshot version and of every file within each version.  The statistics
+    of a version are computed once, when the version is first seen, using a
+    single git diff and are stored in a file within the git directory so that
+    they survive restarts.  Used internally by the ConfigDB class.  There
+    should be no need for a user to create this class directly.
+    """
+    FORMAT_VERSION = 1
+    # Hash of the empty git tree used to compute the stats of the first version
+    EMPTY_TREE = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
+
+    def __init__(self, repo):
+        self._repo = repo
+        self._filename = os.path.join(repo.git_dir, 'snapback-stats.json')
+        self._lock = threading.RLock()
+        self._versions = []
+        self._stats = {}
+        self._lines = {}
+        self._load()
+
+    def _reset(self):
+        """
+        Clear all of the cached statistics
+        """
+        self._versions = []
+        self._stats = {}
+        self._lines = {}
+
+    def _load(self):
+        """
+        Load the cached statistics from disk
+        """
+        try:
+            with open(self._filename, 'r') as cache_file:
+                cache = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return
+        if cache.get('format') != self.FORMAT_VERSION:
+            return
+        self._versions = cache['versions']
+        self._stats = cache['stats']
+        self._lines = cache['lines']
+
+    def _save(self):
+        """
+        Write the cached statistics to disk.  The statistics are written to
+        a temporary file that then replaces the cache file so that an
+        interrupted write does not leave a truncated cache behind.
+        """
+        cache = {'format': self.FORMAT_VERSION,
+                 'versions': self._versions,
+                 'stats': self._stats,
+                 'lines': self._lines}
+        (fd, tmp_filename) = tempfile.mkstemp(prefix='snapback-stats.',
+                                              dir=os.path.dirname(self._filename))
+        try:
+            with os.fdopen(fd, 'w') as cache_file:
+                cache_file.write(json.dumps(cache))
+            os.rename(tmp_filename, self._filename)
+        except BaseException:
+            os.remove(tmp_filename)
+            raise
+
+    def _get_tags(self):
+        """
+        Get the snapshot versions from the repository without spawning a git
+        process
+
+        :returns: list of strings containing the version identifiers in the
+                  same order as returned by git tag
+        """
+        return sorted([str(tag.name) for tag in self._repo.tags])
+
+    def numstat(self, old_version, new_version, filenames=None):
+        """
+        Get the number of additions and deletions per file between 2 versions
+        using a single git diff
+
+        :param old_version: string containing the old version identifier
+        :param new_version: string containing the new version identifier
+        :param filenames: Optional list of strings containing the file names
+                          to limit the diff to.  Default is None.
+        :returns: dictionary of (additions, deletions) integer tuples indexed
+                  by file name
+        """
+        args = ['--numstat', '-z', '--no-renames', old_version, new_version]
+        if filenames is not None:
+            args.append('--')
+            args.extend(filenames)
+        changes = str(self._repo.git.diff(*args))
+        resp = {}
+        for change in changes.split('\0'):
+            change = change.strip('\n')
+            if not len(change):
+                continue
+            (additions, deletions, filename) = change.split('\t', 2)
+            # Binary files do not have line counts
+            if additions == '-':
+                additions = deletions = '0'
+            resp[filename] = (int(additions), int(deletions))
+        return resp
+
+    def _add_version(self, version, prev_version):
+        """
+        Calculate and cache the statistics of a single version
+
+        :param version: string containing the version identifier
+        :param prev_version: string containing the previous version identifier
+                             or None if this is the first version
+        """
+        if prev_version is None:
+            changes = self.numstat(self.EMPTY_TREE, version)
+        else:
+            changes = self.numstat(prev_version, version)
+        additions = 0
+        deletions = 0
+        files = {}
+        for filename in changes:
+            (adds, dels) = changes[filename]
+            additions += adds
+            deletions += dels
+            num_lines = self._lines.get(filename, 0) + adds - dels
+            if num_lines > 0:
+                self._lines[filename] = num_lines
+            else:
+                self._lines.pop(filename, None)
+            files[filename] = [adds, dels, num_lines]
+        self._stats[version] = {'parent': prev_version,
+                                'additions': additions,
+                                'deletions': deletions,
+                                'files': files}
+        self._versions.append(version)
+
+    def update(self):
+        """
+        Bring the cache up to date with the versions in the repository.  Only
+        the versions that are not already cached are calculated.
+        """
+        with self._lock:
+            tags = self._get_tags()
+            if tags == self._versions:
+                return
+            if tags[:len(self._versions)] != self._versions:
+                # Versions were removed or inserted out of order
+                self._reset()
+            prev_version = None
+            if len(self._versions):
+                prev_version = self._versions[-1]
+            for version in tags[len(self._versions):]:
+                self._add_version(version, prev_version)
+                prev_version = version
+            self._save()
+
+    def get_versions(self):
+        """
+        Get the cached versions
+
+        :returns: list of strings containing the version identifiers
+        """
+        self.update()
+        return list(self._versions)
+
+    def get_stats(self, version):
+        """
+        Get the cached statistics of a version
+
+        :param version: string containing the version identifier
+        :returns: dictionary containing the parent version, the total number
+                  of additions and deletions and the per file statistics, or
+                  None if the version is not known.
+        """
+        self.update()
+        return self._stats.get(version)
+
+    def get_latest_file_versions(self):
+        """
+        Get the latest version in which each file was changed
+
+        :returns: dictionary of version identifiers indexed by file name
+        """
+        self.update()
+        resp = {}
+        for version in self._versions:
+            for filename in self._stats[version]['files']:
+                resp[filename] = version
+        return resp
+
+
 class ConfigDB(object):
     """
     Main configuration snapshot and rollback engine.  Instantiate this
@@ -204,7 +720,9 @@ class ConfigDB(object):
             print('Unable to initialize repository. Are you sure git is installed ?')
             sys.exit(0)
         self._snapshot_scheduler = None
+        self._change_stats = ChangeStatsCache(self.repo)
         self.rsp_prop_include = 'config-only'
+        self.max_changes_per_push = 500
 
     def login(self, args, timeout=2):
         """
@@ -350,6 +868,7 @@ class ConfigDB(object):
         # Commit the files and tag with the timestamp
         self.repo.index.commit(tag_name)
         self.repo.git.tag(tag_name)
+        self._change_stats.update()
 
         if callback:
             callback()
@@ -438,6 +957,7 @@ class ConfigDB(object):
         # Commit the files and tag with the timestamp
         self.repo.index.commit(tag_name)
         self.repo.git.tag(tag_name)
+        self._change_stats.update()
 
         if callback:
             callback()
@@ -502,20 +1022,17 @@ class ConfigDB(object):
         :returns: string containing the latest version identifier for the
                   specified file
         """
-        try:
-            versions = str(self.repo.git.show('--tags',
-                                              '--name-only',
-                                              '--oneline',
-                                              filename))
-        except git.exc.GitCommandError:
-            return None
-        versions = versions.split('\n')
-        assert len(versions) >= 2
-        latest_version = versions[-2]
-        assert ' ' in latest_version
-        latest_version = latest_version.split(' ')
-        assert len(versions) >= 2
-        return latest_version[1]
+        return self._change_stats.get_latest_file_versions().get(filename)
+
+    def get_latest_file_versions(self):
+        """
+        Get the latest version identifier of every file in the snapshot
+        repository in a single call.
+
+        :returns: dictionary of strings containing the latest version
+                  identifier indexed by file name
+        """
+        return self._change_stats.get_latest_file_versions()
 
     def get_versions(self, with_changes=False):
         """
@@ -534,44 +1051,45 @@ class ConfigDB(object):
                   representing the number of deletions in this version in
                   comparison with the previous version.
         """
+        versions = self._change_stats.get_versions()
         if not with_changes:
-            versions = str(self.repo.git.tag())
-            if len(versions) == 0:
-                # No snapshots exist
-                no_versions = []
-                return no_versions
-            return versions.split('\n')
-        else:
-            resp = []
-            versions = self.repo.git.tag()
-            if len(versions) == 0:
-                # No snapshots exist
-                no_versions = []
-                return no_versions
-            versions = str(versions).split('\n')
-            previous_version = None
-            for version in versions:
-                additions = '0'
-                deletions = '0'
-                if previous_version is not None:
-                    changes = str(self.repo.git.diff('--shortstat',
-                                                     previous_version,
-                                                     version))
-                else:
-                    changes = str(self.repo.git.show('--shortstat',
-                                                     '--oneline',
-                                                     version))
-                if 'insertions' in changes:
-                    additions = changes.split(' insertions')[0].split(' ')[-1]
-                elif 'insertion' in changes:
-                    additions = '1'
-                if 'deletions' in changes:
-                    deletions = changes.split(' deletions')[0].split(' ')[-1]
-                elif 'deletion' in changes:
-                    deletions = '1'
-                resp.append((version, additions, deletions))
-                previous_version = version
-            return resp
+            return versions
+        resp = []
+        for (version, additions, deletions, files) in self.get_change_stats(versions):
+            resp.append((version, additions, deletions))
+        return resp
+
+    def get_change_stats(self, versions=None):
+        """
+        Get the change statistics of a number of snapshot versions and of all
+        of the files within them in a single call.  The statistics are taken
+        from the cache that is populated when the snapshots are taken.
+
+        :param versions: Optional list of strings containing the version
+                         identifiers.  Default is None which returns the
+                         statistics of all versions.
+        :returns: list of tuples where each tuple contains a string
+                  representing the version identifier, a string representing
+                  the number of additions and a string representing the
+                  number of deletions in this version in comparison with the
+                  previous version, and a list of (filename, additions,
+                  deletions) tuples of strings for the files changed in this
+                  version.
+        """
+        if versions is None:
+            versions = self._change_stats.get_versions()
+        resp = []
+        for version in versions:
+            stats = self._change_stats.get_stats(version)
+            if stats is None:
+                raise ValueError('Version not found')
+            files = []
+            for filename in sorted(stats['files']):
+                (additions, deletions, num_lines) = stats['files'][filename]
+                files.append((filename, str(additions), str(deletions)))
+            resp.append((version, str(stats['additions']),
+                         str(stats['deletions']), files))
+        return resp
 
     def get_latest_version(self):
         """
@@ -582,7 +1100,7 @@ class ConfigDB(object):
         versions = self.get_versions()
         if len(versions) < 1:
             return None
-        return self.get_versions()[-1]
+        return versions[-1]
 
     def get_filenames(self, version,
                       prev_version=None, with_changes=False):
@@ -606,41 +1124,34 @@ class ConfigDB(object):
                   string representing the number of deletions in this file in
                   comparison with the previous version.
         """
-        filenames = str(self.repo.git.show('--name-only',
-                                           '--oneline',
-                                           version))
-        filenames = filenames.split('\n')[1:]
+        stats = self._change_stats.get_stats(version)
+        if stats is None:
+            filenames = str(self.repo.git.show('--name-only',
+                                               '--oneline',
+                                               version))
+            filenames = filenames.split('\n')[1:]
+        else:
+            filenames = sorted(stats['files'])
         if with_changes is False:
             return filenames
+        if prev_version is not None:
+            if stats is not None and stats['parent'] == prev_version:
+                changes = dict((filename, stats['files'][filename][:2])
+                               for filename in filenames)
+            elif len(filenames):
+                changes = self._change_stats.numstat(prev_version, version,
+                                                     filenames)
+            else:
+                changes = {}
+        elif stats is not None:
+            changes = dict((filename, (stats['files'][filename][2], 0))
+                           for filename in filenames)
+        else:
+            changes = {}
         resp = []
         for filename in filenames:
-            additions = '0'
-            deletions = '0'
-            if prev_version is not None:
-                try:
-                    changes = str(self.repo.git.diff('--shortstat',
-                                                     prev_version + ':' + filename,
-                                                     version + ':' + filename))
-                except git.exc.GitCommandError:
-                    changes = ''
-                if 'insertions' in changes:
-                    additions = changes.split(' insertions')[0].split(' ')[-1]
-                elif 'insertion' in changes:
-                    additions = '1'
-                if 'deletions' in changes:
-                    deletions = changes.split(' deletions')[0].split(' ')[-1]
-                elif 'deletion' in changes:
-                    deletions = '1'
-            else:
-                try:
-                    content = self.repo.git.show('--shortstat',
-                                                 '--oneline',
-                                                 version + ':' + filename)
-                    num_lines = len(str(content).split('\n')) - 1
-                    additions = str(num_lines)
-                except git.exc.GitCommandError:
-                    pass
-            resp.append((filename, additions, deletions))
+            (additions, deletions) = changes.get(filename, (0, 0))
+            resp.append((filename, str(additions), str(deletions)))
         return resp
 
     def get_file(self, filename, version):
@@ -729,81 +1240,19 @@ class ConfigDB(object):
         filenames = self.get_filenames(version)
         self._print(title, filenames)
 
-    def _ordered(self, obj):
-        """
-        Internal function used within rollback
-        """
-        if isinstance(obj, dict):
-            return {k: self._ordered(v) for k, v in obj.items()}
-        if isinstance(obj, list):
-            return sorted(self._ordered(x) for x in obj)
-        else:
-            return obj
-
-    def _mark_mismatching(self, current, old):
-        """
-        Internal function used within rollback
-        """
-        for key in current.keys():
-            if key not in old:
-                current[key]['attributes']['status'] = 'deleted'
-                continue
-            if current[key] == old[key]:
-                continue
-            if current[key]['attributes'] == old[key]['attributes']:
-                # check if no children
-                if 'children' not in current[key]:
-                    continue
-
-                # check if children only in the current config
-                if 'children' not in old[key]:
-                    for child in range(0, len(current[key]['children'])):
-                        current[key]['attributes']['status'] = 'deleted'
-                    continue
-
-                # find extra children and mark deleted
-                num_old_children = len(old[key]['children'])
-                num_curr_children = len(current[key]['children'])
-                if num_old_children != num_curr_children:
-                    old_child_idx = 0
-                    for child_idx in range(0, num_curr_children):
-                        if (old_child_idx < num_old_children and
-                            current[key]['children'][child_idx] == old[key]['children'][old_child_idx]):
-                            old_child_idx = old_child_idx + 1
-                        else:
-                            child_key = current[key]['children'][child_idx].keys()[0]
-                            current[key]['children'][child_idx][child_key]['attributes']['status'] = 'deleted'
-
-                old_child_idx = 0
-                for child in range(0, len(current[key]['children'])):
-                    child_key = current[key]['children'][child].keys()[0]
-                    current_attributes = current[key]['children'][child][child_key]['attributes']
-                    if ('status' in current_attributes and
-                        current_attributes['status'] == 'deleted'):
-                        continue
-                    # skip deleted children but contine with the old
-                    # using lower index
-                    self._mark_mismatching(current[key]['children'][child],
-                                           old[key]['children'][old_child_idx])
-                    old_child_idx = old_child_idx + 1
-            else:
-                current[key]['attributes']['status'] = 'deleted'
-
     def _check_versions(self, filename, current_version, old_version):
         """
         Internal function used within rollback
         """
-        current_version = self._ordered(current_version)
-        old_version = self._ordered(old_version)
-
-        if current_version == old_version:
+        diff = ConfigDiff(current_version, old_version)
+        if not diff.has_changes():
             return True
-        else:
-            self._mark_mismatching(current_version, old_version)
-            # Push it to the APIC
-            url = self._get_url_for_file(filename)
-            self.session.push_to_apic(url, current_version)
-            return False
+        # Push only the differences to the APIC
+        url = self._get_url_for_file(filename)
+        for payload in diff.get_payloads(self.max_changes_per_push):
+            print('Pushing....')
+            self.session.push_to_apic(url, payload)
+        return False
 
     def rollback(self, version, filenames=None):
         """
@@ -830,20 +1279,57 @@ class ConfigDB(object):
             old_version = self.get_file(filename, version)
             old_version = json.loads(old_version)
 
-            # Push it to the APIC
-            url = self._get_url_for_file(filename)
-            for data in old_version['imdata']:
-                self.session.push_to_apic(url, data)
-                print('Pushing....')
-                print(data)
-
             # Get the current version
+            url = self._get_url_for_file(filename)
             current_version = self._get_from_apic(url)
 
-            # Look for any remaining differences
-            # If differences exist, it is new config and will be removed.
+            # Push only the differences between the current version and
+            # the rollback version
             self._check_versions(filename, current_version, old_version)
 
+    def get_changes(self, filename, version, other_version=None):
+        """
+        Get the object level changes in a file between 2 snapshot versions,
+        or between a snapshot version and the current configuration on the
+        APIC.
+
+        :param filename: string containing the file name
+        :param version: string containing the version identifier of the
+                        old configuration
+        :param other_version: Optional string containing the version
+                              identifier of the new configuration.  Default
+                              is None which uses the current configuration
+                              on the APIC.
+        :returns: ConfigDiff instance
+        """
+        old_config = json.loads(self.get_file(filename, version))
+        if other_version is None:
+            new_config = self._get_from_apic(self._get_url_for_file(filename))
+        else:
+            new_config = json.loads(self.get_file(filename, other_version))
+        return ConfigDiff(old_config, new_config)
+
+    def print_changes(self, filename, version, other_version=None):
+        """
+        Print the object level changes in a file between 2 snapshot versions,
+        or between a snapshot version and the current configuration on the
+        APIC.
+
+        :param filename: string containing the file name
+        :param version: string containing the version identifier of the
+                        old configuration
+        :param other_version: Optional string containing the version
+                              identifier of the new configuration.
+        """
+        title = 'Changes'
+        items = []
+        for (action, path, props) in self.get_changes(filename, version,
+                                                      other_version).get_summary():
+            if action == 'modified':
+                path = '%s (%s)' % (path, ', '.join(props))
+            items.append('%-9s%s' % (action, path))
+        self._print(title, items)
+
     def _generate_tar_gz(self, filenames, version):
         """
         Generate a .tar.gz compressed archive file
@@ -957,6 +1443,11 @@ def main(args=None):
         commands.add_argument('--show', nargs=2,
                               metavar=('VERSION', 'CONFIGFILE'),
                               help=help_txt)
+        help_txt = ('Show the configuration changes in a particular configfile'
+                    ' between 2 snapshot versions.')
+        commands.add_argument('--changes', nargs=3,
+                              metavar=('VERSION1', 'VERSION2', 'CONFIGFILE'),
+                              help=help_txt)
         args = creds.get()
 
     cdb = ConfigDB()
@@ -993,6 +1484,9 @@ def main(args=None):
         filename = args.show[1]
         config = cdb.get_file(version, filename)
         print(config)
+    elif args.changes is not None:
+        (version1, version2, filename) = args.changes
+        cdb.print_changes(filename, version1, version2)
 
 if __name__ == '__main__':
     try:
@@ -4,8 +4,12 @@ Test routines for aciconfigdb
 import unittest
 import aciconfigdb
 import credentials
+import json
 import mock
+import os
+import shutil
 import sys
+import tempfile
 
 
 class FakeStdio(object):
@@ -121,9 +125,295 @@ class TestBasicSnapshot(unittest.TestCase):
         self.assertEquals(num_versions + 2, num_new_versions)
 
 
+class TestChangeStatsCache(unittest.TestCase):
+    """
+    Change statistics cache testcases.  These do not require an APIC.
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        self.cdb = aciconfigdb.ConfigDB()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def _take_snapshot(self, version, files):
+        """
+        Commit and tag the given files in the same way as a snapshot
+        """
+        for filename in files:
+            full_filename = os.path.join(self.cdb.repo_dir, filename)
+            with open(full_filename, 'w') as config_file:
+                config_file.write(files[filename])
+            self.cdb.repo.index.add([full_filename])
+        self.cdb.repo.index.commit(version)
+        self.cdb.repo.git.tag(version)
+        self.cdb.get_change_stats()
+
+    def _take_snapshots(self):
+        self._take_snapshot('2016-01-01_00.00.00', {'tenant-a.json': 'a\nb\nc\n',
+                                                     'tenant-b.json': 'a\n'})
+        self._take_snapshot('2016-01-02_00.00.00', {'tenant-a.json': 'a\nx\nc\nd\n'})
+        self._take_snapshot('2016-01-03_00.00.00', {'tenant-b.json': 'b\n'})
+
+    def test_get_versions_with_changes(self):
+        """
+        Test the version statistics
+        """
+        self._take_snapshots()
+        self.assertEqual(self.cdb.get_versions(),
+                         ['2016-01-01_00.00.00', '2016-01-02_00.00.00', '2016-01-03_00.00.00'])
+        self.assertEqual(self.cdb.get_versions(with_changes=True),
+                         [('2016-01-01_00.00.00', '4', '0'),
+                          ('2016-01-02_00.00.00', '2', '1'),
+                          ('2016-01-03_00.00.00', '1', '1')])
+
+    def test_get_filenames_with_changes(self):
+        """
+        Test the file statistics
+        """
+        self._take_snapshots()
+        self.assertEqual(self.cdb.get_filenames('2016-01-01_00.00.00'),
+                         ['tenant-a.json', 'tenant-b.json'])
+        self.assertEqual(self.cdb.get_filenames('2016-01-02_00.00.00',
+                                                prev_version='2016-01-01_00.00.00',
+                                                with_changes=True),
+                         [('tenant-a.json', '2', '1')])
+        self.assertEqual(self.cdb.get_filenames('2016-01-02_00.00.00',
+                                                with_changes=True),
+                         [('tenant-a.json', '4', '0')])
+        # Not the immediately preceding version
+        self.assertEqual(self.cdb.get_filenames('2016-01-03_00.00.00',
+                                                prev_version='2016-01-01_00.00.00',
+                                                with_changes=True),
+                         [('tenant-b.json', '1', '1')])
+
+    def test_get_latest_file_versions(self):
+        """
+        Test the latest version of each file
+        """
+        self._take_snapshots()
+        self.assertEqual(self.cdb.get_latest_file_versions(),
+                         {'tenant-a.json': '2016-01-02_00.00.00',
+                          'tenant-b.json': '2016-01-03_00.00.00'})
+        self.assertEqual(self.cdb.get_latest_file_version('tenant-a.json'),
+                         '2016-01-02_00.00.00')
+        self.assertIsNone(self.cdb.get_latest_file_version('tenant-c.json'))
+
+    def test_get_change_stats(self):
+        """
+        Test the batched statistics query
+        """
+        self._take_snapshots()
+        stats = self.cdb.get_change_stats(['2016-01-01_00.00.00'])
+        self.assertEqual(stats, [('2016-01-01_00.00.00', '4', '0',
+                                  [('tenant-a.json', '3', '0'),
+                                   ('tenant-b.json', '1', '0')])])
+        self.assertRaises(ValueError, self.cdb.get_change_stats, ['unknown'])
+
+    def test_cache_is_persisted(self):
+        """
+        Test that the statistics are not recalculated after a restart
+        """
+        self._take_snapshots()
+        expected = self.cdb.get_change_stats()
+        with mock.patch.object(aciconfigdb.ChangeStatsCache, 'numstat') as numstat:
+            cdb = aciconfigdb.ConfigDB()
+            self.assertEqual(cdb.get_change_stats(), expected)
+            self.assertFalse(numstat.called)
+
+    def test_cache_rebuilt_on_removed_version(self):
+        """
+        Test that the statistics are recalculated when a version is removed
+        """
+        self._take_snapshots()
+        self.cdb.repo.git.tag('-d', '2016-01-02_00.00.00')
+        self.assertEqual(self.cdb.get_versions(with_changes=True),
+                         [('2016-01-01_00.00.00', '4', '0'),
+                          ('2016-01-03_00.00.00', '3', '2')])
+
+    def test_interrupted_save(self):
+        """
+        Test that an interrupted write keeps the previous cache
+        """
+        self._take_snapshots()
+        expected = self.cdb.get_change_stats()
+        self.cdb.repo.index.commit('2016-01-04_00.00.00')
+        self.cdb.repo.git.tag('2016-01-04_00.00.00')
+        with mock.patch.object(aciconfigdb.json, 'dumps', side_effect=KeyboardInterrupt):
+            self.assertRaises(KeyboardInterrupt, self.cdb.get_change_stats)
+        self.assertEqual([filename for filename in os.listdir(self.cdb.repo.git_dir)
+                          if filename.startswith('snapback-stats')],
+                         ['snapback-stats.json'])
+        self.cdb.repo.git.tag('-d', '2016-01-04_00.00.00')
+        with mock.patch.object(aciconfigdb.ChangeStatsCache, 'numstat') as numstat:
+            cdb = aciconfigdb.ConfigDB()
+            self.assertEqual(cdb.get_change_stats(), expected)
+            self.assertFalse(numstat.called)
+
+
+class TestConfigDiff(unittest.TestCase):
+    """
+    Structural configuration diff testcases.  These do not require an APIC.
+    """
+    @staticmethod
+    def _get_config():
+        bd = {'fvBD': {'attributes': {'name': 'bd1', 'arpFlood': 'no'},
+                       'children': [{'fvRsCtx': {'attributes': {'tnFvCtxName': 'ctx1'}}},
+                                    {'fvSubnet': {'attributes': {'ip': '10.1.1.1/24', 'name': ''}}}]}}
+        ctx = {'fvCtx': {'attributes': {'name': 'ctx1'}}}
+        return {'imdata': [{'fvTenant': {'attributes': {'dn': 'uni/tn-t1', 'name': 't1'},
+                                         'children': [bd, ctx]}}]}
+
+    def test_no_changes(self):
+        """
+        Test identical configurations with children in a different order
+        """
+        old = self._get_config()
+        new = self._get_config()
+        new['imdata'][0]['fvTenant']['children'].reverse()
+        diff = aciconfigdb.ConfigDiff(old, new)
+        self.assertFalse(diff.has_changes())
+        self.assertEqual(diff.get_payloads(), [])
+
+    def test_changes(self):
+        """
+        Test created, modified and deleted objects
+        """
+        old = self._get_config()
+        new = self._get_config()
+        tenant = new['imdata'][0]['fvTenant']
+        bd = tenant['children'][0]['fvBD']
+        bd['attributes']['arpFlood'] = 'yes'
+        bd['children'].pop()
+        bd['children'].append({'fvSubnet': {'attributes': {'ip': '10.1.2.1/24', 'name': ''}}})
+        tenant['children'].pop()
+        diff = aciconfigdb.ConfigDiff(old, new)
+        self.assertEqual(diff.get_summary(),
+                         [('deleted', 'fvTenant[dn=uni/tn-t1]/fvCtx[name=ctx1]', ['name']),
+                          ('deleted', 'fvTenant[dn=uni/tn-t1]/fvBD[name=bd1]/fvSubnet[ip=10.1.1.1/24]', ['ip', 'name']),
+                          ('modified', 'fvTenant[dn=uni/tn-t1]/fvBD[name=bd1]', ['arpFlood']),
+                          ('created', 'fvTenant[dn=uni/tn-t1]/fvBD[name=bd1]/fvSubnet[ip=10.1.2.1/24]', ['ip', 'name'])])
+
+    def test_payloads(self):
+        """
+        Test that deletions are pushed first and only the changes are pushed
+        """
+        old = self._get_config()
+        new = self._get_config()
+        bd = new['imdata'][0]['fvTenant']['children'][0]['fvBD']
+        bd['attributes']['arpFlood'] = 'yes'
+        bd['children'][0]['fvRsCtx']['attributes']['tnFvCtxName'] = 'ctx2'
+        bd['children'][1]['fvSubnet']['attributes']['ip'] = '10.1.2.1/24'
+        payloads = aciconfigdb.ConfigDiff(old, new).get_payloads()
+        self.assertEqual(len(payloads), 2)
+        deleted = payloads[0]['fvTenant']['children'][0]['fvBD']
+        self.assertEqual(deleted['children'],
+                         [{'fvSubnet': {'attributes': {'ip': '10.1.1.1/24', 'name': '',
+                                                       'status': 'deleted'}}}])
+        modified = payloads[1]['fvTenant']['children'][0]['fvBD']
+        self.assertEqual(modified['attributes'], {'name': 'bd1', 'arpFlood': 'yes'})
+        self.assertEqual(modified['children'],
+                         [{'fvRsCtx': {'attributes': {'tnFvCtxName': 'ctx2'}}},
+                          {'fvSubnet': {'attributes': {'ip': '10.1.2.1/24', 'name': ''}}}])
+        self.assertEqual(len(payloads[1]['fvTenant']['children']), 1)
+
+    def test_payloads_batched(self):
+        """
+        Test that the changes are split in batches
+        """
+        old = {'imdata': [{'fvTenant': {'attributes': {'dn': 'uni/tn-t1', 'name': 't1'}}}]}
+        new = {'imdata': [{'fvTenant': {'attributes': {'dn': 'uni/tn-t1', 'name': 't1'},
+                                        'children': [{'fvCtx': {'attributes': {'name': 'ctx%s' % i}}}
+                                                     for i in range(5)]}}]}
+        payloads = aciconfigdb.ConfigDiff(old, new).get_payloads(max_changes=2)
+        self.assertEqual([len(payload['fvTenant']['children']) for payload in payloads], [2, 2, 1])
+
+    def test_keyless_siblings(self):
+        """
+        Test that siblings without a name or rn are matched by their naming
+        properties and not by their position
+        """
+        def get_config(blocks, next_hops):
+            pool = {'fvnsVlanInstP': {'attributes': {'dn': 'uni/infra/vlanns-[pool1]-static',
+                                                     'name': 'pool1', 'allocMode': 'static'},
+                                      'children': [{'fvnsEncapBlk': {'attributes': {'from': block[0],
+                                                                                    'to': block[1],
+                                                                                    'descr': block[2]}}}
+                                                   for block in blocks]}}
+            route = {'ipRouteP': {'attributes': {'ip': '0.0.0.0/0'},
+                                  'children': [{'ipNexthopP': {'attributes': {'nhAddr': next_hop[0],
+                                                                              'pref': next_hop[1]}}}
+                                               for next_hop in next_hops]}}
+            node = {'l3extRsNodeL3OutAtt': {'attributes': {'tDn': 'topology/pod-1/node-101',
+                                                           'rtrId': '1.1.1.1'},
+                                            'children': [route]}}
+            return [pool, node]
+
+        old = get_config([('vlan-1', 'vlan-10', ''), ('vlan-20', 'vlan-30', '')],
+                         [('10.0.0.1', '1'), ('10.0.0.2', '1')])
+        new = get_config([('vlan-20', 'vlan-30', 'changed'), ('vlan-1', 'vlan-10', '')],
+                         [('10.0.0.3', '1'), ('10.0.0.1', '1')])
+        diff = aciconfigdb.ConfigDiff(old, new)
+        route = 'l3extRsNodeL3OutAtt[tDn=topology/pod-1/node-101]/ipRouteP[ip=0.0.0.0/0]'
+        self.assertEqual(diff.get_summary(),
+                         [('deleted', route + '/ipNexthopP[nhAddr=10.0.0.2]', ['nhAddr', 'pref']),
+                          ('modified',
+                           'fvnsVlanInstP[dn=uni/infra/vlanns-[pool1]-static]/fvnsEncapBlk[from=vlan-20,to=vlan-30]',
+                           ['descr']),
+                          ('created', route + '/ipNexthopP[nhAddr=10.0.0.3]', ['nhAddr', 'pref'])])
+
+    def test_key_by_rn(self):
+        """
+        Test that the rn takes precedence over the other properties
+        """
+        old = {'fvBD': {'attributes': {'dn': 'uni/tn-t1/BD-bd1'},
+                        'children': [{'fvSubnet': {'attributes': {'rn': 'subnet-[10.1.1.1/24]',
+                                                                  'ip': '10.1.1.1/24', 'name': 'a'}}}]}}
+        new = {'fvBD': {'attributes': {'dn': 'uni/tn-t1/BD-bd1'},
+                        'children': [{'fvSubnet': {'attributes': {'rn': 'subnet-[10.1.1.1/24]',
+                                                                  'ip': '10.1.1.1/24', 'name': 'b'}}}]}}
+        self.assertEqual(aciconfigdb.ConfigDiff(old, new).get_summary(),
+                         [('modified', 'fvBD[dn=uni/tn-t1/BD-bd1]/fvSubnet[rn=subnet-[10.1.1.1/24]]', ['name'])])
+
+    def test_rollback_pushes_changes_only(self):
+        """
+        Test that rollback only pushes the differences
+        """
+        cwd = os.getcwd()
+        tmpdir = tempfile.mkdtemp()
+        os.chdir(tmpdir)
+        try:
+            cdb = aciconfigdb.ConfigDB()
+            with open(os.path.join(cdb.repo_dir, 'tenant-t1.json'), 'w') as config_file:
+                config_file.write(json.dumps(self._get_config()))
+            cdb.repo.index.add([os.path.join(cdb.repo_dir, 'tenant-t1.json')])
+            cdb.repo.index.commit('2016-01-01_00.00.00')
+            cdb.repo.git.tag('2016-01-01_00.00.00')
+            cdb.session = mock.Mock()
+            current = self._get_config()
+            current['imdata'][0]['fvTenant']['children'][1]['fvCtx']['attributes']['name'] = 'ctx2'
+            cdb._get_from_apic = mock.Mock(return_value=current)
+            cdb.rollback('2016-01-01_00.00.00')
+            pushed = [call[0][1] for call in cdb.session.push_to_apic.call_args_list]
+            self.assertEqual(pushed,
+                             [{'fvTenant': {'attributes': {'dn': 'uni/tn-t1', 'name': 't1'},
+                                            'children': [{'fvCtx': {'attributes': {'name': 'ctx2',
+                                                                                   'status': 'deleted'}}}]}},
+                              {'fvTenant': {'attributes': {'dn': 'uni/tn-t1', 'name': 't1'},
+                                            'children': [{'fvCtx': {'attributes': {'name': 'ctx1'}}}]}}])
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+
+
 if __name__ == '__main__':
 
     full_suite = unittest.TestSuite()
     full_suite.addTest(unittest.makeSuite(TestBasicSnapshot))
+    full_suite.addTest(unittest.makeSuite(TestChangeStatsCache))
+    full_suite.addTest(unittest.makeSuite(TestConfigDiff))
 
     unittest.main()
@@ -556,17 +556,15 @@ class JsonInterface(BaseView):
         View the snapshots
         """
         if request.method == 'POST':
-            versions = cdb.get_versions(with_changes=True)
             data = {}
             Snapshots = []
-            for (version, additions, deletions) in versions:
-                for (filename, adds, dels) in cdb.get_filenames(version,
-                                                        prev_version=None,
-                                                        with_changes=True):
+            latest_versions = cdb.get_latest_file_versions()
+            for (version, additions, deletions, files) in cdb.get_change_stats():
+                for (filename, adds, dels) in files:
                     item = {}
                     item['filename'] = filename
                     item['version'] = version
-                    is_latest = (version == cdb.get_latest_file_version(filename))
+                    is_latest = (version == latest_versions.get(filename))
                     item['latest'] = is_latest
                     Snapshots.append(item)
             data['snapshots'] = Snapshots
@@ -687,17 +685,15 @@ class JsonInterface(BaseView):
                                               starttime,
                                               build_db)
 
-                versions = cdb.get_versions(with_changes=True)
                 data = {}
                 Snapshots = []
-                for (version, additions, deletions) in versions:
-                    for (filename, adds, dels) in cdb.get_filenames(version,
-                                                        prev_version=None,
-                                                        with_changes=True):
+                latest_versions = cdb.get_latest_file_versions()
+                for (version, additions, deletions, files) in cdb.get_change_stats():
+                    for (filename, adds, dels) in files:
                         item = {}
                         item['filename'] = filename
                         item['version'] = version
-                        is_latest = (version == cdb.get_latest_file_version(filename))
+                        is_latest = (version == latest_versions.get(filename))
                         item['latest'] = is_latest
                         Snapshots.append(item)
                 data['snapshots'] = Snapshots
@@ -922,22 +918,16 @@ def build_db():
     """
     db.drop_all()
     db.create_all()
-    prev_version = None
-    versions = cdb.get_versions(with_changes=True)
-    if versions is None:
-        return
-    for (version, additions, deletions) in versions:
-        for (filename, adds, dels) in cdb.get_filenames(version,
-                                                        prev_version=prev_version,
-                                                        with_changes=True):
+    latest_versions = cdb.get_latest_file_versions()
+    for (version, additions, deletions, files) in cdb.get_change_stats():
+        for (filename, adds, dels) in files:
             snapshot = Snapshots()
             snapshot.version = version
             snapshot.filename = filename
             snapshot.changes = adds + '/' + dels
-            is_latest = (version == cdb.get_latest_file_version(filename))
+            is_latest = (version == latest_versions.get(filename))
             snapshot.latest = is_latest
             db.session.add(snapshot)
-        prev_version = version
     db.session.commit()
     return
 
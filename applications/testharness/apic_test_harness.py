@@ -6,11 +6,23 @@ be difficult to generate in a real system.
 from os import listdir, getpid
 from acitoolkit import FakeSession
 import argparse
+import base64
+import hashlib
+import itertools
+import math
+import select
+import socket
+import struct
 import sys
+import threading
 import logging
 from logging.handlers import RotatingFileHandler
-import ConfigParser
+try:
+    import ConfigParser
+except ImportError:
+    import configparser as ConfigParser
 from flask import Flask, request, abort
+from werkzeug.serving import WSGIRequestHandler
 from werkzeug.urls import iri_to_uri
 import json
 import random
@@ -109,60 +121,302 @@ class FailureHandler(object):
         self._config.read(filename)
 
 
-parser = argparse.ArgumentParser(description='ACI APIC Test Harness Tool')
-parser.add_argument('--directory', default=None,
-                    help='Directory containing the Snapshot files')
-parser.add_argument('--config', default=None,
-                    help='Optional .ini file providing failure scenario configuration')
-parser.add_argument('--maxlogfiles', type=int, default=10,
-                    help='Maximum number of log files (default is 10)')
-parser.add_argument('--debug', nargs='?',
-                    choices=['verbose', 'warnings', 'critical'],
-                    const='critical',
-                    help='Enable debug messages.')
-parser.add_argument('--ip',
-                    default=DEFAULT_IPADDRESS,
-                    help='IP address to listen on.')
-parser.add_argument('--port',
-                    default=DEFAULT_PORT,
-                    help='Port number to listen on.')
-args = parser.parse_args()
-
-if args.directory is None:
-    print('%% No snapshot directory given.')
-    sys.exit(0)
-
-if args.debug is not None:
-    if args.debug == 'verbose':
-        level = logging.DEBUG
-    elif args.debug == 'warnings':
-        level = logging.WARNING
-    else:
-        level = logging.CRITICAL
-else:
-    level = logging.CRITICAL
-format_string = '%(asctime)s %(levelname)s %(funcName)s(%(lineno)d) %(message)s'
-log_formatter = logging.Formatter(format_string)
-log_file = 'apic_test_harness.%s.log' % str(getpid())
-my_handler = RotatingFileHandler(log_file, mode='a', maxBytes=5 * 1024 * 1024,
-                                 backupCount=args.maxlogfiles,
-                                 encoding=None, delay=0)
-my_handler.setLevel(level)
-my_handler.setFormatter(log_formatter)
-logging.getLogger().addHandler(my_handler)
-logging.getLogger().setLevel(level)
-
-# Set the directory to the location of the JSON files
-directory = args.directory
-filenames = [directory + filename for filename in listdir(directory)
-             if filename.endswith('.json')]
-
-# Create the session
-session = FakeSession(filenames)
-
-# Handle failure scenario configuration
+class Simulator(object):
+    """
+    Class for simulating the load characteristics of an APIC.  The
+    simulator adds latency to the responses, limits the number of
+    requests processed concurrently, returns the paging errors of large
+    responses and emits synthetic events on the websocket.
+    """
+    TOO_BIG_ERROR = 'Unable to process the query, result dataset is too big'
+    WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+    def __init__(self):
+        self._config = None
+        self._semaphore = None
+        self._subscriptions = {}
+        self._subscription_ids = itertools.count(72057594037927937)
+        self._lock = threading.Lock()
+
+    def _get(self, section, option, default):
+        """
+        Get a setting of the configuration file
+        :param section: String containing the section of the setting
+        :param option: String containing the name of the setting
+        :param default: Default value of the setting.  The setting is
+                        converted to the type of the default value.
+        :return: The value of the setting or the default value
+        """
+        try:
+            return type(default)(self._config.get(section, option))
+        except (ConfigParser.NoSectionError,
+                ConfigParser.NoOptionError,
+                AttributeError):
+            return default
+
+    def is_enabled(self):
+        """
+        Check whether the Simulator is enabled
+        :return: True if Simulator is enabled. False otherwise
+        """
+        return self._get('Simulator', 'Status', 'disabled') == 'enabled'
+
+    def add_config(self, filename):
+        """
+        Add the configuration file
+        :param filename: String containing the name of the configuration file
+        """
+        if filename is None:
+            return
+        self._config = ConfigParser.ConfigParser()
+        self._config.read(filename)
+        max_requests = self._get('Simulator', 'MaxConcurrentRequests', 0)
+        if self.is_enabled() and max_requests > 0:
+            self._semaphore = threading.BoundedSemaphore(max_requests)
+
+    def acquire(self):
+        """
+        Wait until the request can be processed within the
+        MaxConcurrentRequests limit
+        """
+        if self._semaphore is not None:
+            self._semaphore.acquire()
+
+    def release(self):
+        """
+        Release the request processing slot taken by acquire()
+        """
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    @staticmethod
+    def get_url_class(path, method='GET'):
+        """
+        Get the class of the URL used to select the latency distribution
+        :param path: String containing the URL path and query
+        :param method: String containing the HTTP method
+        :return: String containing one of login, subscription, push,
+                 class or mo
+        """
+        if '/api/aaa' in path or '/api/requestAppToken' in path:
+            return 'login'
+        if method != 'GET':
+            return 'push'
+        if 'subscription=yes' in path or '/api/subscriptionRefresh' in path:
+            return 'subscription'
+        if path.startswith('/api/class/') or path.startswith('/api/node/class/'):
+            return 'class'
+        return 'mo'
+
+    def get_latency(self, url_class, response_size=0):
+        """
+        Get a random latency for the request.  The latency is drawn from
+        the distribution configured in the Latency:<url class> section
+        and grows with the response size based on the SecondsPerMegabyte
+        setting.
+        :param url_class: String containing the class of the URL
+        :param response_size: Integer containing the size of the response
+                              in bytes
+        :return: Float containing the latency in seconds
+        """
+        section = 'Latency:' + url_class
+        distribution = self._get(section, 'Distribution', 'fixed')
+        mean = self._get(section, 'Mean', 0.0)
+        deviation = self._get(section, 'Deviation', 0.0)
+        if distribution == 'uniform':
+            latency = random.uniform(mean - deviation, mean + deviation)
+        elif distribution == 'normal':
+            latency = random.gauss(mean, deviation)
+        elif distribution == 'lognormal' and mean > 0:
+            # Parameters of the underlying normal distribution giving the
+            # configured mean and deviation
+            sigma = math.sqrt(math.log(1 + (deviation / mean) ** 2))
+            latency = random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+        elif distribution == 'exponential' and mean > 0:
+            latency = random.expovariate(1 / mean)
+        else:
+            latency = mean
+        latency = max(latency, self._get(section, 'Minimum', 0.0))
+        latency = min(latency, self._get(section, 'Maximum', latency))
+        latency += self._get('Simulator', 'SecondsPerMegabyte', 0.0) * response_size / 1000000.0
+        return latency
+
+    def enforce_latency(self, url_class, response_size=0):
+        """
+        Delay the response by a random latency
+        :param url_class: String containing the class of the URL
+        :param response_size: Integer containing the size of the response
+                              in bytes
+        """
+        latency = self.get_latency(url_class, response_size)
+        if latency > 0:
+            logging.debug('Delaying %s response by %s seconds...', url_class, latency)
+            time.sleep(latency)
+
+    def paginate(self, data, args):
+        """
+        Apply the page and page-size query options to the response.
+        Responses with more objects than MaxResponseObjects are refused as
+        the APIC does unless they are paged.
+        :param data: Dictionary containing the response
+        :param args: Dictionary containing the query options of the request
+        :return: Tuple of the HTTP status code and the response
+        """
+        imdata = data.get('imdata', [])
+        if 'page-size' in args:
+            page_size = int(args['page-size'])
+            page = int(args.get('page', 0))
+            return 200, {'totalCount': str(len(imdata)),
+                         'imdata': imdata[page * page_size:(page + 1) * page_size]}
+        max_objects = self._get('Simulator', 'MaxResponseObjects', 0)
+        if max_objects and len(imdata) > max_objects:
+            logging.warning('Refusing response of %s objects...', len(imdata))
+            return 400, {'totalCount': '1',
+                         'imdata': [{'error': {'attributes': {'code': '400',
+                                                              'text': self.TOO_BIG_ERROR}}}]}
+        return 200, data
+
+    def subscribe(self, data):
+        """
+        Register a subscription.  The objects in the response are used as
+        the source of the synthetic events of the subscription.
+        :param data: Dictionary containing the response of the subscription
+        :return: String containing the subscription id
+        """
+        objects = []
+        for obj in data.get('imdata', []):
+            for apic_class in obj:
+                attributes = dict(obj[apic_class].get('attributes', {}))
+                objects.append((apic_class, attributes))
+        with self._lock:
+            subscription_id = str(next(self._subscription_ids))
+            self._subscriptions[subscription_id] = objects
+        return subscription_id
+
+    def refresh_subscription(self, subscription_id):
+        """
+        Refresh a subscription
+        :param subscription_id: String containing the subscription id
+        :return: Dictionary containing the response
+        """
+        if subscription_id not in self._subscriptions:
+            abort(400)
+        return {'totalCount': '0', 'imdata': []}
+
+    def get_event(self):
+        """
+        Generate a synthetic event for a random subscription.  The status
+        of the event is picked from the EventStatuses setting.
+        :return: Dictionary containing the event or None if there are no
+                 subscriptions with objects
+        """
+        with self._lock:
+            subscriptions = [(subscription_id, objects)
+                             for subscription_id, objects in self._subscriptions.items() if objects]
+        if not subscriptions:
+            return None
+        subscription_id, objects = random.choice(subscriptions)
+        apic_class, attributes = random.choice(objects)
+        statuses = self._get('Simulator', 'EventStatuses', 'modified').split(',')
+        attributes = dict(attributes)
+        attributes['status'] = random.choice(statuses).strip()
+        return {'totalCount': '1',
+                'subscriptionId': [subscription_id],
+                'imdata': [{apic_class: {'attributes': attributes}}]}
+
+    @staticmethod
+    def _send_frame(connection, payload, opcode=0x1):
+        """
+        Send an unmasked websocket frame
+        :param connection: Socket of the websocket
+        :param payload: Bytes containing the payload
+        :param opcode: Integer containing the opcode of the frame
+        """
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        connection.sendall(header + payload)
+
+    @staticmethod
+    def _recv_frame(rfile):
+        """
+        Receive a websocket frame from the client
+        :param rfile: File object of the websocket
+        :return: Tuple of the opcode and the payload. The opcode is None
+                 if the connection is closed
+        """
+        header = rfile.read(2)
+        if len(header) < 2:
+            return None, b''
+        opcode = bytearray(header)[0] & 0x0f
+        length = bytearray(header)[1] & 0x7f
+        if length == 126:
+            length = struct.unpack('!H', rfile.read(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', rfile.read(8))[0]
+        mask = bytearray(rfile.read(4))
+        payload = bytearray(rfile.read(length))
+        for i in range(length):
+            payload[i] ^= mask[i % 4]
+        return opcode, bytes(payload)
+
+    def serve_websocket(self, handler):
+        """
+        Accept a websocket connection and send synthetic events on it at
+        the rate of the EventsPerSecond setting until the client closes
+        the connection.
+        :param handler: Instance of WSGIRequestHandler for the connection
+        """
+        handler.close_connection = True
+        key = handler.headers.get('Sec-WebSocket-Key', '')
+        accept = base64.b64encode(hashlib.sha1((key + self.WEBSOCKET_GUID).encode('utf-8')).digest())
+        handler.wfile.write(b'HTTP/1.1 101 Switching Protocols\r\n'
+                            b'Upgrade: websocket\r\n'
+                            b'Connection: Upgrade\r\n'
+                            b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        handler.wfile.flush()
+        logging.debug('Websocket opened %s', handler.path)
+        rate = self._get('Simulator', 'EventsPerSecond', 0.0)
+        try:
+            while True:
+                # Events arrive as a Poisson process at the configured rate
+                wait = random.expovariate(rate) if rate > 0 else None
+                readable, _, _ = select.select([handler.connection], [], [], wait)
+                if readable:
+                    opcode, payload = self._recv_frame(handler.rfile)
+                    if opcode is None or opcode == 0x8:
+                        break
+                    if opcode == 0x9:
+                        self._send_frame(handler.connection, payload, opcode=0xa)
+                    continue
+                event = self.get_event()
+                if event is not None:
+                    self._send_frame(handler.connection, json.dumps(event).encode('utf-8'))
+        except (socket.error, ValueError):
+            pass
+        logging.debug('Websocket closed %s', handler.path)
+
+
+class SimulatorRequestHandler(WSGIRequestHandler):
+    """
+    Request handler that serves the websocket of the Simulator and passes
+    all of the other requests to the Flask application
+    """
+    def run_wsgi(self):
+        if simulator.is_enabled() and self.path.startswith('/socket') and \
+                self.headers.get('Upgrade', '').lower() == 'websocket':
+            return simulator.serve_websocket(self)
+        return WSGIRequestHandler.run_wsgi(self)
+
+
+# The session is created from the snapshot files by main()
+session = None
 failure_hdlr = FailureHandler()
-failure_hdlr.add_config(args.config)
+simulator = Simulator()
 
 app = Flask(__name__)
 
@@ -177,13 +431,31 @@ def handle_get(path):
     if path == '/api':
         abort(400)
     logging.debug('Received %s', path)
-    dump = session.get(path)
-    logging.debug('From Fake APIC: %s', dump.json())
-    response = json.dumps(dump.json(), indent=4, separators=(',', ':'))
+    status = 200
+    simulator.acquire()
+    try:
+        if simulator.is_enabled() and path.startswith('/api/subscriptionRefresh'):
+            dump = simulator.refresh_subscription(request.args.get('id'))
+        else:
+            dump = session.get(path).json()
+        if simulator.is_enabled():
+            status, page = simulator.paginate(dump, request.args)
+            # Subscribe once to all of the objects when they are paged
+            if status == 200 and request.args.get('subscription') == 'yes' and \
+                    request.args.get('page', '0') == '0':
+                page = dict(page)
+                page['subscriptionId'] = simulator.subscribe(dump)
+            dump = page
+        logging.debug('From Fake APIC: %s', dump)
+        response = json.dumps(dump, separators=(',', ':'))
+        if simulator.is_enabled():
+            simulator.enforce_latency(simulator.get_url_class(path), len(response))
+    finally:
+        simulator.release()
     failure_hdlr.enforce_delay()
     if failure_hdlr.enforce_connection_failure():
         abort(400)
-    return response
+    return response, status
 
 
 @app.route('/', defaults={'path': ''}, methods=['POST', 'PUT'])
@@ -192,20 +464,97 @@ def handle_post(path):
     """
     Handle the POST and PUT
     """
-    logging.debug('request url: %s received: %s', path, request.data)
-    if not request.data:
+    data = request.get_data(as_text=True)
+    logging.debug('request url: %s received: %s', path, data)
+    if not data:
         logging.debug('Aborting due to no JSON in the POST')
         abort(400)
-    resp = session.push_to_apic('/' + path, request.data)
-    if not resp.ok:
-        logging.debug('Aborting due to no Response coming back as not ok')
-        abort(400)
-    logging.debug('Response: %s', resp.json())
+    simulator.acquire()
+    try:
+        resp = session.push_to_apic('/' + path, data)
+        if not resp.ok:
+            logging.debug('Aborting due to no Response coming back as not ok')
+            abort(400)
+        logging.debug('Response: %s', resp.json())
+        response = json.dumps(resp.json(), separators=(',', ':'))
+        if simulator.is_enabled():
+            simulator.enforce_latency(simulator.get_url_class('/' + path, request.method), len(data))
+    finally:
+        simulator.release()
     failure_hdlr.enforce_delay()
     if failure_hdlr.enforce_connection_failure():
         abort(400)
-    return json.dumps(resp.json(), indent=4, separators=(',', ':'))
+    return response
+
+
+def main():
+    """
+    Main execution routine
+    """
+    global session
+
+    parser = argparse.ArgumentParser(description='ACI APIC Test Harness Tool')
+    parser.add_argument('--directory', default=None,
+                        help='Directory containing the Snapshot files')
+    parser.add_argument('--config', default=None,
+                        help='Optional .ini file providing failure scenario configuration')
+    parser.add_argument('--maxlogfiles', type=int, default=10,
+                        help='Maximum number of log files (default is 10)')
+    parser.add_argument('--debug', nargs='?',
+                        choices=['verbose', 'warnings', 'critical'],
+                        const='critical',
+                        help='Enable debug messages.')
+    parser.add_argument('--ip',
+                        default=DEFAULT_IPADDRESS,
+                        help='IP address to listen on.')
+    parser.add_argument('--port',
+                        default=DEFAULT_PORT,
+                        help='Port number to listen on.')
+    args = parser.parse_args()
+
+    if args.directory is None:
+        print('%% No snapshot directory given.')
+        sys.exit(0)
+
+    if args.debug is not None:
+        if args.debug == 'verbose':
+            level = logging.DEBUG
+        elif args.debug == 'warnings':
+            level = logging.WARNING
+        else:
+            level = logging.CRITICAL
+    else:
+        level = logging.CRITICAL
+    format_string = '%(asctime)s %(levelname)s %(funcName)s(%(lineno)d) %(message)s'
+    log_formatter = logging.Formatter(format_string)
+    log_file = 'apic_test_harness.%s.log' % str(getpid())
+    my_handler = RotatingFileHandler(log_file, mode='a', maxBytes=5 * 1024 * 1024,
+                                     backupCount=args.maxlogfiles,
+                                     encoding=None, delay=0)
+    my_handler.setLevel(level)
+    my_handler.setFormatter(log_formatter)
+    logging.getLogger().addHandler(my_handler)
+    logging.getLogger().setLevel(level)
+
+    # Set the directory to the location of the JSON files
+    directory = args.directory
+    filenames = [directory + filename for filename in listdir(directory)
+                 if filename.endswith('.json')]
+
+    # Create the session
+    session = FakeSession(filenames)
+
+    # Handle failure scenario configuration
+    failure_hdlr.add_config(args.config)
+
+    # Handle load simulation configuration
+    simulator.add_config(args.config)
+
+    # Keep the connections alive like the APIC does so that clients can reuse them
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    app.run(debug=False, host=args.ip, port=int(args.port), threaded=True,
+            request_handler=SimulatorRequestHandler)
 
 
 if __name__ == '__main__':
-    app.run(debug=False, host=args.ip, port=int(args.port))
+    main()
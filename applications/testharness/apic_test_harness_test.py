@@ -0,0 +1,192 @@
+"""
+Test routines for the APIC Test Harness load simulator.  The paging and
+the websocket framing are tested without running the web server.
+"""
+import io
+import os
+import struct
+import tempfile
+import unittest
+from apic_test_harness import Simulator
+
+
+class FakeConnection(object):
+    """
+    Socket that records the data sent on it
+    """
+    def __init__(self):
+        self.data = b''
+
+    def sendall(self, data):
+        self.data += data
+
+
+class TestPaginate(unittest.TestCase):
+    """
+    Simulator paging testcases
+    """
+    def setUp(self):
+        self.simulator = Simulator()
+        self.data = {'totalCount': '5',
+                     'imdata': [{'fvTenant': {'attributes': {'name': str(i)}}} for i in range(5)]}
+
+    def _add_config(self, max_objects):
+        config_file, filename = tempfile.mkstemp(suffix='.ini')
+        with os.fdopen(config_file, 'w') as f:
+            f.write('[Simulator]\nStatus: enabled\nMaxResponseObjects: %s\n' % max_objects)
+        self.addCleanup(os.remove, filename)
+        self.simulator.add_config(filename)
+
+    def _names(self, data):
+        return [obj['fvTenant']['attributes']['name'] for obj in data['imdata']]
+
+    def test_no_paging(self):
+        """
+        Test that the response is unchanged without paging options
+        """
+        self.assertEqual(self.simulator.paginate(self.data, {}), (200, self.data))
+
+    def test_pages(self):
+        """
+        Test that the pages slice the response and keep the total count
+        """
+        status, resp = self.simulator.paginate(self.data, {'page-size': '2'})
+        self.assertEqual(status, 200)
+        self.assertEqual(resp['totalCount'], '5')
+        self.assertEqual(self._names(resp), ['0', '1'])
+        status, resp = self.simulator.paginate(self.data, {'page-size': '2', 'page': '2'})
+        self.assertEqual(self._names(resp), ['4'])
+        status, resp = self.simulator.paginate(self.data, {'page-size': '2', 'page': '3'})
+        self.assertEqual(resp['totalCount'], '5')
+        self.assertEqual(resp['imdata'], [])
+
+    def test_too_big(self):
+        """
+        Test that a response larger than MaxResponseObjects is refused
+        """
+        self._add_config(4)
+        status, resp = self.simulator.paginate(self.data, {})
+        self.assertEqual(status, 400)
+        self.assertEqual(resp['imdata'][0]['error']['attributes']['text'],
+                         Simulator.TOO_BIG_ERROR)
+
+    def test_too_big_paged(self):
+        """
+        Test that a response larger than MaxResponseObjects is returned
+        when it is paged
+        """
+        self._add_config(4)
+        status, resp = self.simulator.paginate(self.data, {'page-size': '3', 'page': '1'})
+        self.assertEqual(status, 200)
+        self.assertEqual(self._names(resp), ['3', '4'])
+
+    def test_within_limit(self):
+        """
+        Test that a response within MaxResponseObjects is returned
+        """
+        self._add_config(5)
+        self.assertEqual(self.simulator.paginate(self.data, {}), (200, self.data))
+
+
+class TestFrames(unittest.TestCase):
+    """
+    Websocket frame encoding and decoding testcases
+    """
+    @staticmethod
+    def _masked_frame(payload, opcode=0x1, mask=b'\x01\x02\x03\x04'):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, 0x80 | length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, length)
+        masked = bytearray(payload)
+        for i in range(length):
+            masked[i] ^= bytearray(mask)[i % 4]
+        return header + mask + bytes(masked)
+
+    def _send(self, payload, opcode=0x1):
+        connection = FakeConnection()
+        Simulator._send_frame(connection, payload, opcode)
+        return connection.data
+
+    def test_send_short(self):
+        """
+        Test the header of a frame with a 7 bit length
+        """
+        data = self._send(b'hello')
+        self.assertEqual(data, b'\x81\x05hello')
+
+    def test_send_medium(self):
+        """
+        Test the header of a frame with a 16 bit length
+        """
+        payload = b'x' * 126
+        data = self._send(payload, opcode=0xa)
+        self.assertEqual(data[:4], b'\x8a\x7e\x00\x7e')
+        self.assertEqual(data[4:], payload)
+
+    def test_send_long(self):
+        """
+        Test the header of a frame with a 64 bit length
+        """
+        payload = b'x' * 65536
+        data = self._send(payload)
+        self.assertEqual(data[:2], b'\x81\x7f')
+        self.assertEqual(struct.unpack('!Q', data[2:10])[0], 65536)
+        self.assertEqual(data[10:], payload)
+
+    def test_recv(self):
+        """
+        Test that masked frames of every length encoding are decoded
+        """
+        for payload in (b'', b'hello', b'y' * 200, b'z' * 70000):
+            rfile = io.BytesIO(self._masked_frame(payload))
+            self.assertEqual(Simulator._recv_frame(rfile), (0x1, payload))
+
+    def test_recv_opcode(self):
+        """
+        Test that the opcode of a control frame is decoded
+        """
+        rfile = io.BytesIO(self._masked_frame(b'ping', opcode=0x9) +
+                           self._masked_frame(b'', opcode=0x8))
+        self.assertEqual(Simulator._recv_frame(rfile), (0x9, b'ping'))
+        self.assertEqual(Simulator._recv_frame(rfile), (0x8, b''))
+
+    def test_recv_closed(self):
+        """
+        Test that a closed connection is reported
+        """
+        self.assertEqual(Simulator._recv_frame(io.BytesIO(b'')), (None, b''))
+        self.assertEqual(Simulator._recv_frame(io.BytesIO(b'\x81')), (None, b''))
+
+
+class TestEvents(unittest.TestCase):
+    """
+    Simulator subscription event testcases
+    """
+    def test_no_subscriptions(self):
+        """
+        Test that no event is generated without subscriptions
+        """
+        simulator = Simulator()
+        self.assertIsNone(simulator.get_event())
+        simulator.subscribe({'totalCount': '0', 'imdata': []})
+        self.assertIsNone(simulator.get_event())
+
+    def test_event(self):
+        """
+        Test that the event is built from the subscribed objects
+        """
+        simulator = Simulator()
+        subscription_id = simulator.subscribe({'totalCount': '1',
+                                               'imdata': [{'fvTenant': {'attributes': {'name': 'a'}}}]})
+        event = simulator.get_event()
+        self.assertEqual(event['subscriptionId'], [subscription_id])
+        self.assertEqual(event['imdata'],
+                         [{'fvTenant': {'attributes': {'name': 'a', 'status': 'modified'}}}])
+
+
+if __name__ == '__main__':
+    unittest.main()
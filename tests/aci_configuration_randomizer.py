@@ -2,7 +2,10 @@ from acitoolkit import (Credentials, Session, Tenant, BridgeDomain, Context, App
                         Contract, ContractSubject, Filter, FilterEntry, Interface, L2Interface)
 import random
 import string
-import ConfigParser
+try:
+    import ConfigParser
+except ImportError:
+    import configparser as ConfigParser
 import json
 import time
 import ast
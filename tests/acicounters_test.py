@@ -0,0 +1,422 @@
+################################################################################
+#                                  _    ____ ___                               #
+#                                 / \  / ___|_ _|                              #
+#                                / _ \| |    | |                               #
+#                               / ___ \ |___ | |                               #
+#                         _____/_/   \_\____|___|_ _                           #
+#                        |_   _|__   ___ | | | _(_) |_                         #
+#                          | |/ _ \ / _ \| | |/ / | __|                        #
+#                          | | (_) | (_) | |   <| | |_                         #
+#                          |_|\___/ \___/|_|_|\_\_|\__|                        #
+#                                                                              #
+################################################################################
+#                                                                              #
+# Copyright (c) 2015 Cisco Systems                                             #
+# All Rights Reserved.                                                         #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may   #
+#    not use this file except in compliance with the License. You may obtain   #
+#    a copy of the License at                                                  #
+#                                                                              #
+#         http://www.apache.org/licenses/LICENSE-2.0                           #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT #
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the  #
+#    License for the specific language governing permissions and limitations   #
+#    under the License.                                                        #
+#                                                                              #
+################################################################################
+"""acicounters.py Test module
+"""
+from acitoolkit.acicounters import (
+    AtomicCountersCollector, AtomicCountersOnGoing, InterfaceStats, InterfaceStatsCollector, InterfaceStatsPoller,
+    InterfaceStatsStore, _parse_timestamp
+)
+import json
+import os
+import requests
+import shutil
+import tempfile
+import time
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+TOTAL_COUNTERS = ['bytesAvg', 'bytesCum', 'bytesMax', 'bytesMin', 'bytesPer',
+                  'pktsAvg', 'pktsCum', 'pktsMax', 'pktsMin', 'pktsPer',
+                  'bytesRate', 'bytesRateAvg', 'bytesRateMax', 'bytesRateMin',
+                  'pktsRate', 'pktsRateAvg', 'pktsRateMax', 'pktsRateMin']
+
+
+def get_interface(node_id, port, egress_bytes, ingress_bytes):
+    """
+    Build a l1PhysIf with its period 1 stats
+    """
+    dn = 'topology/pod-1/node-%s/sys/phys-[eth1/%s]' % (node_id, port)
+    children = [
+        {'eqptEgrTotalHist5min': {'attributes': {
+            'rn': 'HDeqptEgrTotal5min-0', 'index': '0', 'cnt': '10',
+            'bytesCum': str(egress_bytes), 'bytesRate': str(egress_bytes / 300.0),
+            'repIntvStart': '2016-01-01T00:00:00.000+00:00',
+            'repIntvEnd': '2016-01-01T00:05:00.000+00:00'}}},
+        {'eqptIngrTotalHist5min': {'attributes': {
+            'rn': 'HDeqptIngrTotal5min-0', 'index': '0', 'cnt': '10',
+            'bytesCum': str(ingress_bytes)}}},
+        {'eqptIngrTotalHist1h': {'attributes': {
+            'rn': 'HDeqptIngrTotal1h-0', 'index': '0', 'cnt': '10',
+            'bytesCum': str(ingress_bytes * 12)}}},
+    ]
+    for child in children:
+        for counter in TOTAL_COUNTERS:
+            list(child.values())[0]['attributes'].setdefault(counter, '0')
+    return {'l1PhysIf': {'attributes': {'dn': dn}, 'children': children}}
+
+
+class FakeStatsSession(object):
+    """
+    Session that serves the l1PhysIf stats in pages
+    """
+    def __init__(self, interfaces):
+        self.interfaces = interfaces
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        page = int(url.split('&page=')[1].split('&')[0])
+        page_size = int(url.split('&page-size=')[1].split('&')[0])
+        imdata = self.interfaces[page * page_size:(page + 1) * page_size]
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = json.dumps({'imdata': imdata,
+                                    'totalCount': str(len(self.interfaces))}).encode()
+        return resp
+
+
+class TestInterfaceStats(unittest.TestCase):
+    """
+    Test InterfaceStats class from acicounters.py
+    """
+    def test_process_data(self):
+        """
+        Test processing the stats of a single interface
+        """
+        stats = InterfaceStats._process_data(get_interface('101', '1', 3000, 6000))
+        self.assertEqual(stats['egrTotal']['5min'][1]['bytesCum'], 3000)
+        self.assertEqual(stats['ingrTotal']['1h'][1]['bytesCum'], 72000)
+
+    def test_get_count_name(self):
+        """
+        Test the counter family names
+        """
+        self.assertEqual(InterfaceStats._get_count_name('eqptIngrUnkPktsHist5min'), 'ingrUnkPkts')
+        self.assertEqual(InterfaceStats._get_count_name('eqptEgrDropPkts1h'), 'egrDropPkts')
+        self.assertEqual(InterfaceStats._get_count_name('unknown5min'), 'unknown5min')
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestInterfaceStatsCollector(unittest.TestCase):
+    """
+    Test InterfaceStatsCollector class from acicounters.py
+    """
+    def get_collector(self, interfaces, **kwargs):
+        session = FakeStatsSession(interfaces)
+        return session, InterfaceStatsCollector(session, period=1, page_size=2, **kwargs)
+
+    def test_collect_pages(self):
+        """
+        Test that the interfaces are collected one page at a time
+        """
+        interfaces = [get_interface('101', port, port * 1000, port * 2000) for port in range(1, 6)]
+        session, collector = self.get_collector(interfaces)
+        self.assertEqual(collector.collect(), 5)
+        self.assertEqual(len(session.urls), 3)
+        self.assertTrue(all('statsHist.index,"0"' in url for url in session.urls))
+        self.assertEqual(collector.get_families(), ['egrTotal', 'ingrTotal'])
+        self.assertEqual(sorted(collector.get_counter_names('egrTotal')), sorted(TOTAL_COUNTERS))
+        self.assertEqual(collector.retrieve('1/101/1/3', 'egrTotal', '5min', 1, 'bytesCum'), 3000.0)
+        self.assertEqual(collector.retrieve('1/101/1/3', 'ingrTotal', '1h', 1, 'bytesCum'), 72000.0)
+        self.assertEqual(collector.retrieve('1/101/1/3', 'ingrTotal', '5min', 1, 'bytesRate'), 0.0)
+        self.assertIsNone(collector.retrieve('1/101/1/3', 'ingrTotal', '5min', 1, 'bogus'))
+        self.assertIsNone(collector.retrieve('1/101/1/9', 'egrTotal', '5min', 1, 'bytesCum'))
+
+    def test_values_match_process_data(self):
+        """
+        Test that the collected values match the dictionary based stats
+        """
+        interfaces = [get_interface('102', port, port * 7, port * 11) for port in range(1, 4)]
+        session, collector = self.get_collector(interfaces)
+        collector.collect()
+        all_ports = dict((InterfaceStats._parseDn2PortId(interface['l1PhysIf']['attributes']['dn']),
+                          InterfaceStats._process_data(interface)) for interface in interfaces)
+        port_ids, values = collector.get_values('egrTotal', '5min', 'bytesRate')
+        self.assertEqual(sorted(port_ids), sorted(all_ports.keys()))
+        for port_id, value in zip(port_ids, values):
+            self.assertAlmostEqual(value, all_ports[port_id]['egrTotal']['5min'][1]['bytesRate'])
+
+    def test_granularities(self):
+        """
+        Test keeping only some of the granularities
+        """
+        session, collector = self.get_collector([get_interface('101', 1, 10, 20)],
+                                                granularities=['1h'])
+        collector.collect()
+        self.assertEqual(collector.get_families(), ['ingrTotal'])
+        port_ids, values = collector.get_values('ingrTotal', '5min', 'bytesCum')
+        self.assertEqual(port_ids, [])
+
+    def test_deltas_and_top(self):
+        """
+        Test the delta, rate and top N computations across two collections
+        """
+        interfaces = [get_interface('101', port, port * 1000, 0) for port in range(1, 6)]
+        session, collector = self.get_collector(interfaces)
+        collector.collect()
+        port_ids, rates = collector.get_rates('egrTotal', '5min', 'bytesCum')
+        self.assertTrue(numpy.isnan(rates).all())
+
+        interfaces = [get_interface('101', port, port * 1000 + (6 - port) * 100, 0) for port in range(1, 5)]
+        interfaces.append(get_interface('101', 6, 100, 0))
+        session.interfaces = interfaces
+        collector.collect()
+        collector.previous_timestamp = collector.timestamp - 100
+        port_ids, deltas = collector.get_deltas('egrTotal', '5min', 'bytesCum')
+        deltas = dict(zip(port_ids, deltas))
+        self.assertEqual(deltas['1/101/1/1'], 500)
+        self.assertEqual(deltas['1/101/1/4'], 200)
+        self.assertTrue(numpy.isnan(deltas['1/101/1/5']))
+        self.assertTrue(numpy.isnan(deltas['1/101/1/6']))
+        port_ids, rates = collector.get_rates('egrTotal', '5min', 'bytesCum')
+        self.assertEqual(dict(zip(port_ids, rates))['1/101/1/1'], 5.0)
+
+        top = collector.get_top('egrTotal', '5min', 'bytesCum', num=2, mode='delta')
+        self.assertEqual(top, [('1/101/1/1', 500.0), ('1/101/1/2', 400.0)])
+        top = collector.get_top('egrTotal', '5min', 'bytesCum', num=10)
+        self.assertEqual([port_id for port_id, value in top],
+                         ['1/101/1/4', '1/101/1/3', '1/101/1/2', '1/101/1/1', '1/101/1/6'])
+        self.assertRaises(ValueError, collector.get_top, 'egrTotal', '5min', 'bytesCum', mode='bogus')
+
+    def test_invalid_period(self):
+        """
+        Test that period 0 is rejected
+        """
+        self.assertRaises(ValueError, InterfaceStatsCollector, FakeStatsSession([]), period=0)
+
+
+def get_history(node_id, port, periods, latest_end):
+    """
+    Build a l1PhysIf with the 5min and 15min ingrTotal history ending at latest_end
+    """
+    dn = 'topology/pod-1/node-%s/sys/phys-[eth1/%s]' % (node_id, port)
+    children = []
+    for index in range(periods):
+        end = latest_end - index * 300
+        children.append({'eqptIngrTotalHist5min': {'attributes': {
+            'rn': 'HDeqptIngrTotal5min-%s' % index, 'index': str(index),
+            'bytesCum': str(end), 'bytesRate': '1.5', 'dn': dn,
+            'repIntvStart': get_timestamp(end - 300), 'repIntvEnd': get_timestamp(end)}}})
+        children.append({'eqptIngrTotalHist15min': {'attributes': {
+            'rn': 'HDeqptIngrTotal15min-%s' % index, 'index': str(index),
+            'bytesCum': '1', 'repIntvStart': get_timestamp(end - 900),
+            'repIntvEnd': get_timestamp(end)}}})
+    return {'l1PhysIf': {'attributes': {'dn': dn}, 'children': children}}
+
+
+def get_timestamp(seconds):
+    """
+    Format seconds since the epoch as an APIC timestamp
+    """
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000+00:00', time.gmtime(seconds))
+
+
+class FakeHistorySession(FakeStatsSession):
+    """
+    Session that serves the number of statsHist periods that was requested
+    """
+    def __init__(self, latest_end):
+        super(FakeHistorySession, self).__init__([])
+        self.latest_end = latest_end
+
+    def get(self, url):
+        periods = int(url.split('lt(statsHist.index,"')[1].split('"')[0])
+        self.interfaces = [get_history('101', port, periods, self.latest_end) for port in (1, 2)]
+        return super(FakeHistorySession, self).get(url)
+
+
+class TestInterfaceStatsPoller(unittest.TestCase):
+    """
+    Test InterfaceStatsPoller and InterfaceStatsStore classes from acicounters.py
+    """
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_parse_timestamp(self):
+        """
+        Test converting the APIC timestamps
+        """
+        self.assertEqual(_parse_timestamp('1970-01-01T00:05:00.000+00:00'), 300)
+        self.assertEqual(_parse_timestamp('1970-01-01T02:05:00.250+02:00'), 300.25)
+        self.assertEqual(_parse_timestamp('1970-01-01T00:05:00Z'), 300)
+
+    def test_poll_gap_backfill(self):
+        """
+        Test that a poll after a gap reads enough periods to fill it
+        """
+        latest_end = 1500000000
+        session = FakeHistorySession(latest_end)
+        poller = InterfaceStatsPoller(session, InterfaceStatsStore(self.path), page_size=1)
+        self.assertEqual(poller.poll(now=latest_end + 10), 2)
+        self.assertIn('lt(statsHist.index,"1")', session.urls[0])
+
+        # 30 minutes later
+        session.latest_end = latest_end + 1800
+        self.assertEqual(poller.get_num_periods(now=latest_end + 1810), 7)
+        self.assertEqual(poller.poll(now=latest_end + 1810), 12)
+        stats = poller._store.read('ingrTotal', '5min', '1/101/1/1')
+        self.assertEqual([record['intervalEnd'] for record in stats],
+                         [latest_end + 300 * index for index in range(7)])
+        self.assertEqual(stats[-1]['bytesCum'], latest_end + 1800)
+        self.assertEqual(stats[-1]['intervalStart'], latest_end + 1500)
+        self.assertEqual(poller._store.read('ingrTotal', '15min'), [])
+
+        # Nothing new
+        self.assertEqual(poller.poll(now=latest_end + 1810), 0)
+
+    def test_restart(self):
+        """
+        Test that a new store picks up the high-water marks from disk
+        """
+        latest_end = 1500000000
+        session = FakeHistorySession(latest_end)
+        InterfaceStatsPoller(session, InterfaceStatsStore(self.path)).poll(now=latest_end)
+        # Simulate an interrupted write
+        with open(os.path.join(self.path, 'ingrTotal-5min.dat'), 'ab') as data_file:
+            data_file.write(b'\x00' * 5)
+
+        store = InterfaceStatsStore(self.path)
+        self.assertEqual(store.get_high_water_mark('1/101/1/2', 'ingrTotal', '5min'), latest_end)
+        self.assertIsNone(store.get_high_water_mark('1/101/1/3', 'ingrTotal', '5min'))
+        self.assertEqual(store.get_counter_names('ingrTotal', '5min'), ['bytesCum', 'bytesRate'])
+        session.latest_end = latest_end + 600
+        poller = InterfaceStatsPoller(session, store)
+        self.assertEqual(poller.poll(now=latest_end + 600), 4)
+        self.assertEqual(len(store.read('ingrTotal', '5min')), 6)
+        self.assertEqual(len(InterfaceStatsStore(self.path).read('ingrTotal', '5min', '1/101/1/1')), 3)
+
+    def test_max_periods(self):
+        """
+        Test that the number of periods read is capped
+        """
+        session = FakeHistorySession(1500000000)
+        poller = InterfaceStatsPoller(session, InterfaceStatsStore(self.path), max_periods=4)
+        poller.poll(now=1500000000)
+        self.assertEqual(poller.get_num_periods(now=1600000000), 4)
+        self.assertRaises(ValueError, InterfaceStatsPoller, session, poller._store, granularity='2min')
+
+
+def get_path(node1, node2, transmitted, dropped):
+    """
+    Build a fabricPath with its current 15min atomic counters
+    """
+    dn = 'topology/pod-1/node-%s/sys/ac/path-%s-%s' % (node1, node1, node2)
+    txrx = dict((name, '0') for name in ['rxPktAvg', 'rxPktCum', 'rxPktMax', 'rxPktMin', 'rxPktPer',
+                                         'txPktAvg', 'txPktCum', 'txPktMax', 'txPktMin',
+                                         'rxPktRate', 'txPktRate'])
+    txrx.update({'rn': 'CDdbgAcPathATxRx15min', 'txPktPer': str(transmitted)})
+    dropexcess = dict((name, '0') for name in ['dropPktAvg', 'dropPktCum', 'dropPktMax', 'dropPktMin',
+                                               'excessPktAvg', 'excessPktCum', 'excessPktMax',
+                                               'excessPktMin', 'excessPktPer',
+                                               'dropPktRate', 'excessPktRate'])
+    dropexcess.update({'rn': 'CDdbgAcPathADropExcess15min', 'dropPktPer': str(dropped)})
+    return {'fabricPath': {'attributes': {'dn': dn, 'n1': node1, 'n2': node2},
+                           'children': [{'dbgAcPathATxRx15min': {'attributes': txrx}},
+                                        {'dbgAcPathADropExcess15min': {'attributes': dropexcess}}]}}
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestAtomicCountersCollector(unittest.TestCase):
+    """
+    Test AtomicCountersCollector class from acicounters.py
+    """
+    def get_collector(self):
+        paths = [get_path('101', '102', 1000, 10),
+                 get_path('102', '101', 1000, 0),
+                 get_path('101', '103', 100, 5),
+                 get_path('103', '101', 0, 0),
+                 get_path('102', '103', 10, 3)]
+        session = FakeStatsSession(paths)
+        collector = AtomicCountersCollector(session, page_size=2)
+        self.assertEqual(collector.collect(), 5)
+        return session, collector
+
+    def test_single_query(self):
+        """
+        Test that the counters of all of the paths are collected with a class query
+        """
+        session, collector = self.get_collector()
+        self.assertEqual(len(session.urls), 3)
+        self.assertTrue(all(url.startswith('/api/node/class/fabricPath.json') for url in session.urls))
+        self.assertEqual(collector.nodes, ['101', '102', '103'])
+        self.assertEqual(collector.retrieve('101', '103', 'dropPktPer'), 5.0)
+        self.assertEqual(collector.retrieve('102', '101', 'txPktPer'), 1000.0)
+        self.assertIsNone(collector.retrieve('103', '102', 'txPktPer'))
+        self.assertIsNone(collector.retrieve('101', '104', 'txPktPer'))
+        self.assertEqual(collector.get_matrix('dropPktPer').shape, (3, 3))
+        self.assertIn('excessPktRate', collector.get_counter_names())
+
+    def test_top_lossy_paths(self):
+        """
+        Test ranking the paths by loss
+        """
+        session, collector = self.get_collector()
+        self.assertEqual(collector.get_top_lossy_paths(),
+                         [(('102', '103'), 0.3), (('101', '103'), 0.05), (('101', '102'), 0.01)])
+        self.assertEqual(collector.get_top_lossy_paths(num=1, counter='dropPktPer'),
+                         [(('101', '102'), 10.0)])
+        self.assertEqual(collector.get_top_lossy_paths(counter='bogus'), [])
+
+    def test_matches_ongoing(self):
+        """
+        Test that the per-path dictionaries match the matrices
+        """
+        session, collector = self.get_collector()
+        counters = AtomicCountersOnGoing._process_data(session.interfaces[2])
+        self.assertEqual(counters['dropexcess']['15min'][0]['dropPktPer'],
+                         collector.retrieve('101', '103', 'dropPktPer'))
+
+
+class TestAtomicCountersOnGoing(unittest.TestCase):
+    """
+    Test AtomicCountersOnGoing class from acicounters.py
+    """
+    def test_get_pages(self):
+        """
+        Test that the counters of all of the paths are collected one page at a time
+        """
+        paths = [get_path('101', '102', 1000, 10),
+                 get_path('102', '101', 1000, 0),
+                 get_path('101', '103', 100, 5)]
+        session = FakeStatsSession(paths)
+        counters = AtomicCountersOnGoing(None, None).get(session, page_size=2)
+        self.assertEqual(len(session.urls), 2)
+        self.assertEqual(sorted(counters), [('101', '102'), ('101', '103'), ('102', '101')])
+        self.assertEqual(counters[('101', '103')]['dropexcess']['15min'][0]['dropPktPer'], 5.0)
+
+
+if __name__ == '__main__':
+
+    offline = unittest.TestSuite()
+    offline.addTest(unittest.makeSuite(TestInterfaceStats))
+    offline.addTest(unittest.makeSuite(TestInterfaceStatsCollector))
+    offline.addTest(unittest.makeSuite(TestInterfaceStatsPoller))
+    offline.addTest(unittest.makeSuite(TestAtomicCountersCollector))
+    offline.addTest(unittest.makeSuite(TestAtomicCountersOnGoing))
+
+    unittest.main()
@@ -46,6 +46,7 @@ from acitoolkit.aciphysobject import (
     Pod, Powersupply, Supervisorcard, Systemcontroller, Cluster
 )
 import json
+import requests
 import unittest
 
 
@@ -175,6 +176,46 @@ class TestPod(unittest.TestCase):
         self.assertRaises(TypeError, Pod, pod_id, attributes, 'pod-1')
 
 
+class FakeHealthSession(Session):
+    """
+    Session that answers the Node.get queries from canned data
+    """
+    def __init__(self):
+        super(FakeHealthSession, self).__init__('http://1.1.1.1', 'admin', 'password',
+                                                subscription_enabled=False)
+        self.urls = []
+        self.health_error = None
+        self.nodes = []
+        for node_id, role in [('1', 'controller'), ('101', 'leaf'), ('201', 'spine')]:
+            dn = 'topology/pod-1/node-%s' % node_id
+            self.nodes.append({'fabricNode': {'attributes': {
+                'dn': dn, 'name': 'Node%s' % node_id, 'role': role,
+                'fabricSt': 'active', 'model': 'N9K', 'serial': 'SAL%s' % node_id,
+                'vendor': 'Cisco', 'modTs': '2016-01-01T00:00:00.000+00:00'}}})
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        if url.startswith('/api/node/class/fabricNodeHealth5min.json') and self.health_error:
+            resp = requests.Response()
+            resp.status_code = 400
+            resp._content = json.dumps({'imdata': [{'error': {'attributes': {
+                'code': '400', 'text': self.health_error}}}]}).encode()
+            return resp
+        if url.startswith('/api/node/class/fabricNode.json'):
+            imdata = self.nodes
+        elif url.startswith('/api/node/class/fabricNodeHealth5min.json'):
+            imdata = [{'fabricNodeHealth5min': {'attributes': {
+                'dn': 'topology/pod-1/node-%s/sys/CDfabricNodeHealth5min' % node_id,
+                'healthLast': health}}} for node_id, health in [('101', '95'), ('201', '100')]]
+        else:
+            imdata = [node for node in self.nodes
+                      if url.startswith('/api/mo/' + node['fabricNode']['attributes']['dn'] + '.json')]
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = json.dumps({'imdata': imdata}).encode()
+        return resp
+
+
 class TestNode(unittest.TestCase):
     """
     Test Node class
@@ -287,6 +328,37 @@ class TestNode(unittest.TestCase):
         session = 'bogus'
         self.assertRaises(TypeError, Node.get, session)
 
+    def test_get_node_health_single_query(self):
+        """
+        Test that node get retrieves the health of all of the switch nodes
+        with a single query
+
+        :return: None
+        """
+        session = FakeHealthSession()
+        nodes = Node.get(session)
+        self.assertEqual(len(nodes), 3)
+        health = dict((node.node, node.health) for node in nodes)
+        self.assertEqual(health['101'], '95')
+        self.assertEqual(health['201'], '100')
+        self.assertIsNone(health['1'])
+        health_queries = [url for url in session.urls if 'fabricNodeHealth5min' in url]
+        self.assertEqual(health_queries, ['/api/node/class/fabricNodeHealth5min.json'])
+
+    def test_get_node_health_error(self):
+        """
+        Test that node get returns the nodes without health when the APIC
+        returns an error for the health query
+
+        :return: None
+        """
+        session = FakeHealthSession()
+        session.health_error = 'Unable to process the query, result dataset is too big'
+        nodes = Node.get(session)
+        self.assertEqual(len(nodes), 3)
+        for node in nodes:
+            self.assertIsNone(node.health)
+
     def test_node_get_fabric_state(self):
         """
         Test node get fabric state
@@ -32,23 +32,37 @@
 from acitoolkit import (
     AppProfile, BaseContract, BaseACIObject, BaseRelation,
     BGPSession, BridgeDomain, Context, Contract, ContractInterface,
-    ContractSubject, Endpoint, EPG, EPGDomain, Filter, FilterEntry, L2ExtDomain,
-    L2Interface, L3ExtDomain, L3Interface, MonitorPolicy, OSPFInterface,
+    ContractSubject, Endpoint, EndpointEnrichmentCache, EPG, EPGDomain, Filter,
+    FilterEntry, L2ExtDomain, L2Interface, L3ExtDomain, L3Interface, MonitorPolicy, OSPFInterface,
     OSPFInterfacePolicy, OSPFRouter, OutsideEPG, OutsideL3, PhysDomain,
     PortChannel, Subnet, Taboo, Tenant, VmmDomain, LogicalModel, OutsideNetwork,
     AttributeCriterion, OutsideL2, TunnelInterface, FexInterface, VMM,
     OutsideL2EPG, AnyEPG, InputTerminal, OutputTerminal, AcitoolkitGraphBuilder,
-    Interface, Linecard, Node, Fabric, Table, Session, HealthScore, CredentialsError)
+    Interface, Linecard, Node, Fabric, Table, Session, HealthScore, CredentialsError, PhysicalModel,
+    ClusterSession, get_codec, set_codec, AsyncSession, load_snapshot)
+from acitoolkit.acisession import _split_payload, Subscriber
+from acitoolkit.aciasync import _HTTPProtocol
+from acitoolkit.acijson import JSONCodec, decode_response
 import os.path
+import shutil
+import tarfile
+import tempfile
 import unittest
 import string
 import random
+import socket
+import threading
 import time
 import json
 import sys
 import requests
 from requests.exceptions import ConnectionError
 
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
 try:
     from credentials import URL, LOGIN, PASSWORD, CERT_NAME, KEY
 except ImportError:
@@ -397,6 +411,166 @@ class TestTenant(unittest.TestCase):
         self.assertRaises(TypeError, Tenant, 'badtenant', tenant)
 
 
+class TestChangeTracking(unittest.TestCase):
+    """
+    Test the JSON generation of only the changed objects
+    """
+    def get_tenant(self):
+        tenant = Tenant('tenant')
+        app = AppProfile('app', tenant)
+        for i in range(3):
+            epg = EPG('epg-%s' % i, app)
+            bd = BridgeDomain('bd-%s' % i, tenant)
+            epg.add_bd(bd)
+        tenant.mark_clean()
+        return tenant
+
+    def test_new_tenant(self):
+        """
+        Test that all of a new tenant is changed
+        """
+        tenant = Tenant('tenant')
+        BridgeDomain('bd', tenant)
+        self.assertTrue(tenant.has_changes())
+        self.assertEqual(tenant.get_json(changed_only=True), tenant.get_json())
+
+    def test_no_changes(self):
+        """
+        Test that nothing is returned for an unchanged tenant
+        """
+        tenant = self.get_tenant()
+        self.assertFalse(tenant.has_changes())
+        self.assertIsNone(tenant.get_json(changed_only=True))
+        self.assertEqual(len(tenant.get_json()['fvTenant']['children']), 4)
+
+    def test_modified_attribute(self):
+        """
+        Test that a modified object is returned with its ancestors only
+        """
+        tenant = self.get_tenant()
+        epg = tenant.get_child(AppProfile, 'app').get_child(EPG, 'epg-1')
+        epg.descr = 'modified'
+        children = tenant.get_json(changed_only=True)['fvTenant']['children']
+        self.assertEqual(len(children), 1)
+        epgs = children[0]['fvAp']['children']
+        self.assertEqual(len(epgs), 1)
+        self.assertEqual(epgs[0]['fvAEPg']['attributes']['descr'], 'modified')
+
+    def test_same_attribute(self):
+        """
+        Test that setting an attribute to its current value is not a change
+        """
+        tenant = self.get_tenant()
+        bd = tenant.get_child(BridgeDomain, 'bd-1')
+        bd.descr = None
+        self.assertFalse(tenant.has_changes())
+        bd.descr = 'modified'
+        self.assertTrue(tenant.has_changes())
+        bd.descr = None
+        self.assertFalse(tenant.has_changes())
+
+    def test_added_and_deleted(self):
+        """
+        Test that added and deleted objects are returned
+        """
+        tenant = self.get_tenant()
+        Context('ctx', tenant)
+        tenant.get_child(BridgeDomain, 'bd-0').mark_as_deleted()
+        children = tenant.get_json(changed_only=True)['fvTenant']['children']
+        self.assertEqual(sorted(list(child.keys())[0] for child in children), ['fvBD', 'fvCtx'])
+        for child in children:
+            if 'fvBD' in child:
+                self.assertEqual(child['fvBD']['attributes']['status'], 'deleted')
+
+    def test_relation_and_tag(self):
+        """
+        Test that changing relations and tags marks the object as changed
+        """
+        tenant = self.get_tenant()
+        app = tenant.get_child(AppProfile, 'app')
+        epg = app.get_child(EPG, 'epg-2')
+        epg.add_bd(tenant.get_child(BridgeDomain, 'bd-0'))
+        app.add_tag('tag')
+        app_json = tenant.get_json(changed_only=True)['fvTenant']['children'][0]['fvAp']
+        self.assertIn({'tagInst': {'attributes': {'name': 'tag'}}}, app_json['children'])
+        epg_json = [child for child in app_json['children'] if 'fvAEPg' in child]
+        self.assertEqual(len(epg_json), 1)
+        self.assertIn({'fvRsBd': {'attributes': {'tnFvBDName': 'bd-0'}}}, epg_json[0]['fvAEPg']['children'])
+
+    def test_loaded_tenant_is_clean(self):
+        """
+        Test that a tenant loaded from the APIC is unchanged
+        """
+        tenant = self.get_tenant()
+        tenant_json = tenant.get_json()
+        tenant_json['fvTenant']['attributes']['dn'] = 'uni/tn-tenant'
+        session = Session('http://1.1.1.1', 'admin', 'password', subscription_enabled=False)
+        session.session = FakeHTTPSession(json.dumps({'totalCount': '1', 'imdata': [tenant_json]}).encode('ascii'))
+        tenants = Tenant.get_deep(session, names=['tenant'])
+        self.assertEqual(len(tenants), 1)
+        self.assertFalse(tenants[0].has_changes())
+        BridgeDomain('bd-new', tenants[0])
+        self.assertEqual(len(tenants[0].get_json(changed_only=True)['fvTenant']['children']), 1)
+
+
+class TestSnapshotLoader(unittest.TestCase):
+    """
+    Test building the Tenants from snapshot files
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tenants = []
+        for name in ('tenant1', 'tenant2'):
+            tenant = Tenant(name)
+            app = AppProfile('app', tenant)
+            for i in range(3):
+                epg = EPG('epg-%s' % i, app)
+                bd = BridgeDomain('bd-%s' % i, tenant)
+                epg.add_bd(bd)
+            self.tenants.append(tenant)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_json(self, file_name, data):
+        file_name = os.path.join(self.directory, file_name)
+        with open(file_name, 'w') as snapshot_file:
+            snapshot_file.write(json.dumps(data))
+        return file_name
+
+    def check_tenants(self, tenants):
+        self.assertEqual([tenant.name for tenant in tenants], ['tenant1', 'tenant2'])
+        for tenant, expected in zip(tenants, self.tenants):
+            self.assertEqual(tenant.get_json(), expected.get_json())
+            self.assertFalse(tenant.has_changes())
+            epg = tenant.get_child(AppProfile, 'app').get_child(EPG, 'epg-1')
+            self.assertIs(epg.get_bd(), tenant.get_child(BridgeDomain, 'bd-1'))
+
+    def test_directory(self):
+        """
+        Test loading a directory of REST snapshot files
+        """
+        for tenant in self.tenants:
+            self.write_json('snapshot_%s.json' % tenant.name, {'totalCount': '1', 'imdata': [tenant.get_json()]})
+        self.write_json('snapshot_error.json', {'totalCount': '1', 'imdata': [{'error': {}}]})
+        self.check_tenants(load_snapshot(self.directory, workers=1))
+
+    def test_export_archive(self):
+        """
+        Test loading a configuration export archive with worker processes
+        """
+        config = {'polUni': {'attributes': {}, 'children': [tenant.get_json() for tenant in self.tenants]}}
+        file_name = self.write_json('ce2_snapback-1.json', config)
+        archive_name = os.path.join(self.directory, 'ce2_snapback-1.tar.gz')
+        archive = tarfile.open(archive_name, 'w:gz')
+        archive.add(file_name, arcname='ce2_snapback-1.json')
+        archive.close()
+        fabric = Fabric()
+        tenants = load_snapshot([archive_name], parent=fabric, workers=2)
+        self.check_tenants(tenants)
+        self.assertEqual(fabric.get_children(), tenants)
+
+
 class TestSession(unittest.TestCase):
     """
     Offline tests for the Session class
@@ -442,6 +616,988 @@ class TestSession(unittest.TestCase):
                           'cert_name', 'key', False, False, True, None, 'BADVALUE')
 
 
+class FakeReloginSession(Session):
+    """
+    Session counting the logins instead of sending them to the APIC
+    """
+    def __init__(self):
+        super(FakeReloginSession, self).__init__('http://1.1.1.1', 'admin', 'password',
+                                                 subscription_enabled=False)
+        self.logins = 0
+
+    def _send_login_locked(self, timeout=None):
+        self.logins += 1
+        time.sleep(0.1)
+        self._login_generation += 1
+        resp = requests.Response()
+        resp.status_code = 200
+        return resp
+
+
+class TestSessionConnectionPool(unittest.TestCase):
+    """
+    Offline tests for the Session connection pool
+    """
+    def test_pool_configuration(self):
+        """
+        Test that the connection pool settings are applied to the adapters
+        """
+        session = Session('https://1.1.1.1', 'admin', 'password', subscription_enabled=False,
+                          pool_maxsize=32, max_retries=2, keepalive_idle=30)
+        http_session = session._create_http_session()
+        adapter = http_session.get_adapter('https://1.1.1.1/api/mo/uni.json')
+        self.assertEqual(adapter._pool_maxsize, 32)
+        self.assertEqual(adapter.max_retries.total, 2)
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), adapter.get_socket_options())
+
+    def test_no_keepalive_by_default(self):
+        """
+        Test that TCP keep-alive is not enabled by default
+        """
+        session = Session('https://1.1.1.1', 'admin', 'password', subscription_enabled=False)
+        adapter = session._create_http_session().get_adapter('https://1.1.1.1')
+        self.assertNotIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), adapter.get_socket_options())
+
+    def test_concurrent_relogin(self):
+        """
+        Test that threads rejected with the same login token only login once
+        """
+        session = FakeReloginSession()
+        generation = session._login_generation
+        threads = [threading.Thread(target=session._relogin, args=(generation,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(session.logins, 1)
+        session._relogin(session._login_generation)
+        self.assertEqual(session.logins, 2)
+
+    def test_relogin_keeps_pool(self):
+        """
+        Test that the connection pool is kept across logins
+        """
+        session = Session('http://1.1.1.1', 'admin', 'password', subscription_enabled=False,
+                          relogin_forever=True)
+        session.session = session._create_http_session()
+        http_session = session.session
+        http_session.cookies.set('APIC-cookie', 'token')
+        resp = requests.Response()
+        resp.status_code = 401
+        session.push_to_apic = lambda url, data, timeout=None: resp
+        session._send_login()
+        self.assertIs(session.session, http_session)
+        self.assertEqual(len(session.session.cookies), 0)
+        self.assertEqual(session.get_connection_stats()['logins'], 1)
+
+
+class CountingCodec(JSONCodec):
+    """
+    JSON codec counting the documents encoded and decoded
+    """
+    def __init__(self):
+        self.loaded = 0
+        self.dumped = []
+
+    def loads(self, data):
+        self.loaded += 1
+        return super(CountingCodec, self).loads(data)
+
+    def dumps(self, data, sort_keys=False):
+        self.dumped.append(sort_keys)
+        return super(CountingCodec, self).dumps(data, sort_keys=sort_keys)
+
+
+class FakeHTTPSession(object):
+    """
+    requests.Session answering every request with the same JSON document
+    """
+    def __init__(self, content):
+        self.content = content
+        self.posted = []
+
+    def _response(self):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = self.content
+        return resp
+
+    def get(self, url, **kwargs):
+        return self._response()
+
+    def post(self, url, data=None, **kwargs):
+        self.posted.append(data)
+        return self._response()
+
+    def close(self):
+        pass
+
+
+class TestJSONCodec(unittest.TestCase):
+    """
+    Offline tests for the JSON codec
+    """
+    def setUp(self):
+        self.default_codec = get_codec()
+        self.codec = CountingCodec()
+        set_codec(self.codec)
+
+    def tearDown(self):
+        set_codec(self.default_codec)
+
+    def test_loads_bytes(self):
+        """
+        Test that bytes and newlines within strings are decoded
+        """
+        codec = JSONCodec()
+        data = codec.loads(b'{"imdata": [{"faultInst": {"attributes": {"descr": "line1\nline2"}}}]}')
+        self.assertEqual(data['imdata'][0]['faultInst']['attributes']['descr'], 'line1\nline2')
+        self.assertEqual(codec.loads(codec.dumps(data)), data)
+
+    def test_default_codec(self):
+        """
+        Test that the default codec round trips an APIC document
+        """
+        data = {'fvTenant': {'attributes': {'name': 'tenant', 'dn': 'uni/tn-tenant'}, 'children': []}}
+        codec = self.default_codec
+        self.assertEqual(codec.loads(codec.dumps(data).encode('utf-8')), data)
+
+    def test_set_unknown_codec(self):
+        """
+        Test that selecting a codec that is not installed fails
+        """
+        self.assertRaises(ValueError, set_codec, 'unknown')
+
+    def test_response_decoded_once(self):
+        """
+        Test that the response body is decoded once
+        """
+        session = Session('http://1.1.1.1', 'admin', 'password', subscription_enabled=False)
+        session.session = FakeHTTPSession(b'{"totalCount": "0", "imdata": []}')
+        resp = session.get('/api/class/fvTenant.json')
+        self.assertEqual(resp.json()['imdata'], [])
+        self.assertEqual(resp.json()['totalCount'], '0')
+        self.assertEqual(self.codec.loaded, 1)
+        self.assertIsInstance(resp, requests.Response)
+
+    def test_push_not_sorted(self):
+        """
+        Test that the pushed data is only sorted when it is signed
+        """
+        session = Session('http://1.1.1.1', 'admin', 'password', subscription_enabled=False)
+        session.session = FakeHTTPSession(b'{"totalCount": "0", "imdata": []}')
+        data = {'fvTenant': {'attributes': {'name': 'tenant'}}}
+        session.push_to_apic('/api/mo/uni.json', data)
+        self.assertEqual(self.codec.dumped, [False])
+        self.assertEqual(json.loads(session.session.posted[0]), data)
+
+    def test_set_json(self):
+        """
+        Test that replacing the body of a response replaces the decoded data
+        """
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = b'{"totalCount": "1", "imdata": [{}]}'
+        resp = decode_response(resp)
+        resp.set_json({'totalCount': '0', 'imdata': []})
+        self.assertEqual(resp.json()['imdata'], [])
+        self.assertEqual(json.loads(resp.text)['imdata'], [])
+
+    def test_subscription_response_unchanged(self):
+        """
+        Test that queueing the objects of a subscription response leaves
+        the decoded body of the response untouched
+        """
+        session = Session('http://1.1.1.1', 'admin', 'password', subscription_enabled=False)
+        session.session = FakeHTTPSession(b'{"totalCount": "2", "subscriptionId": "72", '
+                                          b'"imdata": [{"fvTenant": {"attributes": {"name": "a"}}}, '
+                                          b'{"fvTenant": {"attributes": {"name": "b"}}}]}')
+        subscriber = Subscriber(session)
+        url = '/api/class/fvTenant.json?subscription=yes'
+        resp = subscriber._send_subscription(url)
+        self.assertEqual(len(resp.json()['imdata']), 2)
+        self.assertEqual(subscriber._subscriptions[url], '72')
+        events = [subscriber._event_q.get_nowait() for i in range(2)]
+        self.assertEqual([event['imdata'] for event in events], [resp.json()['imdata'][:1],
+                                                                 resp.json()['imdata'][1:]])
+        self.assertEqual(self.codec.loaded, 1)
+
+
+class FlakyHTTPSession(FakeHTTPSession):
+    """
+    FakeHTTPSession failing the first POST of the given URLs
+    """
+    def __init__(self, content, failures):
+        super(FlakyHTTPSession, self).__init__(content)
+        self.failures = failures
+        self.lock = threading.Lock()
+
+    def post(self, url, data=None, **kwargs):
+        with self.lock:
+            self.posted.append(data)
+            failure = self.failures.pop(url, None)
+        if failure is None:
+            return self._response()
+        if failure == 'connection':
+            raise ConnectionError
+        resp = requests.Response()
+        resp.status_code = failure
+        resp._content = b'{"imdata": [{"error": {"attributes": {"text": "failed"}}}]}'
+        return resp
+
+
+class TestPushMany(unittest.TestCase):
+    """
+    Offline tests for Session.push_many
+    """
+    def get_tenant(self, name, num_epgs):
+        tenant = Tenant(name)
+        app = AppProfile('app', tenant)
+        for i in range(num_epgs):
+            EPG('epg-%s' % i, app)
+            BridgeDomain('bd-%s' % i, tenant)
+        return tenant
+
+    def get_session(self, failures=None):
+        session = Session('http://1.1.1.1', 'admin', 'password', subscription_enabled=False)
+        session.session = FlakyHTTPSession(b'{"totalCount": "0", "imdata": []}', failures or {})
+        return session
+
+    def test_split_payload(self):
+        """
+        Test that a large tree is split between children
+        """
+        data = self.get_tenant('tenant', 50).get_json()
+        payloads = _split_payload(data, 2000)
+        self.assertGreater(len(payloads), 1)
+        children = []
+        for payload in payloads:
+            self.assertLessEqual(len(get_codec().dumps(payload)), 2000)
+            self.assertEqual(payload['fvTenant']['attributes'], data['fvTenant']['attributes'])
+            children.extend(payload['fvTenant']['children'])
+        bds = [child for child in children if 'fvBD' in child]
+        self.assertEqual(len(bds), 50)
+        epgs = []
+        for child in children:
+            if 'fvAp' in child:
+                epgs.extend(child['fvAp']['children'])
+        self.assertEqual(sorted(json.dumps(epg, sort_keys=True) for epg in epgs),
+                         sorted(json.dumps(epg, sort_keys=True)
+                                for epg in data['fvTenant']['children'][0]['fvAp']['children']))
+
+    def test_split_small_payload(self):
+        """
+        Test that a tree smaller than the payload size is not split
+        """
+        data = self.get_tenant('tenant', 2).get_json()
+        self.assertEqual(_split_payload(data, 100000), [data])
+
+    def test_split_deleted(self):
+        """
+        Test that a deleted tree is not split
+        """
+        tenant = self.get_tenant('tenant', 50)
+        tenant.mark_as_deleted()
+        data = tenant.get_json()
+        self.assertEqual(_split_payload(data, 2000), [data])
+
+    def test_push_many(self):
+        """
+        Test that each object is pushed and reported
+        """
+        session = self.get_session()
+        tenants = [self.get_tenant('tenant-%s' % i, 50) for i in range(4)]
+        results = session.push_many(tenants + [('/api/mo/uni.json', {'fvTenant': {'attributes': {'name': 'x'}}})],
+                                    max_payload=2000)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual([result.obj for result in results[:4]], tenants)
+        self.assertEqual(len(session.session.posted), sum(len(result.payloads) for result in results))
+        self.assertGreater(len(results[0].payloads), 1)
+
+    def test_retry(self):
+        """
+        Test that payloads are sent again after server and connection errors
+        """
+        session = self.get_session({'http://1.1.1.1/api/mo/uni.json': 503})
+        results = session.push_many([self.get_tenant('tenant', 1)], retries=1)
+        self.assertTrue(results[0].ok)
+        self.assertEqual(len(session.session.posted), 2)
+        session = self.get_session({'http://1.1.1.1/api/mo/uni.json': 'connection'})
+        results = session.push_many([self.get_tenant('tenant', 1)], retries=1)
+        self.assertTrue(results[0].ok)
+
+    def test_failure_reported(self):
+        """
+        Test that a rejected payload is not retried and is reported
+        """
+        session = self.get_session({'http://1.1.1.1/api/mo/uni.json': 400})
+        results = session.push_many([self.get_tenant('tenant', 50)], max_payload=2000)
+        self.assertFalse(results[0].ok)
+        self.assertEqual(len(session.session.posted), 1)
+        self.assertEqual(len(results[0].errors), 2)
+
+
+class RoutingHTTPSession(FakeHTTPSession):
+    """
+    FakeHTTPSession answering GET requests with the document of the first
+    matching URL prefix
+    """
+    def __init__(self, routes):
+        super(RoutingHTTPSession, self).__init__(b'{"totalCount": "0", "imdata": []}')
+        self.routes = routes
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        resp = self._response()
+        for prefix in self.routes:
+            if url.startswith('http://1.1.1.1' + prefix):
+                resp._content = json.dumps(self.routes[prefix]).encode('ascii')
+                break
+        return resp
+
+
+class TestLazyLoading(unittest.TestCase):
+    """
+    Test fetching the children of the models on demand
+    """
+    def get_session(self):
+        tenants = []
+        routes = {}
+        for name in ('tenant1', 'tenant2'):
+            tenant = Tenant(name)
+            BridgeDomain('bd', tenant)
+            EPG('epg', AppProfile('app', tenant))
+            tenant_json = tenant.get_json()
+            tenant_json['fvTenant']['attributes']['dn'] = 'uni/tn-%s' % name
+            tenants.append({'fvTenant': {'attributes': tenant_json['fvTenant']['attributes']}})
+            routes['/api/mo/uni/tn-%s.json' % name] = {'totalCount': '1', 'imdata': [tenant_json]}
+        routes['/api/mo/uni.json'] = {'totalCount': '2', 'imdata': tenants}
+        routes['/api/node/class/fabricPod.json'] = {'totalCount': '1', 'imdata': [
+            {'fabricPod': {'attributes': {'dn': 'topology/pod-1', 'id': '1'}}}]}
+        session = Session('http://1.1.1.1', 'admin', 'password', subscription_enabled=False)
+        session.session = RoutingHTTPSession(routes)
+        return session
+
+    def test_tenants_on_demand(self):
+        """
+        Test that each level is only fetched when accessed
+        """
+        session = self.get_session()
+        logical_model = LogicalModel(session)
+        logical_model.enable_lazy_loading()
+        self.assertEqual(session.session.urls, [])
+        tenants = logical_model.get_children()
+        self.assertEqual(sorted(tenant.name for tenant in tenants), ['tenant1', 'tenant2'])
+        self.assertEqual(len(session.session.urls), 1)
+        tenant = logical_model.get_child(Tenant, 'tenant1')
+        app = tenant.get_child(AppProfile, 'app')
+        self.assertIs(app.get_parent(), tenant)
+        self.assertEqual([epg.name for epg in app.get_children(EPG)], ['epg'])
+        self.assertEqual(len(tenant.get_children()), 2)
+        self.assertEqual(len(session.session.urls), 2)
+        self.assertFalse(tenant.has_changes())
+
+    def test_prefetch(self):
+        """
+        Test that the children of the prefetched classes are fetched with them
+        """
+        session = self.get_session()
+        logical_model = LogicalModel(session)
+        logical_model.enable_lazy_loading(prefetch=[Tenant])
+        logical_model.get_children()
+        self.assertEqual(len(session.session.urls), 3)
+        for tenant in logical_model.get_children():
+            self.assertEqual(len(tenant.get_children()), 2)
+        self.assertEqual(len(session.session.urls), 3)
+
+    def test_physical_model(self):
+        """
+        Test that the physical model is fetched on demand
+        """
+        session = self.get_session()
+        physical_model = PhysicalModel(session)
+        physical_model.enable_lazy_loading()
+        pods = physical_model.get_children()
+        self.assertEqual([pod.pod for pod in pods], ['1'])
+        self.assertEqual(len(session.session.urls), 1)
+
+
+class PagingHTTPSession(FakeHTTPSession):
+    """
+    FakeHTTPSession refusing the GET requests that are not paged like an
+    APIC does with a result dataset that is too big
+    """
+    def __init__(self, imdata, page_size=10000):
+        super(PagingHTTPSession, self).__init__(b'')
+        self.imdata = imdata
+        self.page_size = page_size
+
+    def get(self, url, **kwargs):
+        resp = self._response()
+        if 'page-size=' not in url:
+            resp.status_code = 400
+            resp._content = b'Unable to process the query, result dataset is too big'
+            return resp
+        page = int(url.split('&page=')[1].split('&')[0])
+        content = {'totalCount': str(len(self.imdata)),
+                   'imdata': self.imdata[page * self.page_size:(page + 1) * self.page_size]}
+        if 'subscription=yes' in url:
+            content['subscriptionId'] = '1%s' % page
+        resp._content = json.dumps(content).encode('ascii')
+        return resp
+
+
+class TestSessionPaging(unittest.TestCase):
+    """
+    Test collecting the responses that are too big in pages
+    """
+    def get_session(self):
+        imdata = [{'fvTenant': {'attributes': {'name': 'tenant%s' % i}}} for i in range(15000)]
+        session = Session('http://1.1.1.1', 'admin', 'password', subscription_enabled=False)
+        session.session = PagingHTTPSession(imdata)
+        return session
+
+    def test_get_pages(self):
+        """
+        Test that all of the pages are collected
+        """
+        resp = self.get_session().get('/api/class/fvTenant.json?query-target=self')
+        self.assertTrue(resp.ok)
+        self.assertEqual(len(resp.json()['imdata']), 15000)
+        self.assertEqual(resp.json()['imdata'][-1]['fvTenant']['attributes']['name'], 'tenant14999')
+
+    def test_subscription_id(self):
+        """
+        Test that the subscription id of the first page is kept
+        """
+        resp = self.get_session().get('/api/class/fvTenant.json?subscription=yes')
+        self.assertEqual(resp.json()['subscriptionId'], '10')
+
+
+class SlowHTTPSession(FakeHTTPSession):
+    """
+    FakeHTTPSession taking some time to answer GET requests
+    """
+    def __init__(self, content, delay):
+        super(SlowHTTPSession, self).__init__(content)
+        self.delay = delay
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        time.sleep(self.delay)
+        return super(SlowHTTPSession, self).get(url, **kwargs)
+
+
+class FakeTransport(object):
+    """
+    Transport recording the data written to it
+    """
+    def __init__(self):
+        self.written = b''
+        self.closed = False
+
+    def write(self, data):
+        self.written += data
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAPICServer(object):
+    """
+    HTTP server on the event loop answering like an APIC after a delay
+    """
+    def __init__(self, loop, content=b'{"totalCount": "0", "imdata": []}', delay=0.0):
+        self.loop = loop
+        self.content = content
+        self.delay = delay
+        self.statuses = []
+        self.requests = []
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.server = loop.run_until_complete(loop.create_server(lambda: FakeAPICProtocol(self),
+                                                                 '127.0.0.1', 0, backlog=1000))
+        self.url = 'http://127.0.0.1:%s' % self.server.sockets[0].getsockname()[1]
+
+    def close(self):
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+
+
+class FakeAPICProtocol(asyncio.Protocol if asyncio is not None else object):
+    """
+    Connection to a FakeAPICServer
+    """
+    def __init__(self, server):
+        self.server = server
+        self.buffer = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections += 1
+
+    def data_received(self, data):
+        self.buffer += data
+        while True:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                return
+            lines = self.buffer[:end].decode('ascii').split('\r\n')
+            headers = dict((line.split(':', 1)[0].lower(), line.split(':', 1)[1].strip()) for line in lines[1:])
+            length = int(headers.get('content-length', 0))
+            if len(self.buffer) < end + 4 + length:
+                return
+            body = self.buffer[end + 4:end + 4 + length]
+            self.buffer = self.buffer[end + 4 + length:]
+            method, path = lines[0].split(' ')[:2]
+            self.server.requests.append((method, path, headers, body))
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+            self.server.loop.call_later(self.server.delay, self.respond, path)
+
+    def respond(self, path):
+        self.server.in_flight -= 1
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        content = self.server.content
+        cookie = ''
+        if path.startswith('/api/aaaLogin'):
+            content = json.dumps({'totalCount': '1',
+                                  'imdata': [{'aaaLogin': {'attributes': {'token': 'token',
+                                                                          'refreshTimeoutSeconds': '600'}}}]})
+            content = content.encode('ascii')
+            cookie = 'Set-Cookie: APIC-cookie=token; path=/\r\n'
+        header = ('HTTP/1.1 %s Status\r\nContent-Type: application/json\r\n%s'
+                  'Content-Length: %s\r\n\r\n' % (status, cookie, len(content)))
+        self.transport.write(header.encode('ascii') + content)
+
+
+@unittest.skipIf(asyncio is None, 'asyncio is not available')
+class TestAsyncSession(unittest.TestCase):
+    """
+    Offline tests for the AsyncSession
+    """
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # The cleanups of the tests run before the loop is closed
+        self.addCleanup(self.close_loop)
+
+    def close_loop(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def get_session(self, content, delay=0.0, subscription_enabled=False):
+        session = AsyncSession('http://1.1.1.1', 'admin', 'password', subscription_enabled=subscription_enabled,
+                               max_concurrency=8)
+        session.session.session = SlowHTTPSession(content, delay)
+        return session
+
+    def get_server_session(self, delay=0.0, **kwargs):
+        server = FakeAPICServer(self.loop, delay=delay)
+        self.addCleanup(server.close)
+        session = AsyncSession(server.url, 'admin', 'password', subscription_enabled=False, **kwargs)
+        self.addCleanup(session.close)
+        return server, session
+
+    def gather(self, *futures):
+        return self.loop.run_until_complete(asyncio.gather(*futures))
+
+    def test_concurrent_get(self):
+        """
+        Test that many more GET requests than worker threads are in flight
+        at once
+        """
+        server, session = self.get_server_session(delay=0.3, max_concurrency=4)
+        urls = ['/api/mo/topology/pod-1/node-%s.json' % node_id for node_id in range(100, 300)]
+        start = time.time()
+        resps = self.gather(*[session.get(url) for url in urls])
+        # Four threads would take 15 seconds
+        self.assertLess(time.time() - start, 3.0)
+        self.assertTrue(all(resp.ok for resp in resps))
+        self.assertEqual([resp.json() for resp in resps[:1]], [{'totalCount': '0', 'imdata': []}])
+        self.assertEqual(server.max_in_flight, 200)
+        self.assertEqual(sorted(request[1] for request in server.requests), sorted(urls))
+
+    def test_max_requests(self):
+        """
+        Test that the requests wait once max_requests are in flight
+        """
+        server, session = self.get_server_session(delay=0.05, max_requests=10)
+        resps = self.gather(*[session.get('/api/mo/uni/tn-%s.json' % i) for i in range(30)])
+        self.assertTrue(all(resp.ok for resp in resps))
+        self.assertEqual(server.max_in_flight, 10)
+        self.assertEqual(server.connections, 10)
+
+    def test_keep_alive(self):
+        """
+        Test that the connection is reused
+        """
+        server, session = self.get_server_session()
+        for i in range(5):
+            self.assertTrue(self.gather(session.get('/api/mo/uni/tn-%s.json' % i))[0].ok)
+        self.assertEqual(server.connections, 1)
+
+    def test_push_to_apic(self):
+        """
+        Test that the data is pushed with the login cookie
+        """
+        server, session = self.get_server_session()
+        self.assertTrue(self.gather(session.login())[0].ok)
+        tenant = Tenant('tenant')
+        resp = self.gather(session.push_to_apic(tenant.get_url(), tenant.get_json()))[0]
+        self.assertTrue(resp.ok)
+        method, path, headers, body = server.requests[-1]
+        self.assertEqual((method, path), ('POST', tenant.get_url()))
+        self.assertEqual(json.loads(body.decode('utf-8')), tenant.get_json())
+        self.assertEqual(headers['cookie'], 'APIC-cookie=token')
+
+    def test_relogin(self):
+        """
+        Test that a request rejected with 403 is sent again after logging in
+        """
+        server, session = self.get_server_session()
+        self.assertTrue(self.gather(session.login())[0].ok)
+        server.statuses = [403]
+        resp = self.gather(session.get('/api/mo/uni.json'))[0]
+        self.assertTrue(resp.ok)
+        self.assertEqual([(method, path) for method, path, headers, body in server.requests],
+                         [('POST', '/api/aaaLogin.json'), ('GET', '/api/mo/uni.json'),
+                          ('POST', '/api/aaaLogin.json'), ('GET', '/api/mo/uni.json')])
+
+    def test_server_error(self):
+        """
+        Test that the server errors are retried
+        """
+        server, session = self.get_server_session()
+        server.statuses = [503, 500]
+        self.assertTrue(self.gather(session.get('/api/mo/uni.json'))[0].ok)
+        self.assertEqual(len(server.requests), 3)
+        server.statuses = [503] * 4
+        with self.assertRaises(ConnectionError):
+            self.gather(session.get('/api/mo/uni.json'))
+
+    def test_chunked_response(self):
+        """
+        Test that a chunked response split across reads is decoded
+        """
+        protocol = _HTTPProtocol()
+        protocol.connection_made(FakeTransport())
+        future = self.loop.create_future()
+        protocol.send('GET', b'', future)
+        data = (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'5\r\nhello\r\n7;ext=1\r\n, world\r\n0\r\n\r\n')
+        for i in range(0, len(data), 7):
+            protocol.data_received(data[i:i + 7])
+        status, reason, headers, body, keep_alive = future.result()
+        self.assertEqual((status, body, keep_alive), (200, b'hello, world', True))
+
+    def test_response_until_close(self):
+        """
+        Test that a response without a length ends with the connection
+        """
+        protocol = _HTTPProtocol()
+        protocol.connection_made(FakeTransport())
+        future = self.loop.create_future()
+        protocol.send('GET', b'', future)
+        protocol.data_received(b'HTTP/1.1 200 OK\r\n\r\n{"imdata"')
+        protocol.data_received(b': []}')
+        self.assertFalse(future.done())
+        protocol.connection_lost(None)
+        self.assertEqual(future.result()[3:], (b'{"imdata": []}', False))
+
+    def test_connection_refused(self):
+        """
+        Test that a connection failure raises a ConnectionError
+        """
+        server, session = self.get_server_session()
+        server.close()
+        with self.assertRaises(ConnectionError):
+            self.gather(session.get('/api/mo/uni.json'))
+
+    def test_get_objects(self):
+        """
+        Test that the toolkit objects are the same as returned by get
+        """
+        content = json.dumps({'totalCount': '2',
+                              'imdata': [{'fvTenant': {'attributes': {'name': 'tenant1', 'dn': 'uni/tn-tenant1'}}},
+                                         {'fvTenant': {'attributes': {'name': 'tenant2', 'dn': 'uni/tn-tenant2'}}}]})
+        session = self.get_session(content.encode('ascii'))
+        tenants = self.loop.run_until_complete(session.get_objects(Tenant))
+        self.assertEqual([tenant.name for tenant in tenants], ['tenant1', 'tenant2'])
+        self.assertEqual([tenant.name for tenant in Tenant.get(session.session)], ['tenant1', 'tenant2'])
+        session.close()
+
+    def test_get_event(self):
+        """
+        Test that waiting for an event returns it once received
+        """
+        session = self.get_session(b'{"totalCount": "0", "imdata": []}', subscription_enabled=True)
+        url = '/api/class/fvTenant.json?subscription=yes'
+        session.session.subscription_thread._subscriptions[url] = '1'
+        future = session.get_event(url, poll_interval=0.01)
+        event = {'subscriptionId': ['1'], 'imdata': []}
+        self.loop.call_later(0.05, session.session.subscription_thread._event_q.put, event)
+        self.assertEqual(self.loop.run_until_complete(future), event)
+        session.close()
+
+
+class FakeMemberSession(Session):
+    """
+    Session for a single APIC of a FakeClusterSession answering from memory
+    """
+    def __init__(self, url, relogin_forever=False):
+        super(FakeMemberSession, self).__init__(url, 'admin', 'password', subscription_enabled=False,
+                                                relogin_forever=relogin_forever)
+        self.gets = []
+        self.posts = []
+        self.fail = False
+        self.down = False
+        self.status_code = 200
+        self.web_socket_opened = False
+
+    def _open_web_socket(self):
+        self.web_socket_opened = True
+
+    def login(self, timeout=None):
+        resp = requests.Response()
+        resp.status_code = 200
+        if self.down:
+            resp.status_code = 400
+            return resp
+        self._logged_in = True
+        return resp
+
+    def _get_response(self, url):
+        if self.fail:
+            raise ConnectionError
+        resp = requests.Response()
+        resp.status_code = self.status_code
+        data = {'totalCount': '0', 'imdata': []}
+        if 'subscription=yes' in url:
+            data['subscriptionId'] = str(len(self.gets))
+        resp._content = json.dumps(data).encode('ascii')
+        return resp
+
+    def get(self, url, timeout=None):
+        self.gets.append(url)
+        return self._get_response(url)
+
+    def push_to_apic(self, url, data, timeout=None):
+        self.posts.append(url)
+        return self._get_response(url)
+
+
+class FakeClusterSession(ClusterSession):
+    """
+    ClusterSession using FakeMemberSessions
+    """
+    def _create_session(self, url):
+        return FakeMemberSession(url, self.relogin_forever)
+
+
+class TestClusterSession(unittest.TestCase):
+    """
+    Offline tests for the ClusterSession class
+    """
+    def get_session(self):
+        session = FakeClusterSession(['http://1.1.1.1', 'http://1.1.1.2', 'http://1.1.1.3'],
+                                     'admin', 'password')
+        self.assertTrue(session.login().ok)
+        return session
+
+    @staticmethod
+    def get_members(session):
+        return [member.session for member in session._members]
+
+    def test_reads_spread_across_members(self):
+        """
+        Test that the reads are spread across all of the APICs
+        """
+        session = self.get_session()
+        self.assertTrue(isinstance(session, Session))
+        for i in range(30):
+            self.assertTrue(session.get('/api/mo/uni.json').ok)
+        for member in self.get_members(session):
+            self.assertTrue(len(member.gets) > 0)
+
+    def test_reads_prefer_low_latency(self):
+        """
+        Test that the reads prefer the APIC with the lowest latency
+        """
+        session = self.get_session()
+        for member, latency in zip(session._members, [0.5, 0.01, 0.5]):
+            member.record_success(latency, session.latency_weight)
+        for i in range(10):
+            session.get('/api/mo/uni.json')
+        members = self.get_members(session)
+        self.assertEqual(len(members[1].gets), 10)
+
+    def test_read_failover(self):
+        """
+        Test that a failed read is retried on another APIC and the failed
+        APIC is not used until its retry interval has passed
+        """
+        session = self.get_session()
+        members = self.get_members(session)
+        members[0].fail = True
+        for i in range(10):
+            self.assertTrue(session.get('/api/mo/uni.json').ok)
+        self.assertEqual(len(members[0].gets), 1)
+        self.assertEqual(len(members[1].gets) + len(members[2].gets), 10)
+        self.assertFalse(session._members[0].is_available(time.time()))
+
+    def test_read_server_error(self):
+        """
+        Test that a read answered with a server error is retried on another
+        APIC and the APIC is not used until its retry interval has passed
+        """
+        session = self.get_session()
+        members = self.get_members(session)
+        members[0].status_code = 503
+        for i in range(10):
+            self.assertTrue(session.get('/api/mo/uni.json').ok)
+        self.assertEqual(len(members[0].gets), 1)
+        self.assertEqual(len(members[1].gets) + len(members[2].gets), 10)
+        self.assertFalse(session._members[0].is_available(time.time()))
+
+    def test_read_all_members_server_error(self):
+        """
+        Test that the server error is returned when all of the APICs fail
+        """
+        session = self.get_session()
+        members = self.get_members(session)
+        for member in members:
+            member.status_code = 503
+        self.assertEqual(session.get('/api/mo/uni.json').status_code, 503)
+        for member in members:
+            self.assertEqual(len(member.gets), 1)
+
+    def test_read_all_members_failed(self):
+        """
+        Test that ConnectionError is raised when all of the APICs fail
+        """
+        session = self.get_session()
+        for member in self.get_members(session):
+            member.fail = True
+        self.assertRaises(ConnectionError, session.get, '/api/mo/uni.json')
+
+    def test_writes_pinned(self):
+        """
+        Test that the writes are pinned to one APIC and fail over to another
+        """
+        session = self.get_session()
+        members = self.get_members(session)
+        for i in range(5):
+            session.push_to_apic('/api/mo/uni.json', {})
+        self.assertEqual(len(members[0].posts), 5)
+        members[0].fail = True
+        self.assertTrue(session.push_to_apic('/api/mo/uni.json', {}).ok)
+        members[0].fail = False
+        session.push_to_apic('/api/mo/uni.json', {})
+        self.assertEqual(len(members[0].posts), 6)
+        self.assertEqual(len(members[1].posts), 2)
+        self.assertTrue(members[1].relogin_forever)
+        self.assertFalse(members[1].is_subscribed('/api/class/fvTenant.json?subscription=yes'))
+
+        # The APIC no longer used for writes stops logging back in forever
+        members[1].fail = True
+        self.assertTrue(session.push_to_apic('/api/mo/uni.json', {}).ok)
+        self.assertEqual(len(members[2].posts), 1)
+        self.assertFalse(members[1].relogin_forever)
+        self.assertTrue(members[2].relogin_forever)
+        self.assertTrue(members[0].relogin_forever)
+
+    def test_add_member(self):
+        """
+        Test adding an APIC to a logged in cluster
+        """
+        session = self.get_session()
+        self.assertIsNone(session.add_member('http://1.1.1.1'))
+        session.add_member('http://1.1.1.4')
+        self.assertEqual(session.get_member_urls(),
+                         ['http://1.1.1.1', 'http://1.1.1.2', 'http://1.1.1.3', 'http://1.1.1.4'])
+        self.assertTrue(self.get_members(session)[3].logged_in())
+
+    def test_pinned_member(self):
+        """
+        Test that only the APIC used for writes and subscriptions logs back
+        in forever and has a subscription thread
+        """
+        session = ClusterSession(['http://1.1.1.1', 'http://1.1.1.2'], 'admin', 'password')
+        members = self.get_members(session)
+        self.assertTrue(members[0].relogin_forever)
+        self.assertTrue(members[0]._subscription_enabled)
+        members[0].subscription_thread.exit()
+        self.assertFalse(members[1].relogin_forever)
+        self.assertFalse(members[1]._subscription_enabled)
+        self.assertFalse(hasattr(members[1], 'subscription_thread'))
+
+    def test_members_relogin_forever(self):
+        """
+        Test that the APICs log back in forever when requested
+        """
+        session = ClusterSession(['http://1.1.1.1', 'http://1.1.1.2'], 'admin', 'password',
+                                 subscription_enabled=False, relogin_forever=True)
+        for member in self.get_members(session):
+            self.assertTrue(member.relogin_forever)
+            self.assertFalse(member._subscription_enabled)
+
+    def test_subscriptions_first_member_down(self):
+        """
+        Test that the subscriptions go to another APIC when the first APIC is down
+        """
+        session = FakeClusterSession(['http://1.1.1.1', 'http://1.1.1.2', 'http://1.1.1.3'],
+                                     'admin', 'password')
+        members = self.get_members(session)
+        members[0].down = True
+        self.assertTrue(session.login().ok)
+        url = '/api/class/fvTenant.json?subscription=yes'
+        session.subscribe(url)
+        self.assertTrue(session.is_subscribed(url))
+        self.assertEqual(members[0].gets, [])
+        self.assertFalse(members[0].is_subscribed(url))
+        self.assertTrue(members[1].is_subscribed(url))
+        self.assertFalse(session.has_events(url))
+
+    def test_subscriptions_failover(self):
+        """
+        Test that the subscriptions are moved to another APIC when the APIC
+        used for subscriptions fails
+        """
+        session = self.get_session()
+        members = self.get_members(session)
+        callbacks = []
+        session.register_login_callback(callbacks.append)
+        url = '/api/class/fvTenant.json?subscription=yes'
+        session.subscribe(url)
+        self.assertTrue(members[0].is_subscribed(url))
+        self.assertFalse(members[1]._subscription_enabled)
+        members[0].fail = True
+        members[0].subscription_thread._event_q.put({'subscriptionId': ['0'], 'imdata': []})
+        for i in range(3):
+            session.get('/api/mo/uni.json')
+        self.assertFalse(session.has_events(url))
+        self.assertFalse(members[0].is_subscribed(url))
+        self.assertTrue(members[1].is_subscribed(url))
+        self.assertEqual(members[1].gets[-1], url)
+        self.assertEqual(callbacks, [session])
+        self.assertTrue(members[1].web_socket_opened)
+        self.assertTrue(members[1].relogin_forever)
+        self.assertFalse(members[2]._subscription_enabled)
+
+        # The subscriptions stay on the new APIC once the failed APIC recovers
+        members[0].fail = False
+        session._members[0].record_success(0.01, session.latency_weight)
+        self.assertFalse(session.has_events(url))
+        self.assertTrue(members[1].is_subscribed(url))
+        session.unsubscribe(url)
+        self.assertFalse(session.is_subscribed(url))
+
+
 class TestAppProfile(unittest.TestCase):
     """
     AppProfile class tests.  These do not communicate with APIC
@@ -2477,6 +3633,185 @@ class TestEndpoint(unittest.TestCase):
         self.verify_json(data, True)
 
 
+class FakeEndpointSession(Session):
+    """
+    Session that answers the class queries and subscriptions used for the
+    Endpoint events from canned data
+    """
+    def __init__(self, classes):
+        super(FakeEndpointSession, self).__init__('http://1.1.1.1', 'admin', 'password',
+                                                  subscription_enabled=False)
+        self.classes = classes
+        self.events = {}
+        self.urls = []
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        class_name = url.split('/class/')[1].split('.json')[0]
+        imdata = [{class_name: {'attributes': attributes}}
+                  for attributes in self.classes.get(class_name, [])]
+        if 'query-target-filter=eq(' in url:
+            mac = url.split('.mac,"')[1].split('"')[0]
+            imdata = [item for item in imdata if item[class_name]['attributes'].get('mac') == mac]
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = json.dumps({'imdata': imdata}).encode()
+        return resp
+
+    def subscribe(self, url, only_new=False):
+        self.events.setdefault(url, [])
+
+    def is_subscribed(self, url):
+        return url in self.events
+
+    def has_events(self, url):
+        return len(self.events.get(url, [])) > 0
+
+    def get_event(self, url):
+        return self.events[url].pop(0)
+
+    def add_event(self, class_name, attributes):
+        url = '/api/class/%s.json?subscription=yes' % class_name
+        self.events.setdefault(url, []).append({'imdata': [{class_name: {'attributes': attributes}}]})
+
+
+class TestEndpointEnrichmentCache(unittest.TestCase):
+    """
+    Test resolving Endpoint events with the EndpointEnrichmentCache.
+    These tests do not communicate with the APIC
+    """
+    EPG_DN = 'uni/tn-tenant/ap-app/epg-epg'
+
+    def get_session(self):
+        ep_dn = self.EPG_DN + '/cep-00:11:22:33:44:55'
+        path = 'topology/pod-1/paths-101/pathep-[eth1/5]'
+        vpc = 'topology/pod-1/protpaths-101-102/pathep-[vpc1]'
+        classes = {
+            'fabricPathEp': [{'dn': path, 'name': 'eth1/5', 'lagT': 'not-aggregated'},
+                             {'dn': vpc, 'name': 'vpc1', 'lagT': 'node'}],
+            'fvRsCEpToPathEp': [{'dn': ep_dn + '/rscEpToPathEp-[%s]' % path, 'tDn': path,
+                                 'state': 'formed'}],
+            'fvIp': [{'dn': ep_dn + '/ip-[10.0.0.2]', 'addr': '10.0.0.2'}],
+            'fvCEp': [{'dn': ep_dn, 'name': '00:11:22:33:44:55', 'mac': '00:11:22:33:44:55',
+                       'ip': '10.0.0.1', 'encap': 'vlan-5', 'lcC': 'learned',
+                       'modTs': '2016-01-01T00:00:00.000+00:00'}],
+        }
+        session = FakeEndpointSession(classes)
+        Endpoint.subscribe(session)
+        return session
+
+    def get_cache(self, session):
+        cache = EndpointEnrichmentCache(session)
+        cache.subscribe()
+        cache.load()
+        del session.urls[:]
+        return cache
+
+    def test_resolve_locally(self):
+        """
+        Test that a modified endpoint is resolved without querying the APIC
+        """
+        session = self.get_session()
+        cache = self.get_cache(session)
+        session.add_event('fvCEp', {'dn': self.EPG_DN + '/cep-00:11:22:33:44:55',
+                                    'status': 'modified',
+                                    'modTs': '2016-01-01T00:05:00.000+00:00'})
+        ep = Endpoint.get_event(session, cache=cache)
+        self.assertEqual(session.urls, [])
+        self.assertEqual(ep.mac, '00:11:22:33:44:55')
+        self.assertEqual(ep.ip, '10.0.0.1')
+        self.assertEqual(ep.encap, 'vlan-5')
+        self.assertEqual(ep.if_name, 'eth 1/101/1/5')
+        self.assertEqual(ep.secondary_ip, ['10.0.0.2'])
+        self.assertEqual(ep.timestamp, '2016-01-01T00:05:00.000+00:00')
+        epg = ep.get_parent()
+        self.assertEqual((epg.get_parent().get_parent().name, epg.get_parent().name, epg.name),
+                         ('tenant', 'app', 'epg'))
+
+    def test_relation_events(self):
+        """
+        Test that the cache follows the interface relation events
+        """
+        session = self.get_session()
+        cache = self.get_cache(session)
+        ep_dn = self.EPG_DN + '/cep-00:11:22:33:44:66'
+        vpc = 'topology/pod-1/protpaths-101-102/pathep-[vpc1]'
+        session.add_event('fvRsCEpToPathEp', {'dn': ep_dn + '/rscEpToPathEp-[%s]' % vpc,
+                                              'status': 'created'})
+        session.add_event('fvCEp', {'dn': ep_dn, 'status': 'created', 'name': '00:11:22:33:44:66',
+                                    'mac': '00:11:22:33:44:66', 'ip': '10.0.0.3',
+                                    'encap': 'vlan-5', 'lcC': 'learned'})
+        ep = Endpoint.get_event(session, cache=cache)
+        self.assertEqual(session.urls, [])
+        self.assertEqual(ep.if_name, 'vpc1')
+        self.assertEqual(ep.if_dn, [vpc])
+
+        session.add_event('fvCEp', {'dn': ep_dn, 'status': 'deleted'})
+        ep = Endpoint.get_event(session, cache=cache)
+        self.assertTrue(ep.is_deleted())
+        self.assertNotIn(ep_dn, cache._endpoints)
+        self.assertNotIn(ep_dn, cache._paths)
+
+    def test_fallback_lookup(self):
+        """
+        Test that endpoints missing from the cache are looked up in the background
+        """
+        session = self.get_session()
+        cache = self.get_cache(session)
+        session.add_event('fvCEp', {'dn': self.EPG_DN + '/cep-00:11:22:33:44:77', 'status': 'created',
+                                    'name': '00:11:22:33:44:77', 'mac': '00:11:22:33:44:77',
+                                    'ip': '10.0.0.4', 'encap': 'vlan-5', 'lcC': 'learned'})
+        self.assertIsNone(Endpoint.get_event(session, cache=cache))
+        cache.wait_for_lookups()
+        self.assertTrue(any('eq(fvCEp.mac,"00:11:22:33:44:77")' in url for url in session.urls))
+        # The APIC does not know about the endpoint either
+        self.assertFalse(cache.has_resolved())
+
+        session.classes['fvCEp'].append({'dn': self.EPG_DN + '/cep-00:11:22:33:44:88',
+                                         'name': '00:11:22:33:44:88', 'mac': '00:11:22:33:44:88',
+                                         'ip': '10.0.0.5', 'encap': 'vlan-5', 'lcC': 'learned',
+                                         'modTs': '2016-01-01T00:00:00.000+00:00'})
+        self.assertTrue(cache.lookup('00:11:22:33:44:88'))
+        cache.wait_for_lookups()
+        self.assertTrue(cache.has_resolved())
+        ep = Endpoint.get_event(session, cache=cache)
+        self.assertEqual(ep.mac, '00:11:22:33:44:88')
+        self.assertIsNone(Endpoint.get_event(session, cache=cache))
+
+    def test_single_event_per_miss(self):
+        """
+        Test that an endpoint missing from the cache is only returned once,
+        after it is looked up
+        """
+        session = self.get_session()
+        cache = self.get_cache(session)
+        session.classes['fvCEp'].append({'dn': self.EPG_DN + '/cep-00:11:22:33:44:99',
+                                         'name': '00:11:22:33:44:99', 'mac': '00:11:22:33:44:99',
+                                         'ip': '10.0.0.6', 'encap': 'vlan-5', 'lcC': 'learned',
+                                         'modTs': '2016-01-01T00:00:00.000+00:00'})
+        session.add_event('fvCEp', {'dn': self.EPG_DN + '/cep-00:11:22:33:44:99', 'status': 'created',
+                                    'name': '00:11:22:33:44:99', 'mac': '00:11:22:33:44:99',
+                                    'ip': '10.0.0.6', 'encap': 'vlan-5', 'lcC': 'learned'})
+        events = []
+        for _ in range(3):
+            events.append(Endpoint.get_event(session, cache=cache))
+            cache.wait_for_lookups()
+        events = [ep for ep in events if ep is not None]
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].mac, '00:11:22:33:44:99')
+
+    def test_bounded_lookups(self):
+        """
+        Test that lookups are dropped when the queue is full
+        """
+        session = self.get_session()
+        cache = EndpointEnrichmentCache(session, max_pending=1)
+        cache._worker = 'not started'
+        self.assertTrue(cache.lookup('00:11:22:33:44:01'))
+        self.assertTrue(cache.lookup('00:11:22:33:44:01'))
+        self.assertFalse(cache.lookup('00:11:22:33:44:02'))
+
+
 class TestPhysDomain(unittest.TestCase):
     """
     Class for testing Phys Domain
@@ -5544,6 +6879,51 @@ class TestLiveMonitorPolicy(TestLiveAPIC):
                     self.check_collection_policy(monitor_stat)
 
 
+class FakeHealthScoreSession(Session):
+    """
+    Session answering the healthInst class query from memory
+    """
+    def __init__(self, status_code=200):
+        super(FakeHealthScoreSession, self).__init__('http://1.1.1.1', 'admin', 'password',
+                                                     subscription_enabled=False)
+        self.status_code = status_code
+        self.urls = []
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        resp = requests.Response()
+        resp.status_code = self.status_code
+        if resp.ok:
+            imdata = [{'healthInst': {'attributes': {'dn': 'uni/tn-%s/health' % name, 'cur': '100',
+                                                     'prev': '90', 'chng': '10', 'updTs': ''}}}
+                      for name in ('common', 'infra')]
+        else:
+            imdata = [{'error': {'attributes': {'code': '400', 'text': 'Error'}}}]
+        resp._content = json.dumps({'totalCount': str(len(imdata)), 'imdata': imdata}).encode()
+        return resp
+
+
+class TestHealthScore(unittest.TestCase):
+    """
+    Offline tests for the HealthScore class
+    """
+    def test_get_all(self):
+        """
+        Test that all of the health scores are read with a single class query
+        """
+        session = FakeHealthScoreSession()
+        scores = HealthScore.get_all(session)
+        self.assertEqual([score.dn for score in scores], ['uni/tn-common/health', 'uni/tn-infra/health'])
+        self.assertEqual(scores[0].cur, '100')
+        self.assertEqual(session.urls, ['/api/class/healthInst.json'])
+
+    def test_get_all_error(self):
+        """
+        Test that no health score is returned when the APIC returns an error
+        """
+        self.assertEqual(HealthScore.get_all(FakeHealthScoreSession(400)), [])
+
+
 class TestLiveHealthScores(TestLiveAPIC):
     """
     Live tests for HealthScore class
@@ -5663,7 +7043,14 @@ if __name__ == '__main__':
     offline.addTest(unittest.makeSuite(TestBaseRelation))
     offline.addTest(unittest.makeSuite(TestBaseACIObject))
     offline.addTest(unittest.makeSuite(TestTenant))
+    offline.addTest(unittest.makeSuite(TestChangeTracking))
+    offline.addTest(unittest.makeSuite(TestSnapshotLoader))
+    offline.addTest(unittest.makeSuite(TestLazyLoading))
+    offline.addTest(unittest.makeSuite(TestSessionPaging))
     offline.addTest(unittest.makeSuite(TestSession))
+    offline.addTest(unittest.makeSuite(TestJSONCodec))
+    offline.addTest(unittest.makeSuite(TestAsyncSession))
+    offline.addTest(unittest.makeSuite(TestPushMany))
     offline.addTest(unittest.makeSuite(TestAppProfile))
     offline.addTest(unittest.makeSuite(TestBridgeDomain))
     offline.addTest(unittest.makeSuite(TestL2Interface))
@@ -5685,6 +7072,7 @@ if __name__ == '__main__':
     offline.addTest(unittest.makeSuite(TestOspf))
     offline.addTest(unittest.makeSuite(TestBGP))
     offline.addTest(unittest.makeSuite(TestEndpoint))
+    offline.addTest(unittest.makeSuite(TestEndpointEnrichmentCache))
     offline.addTest(unittest.makeSuite(TestMonitorPolicy))
     offline.addTest(unittest.makeSuite(TestAttributeCriterion))
     offline.addTest(unittest.makeSuite(TestOutsideL2))
@@ -0,0 +1,6 @@
+"""Benchmark suite for the acitoolkit core
+
+The benchmarks run the main library entry points against generated
+configurations served by FakeSession so that the results can be compared
+between runs without an APIC.  See README.md in the tests directory.
+"""
@@ -0,0 +1,241 @@
+"""Benchmarks of the toolkit core entry points
+
+Every benchmark is timed through FakeSession against the generated
+fixtures.  The results are reported as JSON so that they can be stored
+and compared between runs::
+
+    python -m benchmarks --tenants 10 100 1000 --output results.json
+    python -m benchmarks --compare results.json
+
+The command is run from the tests directory.
+"""
+import argparse
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from acitoolkit import FakeSession, Interface, Tenant
+from acitoolkit.acitoolkit import build_object_dictionary
+
+from .fixtures import count_objects, generate_leaves, generate_tenants, write_fixture
+
+
+def measure(func, repeat=3):
+    """
+    Time a function and measure the peak memory it allocates
+
+    The function is timed ``repeat`` times with the garbage collector
+    disabled.  The peak memory is measured during one extra call since
+    tracing the allocations slows the function down.  It is only
+    available when the tracemalloc module is.
+
+    :param func: Function to call without arguments
+    :param repeat: Integer containing the number of timed calls
+    :returns: Dictionary containing the best and mean time in seconds\
+              and the peak memory in bytes
+    """
+    times = []
+    gc.collect()
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.time()
+            func()
+            times.append(time.time() - start)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    peak_memory = None
+    if tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'best': min(times),
+            'mean': sum(times) / len(times),
+            'peak_memory': peak_memory}
+
+
+def _result(name, size, objects, repeat, timing):
+    result = {'benchmark': name,
+              'size': size,
+              'objects': objects,
+              'repeat': repeat}
+    result.update(timing)
+    result['throughput'] = objects / timing['best'] if timing['best'] else None
+    return result
+
+
+def bench_tenants(directory, num_tenants, repeat=3, seed=0):
+    """
+    Benchmark the Tenant entry points with a randomized configuration
+
+    :param directory: String containing the directory for the fixture
+    :param num_tenants: Integer containing the number of Tenants
+    :param repeat: Integer containing the number of timed calls
+    :param seed: Seed for the fixture generator
+    :returns: List of dictionaries containing the results
+    """
+    tenants_json = generate_tenants(num_tenants, seed=seed)
+    objects = count_objects(tenants_json)
+    names = [str(tenant['fvTenant']['attributes']['name']) for tenant in tenants_json]
+    filename = write_fixture(tenants_json, os.path.join(directory, 'tenants-%s.json' % num_tenants))
+    session = FakeSession([filename])
+    size = num_tenants
+    resp = []
+
+    timing = measure(lambda: Tenant.get_deep(session, names=names), repeat)
+    resp.append(_result('tenant_get_deep', size, objects, repeat, timing))
+
+    tenants = Tenant.get_deep(session, names=names)
+    timing = measure(lambda: [tenant.get_json() for tenant in tenants], repeat)
+    resp.append(_result('tenant_get_json', size, objects, repeat, timing))
+
+    timing = measure(lambda: [tenant.get_searchable() for tenant in tenants], repeat)
+    resp.append(_result('tenant_get_searchable', size, objects, repeat, timing))
+
+    full_data = [session.get('/api/mo/uni/tn-%s.json?query-target=self&rsp-subtree=full' % name).json()['imdata'][0]
+                 for name in names]
+    obj_dict = build_object_dictionary(tenants)
+
+    def extract_relationships():
+        for tenant in tenants:
+            tenant._extract_relationships(full_data, obj_dict)
+    timing = measure(extract_relationships, repeat)
+    resp.append(_result('tenant_extract_relationships', size, objects, repeat, timing))
+    return resp
+
+
+def bench_leaves(directory, num_leaves, num_ports=48, repeat=3):
+    """
+    Benchmark the Interface entry points with synthetic leaves
+
+    :param directory: String containing the directory for the fixture
+    :param num_leaves: Integer containing the number of leaves
+    :param num_ports: Integer containing the number of ports per leaf
+    :param repeat: Integer containing the number of timed calls
+    :returns: List of dictionaries containing the results
+    """
+    leaves_json = generate_leaves(num_leaves, num_ports)
+    objects = count_objects(leaves_json)
+    filename = write_fixture(leaves_json, os.path.join(directory, 'leaves-%s.json' % num_leaves))
+    session = FakeSession([filename])
+    resp = []
+
+    timing = measure(lambda: Interface.get(session), repeat)
+    resp.append(_result('interface_get', num_leaves, objects, repeat, timing))
+
+    interfaces = Interface.get(session)
+    timing = measure(lambda: [interface.get_searchable() for interface in interfaces], repeat)
+    resp.append(_result('interface_get_searchable', num_leaves, objects, repeat, timing))
+    return resp
+
+
+def run(tenants=(10, 100, 1000), leaves=(2, 10, 40), num_ports=48, repeat=3, seed=0, directory=None):
+    """
+    Run all of the benchmarks
+
+    :param tenants: Sequence of the numbers of Tenants to benchmark
+    :param leaves: Sequence of the numbers of leaves to benchmark
+    :param num_ports: Integer containing the number of ports per leaf
+    :param repeat: Integer containing the number of timed calls
+    :param seed: Seed for the fixture generator
+    :param directory: Optional directory where the fixtures are kept.\
+                      A temporary directory is used and removed otherwise.
+    :returns: Dictionary containing the report
+    """
+    report = {'python': platform.python_version(),
+              'platform': platform.platform(),
+              'date': datetime.datetime.utcnow().isoformat(),
+              'seed': seed,
+              'results': []}
+    keep = directory is not None
+    if not keep:
+        directory = tempfile.mkdtemp()
+    try:
+        for num_tenants in tenants:
+            report['results'].extend(bench_tenants(directory, num_tenants, repeat, seed))
+        for num_leaves in leaves:
+            report['results'].extend(bench_leaves(directory, num_leaves, num_ports, repeat))
+    finally:
+        if not keep:
+            shutil.rmtree(directory)
+    return report
+
+
+def compare(baseline, report):
+    """
+    Compare the results of two reports
+
+    :param baseline: Dictionary containing the baseline report
+    :param report: Dictionary containing the new report
+    :returns: List of tuples of the benchmark name, size, and the ratio\
+              of the new best time over the baseline best time
+    """
+    baseline_results = dict(((result['benchmark'], result['size']), result)
+                            for result in baseline['results'])
+    resp = []
+    for result in report['results']:
+        key = (result['benchmark'], result['size'])
+        if key in baseline_results and baseline_results[key]['best']:
+            resp.append(key + (result['best'] / baseline_results[key]['best'],))
+    return resp
+
+
+def main():
+    """
+    Main execution routine
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the acitoolkit core against FakeSession fixtures')
+    parser.add_argument('--tenants', type=int, nargs='*', default=[10, 100, 1000],
+                        help='Numbers of Tenants to benchmark')
+    parser.add_argument('--leaves', type=int, nargs='*', default=[2, 10, 40],
+                        help='Numbers of leaves to benchmark')
+    parser.add_argument('--ports', type=int, default=48,
+                        help='Number of ports per leaf')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timed calls per benchmark')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for the fixture generator. Runs are only comparable with the same seed')
+    parser.add_argument('--directory', default=None,
+                        help='Directory where the fixtures are kept')
+    parser.add_argument('--output', default=None,
+                        help='File to write the JSON report to. Default is stdout')
+    parser.add_argument('--compare', default=None,
+                        help='JSON report of a previous run to compare with')
+    args = parser.parse_args()
+
+    # FakeSession logs every query for a class that the fixtures do not have
+    logging.getLogger('acitoolkit').setLevel(logging.CRITICAL)
+
+    report = run(args.tenants, args.leaves, args.ports, args.repeat, args.seed, args.directory)
+    if args.output is None:
+        print(json.dumps(report, indent=4, sort_keys=True, separators=(',', ': ')))
+    else:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=4, sort_keys=True, separators=(',', ': '))
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        for name, size, ratio in compare(baseline, report):
+            sys.stderr.write('%-30s %6s %8.2fx\n' % (name, size, ratio))
+
+
+if __name__ == '__main__':
+    main()
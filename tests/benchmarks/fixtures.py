@@ -0,0 +1,218 @@
+"""Fixture generators for the benchmark suite
+
+The tenant fixtures are produced by the ACI configuration randomizer and
+the leaf fixtures are synthetic topSystem subtrees.  Both are written in
+the snapshot file format that FakeSession loads.
+"""
+import ast
+import json
+import os
+import random
+
+try:
+    import ConfigParser
+except ImportError:
+    import configparser as ConfigParser
+
+from aci_configuration_randomizer import ConfigRandomizer
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'aci_configuration_randomizer.ini')
+
+# Relative names of the classes generated by the randomizer.  The format
+# is filled in with the attributes of the object.
+RN_FORMATS = {
+    'fvTenant': 'tn-{name}',
+    'fvAp': 'ap-{name}',
+    'fvAEPg': 'epg-{name}',
+    'fvBD': 'BD-{name}',
+    'fvCtx': 'ctx-{name}',
+    'vzBrCP': 'brc-{name}',
+    'vzSubj': 'subj-{name}',
+    'vzFilter': 'flt-{name}',
+    'vzEntry': 'e-{name}',
+    'vzTaboo': 'taboo-{name}',
+    'vzTSubj': 'tsubj-{name}',
+    'fvRsBd': 'rsbd',
+    'fvRsCtx': 'rsctx',
+    'fvRsProv': 'rsprov-{tnVzBrCPName}',
+    'fvRsCons': 'rscons-{tnVzBrCPName}',
+    'fvRsProtBy': 'rsprotBy-{tnVzTabooName}',
+    'fvRsDomAtt': 'rsdomAtt-[{tDn}]',
+    'fvRsPathAtt': 'rspathAtt-[{tDn}]',
+    'vzRsSubjFiltAtt': 'rssubjFiltAtt-{tnVzFilterName}',
+    'vzRsDenyRule': 'rsdenyRule-{tnVzFilterName}',
+    'tagInst': 'tag-{name}',
+}
+
+
+# Attributes that the APIC fills in with their default value when they
+# are not configured
+DEFAULT_ATTRIBUTES = {
+    'fvRsPathAtt': {'mode': 'regular', 'instrImedcy': 'lazy'},
+    'fvRsDomAtt': {'instrImedcy': 'lazy', 'resImedcy': 'lazy'},
+}
+
+# Prefixes of the relative names of the targets of named relations
+TARGET_RN_PREFIXES = {
+    'tnFvBDName': 'BD-',
+    'tnFvCtxName': 'ctx-',
+    'tnVzBrCPName': 'brc-',
+    'tnVzFilterName': 'flt-',
+    'tnVzTabooName': 'taboo-',
+}
+
+
+def add_dn(data, parent_dn='uni', tenant_dn=None):
+    """
+    Fill in the dn and the default attributes of every managed object in
+    the JSON as the APIC would.  Named relations also get the tRn and tDn
+    of their target, which is resolved in the Tenant of the relation.
+
+    :param data: Dictionary containing the managed object JSON
+    :param parent_dn: String containing the dn of the parent
+    :param tenant_dn: String containing the dn of the Tenant
+    :returns: The same dictionary
+    """
+    for apic_class, contents in data.items():
+        attributes = contents.setdefault('attributes', {})
+        attributes.setdefault('status', '')
+        for attribute, value in DEFAULT_ATTRIBUTES.get(apic_class, {}).items():
+            attributes.setdefault(attribute, value)
+        rn = RN_FORMATS.get(apic_class, apic_class + '-{name}')
+        attributes['dn'] = parent_dn + '/' + rn.format(**attributes)
+        if apic_class == 'fvTenant':
+            tenant_dn = attributes['dn']
+        for attribute, prefix in TARGET_RN_PREFIXES.items():
+            if attribute in attributes and tenant_dn is not None:
+                attributes['tRn'] = prefix + attributes[attribute]
+                attributes['tDn'] = tenant_dn + '/' + attributes['tRn']
+        for child in contents.get('children', []):
+            add_dn(child, attributes['dn'], tenant_dn)
+    return data
+
+
+def count_objects(objects):
+    """
+    Count the managed objects in a list of JSON subtrees
+
+    :param objects: List of dictionaries containing managed object JSON
+    :returns: Integer containing the number of managed objects
+    """
+    count = 0
+    for data in objects:
+        for contents in data.values():
+            count += 1 + count_objects(contents.get('children', []))
+    return count
+
+
+def generate_tenants(num_tenants, config_file=DEFAULT_CONFIG, seed=None):
+    """
+    Generate the JSON of random Tenants using the configuration randomizer
+
+    The global maximums of the randomizer configuration are lifted so
+    that the size of the Tenants does not shrink as the count grows.
+
+    :param num_tenants: Integer containing the number of Tenants
+    :param config_file: String containing the randomizer .ini file
+    :param seed: Optional seed for the random module
+    :returns: List of dictionaries containing the fvTenant JSON
+    """
+    if seed is not None:
+        random.seed(seed)
+    config = ConfigParser.ConfigParser()
+    config.read(config_file)
+    config.set('Tenants', 'Minimum', str(num_tenants))
+    config.set('Tenants', 'Maximum', str(num_tenants))
+    for section in config.sections():
+        if config.has_option(section, 'GlobalMaximum'):
+            config.set(section, 'GlobalMaximum', str(1000000))
+    randomizer = ConfigRandomizer(config)
+    interfaces = ast.literal_eval(config.get('Interfaces', 'Interfaces'))
+    randomizer.create_random_config(interfaces)
+    resp = []
+    names = set()
+    for tenant in randomizer.tenants:
+        # Random names can collide, the APIC would merge the two Tenants
+        if tenant.name in names:
+            continue
+        names.add(tenant.name)
+        resp.append(add_dn(tenant.get_json()))
+    return resp
+
+
+def generate_leaf(node, num_ports=48, pod='1'):
+    """
+    Generate the JSON of a synthetic leaf sys subtree with its physical
+    interfaces
+
+    :param node: Integer containing the node id
+    :param num_ports: Integer containing the number of front panel ports
+    :param pod: String containing the pod id
+    :returns: Dictionary containing the topSystem JSON
+    """
+    interfaces = []
+    for port in range(1, num_ports + 1):
+        name = 'eth1/%s' % port
+        children = [
+            {'ethpmPhysIf': {'attributes': {'rn': 'phys',
+                                            'operSt': 'up' if port % 4 else 'down',
+                                            'operSpeed': '10G'}}},
+            {'l1RsCdpIfPolCons': {'attributes': {'rn': 'rscdpIfPolCons',
+                                                 'tDn': 'uni/infra/cdpIfP-default'}}},
+            {'l1RsLldpIfPolCons': {'attributes': {'rn': 'rslldpIfPolCons',
+                                                  'tDn': 'uni/infra/lldpIfP-default'}}},
+        ]
+        interfaces.append({'l1PhysIf': {'attributes': {'rn': 'phys-[%s]' % name,
+                                                       'id': name,
+                                                       'adminSt': 'up',
+                                                       'descr': '',
+                                                       'monPolDn': 'uni/infra/moninfra-default',
+                                                       'mtu': '9000',
+                                                       'name': '',
+                                                       'portT': 'leaf',
+                                                       'speed': 'inherit',
+                                                       'usage': 'discovery'},
+                                        'children': children}})
+    dn = 'topology/pod-%s/node-%s/sys' % (pod, node)
+    return {'topSystem': {'attributes': {'dn': dn,
+                                         'id': str(node),
+                                         'name': 'leaf%s' % node,
+                                         'role': 'leaf',
+                                         'podId': str(pod)},
+                          'children': interfaces}}
+
+
+def generate_leaves(num_leaves, num_ports=48, pod='1', first_node=101):
+    """
+    Generate the JSON of several synthetic leaves together with the
+    interface policies they refer to
+
+    :param num_leaves: Integer containing the number of leaves
+    :param num_ports: Integer containing the number of ports per leaf
+    :param pod: String containing the pod id
+    :param first_node: Integer containing the node id of the first leaf
+    :returns: List of dictionaries containing the managed object JSON
+    """
+    resp = [{'cdpIfPol': {'attributes': {'dn': 'uni/infra/cdpIfP-default',
+                                         'name': 'default',
+                                         'adminSt': 'disabled'}}},
+            {'lldpIfPol': {'attributes': {'dn': 'uni/infra/lldpIfP-default',
+                                          'name': 'default',
+                                          'adminTxSt': 'enabled'}}}]
+    for node in range(first_node, first_node + num_leaves):
+        resp.append(generate_leaf(node, num_ports, pod))
+    return resp
+
+
+def write_fixture(objects, filename):
+    """
+    Write managed object JSON in the format that FakeSession loads
+
+    :param objects: List of dictionaries containing managed object JSON
+    :param filename: String containing the name of the file to write
+    :returns: The filename
+    """
+    with open(filename, 'w') as fixture_file:
+        json.dump({'totalCount': str(len(objects)), 'imdata': objects}, fixture_file)
+    return filename